@@ -1,22 +1,29 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST
 from contextlib import asynccontextmanager
 
 from app.log import log_router
 from app.alerts import alerts_router
+from app.admin import admin_router
+from app.incidents import incidents_router
+from app.core.config import settings
 from app.celery_utils import create_celery
-from app.log.service import fetch_all_security_logs, send_logs_to_logstash
+from app.core.metrics import render_metrics
+from app.core.profiling import profiled, header_requests_profile, PROFILE_HEADER, PROFILE_ID_HEADER
+from app.log.service import run_startup_ingestion, start_token_refresher, stop_token_refresher
 
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # --- STARTUP ---
-    security_logs = fetch_all_security_logs()
-    
-    send_logs_to_logstash(security_logs)
+    start_token_refresher()
+    run_startup_ingestion()
     yield
     # --- SHUTDOWN (optional) ---
+    stop_token_refresher()
     print("[Shutdown] FastAPI application is shutting down")
 
 celery_app = create_celery()
@@ -37,16 +44,41 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    # cProfile and tracemalloc hook the event-loop thread, not a single request: a
+    # request's profile also covers whatever other coroutines the loop ran meanwhile,
+    # and two profilers at once would clobber each other. Profiled requests therefore
+    # run one at a time; unprofiled ones are not held up.
+    profile_lock = asyncio.Lock()
+
+    @app.middleware("http")
+    async def profile_requests(request: Request, call_next):
+        # Opt-in per request: send "X-Boron-Profile: 1" while PROFILING_ENABLED is set
+        if not (settings.PROFILING_ENABLED and header_requests_profile(request.headers.get(PROFILE_HEADER))):
+            return await call_next(request)
+
+        async with profile_lock:
+            with profiled(f"{request.method} {request.url.path}") as profile_id:
+                response = await call_next(request)
+        if profile_id:
+            response.headers[PROFILE_ID_HEADER] = profile_id
+        return response
+
     app.celery_app = celery_app # type: ignore
 
     app.include_router(log_router)
     app.include_router(alerts_router)
+    app.include_router(incidents_router)
+    app.include_router(admin_router)
 
     @app.get('/')
     async def root():
         return {"message" : "Hello, World!"}
+
+    @app.get('/metrics', include_in_schema=False)
+    async def metrics():
+        return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
     
     return app
 
 
-from . import core, log, alerts
\ No newline at end of file
+from . import core, log, alerts, incidents, admin
\ No newline at end of file
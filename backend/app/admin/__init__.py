@@ -0,0 +1,5 @@
+from fastapi import APIRouter
+
+admin_router = APIRouter(prefix="/admin", tags=["admin"])
+
+from . import routes
@@ -0,0 +1,85 @@
+import redis
+from datetime import datetime
+from elasticsearch import Elasticsearch
+from fastapi import Depends, HTTPException
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+from typing import List, Dict, Any, Optional
+
+from . import admin_router
+from app.alerts.backfill import backfill_report
+from app.alerts.tasks import start_backfill
+from app.core.clients import get_elasticsearch, get_redis
+from app.core.config import settings
+from app.core.profiling import list_profiles, profile_artifact_path, PROFILE_ARTIFACTS
+
+
+def _require_profiling():
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+
+
+@admin_router.get("/profiles")
+async def get_profiles() -> List[Dict[str, Any]]:
+    """List stored profiles, newest first"""
+    _require_profiling()
+    return list_profiles()
+
+
+@admin_router.get("/profiles/{profile_id}/{artifact}")
+async def download_profile(profile_id: str, artifact: str):
+    """Download a profile artifact (pstats, collapsed or memory)"""
+    _require_profiling()
+    if artifact not in PROFILE_ARTIFACTS:
+        raise HTTPException(status_code=400, detail=f"Unknown artifact '{artifact}', expected one of {sorted(PROFILE_ARTIFACTS)}")
+
+    path = profile_artifact_path(profile_id, artifact)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+
+    media_type = "application/octet-stream" if artifact == "pstats" else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=f"{profile_id}{PROFILE_ARTIFACTS[artifact]}")
+
+
+@admin_router.get("/health")
+def get_health(es: Elasticsearch = Depends(get_elasticsearch), redis_client: redis.Redis = Depends(get_redis)) -> Dict[str, bool]:
+    """Check the shared Elasticsearch and Redis clients can reach their servers"""
+    try:
+        redis_ok = bool(redis_client.ping())
+    except redis.RedisError:
+        redis_ok = False
+    try:
+        es_ok = bool(es.ping())
+    except Exception:
+        es_ok = False
+    return {"elasticsearch": es_ok, "redis": redis_ok}
+
+
+class BackfillRequest(BaseModel):
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    rules: List[str] = []
+    run_id: Optional[str] = None
+
+
+@admin_router.post("/backfill")
+def create_backfill(request: BackfillRequest) -> Dict[str, Any]:
+    """Replay a time range through the given rules (all chunkable rules if none), or resume ``run_id``"""
+    if request.run_id is None and (request.start is None or request.end is None):
+        raise HTTPException(status_code=400, detail="start and end are required unless resuming a run_id")
+    try:
+        run_id = start_backfill(request.start, request.end, request.rules, run_id=request.run_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return backfill_report(run_id)
+
+
+@admin_router.get("/backfill/{run_id}")
+def get_backfill(run_id: str) -> Dict[str, Any]:
+    """Progress and throughput of a backfill run"""
+    report = backfill_report(run_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"Backfill {run_id} not found")
+    return report
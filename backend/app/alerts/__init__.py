@@ -2,4 +2,4 @@ from fastapi import APIRouter
 
 alerts_router = APIRouter(prefix="/alerts", tags=["alerts"])
 
-from . import routes
+from . import routes, tasks
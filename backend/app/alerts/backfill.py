@@ -0,0 +1,170 @@
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from app.core.clients import redis_client
+from app.core.config import settings
+from .chunking import chunk_rules, owned_alerts, plan_slices, slice_bounds
+from .models import AlertRule
+from .service import alert_service
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_PREFIX = "alerts:backfill"
+BACKFILL_TAG = "backfill"
+
+
+def _run_key(run_id: str) -> str:
+    return f"{BACKFILL_PREFIX}:{run_id}"
+
+
+def _done_key(run_id: str) -> str:
+    return f"{BACKFILL_PREFIX}:{run_id}:done"
+
+
+def _cursor_key(run_id: str) -> str:
+    return f"{BACKFILL_PREFIX}:{run_id}:next"
+
+
+def backfill_rules(names: Optional[List[str]] = None) -> List[AlertRule]:
+    """Active rules named in ``names`` (all chunkable ones when empty) that can be replayed.
+
+    Rules that are not chunkable keep watermark state for live evaluation, which a
+    replay of old events would corrupt, so asking for one is an error.
+    """
+    rules = alert_service.active_rules()
+    if not names:
+        return chunk_rules(rules)[0]
+    by_name = {rule.name: rule for rule in rules}
+    unknown = [name for name in names if name not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown rules: {', '.join(unknown)}")
+    stateful = [name for name in names if not by_name[name].chunkable]
+    if stateful:
+        raise ValueError(f"Rules keep live state and cannot be backfilled: {', '.join(stateful)}")
+    return [by_name[name] for name in names]
+
+
+def create_run(start: datetime, end: datetime, rule_names: Optional[List[str]] = None) -> str:
+    """Plan [start, end) into partitions for ``rule_names`` and record the run; returns its id.
+
+    Partitions are cut from an event histogram like chunked evaluation, but allowed
+    to span up to BACKFILL_MAX_MINUTES so quiet history yields few partitions. The
+    plan is stored with the run, so a resumed run replays the same partitions.
+    """
+    if end <= start:
+        raise ValueError("Backfill end must be after its start")
+    rules = backfill_rules(rule_names)
+    histogram = alert_service.get_event_histogram(start, end, rules=rules)
+    partitions = plan_slices(start, end, histogram, max_minutes=settings.BACKFILL_MAX_MINUTES)
+
+    run_id = uuid.uuid4().hex
+    pipe = redis_client.pipeline()
+    pipe.hset(_run_key(run_id), mapping={
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "rules": json.dumps([rule.name for rule in rules]),
+        "partitions": json.dumps(partitions),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    })
+    pipe.expire(_run_key(run_id), settings.BACKFILL_STATE_TTL_SECONDS)
+    pipe.execute()
+    logger.info(f"Planned backfill {run_id}: {len(partitions)} partitions of {start.isoformat()} - {end.isoformat()}")
+    return run_id
+
+
+def load_run(run_id: str) -> Optional[Dict[str, Any]]:
+    raw = redis_client.hgetall(_run_key(run_id))
+    if not raw:
+        return None
+    return {
+        "start": raw["start"],
+        "end": raw["end"],
+        "rules": json.loads(raw["rules"]),
+        "partitions": json.loads(raw["partitions"]),
+        "created_at": raw["created_at"],
+    }
+
+
+def reset_cursor(run_id: str):
+    """Start handing out partitions from the first one again; completed ones are skipped"""
+    redis_client.delete(_cursor_key(run_id))
+
+
+def claim_partition(run_id: str, partitions: int) -> Optional[int]:
+    """Claim the next partition of the run that has no checkpoint yet, or None when none are left"""
+    while True:
+        index = redis_client.incr(_cursor_key(run_id)) - 1
+        if index >= partitions:
+            return None
+        if not redis_client.hexists(_done_key(run_id), str(index)):
+            return index
+
+
+def run_partition(run_id: str, index: int) -> Dict[str, Any]:
+    """Replay one partition through the run's rules, store its alerts tagged, and checkpoint it.
+
+    Events are read through a point in time with CHUNK_OVERLAP_MINUTES either side,
+    and only alerts timestamped inside the partition are kept, as for chunks. Alert
+    ids are deterministic, so replaying a partition again merges rather than duplicates.
+    """
+    run = load_run(run_id)
+    if run is None:
+        raise LookupError(f"Backfill {run_id} not found")
+    rules = backfill_rules(run["rules"])
+    time_slice = run["partitions"][index]
+    start, end = slice_bounds(time_slice)
+    overlap = timedelta(minutes=settings.CHUNK_OVERLAP_MINUTES)
+
+    started = time.perf_counter()
+    events = alert_service.get_events_between(start - overlap, end + overlap, rules=rules)
+    alerts = owned_alerts(alert_service.generate_alerts(events=events, rules=rules), time_slice)
+    for alert in alerts:
+        alert.tags = [BACKFILL_TAG]
+        alert_service.store_alert(alert)
+
+    stats = {
+        "events": len(events),
+        "alerts": len(alerts),
+        "seconds": round(time.perf_counter() - started, 3),
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+    }
+    pipe = redis_client.pipeline()
+    pipe.hset(_done_key(run_id), str(index), json.dumps(stats))
+    pipe.expire(_done_key(run_id), settings.BACKFILL_STATE_TTL_SECONDS)
+    pipe.execute()
+    return stats
+
+
+def backfill_report(run_id: str) -> Optional[Dict[str, Any]]:
+    """Progress and throughput of a run, or None if it is unknown (or expired)"""
+    run = load_run(run_id)
+    if run is None:
+        return None
+    done = [json.loads(value) for value in redis_client.hvals(_done_key(run_id))]
+    events = sum(stats["events"] for stats in done)
+    busy = sum(stats["seconds"] for stats in done)
+    complete = len(done) >= len(run["partitions"])
+
+    # Wall time up to the last checkpoint once complete, up to now while running
+    last = max((stats["finished_at"] for stats in done), default=None) if complete else None
+    finished = datetime.fromisoformat(last) if last else datetime.now(timezone.utc)
+    elapsed = max((finished - datetime.fromisoformat(run["created_at"])).total_seconds(), 0.0)
+
+    return {
+        "run_id": run_id,
+        "status": "complete" if complete else "running",
+        "start": run["start"],
+        "end": run["end"],
+        "rules": run["rules"],
+        "partitions": len(run["partitions"]),
+        "completed_partitions": len(done),
+        "events": events,
+        "alerts": sum(stats["alerts"] for stats in done),
+        "elapsed_seconds": round(elapsed, 3),
+        "events_per_second": round(events / elapsed, 1) if elapsed else 0.0,
+        "events_per_partition_second": round(events / busy, 1) if busy else 0.0,
+    }
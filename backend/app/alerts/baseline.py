@@ -0,0 +1,221 @@
+import logging
+from datetime import datetime, timezone
+from statistics import median
+from typing import List, Dict, Any, Optional, Tuple
+
+import redis
+
+from app.core.config import settings
+from app.core.clients import redis_client
+from .dsl import EventBatch
+from .models import Alert, AlertRule, AlertSeverity, AlertStatus, BASE_SOURCE_FIELDS, alert_fingerprint
+from .sketches import BoundedEwmaTable, Ewma, RedisCountMinSketch, RedisDistinctCounter, ewma_alpha
+
+logger = logging.getLogger(__name__)
+
+BASELINE_REDIS_PREFIX = "baseline:failed_logins"
+FAILED_LOGON_EVENT_IDS = ["4625"]
+DAY_SECONDS = 86400
+
+TimedEvent = Tuple[datetime, Dict[str, Any]]
+
+
+def _interval_start(interval: int, interval_seconds: int) -> datetime:
+    return datetime.fromtimestamp(interval * interval_seconds, tz=timezone.utc)
+
+
+class FailedLoginBaselineRule(AlertRule):
+    """Flag failed-logon counts that deviate from each entity's own history.
+
+    Events are folded into fixed intervals (BASELINE_INTERVAL_MINUTES). Per source IP
+    and per target user an EWMA of the per-interval count is kept in Redis, so a
+    service account that always fails a few times stays quiet while a sudden burst
+    stands out. Per day, a Count-Min Sketch counts attempts per IP x user pair and a
+    HyperLogLog per IP counts distinct target users; many targets with only a few
+    attempts each is reported as a password spray even when the rate never spikes.
+
+    Redis memory is bounded: EWMA state is capped at BASELINE_MAX_ENTITIES (least
+    recently seen evicted, along with their HyperLogLogs) and the sketch has a fixed
+    width x depth. A watermark makes overlapping runs fold each interval in once.
+    """
+
+    event_ids = {4625}
+    required_fields = ["@timestamp"]
+    source_fields = BASE_SOURCE_FIELDS + ["source.ip", "IpAddress", "TargetUserName"]
+    # The watermark folds intervals in order; parallel chunks would skip earlier ones
+    chunkable = False
+
+    def __init__(self, prefix: str = BASELINE_REDIS_PREFIX):
+        super().__init__("Failed Login Baseline", AlertSeverity.HIGH)
+        self.prefix = prefix
+
+    @property
+    def client(self) -> redis.Redis:
+        return redis_client
+
+    @property
+    def interval_seconds(self) -> int:
+        return settings.BASELINE_INTERVAL_MINUTES * 60
+
+    def check(self, events: List[Dict[str, Any]]) -> List[Alert]:
+        batch = events if isinstance(events, EventBatch) else EventBatch(events)
+        interval_seconds = self.interval_seconds
+        # Only fold intervals that are complete and past the ingestion settle time
+        current = int(datetime.now(timezone.utc).timestamp()) // interval_seconds
+        last_complete = current - 1 - settings.BASELINE_SETTLE_INTERVALS
+
+        intervals: Dict[int, List[TimedEvent]] = {}
+        for timestamp, event in batch.select(FAILED_LOGON_EVENT_IDS):
+            interval = int(timestamp.timestamp()) // interval_seconds
+            if interval <= last_complete:
+                intervals.setdefault(interval, []).append((timestamp, event))
+        if not intervals:
+            return []
+
+        try:
+            lock = self.client.lock(f"{self.prefix}:lock", timeout=settings.BASELINE_LOCK_TIMEOUT,
+                                    blocking_timeout=settings.BASELINE_LOCK_WAIT)
+            if not lock.acquire():
+                logger.warning("Baseline state is being updated by another worker, skipping this run")
+                return []
+        except redis.RedisError as e:
+            logger.error(f"Error acquiring baseline lock: {e}")
+            return []
+
+        alerts = []
+        try:
+            watermark_key = f"{self.prefix}:watermark"
+            watermark = int(self.client.get(watermark_key) or -1)
+            for interval in sorted(i for i in intervals if i > watermark):
+                alerts.extend(self._fold_interval(interval, intervals[interval]))
+                self.client.set(watermark_key, interval)
+        except redis.RedisError as e:
+            logger.error(f"Error updating failed-login baselines: {e}")
+        finally:
+            try:
+                lock.release()
+            except redis.RedisError:
+                pass # lock expired; the watermark keeps the next run consistent
+        return alerts
+
+    def _fold_interval(self, interval: int, timed_events: List[TimedEvent]) -> List[Alert]:
+        """Score one interval against the stored baselines, then add it to them"""
+        by_ip: Dict[str, List[Dict[str, Any]]] = {}
+        by_user: Dict[str, List[Dict[str, Any]]] = {}
+        pairs: Dict[str, int] = {}
+        targets: Dict[str, set] = {}
+        for _, event in timed_events:
+            ip = str((event.get("source") or {}).get("ip") or event.get("IpAddress") or "-")
+            user = str(event.get("TargetUserName") or "-").lower()
+            if ip != "-":
+                by_ip.setdefault(ip, []).append(event)
+            if user != "-":
+                by_user.setdefault(user, []).append(event)
+            if ip != "-" and user != "-":
+                pair = f"{ip}|{user}"
+                pairs[pair] = pairs.get(pair, 0) + 1
+                targets.setdefault(ip, set()).add(user)
+
+        alpha = ewma_alpha(settings.BASELINE_HALF_LIFE_HOURS * 3600 / self.interval_seconds)
+        interval_start = _interval_start(interval, self.interval_seconds)
+        table = BoundedEwmaTable(self.client, f"{self.prefix}:ewma", settings.BASELINE_MAX_ENTITIES)
+        grouped = {f"ip:{ip}": group for ip, group in by_ip.items()}
+        grouped.update({f"user:{user}": group for user, group in by_user.items()})
+        states = table.get_many(list(grouped))
+
+        alerts = []
+        for entity, group in grouped.items():
+            state = states[entity]
+            state.decay_to(interval, alpha)
+            score = self._score(state, len(group))
+            if score is not None:
+                kind, value = entity.split(":", 1)
+                alerts.append(self._rate_alert(kind, value, group, state, score, interval_start))
+            state.update(len(group), interval, alpha)
+        evicted = table.put_many(states)
+
+        day = interval * self.interval_seconds // DAY_SECONDS
+        ttl = 2 * DAY_SECONDS
+        sketch = RedisCountMinSketch(self.client, f"{self.prefix}:cms:{day}",
+                                     settings.BASELINE_CMS_WIDTH, settings.BASELINE_CMS_DEPTH, ttl)
+        sketch.add_many(pairs)
+        distinct = RedisDistinctCounter(self.client, f"{self.prefix}:targets:{day}", ttl)
+        distinct_counts = distinct.add_and_count(targets)
+        distinct.delete(entity[3:] for entity in evicted if entity.startswith("ip:"))
+
+        day_start = datetime.fromtimestamp(day * DAY_SECONDS, tz=timezone.utc)
+        for ip, count in distinct_counts.items():
+            if count < settings.BASELINE_SPRAY_TARGETS:
+                continue
+            per_target = sketch.estimate_many(f"{ip}|{user}" for user in targets[ip])
+            # Median is robust to the few pairs a sketch collision overestimates
+            if median(per_target.values()) <= settings.BASELINE_SPRAY_MAX_PER_TARGET:
+                alerts.append(self._spray_alert(ip, count, by_ip[ip], day_start))
+        return alerts
+
+    @staticmethod
+    def _score(state: Ewma, count: int) -> Optional[float]:
+        """z-score when ``count`` is anomalous for this entity, else None"""
+        if count < settings.BASELINE_MIN_COUNT:
+            return None
+        if state.count < settings.BASELINE_MIN_OBSERVATIONS:
+            # Not enough history yet: only flag bursts no baseline could explain
+            return float("inf") if count >= settings.BASELINE_COLD_START_COUNT else None
+        z = state.zscore(count, settings.BASELINE_STD_FLOOR)
+        return z if z >= settings.BASELINE_Z_THRESHOLD else None
+
+    def _rate_alert(self, kind: str, value: str, events: List[Dict[str, Any]], state: Ewma,
+                    score: float, interval_start: datetime) -> Alert:
+        if state.count < settings.BASELINE_MIN_OBSERVATIONS:
+            baseline = "no baseline yet"
+        else:
+            baseline = f"baseline {state.mean:.1f} ± {state.std:.1f}, z={score:.1f}"
+        subject = f"from {value}" if kind == "ip" else f"for user {value}"
+        return self._build_alert(
+            alert_id=alert_fingerprint("baseline", self.name, (kind, value), interval_start),
+            title=f"Failed Login Rate Anomaly ({kind})",
+            description=(f"{len(events)} failed logins {subject} in {settings.BASELINE_INTERVAL_MINUTES} "
+                         f"minutes ({baseline})"),
+            severity=self.severity if kind == "ip" else AlertSeverity.MEDIUM,
+            timestamp=interval_start,
+            events=events
+        )
+
+    def _spray_alert(self, ip: str, targets: int, events: List[Dict[str, Any]], day_start: datetime) -> Alert:
+        return self._build_alert(
+            alert_id=alert_fingerprint("spray", self.name, ip, day_start),
+            title="Password Spray Suspected",
+            description=(f"Failed logins from {ip} against ~{targets} distinct users today with at most "
+                         f"{settings.BASELINE_SPRAY_MAX_PER_TARGET} attempts per user (typical)"),
+            severity=self.severity,
+            timestamp=day_start,
+            events=events
+        )
+
+    def _build_alert(self, alert_id: str, title: str, description: str, severity: AlertSeverity,
+                     timestamp: datetime, events: List[Dict[str, Any]]) -> Alert:
+        users = sorted({str(e["TargetUserName"]) for e in events if e.get("TargetUserName")})
+        source_ips = sorted({str((e.get("source") or {}).get("ip") or e.get("IpAddress"))
+                             for e in events if (e.get("source") or {}).get("ip") or e.get("IpAddress")})
+        return Alert(
+            id=alert_id,
+            title=title,
+            description=description,
+            severity=severity,
+            status=AlertStatus.OPEN,
+            source="Security Events",
+            timestamp=timestamp,
+            event_count=len(events),
+            affected_users=users,
+            source_ips=source_ips,
+            event_ids=[str(e.get("EventRecordID", "")) for e in events],
+            raw_events=events
+        )
+
+
+def baseline_rules() -> List[AlertRule]:
+    """The baselining rule when enabled (it keeps state in Redis, so it is opt-in)"""
+    return [baseline_rule] if settings.BASELINE_ENABLED else []
+
+
+baseline_rule = FailedLoginBaselineRule()
@@ -0,0 +1,98 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.clients import redis_client
+from app.core.config import settings
+from .models import Alert, AlertRule
+
+logger = logging.getLogger(__name__)
+
+CHUNK_RESULT_PREFIX = "alerts:chunks"
+
+
+def plan_slices(start: datetime, end: datetime, histogram: Optional[Iterable[Tuple[datetime, int]]],
+                max_events: Optional[int] = None, max_minutes: Optional[int] = None) -> List[Dict[str, str]]:
+    """Cut [start, end) into time slices of at most ``max_events`` events and ``max_minutes`` each.
+
+    ``histogram`` holds (interval start, count) pairs in time order, empty intervals
+    omitted; slices are packed greedily from them, so quiet stretches produce no
+    slice at all. A single interval above ``max_events`` still gets one slice, as
+    intervals are not split further. Without a histogram the window is cut into
+    fixed ``max_minutes`` slices. Slices are plain {"start", "end"} ISO strings, a
+    reference a chunk task can query Elasticsearch with, not the events themselves.
+    """
+    max_events = max_events or settings.CHUNK_MAX_EVENTS
+    span = timedelta(minutes=max_minutes or settings.CHUNK_MAX_MINUTES)
+    bounds: List[Tuple[datetime, datetime]] = []
+
+    if histogram is None:
+        cursor = start
+        while cursor < end:
+            bounds.append((cursor, min(cursor + span, end)))
+            cursor += span
+    else:
+        slice_start, count, last = None, 0, None
+        for interval_start, interval_count in histogram:
+            interval_start = max(interval_start, start)
+            if slice_start is not None and (count + interval_count > max_events or interval_start - slice_start >= span):
+                bounds.append((slice_start, interval_start))
+                slice_start, count = None, 0
+            if slice_start is None:
+                slice_start = interval_start
+            count += interval_count
+            last = interval_start
+        if slice_start is not None and last is not None:
+            bounds.append((slice_start, end))
+
+    return [{"start": s.isoformat(), "end": e.isoformat()} for s, e in bounds]
+
+
+def slice_bounds(time_slice: Dict[str, str]) -> Tuple[datetime, datetime]:
+    return datetime.fromisoformat(time_slice["start"]), datetime.fromisoformat(time_slice["end"])
+
+
+def chunk_rules(rules: List[AlertRule]) -> Tuple[List[AlertRule], List[AlertRule]]:
+    """Split rules into those evaluated per chunk and those that need the whole window in one run"""
+    return [rule for rule in rules if rule.chunkable], [rule for rule in rules if not rule.chunkable]
+
+
+def owned_alerts(alerts: Iterable[Alert], time_slice: Dict[str, str]) -> List[Alert]:
+    """Alerts timestamped inside the slice itself, not in the overlap fetched around it.
+
+    Chunks fetch CHUNK_OVERLAP_MINUTES either side so a burst crossing a boundary is
+    seen whole; keeping only the alerts a slice owns stops neighbours reporting it twice.
+    """
+    start, end = slice_bounds(time_slice)
+    return [alert for alert in alerts if start <= alert.timestamp < end]
+
+
+def chunk_result_key(run_id: str, index: int) -> str:
+    return f"{CHUNK_RESULT_PREFIX}:{run_id}:{index}"
+
+
+def save_chunk_result(key: str, alerts: List[Alert]) -> str:
+    """Park a chunk's alerts in Redis and return the key the reducer reads them from.
+
+    The key is replaced as a whole, so a retried chunk does not leave duplicates.
+    """
+    pipe = redis_client.pipeline()
+    pipe.delete(key)
+    if alerts:
+        pipe.rpush(key, *(json.dumps(alert.to_dict()) for alert in alerts))
+        pipe.expire(key, settings.CHUNK_RESULT_TTL_SECONDS)
+    pipe.execute()
+    return key
+
+
+def load_chunk_results(keys: Iterable[str]) -> List[List[Dict[str, Any]]]:
+    """Read (and drop) the alerts parked under each chunk result key"""
+    results = []
+    for key in keys:
+        pipe = redis_client.pipeline()
+        pipe.lrange(key, 0, -1)
+        pipe.delete(key)
+        raw, _ = pipe.execute()
+        results.append([json.loads(item) for item in raw])
+    return results
@@ -0,0 +1,406 @@
+import os
+import re
+import json
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Callable, Iterable, Tuple
+
+import yaml
+
+from app.core.config import settings
+from .models import (
+    Alert, AlertRule, AlertSeverity, AlertStatus, BASE_SOURCE_FIELDS, ThresholdPlan,
+    parse_timestamp, time_bucket, alert_fingerprint
+)
+
+logger = logging.getLogger(__name__)
+
+RULE_FILE_SUFFIXES = (".yml", ".yaml", ".json")
+
+TimedEvent = Tuple[datetime, Dict[str, Any]]
+Predicate = Callable[[Dict[str, Any]], bool]
+
+
+class RuleSpecError(ValueError):
+    """Raised when a declarative rule definition is invalid"""
+
+
+def get_field(event: Dict[str, Any], path: str) -> Any:
+    """Resolve a dotted field path ("source.ip"), also accepting flattened keys"""
+    if path in event:
+        return event[path]
+    value: Any = event
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _event_id_key(value: Any) -> str:
+    return str(value) if value is not None else ""
+
+
+class EventBatch(list):
+    """A list of events with a lazily built event-ID index and pre-parsed timestamps.
+
+    Built once per generation run and shared by every rule, so each event's
+    timestamp is parsed once and each rule only visits the event IDs it asks for.
+    Treat it as read-only once rules start evaluating.
+    """
+
+    def __init__(self, events=()):
+        super().__init__(events)
+        self._by_event_id: Optional[Dict[str, List[TimedEvent]]] = None
+
+    @classmethod
+    def from_index(cls, by_event_id: Dict[str, List[TimedEvent]]) -> "EventBatch":
+        """Batch over events already parsed and grouped by event ID, each list in time order"""
+        batch = cls(event for timed in by_event_id.values() for _, event in timed)
+        batch._by_event_id = by_event_id
+        return batch
+
+    def _index(self) -> Dict[str, List[TimedEvent]]:
+        if self._by_event_id is None:
+            index: Dict[str, List[TimedEvent]] = {}
+            for event in self:
+                timestamp = parse_timestamp(event.get("@timestamp"))
+                if timestamp is None:
+                    continue
+                event_id = _event_id_key((event.get("event") or {}).get("id"))
+                index.setdefault(event_id, []).append((timestamp, event))
+            for timed in index.values():
+                timed.sort(key=itemgetter(0))
+            self._by_event_id = index
+        return self._by_event_id
+
+    def select(self, event_ids: Optional[List[str]] = None, ordered: bool = True) -> Iterable[TimedEvent]:
+        """(timestamp, event) pairs restricted to ``event_ids`` when given; in time order
+        unless ``ordered`` is False, which skips merging the per-ID lists"""
+        index = self._index()
+        keys = index.keys() if event_ids is None else [k for k in event_ids if k in index]
+        lists = [index[k] for k in keys]
+        if len(lists) == 1:
+            return lists[0]
+        if not ordered:
+            return itertools.chain.from_iterable(lists)
+        return list(heapq.merge(*lists, key=itemgetter(0)))
+
+
+def _compile_predicate(spec: Dict[str, Any]) -> Predicate:
+    if not isinstance(spec, dict):
+        raise RuleSpecError(f"Predicate must be a mapping, got {spec!r}")
+    field = spec.get("field")
+    if not field or not isinstance(field, str):
+        raise RuleSpecError(f"Predicate is missing 'field': {spec}")
+    op = spec.get("op", "equals")
+    value = spec.get("value")
+    ignore_case = bool(spec.get("ignore_case", False))
+
+    def norm(v: Any) -> Any:
+        if v is None:
+            return None
+        return str(v).lower() if ignore_case else str(v)
+
+    if op == "exists":
+        return lambda e: get_field(e, field) not in (None, "")
+    if op == "regex":
+        try:
+            pattern = re.compile(str(value), re.IGNORECASE if ignore_case else 0)
+        except re.error as e:
+            raise RuleSpecError(f"Invalid regex on '{field}': {e}")
+        return lambda e: get_field(e, field) is not None and pattern.search(str(get_field(e, field))) is not None
+
+    if op in ("in", "not_in"):
+        if not isinstance(value, list):
+            raise RuleSpecError(f"Operator '{op}' on '{field}' needs a list value")
+        choices = frozenset(norm(v) for v in value)
+        if op == "in":
+            return lambda e: norm(get_field(e, field)) in choices
+        return lambda e: norm(get_field(e, field)) not in choices
+
+    if value is None:
+        raise RuleSpecError(f"Operator '{op}' on '{field}' needs a value")
+    values = [norm(v) for v in value] if isinstance(value, list) else [norm(value)]
+
+    def text(e: Dict[str, Any]) -> Optional[str]:
+        return norm(get_field(e, field))
+
+    if op == "equals":
+        target = values[0]
+        return lambda e: text(e) == target
+    if op == "not_equals":
+        target = values[0]
+        return lambda e: text(e) != target
+    if op == "contains":
+        return lambda e: (t := text(e)) is not None and any(v in t for v in values)
+    if op == "startswith":
+        prefixes = tuple(values)
+        return lambda e: (t := text(e)) is not None and t.startswith(prefixes)
+    if op == "endswith":
+        suffixes = tuple(values)
+        return lambda e: (t := text(e)) is not None and t.endswith(suffixes)
+    raise RuleSpecError(f"Unknown operator '{op}' on '{field}'")
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") or "rule"
+
+
+class DeclarativeRule(AlertRule):
+    """An AlertRule compiled from a YAML/JSON definition.
+
+    Definition keys: name, severity, event_ids, where (list of field predicates),
+    group_by, threshold (default 1), window_minutes (sliding window; default is one
+    alert per dedup bucket), users_field, ips_field, title, description.
+    """
+
+    def __init__(self, spec: Dict[str, Any]):
+        if not isinstance(spec, dict):
+            raise RuleSpecError(f"Rule definition must be a mapping, got {type(spec).__name__}")
+        name = spec.get("name")
+        if not name:
+            raise RuleSpecError("Rule definition is missing 'name'")
+        try:
+            severity = AlertSeverity(str(spec.get("severity", "medium")).lower())
+        except ValueError:
+            raise RuleSpecError(f"Rule '{name}' has an unknown severity '{spec.get('severity')}'")
+        super().__init__(name, severity)
+
+        ids = spec.get("event_ids")
+        if ids is not None and not isinstance(ids, list):
+            raise RuleSpecError(f"Rule '{name}': 'event_ids' must be a list")
+        self._event_id_keys = sorted({_event_id_key(i) for i in ids}) if ids else None
+        self.event_ids = {int(i) if str(i).isdigit() else i for i in ids} if ids else None
+
+        where = spec.get("where", [])
+        if not isinstance(where, list):
+            raise RuleSpecError(f"Rule '{name}': 'where' must be a list of predicates")
+        self.predicates = [_compile_predicate(p) for p in where]
+        group_by = spec.get("group_by", [])
+        if not isinstance(group_by, list) or not all(isinstance(f, str) for f in group_by):
+            raise RuleSpecError(f"Rule '{name}': 'group_by' must be a list of field names")
+        self.group_by: List[str] = group_by
+        try:
+            self.threshold = int(spec.get("threshold", 1))
+            self.window_minutes = spec.get("window_minutes")
+            positive = self.threshold >= 1 and (self.window_minutes is None or float(self.window_minutes) > 0)
+        except (TypeError, ValueError):
+            positive = False
+        if not positive:
+            raise RuleSpecError(f"Rule '{name}': threshold and window_minutes must be positive")
+        self.users_field = spec.get("users_field", "TargetUserName")
+        self.ips_field = spec.get("ips_field", "source.ip")
+        self.title = spec.get("title", name)
+        self.description = spec.get("description", "Detected {count} matching events{group}")
+        self.id_prefix = spec.get("id_prefix", _slug(name))
+
+        self.required_fields = ["@timestamp"]
+        referenced = [p["field"] for p in where] + self.group_by + [self.users_field, self.ips_field]
+        self.source_fields = BASE_SOURCE_FIELDS + sorted(set(referenced) - set(BASE_SOURCE_FIELDS))
+        # Partitioning on the first grouping field keeps every group on one shard
+        self.shard_fields = self.group_by[:1]
+
+    def threshold_plan(self) -> Optional[ThresholdPlan]:
+        # Predicates aren't part of the aggregation, so counts are an upper bound and
+        # the exact check still runs on the fetched candidate events
+        if self.threshold > 1 and self.window_minutes is not None:
+            return ThresholdPlan(tuple(self.group_by), self.threshold, float(self.window_minutes))
+        return None
+
+    def _matches(self, event: Dict[str, Any]) -> bool:
+        for predicate in self.predicates:
+            if not predicate(event):
+                return False
+        return True
+
+    def _windows(self, timed: List[TimedEvent]) -> List[List[TimedEvent]]:
+        """Split one group's time-ordered events into the bursts that meet the threshold"""
+        if self.window_minutes is None:
+            buckets: Dict[datetime, List[TimedEvent]] = {}
+            for item in timed:
+                buckets.setdefault(time_bucket(item[0]), []).append(item)
+            return [b for b in buckets.values() if len(b) >= self.threshold]
+
+        window = timedelta(minutes=float(self.window_minutes))
+        bursts = []
+        start = end = 0
+        while end < len(timed):
+            while timed[end][0] - timed[start][0] > window:
+                start += 1
+            if end - start + 1 >= self.threshold:
+                # Extend to everything inside the window opened by the first event
+                last = end
+                while last + 1 < len(timed) and timed[last + 1][0] - timed[start][0] <= window:
+                    last += 1
+                bursts.append(timed[start:last + 1])
+                # Bursts never overlap: the sweep resumes after the burst's last event
+                start = end = last + 1
+            else:
+                end += 1
+        return bursts
+
+    def check(self, events: List[Dict[str, Any]]) -> List[Alert]:
+        batch = events if isinstance(events, EventBatch) else EventBatch(events)
+
+        groups: Dict[Tuple, List[TimedEvent]] = {}
+        for item in batch.select(self._event_id_keys):
+            event = item[1]
+            if self.predicates and not self._matches(event):
+                continue
+            key = tuple(get_field(event, f) for f in self.group_by)
+            groups.setdefault(key, []).append(item)
+
+        alerts = []
+        for key, timed in groups.items():
+            for burst in self._windows(timed):
+                alerts.append(self._build_alert(key, burst))
+        return alerts
+
+    def _build_alert(self, key: Tuple, burst: List[TimedEvent]) -> Alert:
+        burst_events = [e for _, e in burst]
+        start, end = burst[0][0], burst[-1][0]
+        users = sorted({str(u) for u in (get_field(e, self.users_field) for e in burst_events) if u})
+        source_ips = sorted({str(ip) for ip in (get_field(e, self.ips_field) for e in burst_events) if ip})
+        group = ", ".join(f"{f}={v}" for f, v in zip(self.group_by, key))
+        context = {
+            "count": len(burst_events),
+            "minutes": round((end - start).total_seconds() / 60, 1),
+            "group": f" ({group})" if group else "",
+            "name": self.name
+        }
+        try:
+            description = self.description.format(**context)
+        except (KeyError, IndexError, ValueError):
+            description = self.description
+
+        return Alert(
+            id=alert_fingerprint(self.id_prefix, self.name, key or None, time_bucket(start)),
+            title=self.title,
+            description=description,
+            severity=self.severity,
+            status=AlertStatus.OPEN,
+            source="Security Events",
+            timestamp=start if self.window_minutes is not None else end,
+            event_count=len(burst_events),
+            affected_users=users,
+            source_ips=source_ips,
+            event_ids=[str(e.get("EventRecordID", "")) for e in burst_events],
+            raw_events=burst_events
+        )
+
+
+def load_rule_file(path: str) -> List[AlertRule]:
+    """Compile every rule in a YAML/JSON file (a single rule, a list, or {"rules": [...]}).
+
+    Sigma rules (YAML documents with logsource/detection) are compiled by app.alerts.sigma.
+    """
+    from .sigma import is_sigma_rule, compile_sigma_documents
+
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            documents = [json.load(f)]
+        else:
+            documents = [d for d in yaml.safe_load_all(f) if d is not None]
+
+    if any(is_sigma_rule(d) for d in documents):
+        return list(compile_sigma_documents(documents, origin=path))
+
+    rules: List[AlertRule] = []
+    for data in documents:
+        if isinstance(data, dict) and "rules" in data:
+            data = data["rules"]
+        specs = data if isinstance(data, list) else [data]
+        rules.extend(DeclarativeRule(spec) for spec in specs)
+    return rules
+
+
+class RuleRegistry:
+    """Declarative and Sigma rules loaded from RULES_DIR and recompiled when files change.
+
+    The directory is re-scanned at most every RULES_RELOAD_SECONDS; only files whose
+    mtime/size changed are recompiled. A file that fails to compile keeps its last
+    good rules so a bad edit never drops detections from a running worker.
+    """
+
+    def __init__(self, rules_dir: Optional[str] = None):
+        self._rules_dir = rules_dir
+        self._files: Dict[str, Tuple[Tuple[int, int], List[AlertRule]]] = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rules_dir(self) -> str:
+        return self._rules_dir or settings.RULES_DIR
+
+    def rules(self) -> List[AlertRule]:
+        self.reload_if_changed()
+        seen = set()
+        rules: List[AlertRule] = []
+        for path in sorted(self._files):
+            for rule in self._files[path][1]:
+                if rule.name in seen:
+                    logger.warning(f"Duplicate rule name '{rule.name}' in {path}, skipping")
+                    continue
+                seen.add(rule.name)
+                rules.append(rule)
+        return rules
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """Rescan the rules directory; returns True if any file was (re)loaded or removed"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < settings.RULES_RELOAD_SECONDS:
+            return False
+
+        with self._lock:
+            self._checked_at = now
+            directory = self.rules_dir
+            try:
+                names = [n for n in os.listdir(directory) if n.endswith(RULE_FILE_SUFFIXES)]
+            except FileNotFoundError:
+                names = []
+            except OSError as e:
+                logger.error(f"Error listing rules directory {directory}: {e}")
+                return False
+
+            changed = False
+            current = set()
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                current.add(path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+                cached = self._files.get(path)
+                if cached and cached[0] == signature:
+                    continue
+                try:
+                    rules = load_rule_file(path)
+                except Exception as e:
+                    # Whatever a bad file raises, it must not take the other files' rules down
+                    logger.error(f"Error compiling rules from {path}: {e}")
+                    if cached:
+                        # Keep serving the last good version, but don't retry until it changes again
+                        self._files[path] = (signature, cached[1])
+                    continue
+                self._files[path] = (signature, rules)
+                changed = True
+                logger.info(f"Loaded {len(rules)} rules from {path}")
+
+            for path in list(self._files):
+                if path not in current:
+                    del self._files[path]
+                    changed = True
+                    logger.info(f"Unloaded rules from removed file {path}")
+            return changed
+
+
+# Shared registry; each worker process polls the directory independently
+rule_registry = RuleRegistry()
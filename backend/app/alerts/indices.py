@@ -0,0 +1,163 @@
+import logging
+from typing import Dict, Any
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+EVENTS_INDEX_PATTERN = "security-events-v2-*"
+EVENTS_TEMPLATE = "boron-security-events"
+EVENTS_POLICY = "boron-security-events"
+
+ALERTS_ALIAS = "security-alerts"
+ALERTS_INDEX_PATTERN = "security-alerts-*"
+# Rolled-over backing indices and a legacy concrete "security-alerts" index alike
+ALERTS_SEARCH_PATTERN = "security-alerts*"
+ALERTS_INITIAL_INDEX = "security-alerts-000001"
+ALERTS_TEMPLATE = "boron-security-alerts"
+ALERTS_POLICY = "boron-security-alerts"
+
+# Composable templates win over the built-in Logstash/ECS ones (priority 100)
+TEMPLATE_PRIORITY = 200
+
+def events_ilm_policy() -> Dict[str, Any]:
+    """Daily event indices (named by Logstash) age from hot to warm and are then deleted"""
+    return {
+        "phases": {
+            "hot": {
+                "actions": {"set_priority": {"priority": 100}}
+            },
+            "warm": {
+                "min_age": f"{settings.ES_EVENTS_WARM_AFTER_DAYS}d",
+                "actions": {
+                    "readonly": {},
+                    "forcemerge": {"max_num_segments": 1},
+                    "set_priority": {"priority": 50}
+                }
+            },
+            "delete": {
+                "min_age": f"{settings.ES_EVENTS_DELETE_AFTER_DAYS}d",
+                "actions": {"delete": {}}
+            }
+        }
+    }
+
+def alerts_ilm_policy() -> Dict[str, Any]:
+    """Alert indices roll over behind the security-alerts alias and are deleted after retention"""
+    return {
+        "phases": {
+            "hot": {
+                "actions": {
+                    "rollover": {
+                        "max_age": settings.ES_ALERTS_ROLLOVER_MAX_AGE,
+                        "max_primary_shard_size": settings.ES_ALERTS_ROLLOVER_MAX_SIZE
+                    },
+                    "set_priority": {"priority": 100}
+                }
+            },
+            "warm": {
+                "min_age": f"{settings.ES_ALERTS_WARM_AFTER_DAYS}d",
+                "actions": {
+                    "forcemerge": {"max_num_segments": 1},
+                    "set_priority": {"priority": 50}
+                }
+            },
+            "delete": {
+                "min_age": f"{settings.ES_ALERTS_DELETE_AFTER_DAYS}d",
+                "actions": {"delete": {}}
+            }
+        }
+    }
+
+def events_index_template() -> Dict[str, Any]:
+    """Explicit mappings for the fields rules query; other strings map to keyword only"""
+    return {
+        "index_patterns": [EVENTS_INDEX_PATTERN],
+        "priority": TEMPLATE_PRIORITY,
+        "template": {
+            "settings": {
+                "number_of_shards": settings.ES_NUMBER_OF_SHARDS,
+                "number_of_replicas": settings.ES_NUMBER_OF_REPLICAS,
+                "index.lifecycle.name": EVENTS_POLICY,
+                "index.mapping.total_fields.limit": settings.ES_EVENTS_TOTAL_FIELDS_LIMIT
+            },
+            "mappings": {
+                "dynamic_templates": [
+                    {
+                        "strings_as_keywords": {
+                            "match_mapping_type": "string",
+                            "mapping": {"type": "keyword", "ignore_above": 1024}
+                        }
+                    }
+                ],
+                "properties": {
+                    "@timestamp": {"type": "date"},
+                    "event": {"properties": {"id": {"type": "keyword"}}},
+                    "host": {"properties": {"name": {"type": "keyword"}}},
+                    "source": {
+                        "properties": {
+                            # Windows logs "-" for logons without a network address
+                            "ip": {"type": "ip", "ignore_malformed": True},
+                            "geo": {"properties": {"location": {"type": "geo_point"}}}
+                        }
+                    },
+                    "EventRecordID": {"type": "keyword"},
+                    "TargetUserName": {"type": "keyword"},
+                    "TargetDomainName": {"type": "keyword"},
+                    "SubjectUserName": {"type": "keyword"},
+                    "MemberName": {"type": "keyword"},
+                    "NewProcessName": {"type": "keyword"},
+                    "ParentProcessName": {"type": "keyword"},
+                    "CommandLine": {"type": "keyword", "ignore_above": 8191},
+                    "_workspace": {"type": "keyword"}
+                }
+            }
+        }
+    }
+
+def alerts_index_template() -> Dict[str, Any]:
+    return {
+        "index_patterns": [ALERTS_INDEX_PATTERN],
+        "priority": TEMPLATE_PRIORITY,
+        "template": {
+            "settings": {
+                "number_of_shards": settings.ES_NUMBER_OF_SHARDS,
+                "number_of_replicas": settings.ES_NUMBER_OF_REPLICAS,
+                "index.lifecycle.name": ALERTS_POLICY,
+                "index.lifecycle.rollover_alias": ALERTS_ALIAS
+            },
+            "mappings": {
+                "properties": {
+                    "id": {"type": "keyword"},
+                    "title": {"type": "text"},
+                    "description": {"type": "text"},
+                    "severity": {"type": "keyword"},
+                    "status": {"type": "keyword"},
+                    "source": {"type": "keyword"},
+                    "timestamp": {"type": "date"},
+                    "event_count": {"type": "integer"},
+                    "affected_users": {"type": "keyword"},
+                    "source_ips": {"type": "ip", "ignore_malformed": True},
+                    "event_ids": {"type": "keyword"},
+                    # Kept in _source for analysts but never indexed: no mapping growth
+                    "raw_events": {"type": "object", "enabled": False},
+                    "tags": {"type": "keyword"},
+                    "created_at": {"type": "date"},
+                    "updated_at": {"type": "date"}
+                }
+            }
+        }
+    }
+
+def install_index_templates(es) -> bool:
+    """Create or update the ILM policies and index templates (idempotent)"""
+    try:
+        es.ilm.put_lifecycle(name=EVENTS_POLICY, policy=events_ilm_policy())
+        es.ilm.put_lifecycle(name=ALERTS_POLICY, policy=alerts_ilm_policy())
+        es.indices.put_index_template(name=EVENTS_TEMPLATE, **events_index_template())
+        es.indices.put_index_template(name=ALERTS_TEMPLATE, **alerts_index_template())
+        logger.info("Installed index templates and ILM policies")
+        return True
+    except Exception as e:
+        logger.error(f"Error installing index templates: {e}")
+        return False
@@ -0,0 +1,338 @@
+import os
+import socket
+import logging
+import ipaddress
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Iterable, Tuple, FrozenSet
+
+from app.core.config import settings
+from app.core.metrics import IOC_INDICATORS
+from .dsl import EventBatch, get_field
+from .models import Alert, AlertRule, AlertSeverity, AlertStatus, BASE_SOURCE_FIELDS, alert_fingerprint, time_bucket
+
+logger = logging.getLogger(__name__)
+
+# Indicator kind -> sub-directory of IOC_DIR holding one list per file (label = file name)
+IOC_KINDS = ("ips", "users", "hashes")
+IOC_FILE_SUFFIXES = (".txt", ".lst")
+
+IP_FIELDS = ["source.ip", "IpAddress"]
+USER_FIELDS = ["TargetUserName", "SubjectUserName"]
+# Sysmon-style "SHA256=...,MD5=..." or a bare hex digest
+HASH_FIELDS = ["Hashes", "FileHash"]
+
+Labels = FrozenSet[str]
+_MISSING = object()
+
+
+class IntervalIndex:
+    """Sorted, disjoint [start, end] integer ranges, each tagged with the lists that cover it.
+
+    Overlapping input ranges are split into elementary segments by a sweep, so a
+    lookup is one binary search over ``starts`` plus a bound check.
+    """
+
+    __slots__ = ("starts", "ends", "labels")
+
+    def __init__(self, ranges: Iterable[Tuple[int, int, str]], typecode: Optional[str] = None):
+        points = []
+        for start, end, label in ranges:
+            points.append((start, 1, label))
+            points.append((end + 1, -1, label))
+        points.sort(key=itemgetter(0))
+
+        starts: List[int] = []
+        ends: List[int] = []
+        labels: List[Labels] = []
+        interned: Dict[Labels, Labels] = {}
+        active: Counter = Counter()
+        previous = None
+        for position, group in groupby(points, key=itemgetter(0)):
+            if previous is not None and active:
+                segment_labels = frozenset(active)
+                segment_labels = interned.setdefault(segment_labels, segment_labels)
+                if ends and ends[-1] + 1 == previous and labels[-1] is segment_labels:
+                    ends[-1] = position - 1
+                else:
+                    starts.append(previous)
+                    ends.append(position - 1)
+                    labels.append(segment_labels)
+            for _, delta, label in group:
+                active[label] += delta
+                if active[label] <= 0:
+                    del active[label]
+            previous = position
+
+        # IPv4 fits machine words; IPv6 needs Python ints
+        self.starts = array(typecode, starts) if typecode else starts
+        self.ends = array(typecode, ends) if typecode else ends
+        self.labels = labels
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def lookup(self, value: int) -> Optional[Labels]:
+        index = bisect_right(self.starts, value) - 1
+        if index >= 0 and value <= self.ends[index]:
+            return self.labels[index]
+        return None
+
+
+def _ip_to_int(value: str) -> Tuple[int, int]:
+    """(version, integer) for a textual IP; raises OSError/ValueError if it isn't one"""
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, value), "big")
+    except OSError:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, value), "big")
+
+
+class IocSnapshot:
+    """An immutable set of indicators; swapped in whole so readers never see a partial load"""
+
+    def __init__(self,
+                 networks: Iterable[Tuple[str, str]] = (),
+                 users: Iterable[Tuple[str, str]] = (),
+                 hashes: Iterable[Tuple[str, str]] = ()):
+        v4, v6 = [], []
+        self.invalid = 0
+        for value, label in networks:
+            try:
+                network = ipaddress.ip_network(value, strict=False)
+            except ValueError:
+                self.invalid += 1
+                continue
+            target = v4 if network.version == 4 else v6
+            target.append((int(network.network_address), int(network.broadcast_address), label))
+        self.ipv4 = IntervalIndex(v4, typecode="Q")
+        self.ipv6 = IntervalIndex(v6)
+        self.users = self._exact(users)
+        self.hashes = self._exact(hashes)
+        self.counts = {"ips": len(v4) + len(v6), "users": len(self.users), "hashes": len(self.hashes)}
+
+    @staticmethod
+    def _exact(entries: Iterable[Tuple[str, str]]) -> Dict[str, Labels]:
+        grouped: Dict[str, set] = {}
+        for value, label in entries:
+            grouped.setdefault(value.lower(), set()).add(label)
+        return {value: frozenset(labels) for value, labels in grouped.items()}
+
+    def __bool__(self) -> bool:
+        return any(self.counts.values())
+
+    def match_ip(self, value: str) -> Optional[Labels]:
+        try:
+            version, number = _ip_to_int(value)
+        except (OSError, ValueError):
+            return None
+        return (self.ipv4 if version == 4 else self.ipv6).lookup(number)
+
+    def match_user(self, value: str) -> Optional[Labels]:
+        return self.users.get(value.lower())
+
+    def match_hash(self, value: str) -> Optional[Labels]:
+        return self.hashes.get(value.lower())
+
+
+def _read_list(path: str) -> List[str]:
+    values = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            value = line.split("#", 1)[0].strip()
+            if value:
+                values.append(value)
+    return values
+
+
+def load_snapshot(ioc_dir: str) -> IocSnapshot:
+    """Build a snapshot from IOC_DIR/{ips,users,hashes}/*.txt; invalid IP lines are skipped"""
+    entries: Dict[str, List[Tuple[str, str]]] = {kind: [] for kind in IOC_KINDS}
+    for kind, path in _list_files(ioc_dir):
+        label = os.path.splitext(os.path.basename(path))[0]
+        entries[kind].extend((value, label) for value in _read_list(path))
+    snapshot = IocSnapshot(entries["ips"], entries["users"], entries["hashes"])
+    if snapshot.invalid:
+        logger.warning(f"Skipped {snapshot.invalid} invalid IP/CIDR entries in {ioc_dir}")
+    return snapshot
+
+
+def _list_files(ioc_dir: str) -> List[Tuple[str, str]]:
+    files = []
+    for kind in IOC_KINDS:
+        directory = os.path.join(ioc_dir, kind)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(IOC_FILE_SUFFIXES):
+                files.append((kind, os.path.join(directory, name)))
+    return files
+
+
+def _hash_values(value: Any) -> List[str]:
+    values = []
+    for part in str(value).split(","):
+        digest = part.split("=", 1)[-1].strip()
+        if digest:
+            values.append(digest)
+    return values
+
+
+class IocRule(AlertRule):
+    """Alert on events whose source IP, user or process hash is on a threat-intel list"""
+
+    required_fields = ["@timestamp"]
+    source_fields = BASE_SOURCE_FIELDS + IP_FIELDS + USER_FIELDS + HASH_FIELDS + ["NewProcessName"]
+
+    def __init__(self, store: "IocStore"):
+        super().__init__("Threat Intel Match", AlertSeverity.HIGH)
+        self.store = store
+
+    @property
+    def any_fields(self) -> List[str]:
+        """Fields of the indicator kinds currently loaded; events with none of them can't match"""
+        counts = self.store.snapshot.counts
+        fields = []
+        for kind, kind_fields in (("ips", IP_FIELDS), ("users", USER_FIELDS), ("hashes", HASH_FIELDS)):
+            if counts[kind]:
+                fields.extend(kind_fields)
+        return fields
+
+    def check(self, events: List[Dict[str, Any]]) -> List[Alert]:
+        # Pin one snapshot for the whole batch; a concurrent reload only affects the next run
+        snapshot = self.store.snapshot
+        if not snapshot:
+            return []
+        batch = events if isinstance(events, EventBatch) else EventBatch(events)
+
+        match_ip, match_user, match_hash = snapshot.match_ip, snapshot.match_user, snapshot.match_hash
+        ip_cache: Dict[str, Any] = {}
+        matches: Dict[Tuple[str, str], Tuple[Labels, List[Tuple[Any, Dict[str, Any]]]]] = {}
+
+        def record(kind: str, value: str, labels: Labels, timestamp, event):
+            entry = matches.get((kind, value))
+            if entry is None:
+                matches[(kind, value)] = (labels, [(timestamp, event)])
+            else:
+                entry[1].append((timestamp, event))
+
+        check_users = bool(snapshot.users)
+        check_hashes = bool(snapshot.hashes)
+        for timestamp, event in batch.select(None, ordered=False):
+            source = event.get("source")
+            ip = source.get("ip") if isinstance(source, dict) else None
+            for value in (ip, event.get("IpAddress")):
+                if value:
+                    labels = ip_cache.get(value, _MISSING)
+                    if labels is _MISSING:
+                        labels = ip_cache[value] = match_ip(str(value))
+                    if labels:
+                        record("ip", value, labels, timestamp, event)
+                        break
+            if check_users:
+                for field in USER_FIELDS:
+                    value = event.get(field)
+                    if value:
+                        labels = match_user(str(value))
+                        if labels:
+                            record("user", str(value), labels, timestamp, event)
+            if check_hashes:
+                for field in HASH_FIELDS:
+                    value = event.get(field)
+                    if value:
+                        for digest in _hash_values(value):
+                            labels = match_hash(digest)
+                            if labels:
+                                record("hash", digest, labels, timestamp, event)
+
+        alerts = []
+        for (kind, value), (labels, hits) in matches.items():
+            buckets: Dict[Any, List[Dict[str, Any]]] = {}
+            for timestamp, event in hits:
+                buckets.setdefault(time_bucket(timestamp), []).append(event)
+            for bucket_start, bucket_events in buckets.items():
+                alerts.append(self._build_alert(kind, value, labels, bucket_start, bucket_events))
+        return alerts
+
+    def _build_alert(self, kind: str, value: str, labels: Labels, bucket_start, events: List[Dict[str, Any]]) -> Alert:
+        users = sorted({str(e[f]) for e in events for f in USER_FIELDS if e.get(f)})
+        source_ips = sorted({str(ip) for e in events for ip in (get_field(e, "source.ip"), e.get("IpAddress")) if ip})
+        return Alert(
+            id=alert_fingerprint("ioc", self.name, (kind, value), bucket_start),
+            title=f"Threat Intel Match ({kind})",
+            description=f"{len(events)} events matched {kind} indicator {value} from {', '.join(sorted(labels))}",
+            severity=self.severity,
+            status=AlertStatus.OPEN,
+            source="Threat Intel",
+            timestamp=bucket_start,
+            event_count=len(events),
+            affected_users=users,
+            source_ips=source_ips,
+            event_ids=[str(e.get("EventRecordID", "")) for e in events],
+            raw_events=events
+        )
+
+
+class IocStore:
+    """Indicator lists from IOC_DIR, rebuilt into a fresh snapshot and swapped in atomically.
+
+    Rebuilds happen at most every IOC_RELOAD_SECONDS and only when a file changed. Only
+    one thread rebuilds at a time; others keep evaluating against the current snapshot.
+    """
+
+    def __init__(self, ioc_dir: Optional[str] = None):
+        self._ioc_dir = ioc_dir
+        self.snapshot = IocSnapshot()
+        self.rule = IocRule(self)
+        self._signature: Optional[Tuple] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def ioc_dir(self) -> str:
+        return self._ioc_dir or settings.IOC_DIR
+
+    def _scan(self) -> Tuple:
+        signature = []
+        for kind, path in _list_files(self.ioc_dir):
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """Rebuild the snapshot if the lists changed; returns True if a new snapshot was swapped in"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < settings.IOC_RELOAD_SECONDS:
+            return False
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            self._checked_at = now
+            signature = self._scan()
+            if signature == self._signature:
+                return False
+            snapshot = load_snapshot(self.ioc_dir)
+            self.snapshot = snapshot
+            self._signature = signature
+            for kind, count in snapshot.counts.items():
+                IOC_INDICATORS.labels(kind=kind).set(count)
+            logger.info(f"Loaded threat-intel indicators: {snapshot.counts}")
+            return True
+        except OSError as e:
+            logger.error(f"Error loading threat-intel lists from {self.ioc_dir}: {e}")
+            return False
+        finally:
+            self._lock.release()
+
+    def rules(self) -> List[AlertRule]:
+        """The IOC rule, only while some indicators are loaded"""
+        self.reload_if_changed()
+        return [self.rule] if self.snapshot else []
+
+
+# Shared store; each worker process loads and refreshes its own copy
+ioc_store = IocStore()
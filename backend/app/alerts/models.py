@@ -1,8 +1,11 @@
-from typing import List, Dict, Any, Optional
+import hashlib
+from typing import List, Dict, Any, Optional, Set, Tuple
 from datetime import datetime, timedelta, timezone
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 
+from app.core.config import settings
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -32,6 +35,7 @@ class Alert:
     source_ips: List[str]
     event_ids: List[str]
     raw_events: List[Dict[str, Any]]
+    tags: List[str] = field(default_factory=list)
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -46,7 +50,8 @@ class Alert:
             "affected_users": self.affected_users,
             "source_ips": self.source_ips,
             "event_ids": self.event_ids,
-            "raw_events": self.raw_events
+            "raw_events": self.raw_events,
+            "tags": self.tags
         }
     
     @classmethod
@@ -64,11 +69,66 @@ class Alert:
             affected_users=data.get("affected_users", []),
             source_ips=data.get("source_ips", []),
             event_ids=data.get("event_ids", []),
-            raw_events=data.get("raw_events", [])
+            raw_events=data.get("raw_events", []),
+            tags=data.get("tags", [])
         )
 
+# Context fields kept in raw_events for every rule when _source filtering is applied
+BASE_SOURCE_FIELDS = ["@timestamp", "event", "host.name", "EventRecordID", "Activity", "Account", "_workspace"]
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """Parse an ES/ISO-8601 timestamp, returning None when missing or malformed"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except (ValueError, TypeError):
+        return None
+
+def time_bucket(timestamp: datetime, minutes: Optional[int] = None) -> datetime:
+    """Floor a timestamp to the start of its dedup bucket"""
+    minutes = minutes or settings.ALERT_DEDUP_BUCKET_MINUTES
+    bucket_seconds = minutes * 60
+    epoch = int(timestamp.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % bucket_seconds, tz=timezone.utc)
+
+def alert_fingerprint(prefix: str, rule_name: str, group_key: Any, bucket_start: datetime) -> str:
+    """Deterministic alert id: the same rule, grouping key and time bucket always map to the same id"""
+    raw = f"{rule_name}|{group_key!r}|{int(bucket_start.timestamp())}"
+    return f"{prefix}_{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]}"
+
+def _bucket_events(events: List[Dict[str, Any]]) -> Dict[datetime, List[Dict[str, Any]]]:
+    """Group events by the dedup bucket of their @timestamp; events without a valid timestamp are skipped"""
+    buckets: Dict[datetime, List[Dict[str, Any]]] = {}
+    for event in events:
+        timestamp = parse_timestamp(event.get("@timestamp"))
+        if timestamp is not None:
+            buckets.setdefault(time_bucket(timestamp), []).append(event)
+    return buckets
+
+@dataclass(frozen=True)
+class ThresholdPlan:
+    """How a threshold rule can be pre-screened with an Elasticsearch aggregation:
+    ``threshold`` events sharing the ``group_by`` field values within ``window_minutes``"""
+    group_by: Tuple[str, ...]
+    threshold: int
+    window_minutes: float
+
 class AlertRule:
     """Base class for alert rules"""
+
+    # Requirements pushed down into the Elasticsearch query (None/empty means "no constraint")
+    event_ids: Optional[Set[int]] = None
+    required_fields: List[str] = []
+    # At least one of these fields must exist (for rules that look at whichever is present)
+    any_fields: List[str] = []
+    source_fields: Optional[List[str]] = None
+    # Partitioning key when rules are sharded across workers (first non-empty field wins);
+    # rules grouping on something else, or on nothing, leave it empty and run unsharded
+    shard_fields: List[str] = []
+    # False for rules that must see the whole window in order (e.g. watermark-driven state),
+    # which then run once in the coordinator rather than per time chunk
+    chunkable: bool = True
     
     def __init__(self, name: str, severity: AlertSeverity):
         self.name = name
@@ -78,13 +138,25 @@ class AlertRule:
         """Override this method in subclasses to implement rule logic"""
         raise NotImplementedError
 
+    def threshold_plan(self) -> Optional[ThresholdPlan]:
+        """Return a plan if the rule only fires on per-key counts (enables aggregation pushdown)"""
+        return None
+
 class MultipleFailedLoginsRule(AlertRule):
     """Alert on multiple failed login attempts from same IP"""
+
+    event_ids = {4625}
+    required_fields = ["@timestamp"]
+    source_fields = BASE_SOURCE_FIELDS + ["source.ip", "TargetUserName", "TargetDomainName", "LogonType"]
+    shard_fields = ["source.ip"]
     
     def __init__(self):
         super().__init__("Multiple Failed Logins", AlertSeverity.HIGH)
         self.threshold = 5
         self.time_window_minutes = 10
+
+    def threshold_plan(self) -> Optional[ThresholdPlan]:
+        return ThresholdPlan(("source.ip", "TargetUserName"), self.threshold, self.time_window_minutes)
     
     def check(self, events: List[Dict[str, Any]]) -> List[Alert]:
         alerts = []
@@ -141,7 +213,7 @@ class MultipleFailedLoginsRule(AlertRule):
                     
                     # If we found enough events in this window, create an alert
                     if len(window_events) >= self.threshold:
-                        alert_id = f"failed_logins_{source_ip}_{target_user}_{int(window_start.timestamp())}"
+                        alert_id = alert_fingerprint("failed_logins", self.name, (source_ip, target_user), time_bucket(window_start))
                         
                         # Check if we already created an alert for this combination recently
                         # (to avoid duplicate alerts for overlapping windows)
@@ -179,6 +251,10 @@ class MultipleFailedLoginsRule(AlertRule):
 
 class PrivilegeEscalationRule(AlertRule):
     """Alert on potential privilege escalation"""
+
+    event_ids = {4728, 4732, 4756}
+    required_fields = ["@timestamp"]
+    source_fields = BASE_SOURCE_FIELDS + ["source.ip", "TargetUserName", "SubjectUserName", "MemberName", "MemberSid"]
     
     def __init__(self):
         super().__init__("Privilege Escalation", AlertSeverity.CRITICAL)
@@ -192,26 +268,24 @@ class PrivilegeEscalationRule(AlertRule):
             if event.get("event", {}).get("id") in [4728, 4732, 4756]:  # User added to privileged group
                 escalation_events.append(event)
         
-        if escalation_events:
-            current_time = datetime.now(timezone.utc)
-            alert_id = f"privilege_escalation_{int(current_time.timestamp())}"
-            
-            users = list(set(e.get("TargetUserName", "Unknown") for e in escalation_events))
-            source_ips = list(set(e.get("source", {}).get("ip") for e in escalation_events if e.get("source", {}).get("ip")))
+        # One alert per dedup bucket so re-running over the same events yields the same ids
+        for bucket_start, bucket_events in _bucket_events(escalation_events).items():
+            users = list(set(e.get("TargetUserName", "Unknown") for e in bucket_events))
+            source_ips = list(set(e.get("source", {}).get("ip") for e in bucket_events if e.get("source", {}).get("ip")))
             
             alert = Alert(
-                id=alert_id,
+                id=alert_fingerprint("privilege_escalation", self.name, None, bucket_start),
                 title="Potential Privilege Escalation Detected",
-                description=f"Detected {len(escalation_events)} privilege escalation events affecting users: {', '.join(users)}",
+                description=f"Detected {len(bucket_events)} privilege escalation events affecting users: {', '.join(users)}",
                 severity=self.severity,
                 status=AlertStatus.OPEN,
                 source="Security Events",
-                timestamp=max(datetime.fromisoformat(e["@timestamp"].replace('Z', '+00:00')) for e in escalation_events if e.get("@timestamp")),
-                event_count=len(escalation_events),
+                timestamp=max(parse_timestamp(e["@timestamp"]) for e in bucket_events),
+                event_count=len(bucket_events),
                 affected_users=users,
                 source_ips=source_ips,
-                event_ids=[str(e.get("EventRecordID", "")) for e in escalation_events],
-                raw_events=escalation_events
+                event_ids=[str(e.get("EventRecordID", "")) for e in bucket_events],
+                raw_events=bucket_events
             )
             alerts.append(alert)
         
@@ -219,6 +293,10 @@ class PrivilegeEscalationRule(AlertRule):
 
 class SuspiciousProcessRule(AlertRule):
     """Alert on suspicious process creation"""
+
+    event_ids = {4688}
+    required_fields = ["@timestamp", "NewProcessName"]
+    source_fields = BASE_SOURCE_FIELDS + ["source.ip", "NewProcessName", "SubjectUserName", "CommandLine", "ParentProcessName"]
     
     def __init__(self):
         super().__init__("Suspicious Process", AlertSeverity.MEDIUM)
@@ -240,26 +318,23 @@ class SuspiciousProcessRule(AlertRule):
                 if any(susp_proc in process_name for susp_proc in self.suspicious_processes):
                     suspicious_events.append(event)
         
-        if suspicious_events:
-            current_time = datetime.now(timezone.utc)
-            alert_id = f"suspicious_process_{int(current_time.timestamp())}"
-            
-            users = list(set(e.get("SubjectUserName", "Unknown") for e in suspicious_events))
-            source_ips = list(set(e.get("source", {}).get("ip") for e in suspicious_events if e.get("source", {}).get("ip")))
+        for bucket_start, bucket_events in _bucket_events(suspicious_events).items():
+            users = list(set(e.get("SubjectUserName", "Unknown") for e in bucket_events))
+            source_ips = list(set(e.get("source", {}).get("ip") for e in bucket_events if e.get("source", {}).get("ip")))
             
             alert = Alert(
-                id=alert_id,
+                id=alert_fingerprint("suspicious_process", self.name, None, bucket_start),
                 title="Suspicious Process Activity Detected",
-                description=f"Detected {len(suspicious_events)} suspicious process executions",
+                description=f"Detected {len(bucket_events)} suspicious process executions",
                 severity=self.severity,
                 status=AlertStatus.OPEN,
                 source="Security Events",
-                timestamp=max(datetime.fromisoformat(e["@timestamp"].replace('Z', '+00:00')) for e in suspicious_events if e.get("@timestamp")),
-                event_count=len(suspicious_events),
+                timestamp=max(parse_timestamp(e["@timestamp"]) for e in bucket_events),
+                event_count=len(bucket_events),
                 affected_users=users,
                 source_ips=source_ips,
-                event_ids=[str(e.get("EventRecordID", "")) for e in suspicious_events],
-                raw_events=suspicious_events
+                event_ids=[str(e.get("EventRecordID", "")) for e in bucket_events],
+                raw_events=bucket_events
             )
             alerts.append(alert)
         
@@ -1,14 +1,33 @@
+from datetime import datetime
 from fastapi import HTTPException, Query
 from typing import Optional, List, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from . import alerts_router
-from .service import alert_service
+from .service import AlertVersionConflict, alert_service
 from .models import AlertSeverity, AlertStatus
 
 
 class AlertStatusUpdate(BaseModel):
     status: AlertStatus
+    # index/seq_no/primary_term from GET /alerts: update the alert where it lives,
+    # and only if it is unchanged since
+    index: Optional[str] = Field(None, pattern=r"^security-alerts(-\d+)?$")
+    if_seq_no: Optional[int] = None
+    if_primary_term: Optional[int] = None
+
+
+class AlertStatusQuery(BaseModel):
+    status: Optional[AlertStatus] = None
+    severity: Optional[AlertSeverity] = None
+    source: Optional[str] = None
+    before: Optional[datetime] = None
+
+
+class AlertBulkStatusUpdate(BaseModel):
+    status: AlertStatus
+    ids: Optional[List[str]] = Field(None, max_length=10000)
+    query: Optional[AlertStatusQuery] = None
 
 @alerts_router.get("/")
 async def get_alerts(
@@ -57,11 +76,38 @@ async def get_recent_events(hours: int = Query(24, ge=1, le=168, description="Ho
         raise HTTPException(status_code=500, detail=f"Error fetching events: {str(e)}")
 
 
+@alerts_router.patch("/status")
+async def update_alerts_status(update: AlertBulkStatusUpdate) -> Dict[str, Any]:
+    """Update the status of many alerts, given by ``ids`` or matched by ``query``"""
+    if (update.ids is None) == (update.query is None):
+        raise HTTPException(status_code=400, detail="Provide either ids or query")
+    if update.query is not None and not update.query.model_dump(exclude_none=True):
+        raise HTTPException(status_code=400, detail="Query needs at least one filter")
+    try:
+        if update.ids is not None:
+            result = alert_service.update_alerts_status(update.status, alert_ids=update.ids)
+        else:
+            result = alert_service.update_alerts_status(
+                update.status,
+                current_status=update.query.status,
+                severity=update.query.severity,
+                source=update.query.source,
+                before=update.query.before
+            )
+        return {"new_status": update.status.value, **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating alert statuses: {str(e)}")
+
+
 @alerts_router.patch("/{alert_id}/status")
 async def update_alert_status(alert_id: str, status_update: AlertStatusUpdate) -> Dict[str, Any]:
     """Update the status of an alert"""
     try:
-        success = alert_service.update_alert_status(alert_id, status_update.status)
+        success = alert_service.update_alert_status(
+            alert_id, status_update.status,
+            if_seq_no=status_update.if_seq_no, if_primary_term=status_update.if_primary_term,
+            index=status_update.index
+        )
         if not success:
             raise HTTPException(status_code=404, detail=f"Alert {alert_id} not found or could not be updated")
         
@@ -72,5 +118,7 @@ async def update_alert_status(alert_id: str, status_update: AlertStatusUpdate) -
         }
     except HTTPException:
         raise
+    except AlertVersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating alert status: {str(e)}")
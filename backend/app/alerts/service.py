@@ -1,23 +1,293 @@
+import os
 import json
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+import redis
+from typing import List, Dict, Any, Optional, Iterable, Tuple
 from datetime import datetime, timedelta, timezone
 from elasticsearch import Elasticsearch
 
 from app.core.config import settings
-from .models import Alert, ALERT_RULES, AlertStatus, AlertSeverity
+from app.core.profiling import profiled
+from app.core.breaker import CircuitBreaker, LRUCache
+from app.core.clients import ForkSafeClient, build_elasticsearch_client, elasticsearch_client, redis_client
+from app.core.metrics import ES_QUERY_SECONDS, RULE_EVALUATION_SECONDS, RULE_EVENTS_SCANNED, RULE_ALERTS_GENERATED, record_cache_lookup
+from .indices import install_index_templates, ALERTS_ALIAS, ALERTS_INITIAL_INDEX, ALERTS_SEARCH_PATTERN
+from .models import Alert, AlertRule, ALERT_RULES, AlertStatus, AlertSeverity, ThresholdPlan
+from .dsl import EventBatch, rule_registry
+from .ioc import ioc_store
+from .baseline import baseline_rules
+from .spray import spray_rules
 
 logger = logging.getLogger(__name__)
 
+EVENTS_SEARCH_PATTERN = "security-events-*"
+# Elasticsearch's default index.max_terms_count; longer value lists are split across clauses
+ES_MAX_TERMS = 65536
+
+
+class AlertVersionConflict(Exception):
+    """Raised when a conditional alert update finds the alert changed since it was read"""
+
+
+def build_rules_filter(rules: List[AlertRule]) -> Optional[Dict[str, Any]]:
+    """Build a filter matching only events some rule can use, or None if a rule needs everything.
+
+    Each rule contributes a clause of its event IDs (terms on event.id), required
+    fields (exists) and alternative fields (exists on any one); an event is fetched
+    if it satisfies any rule's clause.
+    """
+    clauses = []
+    for rule in rules:
+        clause = []
+        if rule.event_ids:
+            clause.append({"terms": {"event.id": sorted(rule.event_ids)}})
+        for field in rule.required_fields:
+            clause.append({"exists": {"field": field}})
+        if rule.any_fields:
+            clause.append({"bool": {
+                "should": [{"exists": {"field": field}} for field in rule.any_fields],
+                "minimum_should_match": 1
+            }})
+        if not clause:
+            return None
+        clauses.append({"bool": {"filter": clause}})
+
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"bool": {"should": clauses, "minimum_should_match": 1}}
+
+def _has_shard_value(field: str) -> Dict[str, Any]:
+    return {"bool": {"filter": [{"exists": {"field": field}}], "must_not": [{"terms": {field: ["", "-"]}}]}}
+
+def build_shard_filter(rules: List[AlertRule], owned: Dict[str, Dict[str, List[Any]]]) -> Optional[Dict[str, Any]]:
+    """Filter matching only the events whose shard keys ``owned`` holds, or None if it holds none.
+
+    ``owned`` maps rule name -> shard field -> values (see assign_shard_keys). As in
+    shard_value, an event is keyed by its first shard field with a value, so a later
+    field's values only match events whose earlier fields are empty, and "" under the
+    first field stands for events without any. Each rule's clause also carries the
+    rule's own requirements, so one rule's keys don't pull in events for another.
+    """
+    clauses = []
+    for rule in rules:
+        fields = owned.get(rule.name)
+        if not fields:
+            continue
+        key_clauses: List[Dict[str, Any]] = []
+        for position, field in enumerate(rule.shard_fields):
+            earlier = [_has_shard_value(f) for f in rule.shard_fields[:position]]
+            values = [value for value in fields.get(field, []) if value != ""]
+            for offset in range(0, len(values), ES_MAX_TERMS):
+                clause: Dict[str, Any] = {"bool": {"filter": [{"terms": {field: values[offset:offset + ES_MAX_TERMS]}}]}}
+                if earlier:
+                    clause["bool"]["must_not"] = earlier
+                key_clauses.append(clause)
+        if "" in fields.get(rule.shard_fields[0], []):
+            key_clauses.append({"bool": {"must_not": [_has_shard_value(f) for f in rule.shard_fields]}})
+        if not key_clauses:
+            continue
+
+        rule_clause = [{"bool": {"should": key_clauses, "minimum_should_match": 1}}]
+        rules_filter = build_rules_filter([rule])
+        if rules_filter:
+            rule_clause.insert(0, rules_filter)
+        clauses.append({"bool": {"filter": rule_clause}})
+
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"bool": {"should": clauses, "minimum_should_match": 1}}
+
+def build_rules_source(rules: List[AlertRule]) -> Optional[Dict[str, Any]]:
+    """Union of the rules' _source includes, or None if any rule needs full documents"""
+    fields = set()
+    for rule in rules:
+        if rule.source_fields is None:
+            return None
+        fields.update(rule.source_fields)
+    return {"includes": sorted(fields)} if fields else None
+
+def apply_rules_to_query(query: Dict[str, Any], rules: Optional[List[AlertRule]]) -> Dict[str, Any]:
+    """Narrow a search body to what the given rules need (filter context + _source includes)"""
+    if not rules:
+        return query
+
+    rules_filter = build_rules_filter(rules)
+    if rules_filter:
+        base = query["query"]
+        if "bool" in base:
+            base["bool"].setdefault("filter", []).append(rules_filter)
+        else:
+            query["query"] = {"bool": {"filter": [rules_filter]}}
+
+    source = build_rules_source(rules)
+    if source:
+        query["_source"] = source
+    return query
+
+def _window_ms(plan: ThresholdPlan) -> int:
+    return max(1, int(round(plan.window_minutes * 60))) * 1000
+
+def build_threshold_aggregation(plan: ThresholdPlan, page_size: int, after: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Composite aggregation counting events per group key and per window-sized time bucket"""
+    sources: List[Dict[str, Any]] = [
+        {f"g{i}": {"terms": {"field": field, "missing_bucket": True}}}
+        for i, field in enumerate(plan.group_by)
+    ]
+    # Time last, so each key's buckets arrive consecutively and in order
+    sources.append({"window": {"date_histogram": {"field": "@timestamp", "fixed_interval": f"{_window_ms(plan) // 1000}s"}}})
+    composite: Dict[str, Any] = {"size": page_size, "sources": sources}
+    if after:
+        composite["after"] = after
+    return {"candidates": {"composite": composite}}
+
+def find_threshold_candidates(buckets: Iterable[Dict[str, Any]], plan: ThresholdPlan) -> Dict[Tuple, List[Tuple[int, int]]]:
+    """Keys that could reach the threshold, with the epoch-millisecond spans to fetch for each.
+
+    A window of ``window_minutes`` overlaps at most two adjacent histogram buckets,
+    so a key can only fire where one bucket, or two consecutive buckets, hold at
+    least ``threshold`` events. A burst starting in bucket k lies within buckets k
+    and k+1, so each hit fetches the two-bucket span starting at its first bucket.
+    """
+    interval = _window_ms(plan)
+    candidates: Dict[Tuple, List[Tuple[int, int]]] = {}
+    previous = None
+
+    for bucket in buckets:
+        key = tuple(bucket["key"][f"g{i}"] for i in range(len(plan.group_by)))
+        start = int(bucket["key"]["window"])
+        count = bucket["doc_count"]
+
+        hits = []
+        if (previous and previous[0] == key and start - previous[1] == interval
+                and previous[2] + count >= plan.threshold):
+            hits.append(previous[1])
+        if count >= plan.threshold:
+            hits.append(start)
+
+        spans = candidates.setdefault(key, []) if hits else None
+        for hit in hits:
+            span = (hit, hit + 2 * interval)
+            if spans and span[0] <= spans[-1][1]:
+                spans[-1] = (spans[-1][0], max(spans[-1][1], span[1]))
+            else:
+                spans.append(span)
+        previous = (key, start, count)
+
+    return candidates
+
+def _candidate_filter(plan: ThresholdPlan, key: Tuple, spans: List[Tuple[int, int]]) -> Dict[str, Any]:
+    clauses: List[Dict[str, Any]] = []
+    for field, value in zip(plan.group_by, key):
+        if value is None:
+            clauses.append({"bool": {"must_not": {"exists": {"field": field}}}})
+        else:
+            clauses.append({"term": {field: value}})
+    clauses.append({
+        "bool": {
+            "should": [
+                {"range": {"@timestamp": {"gte": start, "lt": end, "format": "epoch_millis"}}}
+                for start, end in spans
+            ],
+            "minimum_should_match": 1
+        }
+    })
+    return {"bool": {"filter": clauses}}
+
+# Merge a re-detected alert into the stored one: union the event ids / entities,
+# append raw events for new ids (capped), keep analyst-set status untouched,
+# and turn the update into a no-op when nothing new was seen.
+MERGE_ALERT_SCRIPT = """
+boolean changed = false;
+if (ctx._source.event_ids == null) { ctx._source.event_ids = new ArrayList(); }
+if (ctx._source.affected_users == null) { ctx._source.affected_users = new ArrayList(); }
+if (ctx._source.source_ips == null) { ctx._source.source_ips = new ArrayList(); }
+if (ctx._source.raw_events == null) { ctx._source.raw_events = new ArrayList(); }
+Set previous = new HashSet(ctx._source.event_ids);
+Set known = new HashSet(previous);
+int added = 0;
+for (def id : params.event_ids) {
+  if (!known.contains(id)) { known.add(id); ctx._source.event_ids.add(id); added++; changed = true; }
+}
+for (def user : params.affected_users) {
+  if (!ctx._source.affected_users.contains(user)) { ctx._source.affected_users.add(user); changed = true; }
+}
+for (def ip : params.source_ips) {
+  if (!ctx._source.source_ips.contains(ip)) { ctx._source.source_ips.add(ip); changed = true; }
+}
+if (!changed) { ctx.op = 'noop'; return; }
+for (def raw : params.raw_events) {
+  if (ctx._source.raw_events.size() >= params.max_raw_events) { break; }
+  if (!previous.contains(String.valueOf(raw.EventRecordID))) { ctx._source.raw_events.add(raw); }
+}
+ctx._source.event_count = Math.max(ctx._source.event_count + added, params.event_count);
+ctx._source.description = params.description;
+ctx._source.updated_at = params.now;
+"""
+
+SEEN_KEY_PREFIX = "alerts:seen"
+
+def _seen_key(alert: Alert) -> str:
+    """Key identifying an alert id together with the exact set of events it carries"""
+    digest = hashlib.sha1("\x1f".join(sorted(alert.event_ids)).encode("utf-8")).hexdigest()[:16]
+    return f"{SEEN_KEY_PREFIX}:{alert.id}:{digest}:{alert.event_count}"
+
+def _mark_seen(key: str) -> bool:
+    """Returns True if the key is new (the alert must be written), False if already stored"""
+    try:
+        is_new = bool(redis_client.set(key, 1, nx=True, ex=settings.ALERT_SEEN_TTL_SECONDS))
+    except redis.RedisError as e:
+        logger.warning(f"Alert seen-set unavailable, writing through: {e}")
+        return True
+    record_cache_lookup("alert_seen_set", hit=not is_new)
+    return is_new
+
+def _forget_seen(key: str):
+    try:
+        redis_client.delete(key)
+    except redis.RedisError:
+        pass
+
 class AlertService:
-    def __init__(self):
+    def __init__(self, lazy: bool = False, client: Optional[ForkSafeClient] = None):
+        """Connect to Elasticsearch now, or with ``lazy`` on first use in each process.
+
+        The shared instance is lazy so that importing the app in a pre-forking server
+        does not open a connection the forked workers would share, and it uses the
+        process-wide pooled ``client``; without one the service builds its own.
+        """
+        self._client = client
+        self._es: Optional[Elasticsearch] = None
+        self._es_pid: Optional[int] = None
+        self._es_lock = threading.Lock()
+        # Degraded read mode: skip a failing Elasticsearch and serve the last good pages
+        self.read_breaker = CircuitBreaker("alerts_read")
+        self.page_cache = LRUCache("alert_pages", settings.ALERT_PAGE_CACHE_SIZE)
+        if not lazy:
+            self._connect()
+
+    @property
+    def es(self) -> Optional[Elasticsearch]:
+        if self._es_pid != os.getpid():
+            with self._es_lock:
+                if self._es_pid != os.getpid():
+                    self._connect()
+        return self._es
+
+    @es.setter
+    def es(self, client: Optional[Elasticsearch]):
+        self._es = client
+        self._es_pid = os.getpid()
+
+    def _connect(self):
         # Connect to Elasticsearch
         try:
-            self.es = Elasticsearch(
-                [settings.ELASTICSEARCH_HOST],
-                ca_certs=settings.APP_CERT_PATH,
-                basic_auth=(settings.ELASTIC_USERNAME, settings.ELASTIC_PASSWORD)
-                )
+            self.es = self._client.get() if self._client is not None else build_elasticsearch_client()
             if not self.es.ping():
                 logger.error("Could not connect to Elasticsearch")
                 self.es = None
@@ -28,39 +298,38 @@ class AlertService:
             logger.error(f"Error connecting to Elasticsearch: {e}")
             self.es = None
             
+    def _read_client(self) -> Optional[Elasticsearch]:
+        """The client for a read, or None while the read breaker is open or Elasticsearch is unreachable"""
+        if not self.read_breaker.allow():
+            return None
+        es = self.es
+        if es is None:
+            # Reconnect at most once per breaker trial, e.g. after Elasticsearch was down at startup
+            with self._es_lock:
+                self._connect()
+            es = self._es
+            if es is None:
+                self.read_breaker.record_failure()
+        return es
+
     def _ensure_alerts_index(self):
-        """Ensure the alerts index exists with proper mapping"""
+        """Ensure templates/ILM policies are installed and the alerts rollover alias exists"""
         if not self.es:
             return
-            
-        index_name = "security-alerts"
-        
-        if not self.es.indices.exists(index=index_name):
-            mapping = {
-                "mappings": {
-                    "properties": {
-                        "id": {"type": "keyword"},
-                        "title": {"type": "text"},
-                        "description": {"type": "text"},
-                        "severity": {"type": "keyword"},
-                        "status": {"type": "keyword"},
-                        "source": {"type": "keyword"},
-                        "timestamp": {"type": "date"},
-                        "event_count": {"type": "integer"},
-                        "affected_users": {"type": "keyword"},
-                        "source_ips": {"type": "ip"},
-                        "event_ids": {"type": "keyword"},
-                        "raw_events": {"type": "object"},
-                        "created_at": {"type": "date"},
-                        "updated_at": {"type": "date"}
-                    }
-                }
-            }
-            self.es.indices.create(index=index_name, body=mapping)
-            logger.info(f"Created alerts index: {index_name}")
+
+        install_index_templates(self.es)
+
+        # An existing legacy concrete "security-alerts" index also satisfies this check
+        # and keeps working; only fresh clusters get the rollover layout.
+        if not self.es.indices.exists(index=ALERTS_ALIAS):
+            self.es.indices.create(
+                index=ALERTS_INITIAL_INDEX,
+                aliases={ALERTS_ALIAS: {"is_write_index": True}}
+            )
+            logger.info(f"Created alerts index {ALERTS_INITIAL_INDEX} behind alias {ALERTS_ALIAS}")
     
-    def get_recent_events(self, hours: int = 24) -> List[Dict[str, Any]]:
-        """Fetch recent security events from Elasticsearch"""
+    def get_recent_events(self, hours: int = 24, rules: Optional[List[AlertRule]] = None) -> List[Dict[str, Any]]:
+        """Fetch recent security events from Elasticsearch, narrowed to what ``rules`` need"""
         if not self.es:
             logger.warning("Elasticsearch not available, returning empty events")
             return []
@@ -74,7 +343,7 @@ class AlertService:
             query = {
                 "query": {
                     "bool": {
-                        "must": [
+                        "filter": [
                             {
                                 "range": {
                                     "@timestamp": {
@@ -91,12 +360,14 @@ class AlertService:
                 ],
                 "size": 10000  # Adjust as needed
             }
+            query = apply_rules_to_query(query, rules)
             
             # Execute search
-            response = self.es.search(
-                index="security-events-*",  # Adjust index pattern as needed
-                body=query
-            )
+            with ES_QUERY_SECONDS.labels(call_site="get_recent_events").time():
+                response = self.es.search(
+                    index=EVENTS_SEARCH_PATTERN,
+                    body=query
+                )
             
             events = []
             for hit in response["hits"]["hits"]:
@@ -109,7 +380,7 @@ class AlertService:
             logger.error(f"Error fetching events from Elasticsearch: {e}")
             return []
     
-    def get_all_events(self, limit: int = 10000) -> List[Dict[str, Any]]:
+    def get_all_events(self, limit: int = 10000, rules: Optional[List[AlertRule]] = None) -> List[Dict[str, Any]]:
         """Fetch all available security events from Elasticsearch (fallback when recent events are empty)"""
         if not self.es:
             logger.warning("Elasticsearch not available, returning empty events")
@@ -126,12 +397,14 @@ class AlertService:
                 ],
                 "size": limit  # Limit to prevent memory issues
             }
+            query = apply_rules_to_query(query, rules)
             
             # Execute search
-            response = self.es.search(
-                index="security-events-*",  # Adjust index pattern as needed
-                body=query
-            )
+            with ES_QUERY_SECONDS.labels(call_site="get_all_events").time():
+                response = self.es.search(
+                    index=EVENTS_SEARCH_PATTERN,
+                    body=query
+                )
             
             events = []
             for hit in response["hits"]["hits"]:
@@ -144,21 +417,242 @@ class AlertService:
             logger.error(f"Error fetching all events from Elasticsearch: {e}")
             return []
     
-    def generate_alerts(self, events: Optional[List[Dict[str, Any]]] = None) -> List[Alert]:
-        """Generate alerts by applying all rules to recent events"""
+    def get_threshold_events(self, rule: AlertRule, hours: int = 24) -> Optional[List[Dict[str, Any]]]:
+        """Fetch only the events a threshold rule could fire on, screened by a composite aggregation.
+
+        Returns None when the rule has no threshold plan or the aggregation fails, so
+        the caller can fall back to scanning every event.
+        """
+        plan = rule.threshold_plan()
+        if not self.es or plan is None:
+            return None
+
+        end_time = datetime.now(timezone.utc)
+        start_time = end_time - timedelta(hours=hours)
+        base_filter: List[Dict[str, Any]] = [
+            {"range": {"@timestamp": {"gte": start_time.isoformat(), "lte": end_time.isoformat()}}}
+        ]
+        rules_filter = build_rules_filter([rule])
+        if rules_filter:
+            base_filter.append(rules_filter)
+
+        scanned = {"buckets": 0}
+
+        def pages():
+            after = None
+            while True:
+                with ES_QUERY_SECONDS.labels(call_site="threshold_candidates").time():
+                    response = self.es.search(
+                        index=EVENTS_SEARCH_PATTERN,
+                        size=0,
+                        query={"bool": {"filter": base_filter}},
+                        aggs=build_threshold_aggregation(plan, settings.ES_COMPOSITE_PAGE_SIZE, after)
+                    )
+                aggregation = response["aggregations"]["candidates"]
+                scanned["buckets"] += len(aggregation["buckets"])
+                yield from aggregation["buckets"]
+                after = aggregation.get("after_key")
+                if not after or not aggregation["buckets"]:
+                    return
+
+        try:
+            candidates = list(find_threshold_candidates(pages(), plan).items())
+            source = build_rules_source([rule])
+            events: List[Dict[str, Any]] = []
+            step = settings.ES_CANDIDATE_KEYS_PER_QUERY
+            for offset in range(0, len(candidates), step):
+                query: Dict[str, Any] = {
+                    "query": {
+                        "bool": {
+                            "filter": base_filter + [{
+                                "bool": {
+                                    "should": [_candidate_filter(plan, key, spans) for key, spans in candidates[offset:offset + step]],
+                                    "minimum_should_match": 1
+                                }
+                            }]
+                        }
+                    }
+                }
+                if source:
+                    query["_source"] = source
+                # Paged, so a burst of candidate events is never cut off at one page
+                events.extend(self._search_all(query, call_site="threshold_events"))
+
+            logger.info(f"Rule '{rule.name}': {scanned['buckets']} aggregation buckets, "
+                        f"{len(candidates)} candidate keys, {len(events)} events fetched")
+            return events
+        except Exception as e:
+            logger.error(f"Error running aggregation pushdown for rule '{rule.name}': {e}")
+            return None
+
+    def get_event_histogram(self, start: datetime, end: datetime, rules: Optional[List[AlertRule]] = None,
+                            interval_minutes: Optional[int] = None) -> Optional[List[Tuple[datetime, int]]]:
+        """Count the events ``rules`` need per fixed interval of [start, end); None if the aggregation fails"""
+        if not self.es:
+            return None
+        query = apply_rules_to_query({"query": {"bool": {"filter": [
+            {"range": {"@timestamp": {"gte": start.isoformat(), "lt": end.isoformat()}}}
+        ]}}}, rules)
+        interval = interval_minutes or settings.CHUNK_HISTOGRAM_MINUTES
+        try:
+            with ES_QUERY_SECONDS.labels(call_site="event_histogram").time():
+                response = self.es.search(
+                    index=EVENTS_SEARCH_PATTERN,
+                    size=0,
+                    query=query["query"],
+                    aggs={"per_interval": {"date_histogram": {
+                        "field": "@timestamp", "fixed_interval": f"{interval}m", "min_doc_count": 1
+                    }}}
+                )
+            return [
+                (datetime.fromtimestamp(bucket["key"] / 1000, tz=timezone.utc), bucket["doc_count"])
+                for bucket in response["aggregations"]["per_interval"]["buckets"]
+            ]
+        except Exception as e:
+            logger.error(f"Error counting events per interval: {e}")
+            return None
+
+    def get_events_between(self, start: datetime, end: datetime, rules: Optional[List[AlertRule]] = None,
+                           extra_filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Fetch every event ``rules`` need in [start, end), oldest first, paging through a point in time.
+
+        Unlike get_recent_events this is not capped at one 10k page; callers bound
+        memory by keeping the range small (see the chunked evaluation pipeline) or by
+        narrowing it with ``extra_filter`` (a shard's keys). Errors are raised rather
+        than returning a partial range, so a chunk task can retry.
+        """
+        if not self.es:
+            logger.warning("Elasticsearch not available, returning empty events")
+            return []
+
+        filters: List[Dict[str, Any]] = [{"range": {"@timestamp": {"gte": start.isoformat(), "lt": end.isoformat()}}}]
+        if extra_filter:
+            filters.append(extra_filter)
+        query = apply_rules_to_query({"query": {"bool": {"filter": filters}}}, rules)
+        try:
+            events = self._search_all(query, call_site="get_events_between")
+            logger.info(f"Retrieved {len(events)} events between {start.isoformat()} and {end.isoformat()}")
+        except Exception as e:
+            logger.error(f"Error fetching events between {start.isoformat()} and {end.isoformat()}: {e}")
+            raise
+        return events
+
+    def get_shard_keys(self, start: datetime, end: datetime, rules: List[AlertRule]) -> Dict[str, List[Any]]:
+        """Distinct values of the rules' shard fields in [start, end), paged through composite aggregations.
+
+        Only keys come back, not events, so a sharded run can hand each owner the keys
+        it holds and every owner fetches just its own events. Errors are raised.
+        """
+        if not self.es:
+            return {}
+
+        keys: Dict[str, List[Any]] = {}
+        for field in sorted({field for rule in rules for field in rule.shard_fields}):
+            query = apply_rules_to_query({"query": {"bool": {"filter": [
+                {"range": {"@timestamp": {"gte": start.isoformat(), "lt": end.isoformat()}}}
+            ]}}}, [rule for rule in rules if field in rule.shard_fields])["query"]
+            values: List[Any] = []
+            after = None
+            while True:
+                composite: Dict[str, Any] = {
+                    "size": settings.ES_COMPOSITE_PAGE_SIZE,
+                    "sources": [{"value": {"terms": {"field": field}}}]
+                }
+                if after:
+                    composite["after"] = after
+                with ES_QUERY_SECONDS.labels(call_site="shard_keys").time():
+                    response = self.es.search(index=EVENTS_SEARCH_PATTERN, size=0, query=query,
+                                              aggs={"keys": {"composite": composite}})
+                aggregation = response["aggregations"]["keys"]
+                values.extend(bucket["key"]["value"] for bucket in aggregation["buckets"])
+                after = aggregation.get("after_key")
+                if not after or not aggregation["buckets"]:
+                    break
+            keys[field] = values
+        logger.info(f"Found {sum(len(v) for v in keys.values())} shard keys between {start.isoformat()} and {end.isoformat()}")
+        return keys
+
+    def _search_all(self, query: Dict[str, Any], call_site: str) -> List[Dict[str, Any]]:
+        """Every event matching ``query`` (oldest first) in CHUNK_PAGE_SIZE pages through a point in time.
+
+        ``query`` is a search body without sort, size or pit; errors are raised.
+        """
+        page_size = settings.CHUNK_PAGE_SIZE
+        events: List[Dict[str, Any]] = []
+        pit_id = None
+        try:
+            pit_id = self.es.open_point_in_time(index=EVENTS_SEARCH_PATTERN, keep_alive="1m")["id"]
+            search_after = None
+            while True:
+                body = {
+                    **query,
+                    "sort": [{"@timestamp": {"order": "asc"}}],
+                    "size": page_size,
+                    "pit": {"id": pit_id, "keep_alive": "1m"}
+                }
+                if search_after:
+                    body["search_after"] = search_after
+                with ES_QUERY_SECONDS.labels(call_site=call_site).time():
+                    response = self.es.search(body=body)
+                hits = response["hits"]["hits"]
+                events.extend(hit["_source"] for hit in hits)
+                pit_id = response.get("pit_id", pit_id)
+                if len(hits) < page_size:
+                    break
+                search_after = hits[-1]["sort"]
+        finally:
+            if pit_id:
+                try:
+                    self.es.close_point_in_time(id=pit_id)
+                except Exception:
+                    pass # the point in time expires on its own after keep_alive
+        return events
+
+    def active_rules(self) -> List[AlertRule]:
+        """Built-in, declarative/Sigma, threat-intel and opt-in stateful rules for this run"""
+        return list(ALERT_RULES) + rule_registry.rules() + ioc_store.rules() + baseline_rules() + spray_rules()
+
+    def generate_alerts(self, events: Optional[List[Dict[str, Any]]] = None, profile: bool = False,
+                        rules: Optional[List[AlertRule]] = None) -> List[Alert]:
+        """Generate alerts by applying ``rules`` (default: all active rules) to recent events"""
+        if profile:
+            with profiled("generate_alerts"):
+                return self._generate_alerts(events, rules)
+        return self._generate_alerts(events, rules)
+
+    def _generate_alerts(self, events: Optional[List[Dict[str, Any]]], rules: Optional[List[AlertRule]] = None) -> List[Alert]:
+        rules = self.active_rules() if rules is None else rules
+        # Threshold rules evaluated on aggregation-screened events instead of the shared scan
+        pushed_down: Dict[AlertRule, EventBatch] = {}
         if events is None:
-            events = self.get_recent_events()
+            scan_rules = rules
+            if settings.RULE_EXECUTION_MODE == "aggregation":
+                scan_rules = []
+                for rule in rules:
+                    candidate_events = self.get_threshold_events(rule)
+                    if candidate_events is None:
+                        scan_rules.append(rule)
+                    else:
+                        pushed_down[rule] = EventBatch(candidate_events)
+
+            events = self.get_recent_events(rules=scan_rules) if scan_rules else []
             
             # If recent events are empty, try to get all events as fallback
-            if not events:
+            if not events and scan_rules:
                 logger.warning("No recent events found, attempting to fetch all events as fallback")
-                events = self.get_all_events()
+                events = self.get_all_events(rules=scan_rules)
         
+        # One shared index/timestamp parse for every rule in this run
+        events = events if isinstance(events, EventBatch) else EventBatch(events)
         all_alerts = []
         
-        for rule in ALERT_RULES:
+        for rule in rules:
             try:
-                alerts = rule.check(events)
+                rule_events = pushed_down.get(rule, events)
+                RULE_EVENTS_SCANNED.labels(rule=rule.name).observe(len(rule_events))
+                with RULE_EVALUATION_SECONDS.labels(rule=rule.name).time():
+                    alerts = rule.check(rule_events)
+                RULE_ALERTS_GENERATED.labels(rule=rule.name).inc(len(alerts))
                 all_alerts.extend(alerts)
                 logger.info(f"Rule '{rule.name}' generated {len(alerts)} alerts")
             except Exception as e:
@@ -170,118 +664,261 @@ class AlertService:
                    status: Optional[AlertStatus] = None,
                    severity: Optional[AlertSeverity] = None,
                    limit: int = 100) -> List[Dict[str, Any]]:
-        """Get alerts with optional filtering"""
-        
-        # Try to get stored alerts first
-        stored_alerts = self.get_stored_alerts(status=status, severity=severity, limit=limit)
-        if stored_alerts:
-            return stored_alerts
-        
-        # Fallback to generating alerts in real-time
-        alerts = self.generate_alerts()
-        
-        # Store newly generated alerts
-        for alert in alerts:
-            self.store_alert(alert)
-        
-        # Apply filters
-        if status:
-            alerts = [a for a in alerts if a.status == status]
-        
-        if severity:
-            alerts = [a for a in alerts if a.severity == severity]
-        
-        # Sort by timestamp (newest first) and limit
-        alerts.sort(key=lambda x: x.timestamp, reverse=True)
-        alerts = alerts[:limit]
-        
-        # Convert to dict format
-        return [alert.to_dict() for alert in alerts]
+        """Get stored alerts with optional filtering.
+
+        Read-only: alerts are produced by the scheduled tasks, never by a request,
+        so an empty or unreachable index cannot make reads re-run every rule.
+        """
+        return self.get_stored_alerts(status=status, severity=severity, limit=limit)
     
     def get_alert_stats(self) -> Dict[str, Any]:
-        """Get alert statistics for dashboard"""
-        alerts = self.generate_alerts()
-        
-        stats = {
-            "total_alerts": len(alerts),
-            "by_severity": {
-                "critical": len([a for a in alerts if a.severity == AlertSeverity.CRITICAL]),
-                "high": len([a for a in alerts if a.severity == AlertSeverity.HIGH]),
-                "medium": len([a for a in alerts if a.severity == AlertSeverity.MEDIUM]),
-                "low": len([a for a in alerts if a.severity == AlertSeverity.LOW])
-            },
-            "by_status": {
-                "open": len([a for a in alerts if a.status == AlertStatus.OPEN]),
-                "investigating": len([a for a in alerts if a.status == AlertStatus.INVESTIGATING]),
-                "resolved": len([a for a in alerts if a.status == AlertStatus.RESOLVED]),
-                "false_positive": len([a for a in alerts if a.status == AlertStatus.FALSE_POSITIVE])
-            },
-            "recent_activity": self._get_recent_activity_stats(alerts)
-        }
-        
+        """Get alert statistics for dashboard, aggregated over stored alerts"""
+        cache_key = ("stats",)
+        es = self._read_client()
+        if es is None:
+            logger.warning("Elasticsearch unavailable, serving last known alert stats")
+            return self.page_cache.get(cache_key) or _empty_stats()
+
+        now = datetime.now(timezone.utc)
+        try:
+            with ES_QUERY_SECONDS.labels(call_site="get_alert_stats").time():
+                response = es.search(
+                    index=ALERTS_ALIAS,
+                    size=0,
+                    track_total_hits=True,
+                    aggs={
+                        "by_severity": {"terms": {"field": "severity"}},
+                        "by_status": {"terms": {"field": "status"}},
+                        "recent": {
+                            "filter": {"range": {"timestamp": {"gte": (now - timedelta(hours=24)).isoformat()}}},
+                            "aggs": {"by_hour": {
+                                "date_histogram": {"field": "timestamp", "fixed_interval": "1h"},
+                                "aggs": {"by_severity": {"terms": {"field": "severity"}}}
+                            }}
+                        }
+                    }
+                )
+            self.read_breaker.record_success()
+        except Exception as e:
+            self.read_breaker.record_failure()
+            logger.error(f"Error aggregating alert stats: {e}")
+            return self.page_cache.get(cache_key) or _empty_stats()
+
+        aggregations = response.get("aggregations", {})
+        stats = _empty_stats()
+        stats["total_alerts"] = response["hits"]["total"]["value"]
+        stats["by_severity"] = _bucket_counts(aggregations.get("by_severity"), stats["by_severity"])
+        stats["by_status"] = _bucket_counts(aggregations.get("by_status"), stats["by_status"])
+        stats["recent_activity"] = self._get_recent_activity_stats(
+            aggregations.get("recent", {}).get("by_hour", {}).get("buckets", []), now
+        )
+        self.page_cache.put(cache_key, stats)
         return stats
     
+    def _alert_indices(self, alert_ids: List[str]) -> Dict[str, str]:
+        """Concrete index of each of ``alert_ids`` that is already stored.
+
+        Writes by id through the rollover alias only reach its current write index,
+        so an alert stored before a rollover has to be updated where it lives.
+        """
+        response = self.es.search(
+            index=ALERTS_SEARCH_PATTERN,
+            query={"ids": {"values": alert_ids}},
+            source=False,
+            size=len(alert_ids)
+        )
+        return {hit["_id"]: hit["_index"] for hit in response["hits"]["hits"]}
+
     def store_alert(self, alert: Alert) -> bool:
-        """Store an alert in Elasticsearch"""
+        """Upsert an alert in Elasticsearch, merging events into an existing alert with the same id"""
         if not self.es:
             logger.warning("Elasticsearch not available, cannot store alert")
             return False
+
+        seen_key = _seen_key(alert)
+        if not _mark_seen(seen_key):
+            logger.debug(f"Alert {alert.id} already stored with the same events, skipping")
+            return True
             
         try:
+            now = datetime.now(timezone.utc).isoformat()
             alert_dict = alert.to_dict()
-            alert_dict["created_at"] = datetime.now(timezone.utc).isoformat()
-            alert_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
+            alert_dict["created_at"] = now
+            alert_dict["updated_at"] = now
             
-            self.es.index(
-                index="security-alerts",
-                id=alert.id,
-                body=alert_dict
-            )
+            with ES_QUERY_SECONDS.labels(call_site="store_alert").time():
+                # Merge into the index the alert already lives in; new alerts go to the write index
+                index = self._alert_indices([alert.id]).get(alert.id, ALERTS_ALIAS)
+                self.es.update(
+                    index=index,
+                    id=alert.id,
+                    script={
+                        "source": MERGE_ALERT_SCRIPT,
+                        "lang": "painless",
+                        "params": {
+                            "event_ids": alert_dict["event_ids"],
+                            "affected_users": alert_dict["affected_users"],
+                            "source_ips": alert_dict["source_ips"],
+                            "raw_events": alert_dict["raw_events"],
+                            "event_count": alert_dict["event_count"],
+                            "description": alert_dict["description"],
+                            "max_raw_events": settings.ALERT_MAX_RAW_EVENTS,
+                            "now": now
+                        }
+                    },
+                    upsert=alert_dict,
+                    retry_on_conflict=3
+                )
             logger.info(f"Stored alert {alert.id} in Elasticsearch")
             return True
         except Exception as e:
             logger.error(f"Error storing alert {alert.id}: {e}")
+            _forget_seen(seen_key)
             return False
     
-    def update_alert_status(self, alert_id: str, status: AlertStatus) -> bool:
-        """Update the status of an alert"""
+    def update_alert_status(self, alert_id: str, status: AlertStatus,
+                            if_seq_no: Optional[int] = None, if_primary_term: Optional[int] = None,
+                            index: Optional[str] = None) -> bool:
+        """Set an alert's status in one request; False if it does not exist or the update failed.
+
+        There is no existence check first: the update's own 404 says the alert is
+        missing. Pass the ``index``, ``seq_no`` and ``primary_term`` the alert was read
+        with to update it where it lives, and only if nobody updated it since;
+        otherwise AlertVersionConflict is raised. Without ``index`` the update goes to
+        the write index, and an alert there is missing from is looked up across every
+        alerts index, since it may have been rolled over.
+        """
         if not self.es:
             logger.warning("Elasticsearch not available, cannot update alert")
             return False
-            
+
+        concurrency = {}
+        if if_seq_no is not None and if_primary_term is not None:
+            concurrency = {"if_seq_no": if_seq_no, "if_primary_term": if_primary_term}
+        doc = {"status": status.value, "updated_at": datetime.now(timezone.utc).isoformat()}
         try:
-            # Check if alert exists
-            if not self.es.exists(index="security-alerts", id=alert_id):
-                logger.error(f"Alert {alert_id} not found")
-                return False
-                
-            # Update the alert status
-            update_body = {
-                "doc": {
-                    "status": status.value,
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }
-            }
-            
-            self.es.update(
-                index="security-alerts",
-                id=alert_id,
-                body=update_body
-            )
+            with ES_QUERY_SECONDS.labels(call_site="update_alert_status").time():
+                try:
+                    self.es.update(index=index or ALERTS_ALIAS, id=alert_id, doc=doc, **concurrency)
+                except Exception as e:
+                    if index or getattr(e, "status_code", None) != 404:
+                        raise
+                    located = self._alert_indices([alert_id]).get(alert_id)
+                    if located is None:
+                        raise
+                    self.es.update(index=located, id=alert_id, doc=doc, **concurrency)
             logger.info(f"Updated alert {alert_id} status to {status.value}")
             return True
         except Exception as e:
-            logger.error(f"Error updating alert {alert_id} status: {e}")
+            status_code = getattr(e, "status_code", None) # elasticsearch.ApiError
+            if status_code == 409:
+                raise AlertVersionConflict(f"Alert {alert_id} was modified since it was read")
+            if status_code == 404:
+                logger.error(f"Alert {alert_id} not found")
+            else:
+                logger.error(f"Error updating alert {alert_id} status: {e}")
             return False
-    
+
+    def update_alerts_status(self, status: AlertStatus, alert_ids: Optional[List[str]] = None,
+                             severity: Optional[AlertSeverity] = None, current_status: Optional[AlertStatus] = None,
+                             source: Optional[str] = None, before: Optional[datetime] = None) -> Dict[str, Any]:
+        """Set the status of many alerts at once, by id (one _bulk request) or by filter (update_by_query).
+
+        With ``alert_ids`` only those alerts are updated and missing ones are listed
+        in ``not_found``. Otherwise every alert matching the given severity, current
+        status, source rule and timestamp ``before`` is updated (at least one is
+        required; ValueError otherwise); alerts changed by a concurrent write are
+        counted as ``conflicts`` and left alone.
+        """
+        result: Dict[str, Any] = {"updated": 0, "not_found": [], "conflicts": 0, "failed": 0}
+        if not self.es:
+            logger.warning("Elasticsearch not available, cannot update alerts")
+            return result
+        now = datetime.now(timezone.utc).isoformat()
+
+        if alert_ids is not None:
+            if not alert_ids:
+                return result
+            doc = {"status": status.value, "updated_at": now}
+            targets = {alert_id: ALERTS_ALIAS for alert_id in alert_ids}
+            with ES_QUERY_SECONDS.labels(call_site="update_alerts_status").time():
+                missing = self._bulk_update(targets, doc, result)
+                # Alerts missing from the write index may have been rolled over
+                if missing:
+                    located = self._alert_indices(missing)
+                    result["not_found"].extend(alert_id for alert_id in missing if alert_id not in located)
+                    if located:
+                        result["not_found"].extend(self._bulk_update(located, doc, result))
+        else:
+            filters: List[Dict[str, Any]] = []
+            if current_status:
+                filters.append({"term": {"status": current_status.value}})
+            if severity:
+                filters.append({"term": {"severity": severity.value}})
+            if source:
+                filters.append({"term": {"source": source}})
+            if before:
+                filters.append({"range": {"timestamp": {"lt": before.isoformat()}}})
+            if not filters:
+                raise ValueError("Refusing to update every alert: give alert ids or at least one filter")
+            # Nothing to change on alerts already in the target status
+            query = {"bool": {"filter": filters, "must_not": [{"term": {"status": status.value}}]}}
+            with ES_QUERY_SECONDS.labels(call_site="update_alerts_status").time():
+                response = self.es.update_by_query(
+                    index=ALERTS_SEARCH_PATTERN,
+                    query=query,
+                    script={
+                        "source": "ctx._source.status = params.status; ctx._source.updated_at = params.now",
+                        "lang": "painless",
+                        "params": {"status": status.value, "now": now}
+                    },
+                    conflicts="proceed",
+                    slices="auto"
+                )
+            result["updated"] = response.get("updated", 0)
+            result["conflicts"] = response.get("version_conflicts", 0)
+            result["failed"] = len(response.get("failures", []))
+
+        logger.info(f"Set status {status.value} on {result['updated']} alerts")
+        return result
+
+    def _bulk_update(self, targets: Dict[str, str], doc: Dict[str, Any], result: Dict[str, Any]) -> List[str]:
+        """Apply ``doc`` to each alert id in the index ``targets`` maps it to, counting
+        outcomes into ``result``; returns the ids that were not found"""
+        operations: List[Dict[str, Any]] = []
+        for alert_id, index in targets.items():
+            operations.append({"update": {"_index": index, "_id": alert_id}})
+            operations.append({"doc": doc})
+        response = self.es.bulk(operations=operations)
+        missing = []
+        for item in response["items"]:
+            outcome = item["update"]
+            if outcome.get("status") == 404:
+                missing.append(outcome["_id"])
+            elif outcome.get("status") == 409:
+                result["conflicts"] += 1
+            elif "error" in outcome:
+                result["failed"] += 1
+            else:
+                result["updated"] += 1
+        return missing
+
     def get_stored_alerts(self, 
                          status: Optional[AlertStatus] = None,
                          severity: Optional[AlertSeverity] = None,
                          limit: int = 100) -> List[Dict[str, Any]]:
-        """Get stored alerts from Elasticsearch with optional filtering"""
-        if not self.es:
-            logger.warning("Elasticsearch not available, falling back to generated alerts")
-            return self.get_alerts(status=status, severity=severity, limit=limit)
+        """Get stored alerts from Elasticsearch with optional filtering.
+
+        Every good page is kept in a bounded in-process LRU (ALERT_PAGE_CACHE_SIZE).
+        When the search fails, or the read breaker is open after repeated failures,
+        the last good copy of the same page is served instead, or an empty list if
+        there is none; Elasticsearch is tried again once the breaker lets a trial through.
+        """
+        cache_key = (status, severity, limit)
+        es = self._read_client()
+        if es is None:
+            logger.warning("Elasticsearch unavailable, serving last known alerts")
+            return self.page_cache.get(cache_key) or []
         
         try:
             # Build query
@@ -301,52 +938,68 @@ class AlertService:
                 }
             
             # Search for alerts
-            response = self.es.search(
-                index="security-alerts",
-                body={
-                    "query": query,
-                    "sort": [{"timestamp": {"order": "desc"}}],
-                    "size": limit
-                }
-            )
-            
-            alerts = []
-            for hit in response["hits"]["hits"]:
-                alert_data = hit["_source"]
-                alerts.append(alert_data)
-                
-            return alerts
+            with ES_QUERY_SECONDS.labels(call_site="get_stored_alerts").time():
+                response = es.search(
+                    index=ALERTS_ALIAS,
+                    body={
+                        "query": query,
+                        "sort": [{"timestamp": {"order": "desc"}}],
+                        "size": limit,
+                        "seq_no_primary_term": True
+                    }
+                )
+            self.read_breaker.record_success()
         except Exception as e:
+            self.read_breaker.record_failure()
             logger.error(f"Error retrieving stored alerts: {e}")
-            # Fallback to generated alerts
-            return self.get_alerts(status=status, severity=severity, limit=limit)
+            return self.page_cache.get(cache_key) or []
+            
+        alerts = []
+        for hit in response["hits"]["hits"]:
+            alert_data = hit["_source"]
+            # Location and version the client can send back for a conditional status update
+            if "_index" in hit:
+                alert_data["index"] = hit["_index"]
+            if "_seq_no" in hit:
+                alert_data["seq_no"] = hit["_seq_no"]
+                alert_data["primary_term"] = hit["_primary_term"]
+            alerts.append(alert_data)
+        self.page_cache.put(cache_key, alerts)
+        return alerts
     
-    def _get_recent_activity_stats(self, alerts: List[Alert]) -> List[Dict[str, Any]]:
-        """Get recent activity statistics for charts"""
-        # Group alerts by hour for the last 24 hours
-        current_time = datetime.now(timezone.utc)
-        hourly_stats = {}
+    def _get_recent_activity_stats(self, buckets: List[Dict[str, Any]], now: datetime) -> List[Dict[str, Any]]:
+        """Hourly alert counts by severity for the last 24 hours, newest hour first, for charts"""
+        by_hour = {bucket["key_as_string"][:13]: bucket for bucket in buckets if "key_as_string" in bucket}
+        current_hour = now.replace(minute=0, second=0, microsecond=0)
+        hourly_stats = []
         
         for i in range(24):
-            hour_start = current_time - timedelta(hours=i+1)
-            hour_end = current_time - timedelta(hours=i)
-            hour_key = hour_start.strftime("%H:00")
-            
-            hour_alerts = [
-                a for a in alerts 
-                if hour_start <= a.timestamp <= hour_end
-            ]
-            
-            hourly_stats[hour_key] = {
-                "time": hour_key,
-                "total": len(hour_alerts),
-                "critical": len([a for a in hour_alerts if a.severity == AlertSeverity.CRITICAL]),
-                "high": len([a for a in hour_alerts if a.severity == AlertSeverity.HIGH]),
-                "medium": len([a for a in hour_alerts if a.severity == AlertSeverity.MEDIUM]),
-                "low": len([a for a in hour_alerts if a.severity == AlertSeverity.LOW])
-            }
+            hour_start = current_hour - timedelta(hours=i)
+            bucket = by_hour.get(hour_start.strftime("%Y-%m-%dT%H"), {})
+            counts = _bucket_counts(bucket.get("by_severity"), {"critical": 0, "high": 0, "medium": 0, "low": 0})
+            hourly_stats.append({
+                "time": hour_start.strftime("%H:00"),
+                "total": bucket.get("doc_count", 0),
+                **counts
+            })
         
-        return list(hourly_stats.values())
+        return hourly_stats
+
+def _empty_stats() -> Dict[str, Any]:
+    return {
+        "total_alerts": 0,
+        "by_severity": {severity.value: 0 for severity in AlertSeverity},
+        "by_status": {status.value: 0 for status in AlertStatus},
+        "recent_activity": []
+    }
+
+def _bucket_counts(aggregation: Optional[Dict[str, Any]], known: Dict[str, int]) -> Dict[str, int]:
+    """doc_count per key of a terms aggregation, for the keys in ``known`` (others start at 0)"""
+    counts = dict.fromkeys(known, 0)
+    for bucket in (aggregation or {}).get("buckets", []):
+        if bucket["key"] in counts:
+            counts[bucket["key"]] = bucket["doc_count"]
+    return counts
 
 # Global service instance
-alert_service = AlertService()
+alert_service = AlertService(lazy=True, client=elasticsearch_client)
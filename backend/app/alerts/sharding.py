@@ -0,0 +1,287 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_right
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+import redis
+
+from app.core.config import settings
+from app.core.metrics import SHARD_WORKERS, SHARD_REBALANCES
+from app.core.clients import redis_client
+from .chunking import load_chunk_results, save_chunk_result
+from .dsl import EventBatch, get_field
+from .models import Alert, AlertRule
+
+logger = logging.getLogger(__name__)
+
+SHARD_QUEUE_PREFIX = "alerts.shard"
+MEMBERS_KEY = "alerts:shard:members"
+SHARD_RUN_PREFIX = "alerts:shard:run"
+
+# {"events": [...], "rules": {rule name: positions in "events"}}
+ShardPayload = Dict[str, Any]
+# rule name -> shard field -> values of that field a worker owns
+ShardKeys = Dict[str, Dict[str, List[Any]]]
+
+# Field values that don't count as a shard key
+EMPTY_SHARD_VALUES = (None, "", "-")
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def shard_queue(worker: str) -> str:
+    """Queue consumed only by ``worker``; shard tasks are routed to their owner through it"""
+    return f"{SHARD_QUEUE_PREFIX}.{worker}"
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes.
+
+    Each member is placed at ``replicas`` points on a 64-bit ring and a key belongs to
+    the first point at or after its hash. Adding or removing a member only moves the
+    keys between that member's points and their predecessors (~1/n of all keys), so
+    the other workers keep the window state they already own.
+    """
+
+    def __init__(self, members: Iterable[str], replicas: Optional[int] = None):
+        replicas = replicas or settings.SHARD_VIRTUAL_NODES
+        self.members = tuple(sorted(set(members)))
+        points = sorted((_hash(f"{member}#{i}"), member) for member in self.members for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._owners = [m for _, m in points]
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def owner(self, key: str) -> str:
+        if not self._owners:
+            raise LookupError("Hash ring has no members")
+        index = bisect_right(self._hashes, _hash(key))
+        return self._owners[index % len(self._owners)]
+
+
+class ShardMembership:
+    """Live rule-evaluation workers, tracked as heartbeats in a Redis sorted set.
+
+    Workers heartbeat every SHARD_HEARTBEAT_SECONDS; a member that misses
+    SHARD_MEMBER_TTL_SECONDS is dropped, and the ring is rebuilt whenever the live
+    set changes, which is how joins and leaves rebalance the shards.
+    """
+
+    def __init__(self, key: str = MEMBERS_KEY):
+        self.key = key
+        self._ring: Optional[HashRing] = None
+
+    @property
+    def client(self) -> redis.Redis:
+        return redis_client
+
+    def heartbeat(self, worker: str):
+        self.client.zadd(self.key, {worker: time.time()})
+
+    def leave(self, worker: str):
+        self.client.zrem(self.key, worker)
+
+    def live_members(self) -> List[str]:
+        cutoff = time.time() - settings.SHARD_MEMBER_TTL_SECONDS
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zremrangebyscore(self.key, "-inf", cutoff)
+        pipe.zrange(self.key, 0, -1)
+        members = pipe.execute()[-1]
+        return sorted(m.decode() if isinstance(m, bytes) else m for m in members)
+
+    def ring(self) -> HashRing:
+        members = self.live_members()
+        if self._ring is None or self._ring.members != tuple(members):
+            if self._ring is not None:
+                joined = sorted(set(members) - set(self._ring.members))
+                left = sorted(set(self._ring.members) - set(members))
+                logger.info(f"Rebalancing rule shards: joined={joined} left={left}")
+                SHARD_REBALANCES.inc()
+            self._ring = HashRing(members)
+            SHARD_WORKERS.set(len(members))
+        return self._ring
+
+
+def shard_value(rule: AlertRule, event: Dict[str, Any]) -> str:
+    """The partitioning key of ``event`` for ``rule``: its first non-empty shard field"""
+    for field in rule.shard_fields:
+        value = get_field(event, field)
+        if value not in EMPTY_SHARD_VALUES:
+            return str(value)
+    return ""
+
+
+def assign_shard_keys(rules: List[AlertRule], keys: Dict[str, List[Any]], ring: HashRing) -> Dict[str, ShardKeys]:
+    """Split the shard field values found in a range (``keys``) across the ring's owners.
+
+    A value is owned where partition_events would send its events: by the rule's
+    first shard field and the value. The owner of the empty key also gets "" under
+    that field, standing for the rule's events that have no shard value.
+    """
+    owned: Dict[str, ShardKeys] = {owner: {} for owner in ring.members}
+    for rule in rules:
+        key_field = rule.shard_fields[0]
+        for owner in ring.members:
+            owned[owner][rule.name] = {field: [] for field in rule.shard_fields}
+        owned[ring.owner(f"{key_field}=")][rule.name][key_field].append("")
+        for field in rule.shard_fields:
+            for value in keys.get(field, []):
+                if value not in EMPTY_SHARD_VALUES:
+                    owned[ring.owner(f"{key_field}={value}")][rule.name][field].append(value)
+    return owned
+
+
+def partition_events(rules: List[AlertRule], events: List[Dict[str, Any]], ring: HashRing) -> Dict[str, ShardPayload]:
+    """Split each shardable rule's events across the ring's owners.
+
+    Every event with the same shard value goes to the same worker, so groups a rule
+    builds on that key never straddle shards. An event needed by several rules on one
+    worker is shipped once; ``rules`` maps each rule name to positions in ``events``.
+    """
+    batch = events if isinstance(events, EventBatch) else EventBatch(events)
+    payloads: Dict[str, ShardPayload] = {}
+    positions: Dict[str, Dict[int, int]] = {}
+    owners: Dict[Tuple[str, str], str] = {}
+
+    for rule in rules:
+        ids = None if not rule.event_ids else [str(i) for i in rule.event_ids]
+        for _, event in batch.select(ids, ordered=False):
+            value = shard_value(rule, event)
+            owner = owners.get((rule.shard_fields[0], value))
+            if owner is None:
+                owner = owners[(rule.shard_fields[0], value)] = ring.owner(f"{rule.shard_fields[0]}={value}")
+            payload = payloads.setdefault(owner, {"events": [], "rules": {}})
+            seen = positions.setdefault(owner, {})
+            index = seen.get(id(event))
+            if index is None:
+                index = seen[id(event)] = len(payload["events"])
+                payload["events"].append(event)
+            payload["rules"].setdefault(rule.name, []).append(index)
+    return payloads
+
+
+def evaluate_shard(payload: ShardPayload, rules: List[AlertRule]) -> List[Dict[str, Any]]:
+    """Run each named rule over its slice of the shard and return the alerts as dicts"""
+    by_name = {rule.name: rule for rule in rules}
+    events = payload["events"]
+    alerts = []
+    for name, indices in payload["rules"].items():
+        rule = by_name.get(name)
+        if rule is None:
+            logger.warning(f"Rule '{name}' is not loaded on this worker, skipping its shard")
+            continue
+        try:
+            alerts.extend(alert.to_dict() for alert in rule.check(EventBatch(events[i] for i in indices)))
+        except Exception as e:
+            logger.error(f"Error running rule '{name}' on shard: {e}")
+    return alerts
+
+
+def merge_alerts(results: Iterable[List[Dict[str, Any]]]) -> List[Alert]:
+    """Merge per-shard (or per-chunk) results; on a duplicate id, keep the alert with more events"""
+    merged: Dict[str, Alert] = {}
+    for result in results:
+        for data in result or []:
+            alert = Alert.from_dict(data)
+            current = merged.get(alert.id)
+            if current is None or alert.event_count > current.event_count:
+                merged[alert.id] = alert
+    return list(merged.values())
+
+
+def _run_key(run_id: str) -> str:
+    return f"{SHARD_RUN_PREFIX}:{run_id}"
+
+
+def _done_key(run_id: str) -> str:
+    return f"{SHARD_RUN_PREFIX}:{run_id}:done"
+
+
+def _merged_key(run_id: str) -> str:
+    return f"{SHARD_RUN_PREFIX}:{run_id}:merged"
+
+
+def _result_key(run_id: str, owner: str) -> str:
+    return f"{SHARD_RUN_PREFIX}:{run_id}:{owner}"
+
+
+def create_shard_run(owners: List[str]) -> str:
+    """Record which owners a sharded run is waiting on; returns its id"""
+    run_id = uuid.uuid4().hex
+    redis_client.set(_run_key(run_id), json.dumps(sorted(owners)), ex=settings.CHUNK_RESULT_TTL_SECONDS)
+    return run_id
+
+
+def shard_owners(run_id: str) -> List[str]:
+    raw = redis_client.get(_run_key(run_id))
+    return json.loads(raw) if raw else []
+
+
+def pending_shards(run_id: str) -> List[str]:
+    """Owners of the run whose shard has not been evaluated yet, by them or by recovery"""
+    done = {m.decode() if isinstance(m, bytes) else m for m in redis_client.smembers(_done_key(run_id))}
+    return [owner for owner in shard_owners(run_id) if owner not in done]
+
+
+def finish_shard(run_id: str, owner: str, alerts: List[Alert]) -> bool:
+    """Park ``owner``'s alerts and mark its shard done; True if the caller should merge the run.
+
+    Finishing a shard twice (its owner came back after recovery evaluated it) only
+    replaces its result with the same alerts. The merge is handed to exactly one
+    caller, the first to see every shard done.
+    """
+    save_chunk_result(_result_key(run_id, owner), alerts)
+    pipe = redis_client.pipeline()
+    pipe.sadd(_done_key(run_id), owner)
+    pipe.expire(_done_key(run_id), settings.CHUNK_RESULT_TTL_SECONDS)
+    pipe.execute()
+    if pending_shards(run_id):
+        return False
+    return bool(redis_client.set(_merged_key(run_id), owner, nx=True, ex=settings.CHUNK_RESULT_TTL_SECONDS))
+
+
+def shard_results(run_id: str) -> List[List[Dict[str, Any]]]:
+    """Read (and drop) every owner's parked alerts for the merge"""
+    return load_chunk_results(_result_key(run_id, owner) for owner in shard_owners(run_id))
+
+
+_heartbeat_thread = None
+_heartbeat_stop = threading.Event()
+
+
+def _heartbeat_loop(worker: str):
+    while not _heartbeat_stop.is_set():
+        try:
+            membership.heartbeat(worker)
+        except redis.RedisError as e:
+            logger.error(f"Error sending shard heartbeat for {worker}: {e}")
+        _heartbeat_stop.wait(settings.SHARD_HEARTBEAT_SECONDS)
+
+
+def start_heartbeat(worker: str):
+    """Join the ring and keep this worker's membership fresh from a daemon thread"""
+    global _heartbeat_thread
+    if _heartbeat_thread and _heartbeat_thread.is_alive():
+        return
+    _heartbeat_stop.clear()
+    _heartbeat_thread = threading.Thread(target=_heartbeat_loop, args=(worker,), name="shard-heartbeat", daemon=True)
+    _heartbeat_thread.start()
+
+
+def stop_heartbeat(worker: str):
+    """Stop heartbeating and leave the ring right away instead of waiting for the TTL"""
+    _heartbeat_stop.set()
+    try:
+        membership.leave(worker)
+    except redis.RedisError as e:
+        logger.error(f"Error leaving shard ring for {worker}: {e}")
+
+
+membership = ShardMembership()
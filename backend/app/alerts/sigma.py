@@ -0,0 +1,542 @@
+import re
+import sys
+import ipaddress
+import logging
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Callable, Set, Tuple
+
+import yaml
+
+from app.core.config import settings
+from .dsl import EventBatch, RuleSpecError, get_field
+from .models import (
+    Alert, AlertRule, AlertSeverity, AlertStatus, BASE_SOURCE_FIELDS, alert_fingerprint
+)
+
+logger = logging.getLogger(__name__)
+
+Predicate = Callable[[Dict[str, Any]], bool]
+
+SIGMA_LEVELS = {
+    "informational": AlertSeverity.LOW,
+    "low": AlertSeverity.LOW,
+    "medium": AlertSeverity.MEDIUM,
+    "high": AlertSeverity.HIGH,
+    "critical": AlertSeverity.CRITICAL
+}
+
+# Sigma Windows field names -> where the Logstash pipeline puts them. IpAddress is only
+# renamed to source.ip for public addresses, so both locations are checked.
+SIGMA_FIELD_MAP: Dict[str, List[str]] = {
+    "EventID": ["event.id"],
+    "Computer": ["host.name"],
+    "IpAddress": ["source.ip", "IpAddress"]
+}
+
+# Above this many substrings one alternation regex beats a Python loop of ``in`` checks
+REGEX_ALTERNATION_MIN = 4
+
+
+class SigmaError(RuleSpecError):
+    """Raised when a Sigma rule uses a feature this importer can't compile"""
+
+
+def is_sigma_rule(document: Any) -> bool:
+    return isinstance(document, dict) and "detection" in document and "logsource" in document
+
+
+def is_windows_security(document: Dict[str, Any]) -> bool:
+    logsource = document.get("logsource") or {}
+    return (str(logsource.get("product", "")).lower() == "windows"
+            and str(logsource.get("service", "")).lower() == "security")
+
+
+def _path_getter(path: str) -> Callable[[Dict[str, Any]], Any]:
+    if "." not in path:
+        return lambda e: e.get(path)
+    head, tail = path.split(".", 1)
+    if "." in tail:
+        return lambda e: get_field(e, path)
+
+    # Two-level paths (event.id, host.name, source.ip) are the hot case
+    def get(event: Dict[str, Any]) -> Any:
+        parent = event.get(head)
+        if isinstance(parent, dict):
+            return parent.get(tail)
+        return event.get(path)
+    return get
+
+
+@lru_cache(maxsize=65536)
+def _parse_ip(value: str) -> Optional[Any]:
+    try:
+        return ipaddress.ip_address(value)
+    except ValueError:
+        return None
+
+
+def _getter(field: str) -> Callable[[Dict[str, Any]], Any]:
+    getters = [_path_getter(path) for path in SIGMA_FIELD_MAP.get(field, [field])]
+    if len(getters) == 1:
+        return getters[0]
+
+    def get(event: Dict[str, Any]) -> Any:
+        for getter in getters:
+            value = getter(event)
+            if value is not None:
+                return value
+        return None
+    return get
+
+
+def _all_of(predicates: List[Predicate]) -> Predicate:
+    if len(predicates) == 1:
+        return predicates[0]
+
+    def match(event: Dict[str, Any]) -> bool:
+        for predicate in predicates:
+            if not predicate(event):
+                return False
+        return True
+    return match
+
+
+def _any_of(predicates: List[Predicate]) -> Predicate:
+    if len(predicates) == 1:
+        return predicates[0]
+
+    def match(event: Dict[str, Any]) -> bool:
+        for predicate in predicates:
+            if predicate(event):
+                return True
+        return False
+    return match
+
+
+def _wildcard_regex(value: str) -> str:
+    """Translate Sigma wildcards (*, ?; backslash escapes them) into a regex fragment"""
+    out = []
+    i = 0
+    while i < len(value):
+        char = value[i]
+        if char == "\\" and i + 1 < len(value) and value[i + 1] in "*?\\":
+            out.append(re.escape(value[i + 1]))
+            i += 2
+            continue
+        if char == "*":
+            out.append(".*")
+        elif char == "?":
+            out.append(".")
+        else:
+            out.append(re.escape(char))
+        i += 1
+    return "".join(out)
+
+
+def _has_wildcard(value: str) -> bool:
+    return re.search(r"(?<!\\)[*?]", value) is not None
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\([*?\\])", r"\1", value)
+
+
+def _windash_variants(value: str) -> List[str]:
+    variants = [value]
+    for dash in ("/", "–", "—", "―"):
+        if "-" in value:
+            variants.append(value.replace("-", dash))
+    return variants
+
+
+def _string_matcher(values: List[str], mode: str) -> Callable[[str], bool]:
+    """One matcher for a list of values OR-ed together; ``mode`` is equals/contains/startswith/endswith"""
+    lowered = [v.lower() for v in values]
+    if any(_has_wildcard(v) for v in values):
+        if mode == "contains":
+            parts = [f".*{_wildcard_regex(v)}.*" for v in lowered]
+        elif mode == "startswith":
+            parts = [f"{_wildcard_regex(v)}.*" for v in lowered]
+        elif mode == "endswith":
+            parts = [f".*{_wildcard_regex(v)}" for v in lowered]
+        else:
+            parts = [_wildcard_regex(v) for v in lowered]
+        pattern = re.compile("|".join(f"(?:{p})" for p in parts), re.IGNORECASE | re.DOTALL)
+        return lambda s: pattern.fullmatch(s) is not None
+
+    lowered = [_unescape(v) for v in lowered]
+    if mode == "equals":
+        choices = frozenset(lowered)
+        return lambda s: s.lower() in choices
+    if mode == "startswith":
+        prefixes = tuple(lowered)
+        return lambda s: s.lower().startswith(prefixes)
+    if mode == "endswith":
+        suffixes = tuple(lowered)
+        return lambda s: s.lower().endswith(suffixes)
+    if len(lowered) >= REGEX_ALTERNATION_MIN:
+        pattern = re.compile("|".join(re.escape(v) for v in lowered), re.IGNORECASE)
+        return lambda s: pattern.search(s) is not None
+    if len(lowered) == 1:
+        needle = lowered[0]
+        return lambda s: needle in s.lower()
+    return lambda s: _contains_any(s.lower(), lowered)
+
+
+def _contains_any(text: str, needles: List[str]) -> bool:
+    for needle in needles:
+        if needle in text:
+            return True
+    return False
+
+
+def _compile_field(key: str, raw_values: Any) -> Tuple[str, Predicate]:
+    """Compile one ``Field|mod1|mod2: values`` entry into a predicate on an event"""
+    field, *modifiers = key.split("|")
+    get = _getter(field)
+    values = raw_values if isinstance(raw_values, list) else [raw_values]
+
+    match_all = "all" in modifiers
+    modifiers = [m for m in modifiers if m != "all"]
+    if "windash" in modifiers:
+        modifiers.remove("windash")
+        values = [variant for v in values for variant in _windash_variants(str(v))]
+
+    if not modifiers and any(v is None for v in values):
+        others = [v for v in values if v is not None]
+        rest = _compile_field(key, others)[1] if others else None
+        return field, lambda e: get(e) in (None, "") or (rest is not None and rest(e))
+
+    if len(modifiers) > 1:
+        raise SigmaError(f"Unsupported modifier chain on '{key}'")
+    modifier = modifiers[0] if modifiers else "equals"
+
+    if modifier == "exists":
+        expected = bool(values[0])
+        return field, lambda e: (get(e) not in (None, "")) == expected
+
+    if modifier == "re":
+        patterns = [re.compile(str(v)) for v in values]
+        combine = all if match_all else any
+        return field, lambda e: (v := get(e)) is not None and combine(p.search(str(v)) for p in patterns)
+
+    if modifier == "cidr":
+        networks = [ipaddress.ip_network(str(v), strict=False) for v in values]
+
+        def in_networks(event: Dict[str, Any]) -> bool:
+            value = get(event)
+            address = _parse_ip(str(value)) if value is not None else None
+            if address is None:
+                return False
+            for network in networks:
+                if address in network:
+                    return True
+            return False
+        return field, in_networks
+
+    if modifier in ("lt", "lte", "gt", "gte"):
+        limit = float(values[0])
+        compare = {
+            "lt": lambda x: x < limit, "lte": lambda x: x <= limit,
+            "gt": lambda x: x > limit, "gte": lambda x: x >= limit
+        }[modifier]
+
+        def numeric(event: Dict[str, Any]) -> bool:
+            try:
+                return compare(float(get(event)))
+            except (TypeError, ValueError):
+                return False
+        return field, numeric
+
+    if modifier not in ("equals", "contains", "startswith", "endswith"):
+        raise SigmaError(f"Unsupported modifier '{modifier}' on '{field}'")
+
+    strings = [str(v) for v in values]
+    if match_all and len(strings) > 1:
+        matchers = [_string_matcher([s], modifier) for s in strings]
+        return field, lambda e: (v := get(e)) is not None and all(m(str(v)) for m in matchers)
+    matcher = _string_matcher(strings, modifier)
+    return field, lambda e: (v := get(e)) is not None and matcher(str(v))
+
+
+def _equality_ids(key: str, raw_values: Any) -> Optional[Set[str]]:
+    if key != "EventID":
+        return None
+    values = raw_values if isinstance(raw_values, list) else [raw_values]
+    if any(v is None or _has_wildcard(str(v)) for v in values):
+        return None
+    return {str(v) for v in values}
+
+
+class Selection:
+    """A compiled detection item: a map (AND of fields) or a list of maps (OR)"""
+
+    def __init__(self, name: str, definition: Any):
+        self.name = name
+        self.fields: Set[str] = set()
+        if isinstance(definition, dict):
+            alternatives = [definition]
+        elif isinstance(definition, list) and all(isinstance(d, dict) for d in definition):
+            alternatives = definition
+        else:
+            # Keyword lists search every field of the raw event; not expressible efficiently here
+            raise SigmaError(f"Keyword selection '{name}' is not supported")
+
+        # Per alternative: its field predicates, each with the event IDs it pins (if any)
+        self._alternatives: List[List[Tuple[Predicate, Optional[Set[str]]]]] = []
+        ids: List[Optional[Set[str]]] = []
+        for alternative in alternatives:
+            predicates = []
+            alternative_ids: Optional[Set[str]] = None
+            for key, raw_values in alternative.items():
+                field, predicate = _compile_field(str(key), raw_values)
+                self.fields.add(field)
+                found = _equality_ids(str(key), raw_values)
+                predicates.append((predicate, found))
+                if found is not None:
+                    alternative_ids = found if alternative_ids is None else alternative_ids & found
+            self._alternatives.append(predicates)
+            ids.append(alternative_ids)
+
+        # A selection only constrains event IDs if every alternative does
+        self.event_ids = set().union(*ids) if ids and all(i is not None for i in ids) else None
+
+    def matcher(self, dispatched: Optional[Set[str]] = None) -> Predicate:
+        """Predicate for this selection; EventID checks already implied by the rule's
+        event-ID dispatch (``dispatched``) are dropped"""
+        groups = []
+        for predicates in self._alternatives:
+            groups.append(_all_of([
+                predicate for predicate, found in predicates
+                if not (dispatched is not None and found is not None and dispatched <= found)
+            ]))
+        return _any_of(groups)
+
+
+# Condition AST nodes are tuples: ("sel", name) | ("not", node) | ("and", [nodes]) | ("or", [nodes])
+TOKEN_PATTERN = re.compile(r"\s*(\(|\)|[A-Za-z0-9_*]+)")
+
+
+def _tokenize(condition: str) -> List[str]:
+    if "|" in condition:
+        raise SigmaError("Aggregation conditions ('| count() ...') are not supported")
+    tokens = []
+    position = 0
+    condition = condition.strip()
+    while position < len(condition):
+        match = TOKEN_PATTERN.match(condition, position)
+        if not match:
+            raise SigmaError(f"Cannot parse condition near '{condition[position:]}'")
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+
+class _ConditionParser:
+    def __init__(self, condition: str, names: List[str]):
+        self.tokens = _tokenize(condition)
+        self.position = 0
+        self.names = names
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise SigmaError("Unexpected end of condition")
+        self.position += 1
+        return token
+
+    def parse(self) -> Tuple:
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise SigmaError(f"Unexpected token '{self.peek()}' in condition")
+        return node
+
+    def parse_or(self) -> Tuple:
+        nodes = [self.parse_and()]
+        while self.peek() is not None and self.peek().lower() == "or":
+            self.take()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and(self) -> Tuple:
+        nodes = [self.parse_not()]
+        while self.peek() is not None and self.peek().lower() == "and":
+            self.take()
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_not(self) -> Tuple:
+        if self.peek() is not None and self.peek().lower() == "not":
+            self.take()
+            return ("not", self.parse_not())
+        return self.parse_primary()
+
+    def parse_primary(self) -> Tuple:
+        token = self.take()
+        if token == "(":
+            node = self.parse_or()
+            if self.take() != ")":
+                raise SigmaError("Unbalanced parentheses in condition")
+            return node
+        following = self.peek()
+        if following is not None and following.lower() == "of":
+            self.take()
+            return self.quantifier(token.lower(), self.take())
+        if token not in self.names:
+            raise SigmaError(f"Condition references unknown selection '{token}'")
+        return ("sel", token)
+
+    def quantifier(self, amount: str, target: str) -> Tuple:
+        if target.lower() == "them":
+            matched = [n for n in self.names if not n.startswith("_")]
+        else:
+            pattern = re.compile(_wildcard_regex(target))
+            matched = [n for n in self.names if pattern.fullmatch(n)]
+        if not matched:
+            raise SigmaError(f"'{amount} of {target}' matches no selections")
+        nodes = [("sel", n) for n in matched]
+        if amount == "all":
+            return ("and", nodes)
+        if amount in ("1", "any"):
+            return ("or", nodes)
+        raise SigmaError(f"Quantifier '{amount} of' is not supported")
+
+
+def _compile_condition(node: Tuple, selections: Dict[str, Selection], dispatched: Optional[Set[str]] = None) -> Predicate:
+    kind = node[0]
+    if kind == "sel":
+        return selections[node[1]].matcher(dispatched)
+    if kind == "not":
+        inner = _compile_condition(node[1], selections, dispatched)
+        return lambda e: not inner(e)
+    children = [_compile_condition(child, selections, dispatched) for child in node[1]]
+    return _all_of(children) if kind == "and" else _any_of(children)
+
+
+def required_event_ids(node: Tuple, selections: Dict[str, Selection]) -> Optional[Set[str]]:
+    """Event IDs every match must have, or None if the condition doesn't constrain them"""
+    kind = node[0]
+    if kind == "sel":
+        return selections[node[1]].event_ids
+    if kind == "not":
+        return None
+    child_ids = [required_event_ids(child, selections) for child in node[1]]
+    if kind == "and":
+        constrained = [ids for ids in child_ids if ids is not None]
+        return set.intersection(*constrained) if constrained else None
+    if any(ids is None for ids in child_ids):
+        return None
+    return set().union(*child_ids)
+
+
+class SigmaRule(AlertRule):
+    """A Sigma rule (product: windows, service: security) compiled into a Boron rule.
+
+    Matching events are grouped into one alert per host and dedup bucket.
+    """
+
+    def __init__(self, document: Dict[str, Any]):
+        if not is_sigma_rule(document):
+            raise SigmaError("Not a Sigma rule (needs 'logsource' and 'detection')")
+        if not is_windows_security(document):
+            raise SigmaError("Only 'product: windows, service: security' rules are supported")
+
+        title = document.get("title") or document.get("id")
+        if not title:
+            raise SigmaError("Sigma rule has no title")
+        level = str(document.get("level", "medium")).lower()
+        super().__init__(title, SIGMA_LEVELS.get(level, AlertSeverity.MEDIUM))
+        self.sigma_id = str(document.get("id", title))
+        self.description = str(document.get("description", title)).strip()
+
+        detection = dict(document["detection"])
+        condition = detection.pop("condition", None)
+        detection.pop("timeframe", None)
+        if condition is None:
+            raise SigmaError(f"Sigma rule '{title}' has no condition")
+        selections = {name: Selection(name, definition) for name, definition in detection.items()}
+
+        conditions = condition if isinstance(condition, list) else [condition]
+        trees = [_ConditionParser(str(c), list(selections)).parse() for c in conditions]
+        tree = trees[0] if len(trees) == 1 else ("or", trees)
+        ids = required_event_ids(tree, selections)
+        self.matches: Predicate = _compile_condition(tree, selections, ids or None)
+        self._event_id_keys = sorted(ids) if ids else None
+        self.event_ids = {int(i) if i.isdigit() else i for i in ids} if ids else None
+        self.required_fields = ["@timestamp"]
+        fields = {p for s in selections.values() for f in s.fields for p in SIGMA_FIELD_MAP.get(f, [f])}
+        self.source_fields = BASE_SOURCE_FIELDS + sorted(fields - set(BASE_SOURCE_FIELDS) | {"TargetUserName", "SubjectUserName", "source.ip"})
+        self.shard_fields = ["host.name"]
+
+    def check(self, events: List[Dict[str, Any]]) -> List[Alert]:
+        batch = events if isinstance(events, EventBatch) else EventBatch(events)
+        matches = self.matches
+        host_of = _path_getter("host.name")
+        ip_of = _path_getter("source.ip")
+        bucket_seconds = settings.ALERT_DEDUP_BUCKET_MINUTES * 60
+
+        groups: Dict[Tuple[Any, int], List[Dict[str, Any]]] = {}
+        for timestamp, event in batch.select(self._event_id_keys, ordered=False):
+            if matches(event):
+                key = (host_of(event), int(timestamp.timestamp()) // bucket_seconds)
+                groups.setdefault(key, []).append(event)
+
+        alerts = []
+        for (host, bucket), matched in groups.items():
+            bucket_start = datetime.fromtimestamp(bucket * bucket_seconds, tz=timezone.utc)
+            users = sorted({str(u) for e in matched for u in (e.get("TargetUserName"), e.get("SubjectUserName")) if u})
+            source_ips = sorted({str(ip) for ip in (ip_of(e) for e in matched) if ip})
+            alerts.append(Alert(
+                id=alert_fingerprint("sigma", self.sigma_id, host, bucket_start),
+                title=self.name,
+                description=f"{self.description} ({len(matched)} matching events{f' on {host}' if host else ''})",
+                severity=self.severity,
+                status=AlertStatus.OPEN,
+                source="Sigma",
+                timestamp=bucket_start,
+                event_count=len(matched),
+                affected_users=users,
+                source_ips=source_ips,
+                event_ids=[str(e.get("EventRecordID", "")) for e in matched],
+                raw_events=matched
+            ))
+        return alerts
+
+
+def compile_sigma_documents(documents: List[Any], origin: str = "<sigma>") -> List[SigmaRule]:
+    """Compile the Windows Security rules among ``documents``; others are skipped with a log line"""
+    rules = []
+    for document in documents:
+        if not is_sigma_rule(document):
+            continue
+        title = document.get("title", "untitled")
+        if not is_windows_security(document):
+            logger.debug(f"Skipping Sigma rule '{title}' from {origin}: not a Windows Security rule")
+            continue
+        try:
+            rules.append(SigmaRule(document))
+        except (SigmaError, re.error, ValueError) as e:
+            logger.warning(f"Skipping Sigma rule '{title}' from {origin}: {e}")
+    return rules
+
+
+def main(paths: List[str]) -> int:
+    """Report which Sigma rules in ``paths`` compile: python -m app.alerts.sigma rules/*.yml"""
+    compiled = 0
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            documents = list(yaml.safe_load_all(f))
+        rules = compile_sigma_documents(documents, origin=path)
+        compiled += len(rules)
+        for rule in rules:
+            print(f"{path}: {rule.name} [{rule.severity.value}] event_ids={sorted(rule.event_ids or [])}")
+    print(f"{compiled} Sigma rules compiled")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
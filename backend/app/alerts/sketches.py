@@ -0,0 +1,202 @@
+import hashlib
+import math
+from dataclasses import dataclass
+from typing import List, Dict, Iterable, Optional
+
+import redis
+
+
+def ewma_alpha(half_life: float) -> float:
+    """Smoothing factor whose weight halves every ``half_life`` observations"""
+    return 1.0 - 0.5 ** (1.0 / max(half_life, 1e-9))
+
+
+@dataclass
+class Ewma:
+    """Exponentially weighted mean/variance of a per-interval count.
+
+    ``last`` is the interval index of the last observation; intervals skipped since
+    then are folded in as zero counts when the entity is next seen, so idle entities
+    cost nothing until they reappear.
+    """
+    mean: float = 0.0
+    var: float = 0.0
+    count: int = 0
+    last: Optional[int] = None
+
+    # After this many empty intervals the state has decayed to (almost) nothing anyway
+    MAX_GAP_STEPS = 512
+
+    def _step(self, value: float, alpha: float):
+        diff = value - self.mean
+        increment = alpha * diff
+        self.mean += increment
+        self.var = (1.0 - alpha) * (self.var + diff * increment)
+        self.count += 1
+
+    def decay_to(self, interval: int, alpha: float):
+        """Account for the empty intervals between the last observation and ``interval``"""
+        if self.last is None:
+            return
+        gap = interval - self.last - 1
+        if gap <= 0:
+            return
+        if gap > self.MAX_GAP_STEPS:
+            self.mean = self.var = 0.0
+            self.count += gap
+        else:
+            for _ in range(gap):
+                self._step(0.0, alpha)
+        self.last = interval - 1
+
+    def update(self, value: float, interval: int, alpha: float):
+        self.decay_to(interval, alpha)
+        if self.count == 0:
+            self.mean, self.var, self.count = float(value), 0.0, 1
+        else:
+            self._step(float(value), alpha)
+        self.last = interval
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(max(self.var, 0.0))
+
+    def zscore(self, value: float, std_floor: float) -> float:
+        return (value - self.mean) / max(self.std, std_floor)
+
+    def dumps(self) -> str:
+        return f"{self.mean:.6g}:{self.var:.6g}:{self.count}:{'' if self.last is None else self.last}"
+
+    @classmethod
+    def loads(cls, raw) -> 'Ewma':
+        if isinstance(raw, bytes):
+            raw = raw.decode()
+        mean, var, count, last = raw.split(":")
+        return cls(float(mean), float(var), int(count), int(last) if last else None)
+
+
+def cms_positions(key: str, width: int, depth: int) -> List[int]:
+    """Column for ``key`` in each of ``depth`` rows (Kirsch-Mitzenmacher double hashing)"""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + row * h2) % width for row in range(depth)]
+
+
+class RedisCountMinSketch:
+    """Count-Min Sketch stored as a Redis hash of ``row:column`` counters.
+
+    Memory is fixed at width x depth counters whatever the number of distinct keys;
+    estimates never undercount and overcount by at most ~e/width of the total with
+    probability 1 - e^-depth. HINCRBY keeps concurrent writers from different
+    workers consistent without a lock.
+    """
+
+    def __init__(self, client: redis.Redis, key: str, width: int, depth: int, ttl: Optional[int] = None):
+        self.client = client
+        self.key = key
+        self.width = width
+        self.depth = depth
+        self.ttl = ttl
+
+    def _fields(self, item: str) -> List[str]:
+        return [f"{row}:{column}" for row, column in enumerate(cms_positions(item, self.width, self.depth))]
+
+    def add_many(self, counts: Dict[str, int]):
+        if not counts:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for item, count in counts.items():
+            for field in self._fields(item):
+                pipe.hincrby(self.key, field, count)
+        if self.ttl:
+            pipe.expire(self.key, self.ttl)
+        pipe.execute()
+
+    def estimate_many(self, items: Iterable[str]) -> Dict[str, int]:
+        items = list(items)
+        if not items:
+            return {}
+        pipe = self.client.pipeline(transaction=False)
+        for item in items:
+            pipe.hmget(self.key, self._fields(item))
+        estimates = {}
+        for item, values in zip(items, pipe.execute()):
+            estimates[item] = min(int(v or 0) for v in values)
+        return estimates
+
+
+class BoundedEwmaTable:
+    """Per-entity EWMA state in a Redis hash, capped at ``max_entries``.
+
+    A sorted set tracks when each entity was last updated; once the cap is exceeded
+    the least recently seen entities are evicted, keeping memory bounded however many
+    distinct IPs/users appear.
+    """
+
+    def __init__(self, client: redis.Redis, key: str, max_entries: int):
+        self.client = client
+        self.key = key
+        self.recency_key = f"{key}:recency"
+        self.max_entries = max_entries
+
+    def get_many(self, entities: List[str]) -> Dict[str, Ewma]:
+        if not entities:
+            return {}
+        values = self.client.hmget(self.key, entities)
+        return {entity: Ewma.loads(raw) if raw else Ewma() for entity, raw in zip(entities, values)}
+
+    def put_many(self, states: Dict[str, Ewma]) -> List[str]:
+        """Store states and return the entities evicted to stay within the cap"""
+        if not states:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(self.key, mapping={entity: state.dumps() for entity, state in states.items()})
+        pipe.zadd(self.recency_key, {entity: state.last or 0 for entity, state in states.items()})
+        pipe.zcard(self.recency_key)
+        size = pipe.execute()[-1]
+
+        overflow = size - self.max_entries
+        if overflow <= 0:
+            return []
+        evicted = [self._decode(member) for member, _ in self.client.zpopmin(self.recency_key, overflow)]
+        if evicted:
+            self.client.hdel(self.key, *evicted)
+        return evicted
+
+    @staticmethod
+    def _decode(member) -> str:
+        return member.decode() if isinstance(member, bytes) else member
+
+
+class RedisDistinctCounter:
+    """Per-key HyperLogLog (Redis PFADD/PFCOUNT): distinct counts in at most 12 KB per key,
+    ~0.8% standard error"""
+
+    def __init__(self, client: redis.Redis, prefix: str, ttl: int):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def add_and_count(self, members: Dict[str, Iterable[str]]) -> Dict[str, int]:
+        if not members:
+            return {}
+        names = list(members)
+        pipe = self.client.pipeline(transaction=False)
+        for name in names:
+            values = list(members[name])
+            if values:
+                pipe.pfadd(self._key(name), *values)
+            pipe.expire(self._key(name), self.ttl)
+        for name in names:
+            pipe.pfcount(self._key(name))
+        results = pipe.execute()
+        return dict(zip(names, results[-len(names):]))
+
+    def delete(self, names: Iterable[str]):
+        keys = [self._key(name) for name in names]
+        if keys:
+            self.client.delete(*keys)
@@ -0,0 +1,172 @@
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.core.config import settings
+from .dsl import EventBatch
+from .models import Alert, AlertRule, AlertSeverity, AlertStatus, BASE_SOURCE_FIELDS, alert_fingerprint, time_bucket
+
+logger = logging.getLogger(__name__)
+
+FAILED_LOGON_EVENT_IDS = ["4625"]
+
+TimedEvent = Tuple[datetime, Dict[str, Any]]
+
+
+class _SourceWindow:
+    """Sliding-window state for one source IP.
+
+    ``users`` maps each target user to its latest attempt, oldest first, so expiring
+    the window is a pop from the front. Once enough distinct users are seen the
+    window becomes a burst that absorbs further targets until it is ``window`` old.
+    """
+    __slots__ = ("last_seen", "users", "burst_start", "burst")
+
+    def __init__(self):
+        self.last_seen: Optional[datetime] = None
+        self.users: "OrderedDict[str, TimedEvent]" = OrderedDict()
+        self.burst_start: Optional[datetime] = None
+        self.burst: Optional[Dict[str, TimedEvent]] = None
+
+
+class PasswordSprayRule(AlertRule):
+    """Alert when one source IP fails logons against many distinct users within a window.
+
+    MultipleFailedLoginsRule groups by (source IP, user), so one password tried against
+    hundreds of accounts never reaches its threshold. This rule counts distinct
+    TargetUserName per source.ip over a sliding SPRAY_WINDOW_MINUTES window in a single
+    time-ordered pass over the shared batch.
+
+    Memory is bounded: sources idle for longer than the window are dropped as the pass
+    advances, at most SPRAY_MAX_TRACKED_IPS sources are tracked (least recently active
+    evicted first) and each keeps at most SPRAY_MAX_USERS_PER_IP distinct users. Alerts
+    carry one attempt per targeted user rather than every retry.
+    """
+
+    event_ids = {4625}
+    required_fields = ["@timestamp"]
+    source_fields = BASE_SOURCE_FIELDS + ["source.ip", "IpAddress", "TargetUserName", "TargetDomainName", "LogonType"]
+    shard_fields = ["source.ip", "IpAddress"]
+
+    def __init__(self, threshold: Optional[int] = None, window_minutes: Optional[float] = None,
+                 max_tracked_ips: Optional[int] = None, max_users_per_ip: Optional[int] = None):
+        super().__init__("Password Spray", AlertSeverity.HIGH)
+        self._threshold = threshold
+        self._window_minutes = window_minutes
+        self._max_tracked_ips = max_tracked_ips
+        self._max_users_per_ip = max_users_per_ip
+
+    @property
+    def threshold(self) -> int:
+        return self._threshold or settings.SPRAY_DISTINCT_USERS
+
+    @property
+    def window(self) -> timedelta:
+        return timedelta(minutes=self._window_minutes or settings.SPRAY_WINDOW_MINUTES)
+
+    def check(self, events: List[Dict[str, Any]]) -> List[Alert]:
+        batch = events if isinstance(events, EventBatch) else EventBatch(events)
+        threshold = self.threshold
+        window = self.window
+        max_ips = self._max_tracked_ips or settings.SPRAY_MAX_TRACKED_IPS
+        max_users = max(self._max_users_per_ip or settings.SPRAY_MAX_USERS_PER_IP, threshold)
+
+        # Least recently active source first
+        sources: "OrderedDict[str, _SourceWindow]" = OrderedDict()
+        alerts: List[Alert] = []
+        evicted = 0
+
+        for timestamp, event in batch.select(FAILED_LOGON_EVENT_IDS):
+            source = event.get("source")
+            ip = (source.get("ip") if isinstance(source, dict) else None) or event.get("IpAddress")
+            user = event.get("TargetUserName")
+            if not ip or ip == "-" or not user or user == "-":
+                continue
+            ip, user = str(ip), str(user).lower()
+
+            horizon = timestamp - window
+            while sources:
+                oldest = next(iter(sources.values()))
+                if oldest.last_seen >= horizon:
+                    break
+                self._close(sources.popitem(last=False), alerts)
+
+            state = sources.get(ip)
+            if state is None:
+                state = sources[ip] = _SourceWindow()
+            else:
+                sources.move_to_end(ip)
+            state.last_seen = timestamp
+
+            if state.burst is not None:
+                if timestamp - state.burst_start <= window:
+                    if user not in state.burst and len(state.burst) < max_users:
+                        state.burst[user] = (timestamp, event)
+                    continue
+                self._close((ip, state), alerts)
+
+            users = state.users
+            while users:
+                first = next(iter(users.values()))
+                if first[0] >= horizon:
+                    break
+                users.popitem(last=False)
+            if user in users:
+                users.move_to_end(user)
+            users[user] = (timestamp, event)
+            if len(users) > max_users:
+                users.popitem(last=False)
+
+            if len(users) >= threshold:
+                state.burst = dict(users)
+                state.burst_start = next(iter(users.values()))[0]
+                users.clear()
+
+            if len(sources) > max_ips:
+                self._close(sources.popitem(last=False), alerts)
+                evicted += 1
+
+        for item in sources.items():
+            self._close(item, alerts)
+        if evicted:
+            logger.warning(f"Password spray tracking evicted {evicted} active sources (SPRAY_MAX_TRACKED_IPS={max_ips})")
+        return alerts
+
+    def _close(self, item: Tuple[str, _SourceWindow], alerts: List[Alert]):
+        """Emit the alert for a source's open burst, if any, and reset it"""
+        ip, state = item
+        if state.burst is None:
+            return
+        alerts.append(self._build_alert(ip, state.burst_start, list(state.burst.values())))
+        state.burst = state.burst_start = None
+        state.users.clear()
+
+    def _build_alert(self, ip: str, start: datetime, burst: List[TimedEvent]) -> Alert:
+        burst.sort(key=lambda item: item[0])
+        burst_events = [e for _, e in burst]
+        minutes = (burst[-1][0] - start).total_seconds() / 60
+        users = sorted({str(e["TargetUserName"]) for e in burst_events})
+        return Alert(
+            id=alert_fingerprint("password_spray", self.name, ip, time_bucket(start)),
+            title="Password Spray Detected",
+            description=(f"Failed logins from {ip} against {len(burst)} distinct users within "
+                         f"{minutes:.1f} minutes"),
+            severity=self.severity,
+            status=AlertStatus.OPEN,
+            source="Security Events",
+            timestamp=start,
+            event_count=len(burst_events),
+            affected_users=users,
+            source_ips=[ip],
+            event_ids=[str(e.get("EventRecordID", "")) for e in burst_events],
+            raw_events=burst_events
+        )
+
+
+def spray_rules() -> List[AlertRule]:
+    """The password-spray rule unless disabled with SPRAY_ENABLED=false"""
+    return [password_spray_rule] if settings.SPRAY_ENABLED else []
+
+
+password_spray_rule = PasswordSprayRule()
@@ -0,0 +1,85 @@
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from .chunking import chunk_rules
+from .dsl import EventBatch, TimedEvent, _event_id_key
+from .models import Alert, AlertRule, parse_timestamp
+from .service import alert_service
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingDetector:
+    """Apply rules to events as they arrive instead of re-reading them from Elasticsearch.
+
+    Windowed rules need more than the latest batch, so a sliding buffer keeps the
+    last STREAM_DETECTION_WINDOW_MINUTES of events (by the newest @timestamp seen,
+    capped at STREAM_DETECTION_MAX_EVENTS) and every batch is evaluated together with
+    it. Alerts found again on later batches keep their id, and store_alert's seen-set
+    makes re-storing them a no-op. Rules that are not chunkable (watermark-driven
+    state) are skipped here and keep running on the scheduled path.
+
+    The event-ID index rules select from is kept up to date as events arrive and
+    expire, so a batch costs a copy of the window rather than re-parsing it.
+    """
+
+    def __init__(self, window_minutes: Optional[float] = None, max_events: Optional[int] = None,
+                 rules: Optional[List[AlertRule]] = None):
+        self._window_minutes = window_minutes
+        self._max_events = max_events
+        self._rules = rules
+        # Arrival order, for expiry; each event's entry in _by_event_id is the oldest one there
+        self._buffer: Deque[Tuple[datetime, Dict[str, Any], str]] = deque()
+        self._by_event_id: Dict[str, Deque[TimedEvent]] = {}
+        self._newest: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    @property
+    def window(self) -> timedelta:
+        return timedelta(minutes=self._window_minutes or settings.STREAM_DETECTION_WINDOW_MINUTES)
+
+    def rules(self) -> List[AlertRule]:
+        # Resolved per batch so rule reloads and opt-in rule groups take effect
+        rules = alert_service.active_rules() if self._rules is None else self._rules
+        return chunk_rules(rules)[0]
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def process(self, events: Iterable[Dict[str, Any]]) -> List[Alert]:
+        """Add ``events`` (indexed document shape) to the window and return the alerts it now holds"""
+        max_events = self._max_events or settings.STREAM_DETECTION_MAX_EVENTS
+        with self._lock:
+            added = 0
+            for event in events:
+                timestamp = parse_timestamp(event.get("@timestamp"))
+                if timestamp is None:
+                    continue
+                event_id = _event_id_key((event.get("event") or {}).get("id"))
+                self._buffer.append((timestamp, event, event_id))
+                self._by_event_id.setdefault(event_id, deque()).append((timestamp, event))
+                if self._newest is None or timestamp > self._newest:
+                    self._newest = timestamp
+                added += 1
+            if not added:
+                return []
+
+            horizon = self._newest - self.window
+            # Arrival order is roughly time order; late stragglers expire on a later batch
+            while self._buffer and (self._buffer[0][0] < horizon or len(self._buffer) > max_events):
+                event_id = self._buffer.popleft()[2]
+                timed = self._by_event_id[event_id]
+                timed.popleft()
+                if not timed:
+                    del self._by_event_id[event_id]
+            window = EventBatch.from_index({
+                event_id: sorted((item for item in timed if item[0] >= horizon), key=itemgetter(0))
+                for event_id, timed in self._by_event_id.items()
+            })
+
+        return alert_service.generate_alerts(events=window, rules=self.rules())
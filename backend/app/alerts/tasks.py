@@ -0,0 +1,259 @@
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from celery import chord, group, shared_task
+from celery.signals import celeryd_after_setup, worker_ready, worker_shutdown
+
+from app.core.config import settings
+from .backfill import claim_partition, create_run, load_run, reset_cursor, run_partition
+from .chunking import chunk_result_key, chunk_rules, load_chunk_results, owned_alerts, plan_slices, save_chunk_result, slice_bounds
+from .models import Alert
+from .service import alert_service, build_shard_filter
+from .sharding import (
+    HashRing, assign_shard_keys, create_shard_run, evaluate_shard, finish_shard, membership, merge_alerts,
+    partition_events, pending_shards, shard_owners, shard_queue, shard_results, start_heartbeat, stop_heartbeat
+)
+
+logger = logging.getLogger(__name__)
+
+# Node name of this worker (e.g. "celery@host") once it consumes its shard queue
+_worker_name: Optional[str] = None
+
+
+@shared_task(name="alerts.generate")
+def generate_alerts_task(profile: bool = False) -> int:
+    """Generate and store alerts; pass profile=True to capture a cProfile/tracemalloc profile.
+
+    With INLINE_DETECTION_ENABLED the chunkable rules already ran on each fetched
+    slice, so only the rules that need the whole history are evaluated here.
+    """
+    rules = chunk_rules(alert_service.active_rules())[1] if settings.INLINE_DETECTION_ENABLED else None
+    if rules == []:
+        return 0
+    alerts = alert_service.generate_alerts(profile=profile, rules=rules)
+    for alert in alerts:
+        alert_service.store_alert(alert)
+    logger.info(f"Generated {len(alerts)} alerts in Celery task")
+    return len(alerts)
+
+
+@shared_task(name="alerts.generate_sharded")
+def generate_sharded_alerts_task(hours: int = 24) -> int:
+    """Evaluate unshardable rules here and fan shardable ones out to the workers owning their keys.
+
+    The coordinator reads the range's shard keys once, by aggregation, and each
+    shard task carries the time range and the keys its owner holds, not events:
+    each owner fetches only the events of its own keys, parking its alerts in Redis; the last shard to finish merges and stores them. A recovery
+    task evaluates, on any worker, the shards still unfinished after
+    SHARD_TASK_EXPIRES_SECONDS, so a dead owner delays a run instead of losing it.
+    Falls back to a single-worker run while sharding is disabled or fewer than two
+    workers are live. Returns the number of shard tasks dispatched.
+    """
+    rules = alert_service.active_rules()
+    sharded = [rule for rule in rules if rule.shard_fields]
+    ring = membership.ring() if settings.RULE_SHARDING_ENABLED and sharded else None
+    if ring is None or len(ring) < 2:
+        generate_alerts_task()
+        return 0
+
+    local = [rule for rule in rules if not rule.shard_fields]
+    local_alerts = alert_service.generate_alerts(rules=local) if local else []
+    for alert in local_alerts:
+        alert_service.store_alert(alert)
+
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(hours=hours)
+    owned = assign_shard_keys(sharded, alert_service.get_shard_keys(start, end, sharded), ring)
+    run_id = create_shard_run(list(ring.members))
+    for owner in ring.members:
+        payload = {"run_id": run_id, "owner": owner, "members": list(ring.members),
+                   "start": start.isoformat(), "end": end.isoformat(), "keys": owned[owner]}
+        evaluate_shard_task.apply_async((payload,), queue=shard_queue(owner), expires=settings.SHARD_TASK_EXPIRES_SECONDS)
+    recover_shards_task.apply_async((run_id, hours, end.isoformat()), countdown=settings.SHARD_TASK_EXPIRES_SECONDS)
+    logger.info(f"Generated {len(local_alerts)} unsharded alerts and dispatched shard run {run_id} "
+                f"across {len(ring)} workers")
+    return len(ring)
+
+
+def _evaluate_owned_shard(payload: Dict[str, Any]) -> List[Alert]:
+    """Fetch the events of the keys the payload's owner holds and run the shardable rules over them"""
+    rules = [rule for rule in alert_service.active_rules() if rule.shard_fields]
+    shard_filter = build_shard_filter(rules, payload["keys"])
+    if shard_filter is None:
+        return []
+    start, end = slice_bounds(payload)
+    events = alert_service.get_events_between(start, end, rules=rules, extra_filter=shard_filter)
+    # The query already selects this owner's keys; partitioning splits the events between the rules
+    shard = partition_events(rules, events, HashRing(payload["members"])).get(payload["owner"])
+    return [Alert.from_dict(data) for data in evaluate_shard(shard, rules)] if shard else []
+
+
+def _finish_shard(payload: Dict[str, Any], alerts: List[Alert]) -> None:
+    if finish_shard(payload["run_id"], payload["owner"], alerts):
+        merge_shard_results(payload["run_id"])
+
+
+@shared_task(name="alerts.evaluate_shard")
+def evaluate_shard_task(payload: Dict[str, Any]) -> int:
+    """Run this worker's shard of the shardable rules; returns its alert count"""
+    if payload["owner"] not in pending_shards(payload["run_id"]):
+        logger.info(f"Shard of {payload['owner']} in run {payload['run_id']} was already recovered, skipping")
+        return 0
+    alerts = _evaluate_owned_shard(payload)
+    _finish_shard(payload, alerts)
+    return len(alerts)
+
+
+@shared_task(name="alerts.recover_shards", autoretry_for=(Exception,), max_retries=3, retry_backoff=True)
+def recover_shards_task(run_id: str, hours: int, end: str) -> int:
+    """Evaluate here the shards of ``run_id`` whose owners never finished them; returns how many"""
+    pending = pending_shards(run_id)
+    if not pending:
+        return 0
+    logger.warning(f"Shard run {run_id}: evaluating unfinished shards of {pending} locally")
+    members = shard_owners(run_id)
+    end_time = datetime.fromisoformat(end)
+    start_time = end_time - timedelta(hours=hours)
+    sharded = [rule for rule in alert_service.active_rules() if rule.shard_fields]
+    owned = assign_shard_keys(sharded, alert_service.get_shard_keys(start_time, end_time, sharded), HashRing(members))
+    for owner in pending:
+        payload = {"run_id": run_id, "owner": owner, "members": members,
+                   "start": start_time.isoformat(), "end": end, "keys": owned[owner]}
+        _finish_shard(payload, _evaluate_owned_shard(payload))
+    return len(pending)
+
+
+def merge_shard_results(run_id: str) -> int:
+    """Merge every shard's alerts and store them"""
+    results = shard_results(run_id)
+    alerts = merge_alerts(results)
+    for alert in alerts:
+        alert_service.store_alert(alert)
+    logger.info(f"Merged {len(alerts)} alerts from {len(results)} shards")
+    return len(alerts)
+
+
+@shared_task(name="alerts.generate_chunked")
+def generate_chunked_alerts_task(hours: int = 24) -> int:
+    """Evaluate the last ``hours`` as a chord of bounded time chunks instead of one task.
+
+    Slices are sized from an event-count histogram (CHUNK_MAX_EVENTS, CHUNK_MAX_MINUTES)
+    and sent as time ranges; each chunk fetches its own events and parks its alerts in
+    Redis, and the reducer merges and stores them. A failing chunk retries alone.
+    Rules that are not chunkable run here over the full window. Returns the slice count.
+    """
+    rules = alert_service.active_rules()
+    chunked, whole = chunk_rules(rules)
+    if whole:
+        alerts = alert_service.generate_alerts(rules=whole)
+        for alert in alerts:
+            alert_service.store_alert(alert)
+
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(hours=hours)
+    slices = plan_slices(start, end, alert_service.get_event_histogram(start, end, rules=chunked)) if chunked else []
+    if slices:
+        run_id = uuid.uuid4().hex
+        arguments = [(time_slice, run_id, index) for index, time_slice in enumerate(slices)]
+        if settings.CHUNK_SLICES_PER_TASK > 1:
+            # Batch small slices into fewer messages; a retry then covers the whole batch
+            header = evaluate_chunk_task.chunks(arguments, settings.CHUNK_SLICES_PER_TASK).group()
+        else:
+            header = group(evaluate_chunk_task.s(*args) for args in arguments)
+        chord(header)(merge_chunk_results_task.s())
+    logger.info(f"Dispatched {len(slices)} chunks covering {hours}h for {len(chunked)} rules")
+    return len(slices)
+
+
+@shared_task(name="alerts.evaluate_chunk", autoretry_for=(Exception,), max_retries=3, retry_backoff=True)
+def evaluate_chunk_task(time_slice: Dict[str, str], run_id: str, index: int) -> str:
+    """Run the chunkable rules over one slice (plus overlap); returns the Redis key of its alerts"""
+    chunked, _ = chunk_rules(alert_service.active_rules())
+    start, end = slice_bounds(time_slice)
+    overlap = timedelta(minutes=settings.CHUNK_OVERLAP_MINUTES)
+    events = alert_service.get_events_between(start - overlap, end + overlap, rules=chunked)
+    alerts = owned_alerts(alert_service.generate_alerts(events=events, rules=chunked), time_slice)
+    return save_chunk_result(chunk_result_key(run_id, index), alerts)
+
+
+@shared_task(name="alerts.merge_chunk_results")
+def merge_chunk_results_task(results: List[Any]) -> int:
+    """Chord callback: merge the alerts parked by every chunk, dedup by id, and store them"""
+    keys = [key for result in results for key in ([result] if isinstance(result, str) else result)]
+    alerts = merge_alerts(load_chunk_results(keys))
+    for alert in alerts:
+        alert_service.store_alert(alert)
+    logger.info(f"Merged {len(alerts)} alerts from {len(keys)} chunks")
+    return len(alerts)
+
+
+def start_backfill(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   rules: Optional[List[str]] = None, run_id: Optional[str] = None) -> str:
+    """Start a backfill of [start, end) through ``rules``, or resume ``run_id``; returns the run id.
+
+    Dispatches up to BACKFILL_PARALLELISM partition tasks on BACKFILL_QUEUE. Each
+    one claims the next unfinished partition when it is done, so a long replay never
+    holds more than that many worker slots. A partition that keeps failing ends its
+    lane; resuming the run dispatches fresh lanes and skips checkpointed partitions.
+    """
+    if run_id is None:
+        run_id = create_run(start, end, rules)
+    run = load_run(run_id)
+    if run is None:
+        raise LookupError(f"Backfill {run_id} not found")
+
+    reset_cursor(run_id)
+    lanes = 0
+    for _ in range(settings.BACKFILL_PARALLELISM):
+        index = claim_partition(run_id, len(run["partitions"]))
+        if index is None:
+            break
+        backfill_partition_task.apply_async((run_id, index), queue=settings.BACKFILL_QUEUE)
+        lanes += 1
+    logger.info(f"Backfill {run_id}: {lanes} lanes over {len(run['partitions'])} partitions")
+    return run_id
+
+
+@shared_task(name="alerts.backfill_partition", autoretry_for=(Exception,), max_retries=3, retry_backoff=True)
+def backfill_partition_task(run_id: str, index: int) -> int:
+    """Replay one backfill partition, then hand this lane the next unfinished one"""
+    stats = run_partition(run_id, index)
+    logger.info(f"Backfill {run_id} partition {index}: {stats['events']} events, {stats['alerts']} alerts "
+                f"in {stats['seconds']}s")
+
+    run = load_run(run_id)
+    following = claim_partition(run_id, len(run["partitions"])) if run else None
+    if following is not None:
+        backfill_partition_task.apply_async((run_id, following), queue=settings.BACKFILL_QUEUE)
+    return stats["events"]
+
+
+@celeryd_after_setup.connect
+def consume_backfill_queue(sender, instance, **kwargs):
+    """Let workers pick up backfill partitions; their count is capped by the lanes, not the queue"""
+    if settings.BACKFILL_QUEUE:
+        instance.app.amqp.queues.select_add(settings.BACKFILL_QUEUE)
+
+
+@celeryd_after_setup.connect
+def consume_shard_queue(sender, instance, **kwargs):
+    """Have each worker consume its own shard queue alongside the default one"""
+    global _worker_name
+    if not settings.RULE_SHARDING_ENABLED:
+        return
+    _worker_name = sender
+    instance.app.amqp.queues.select_add(shard_queue(sender))
+
+
+@worker_ready.connect
+def join_shard_ring(sender=None, **kwargs):
+    if _worker_name:
+        start_heartbeat(_worker_name)
+
+
+@worker_shutdown.connect
+def leave_shard_ring(sender=None, **kwargs):
+    if _worker_name:
+        stop_heartbeat(_worker_name)
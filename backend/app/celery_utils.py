@@ -1,9 +1,12 @@
 from celery import current_app as current_celery_app
 
 from app.core.config import settings
+from app.core.serialization import register_serializer
 
 
 def create_celery():
+    # Registered before the config names it as task/result serializer
+    register_serializer()
     celery_app = current_celery_app
     celery_app.config_from_object(settings, namespace='CELERY') # type: ignore
 
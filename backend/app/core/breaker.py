@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from app.core.config import settings
+from app.core.metrics import CIRCUIT_BREAKER_OPEN, record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Stop calling a failing dependency for a while instead of piling requests onto it.
+
+    Closed, every call is allowed and consecutive failures are counted; at
+    ``failure_threshold`` the breaker opens and ``allow()`` refuses calls for
+    ``reset_seconds``. After that a single trial call is let through (half-open):
+    its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_seconds: Optional[float] = None):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            reset_seconds = self._reset_seconds or settings.ES_BREAKER_RESET_SECONDS
+            if self._trial_in_flight or time.monotonic() - self._opened_at < reset_seconds:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"Circuit breaker '{self.name}' closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+        CIRCUIT_BREAKER_OPEN.labels(breaker=self.name).set(0)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            threshold = self._failure_threshold or settings.ES_BREAKER_FAILURE_THRESHOLD
+            if self._trial_in_flight or self._failures >= threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Circuit breaker '{self.name}' opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+        if self.is_open:
+            CIRCUIT_BREAKER_OPEN.labels(breaker=self.name).set(1)
+
+
+class LRUCache:
+    """Bounded, thread-safe mapping that evicts the least recently used entry"""
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        record_cache_lookup(self.name, hit=value is not None)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
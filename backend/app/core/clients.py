@@ -0,0 +1,149 @@
+import os
+import threading
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+import httpx
+import redis
+from elasticsearch import Elasticsearch
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
+
+from app.core.config import settings
+from app.core.metrics import register_pool_usage
+
+T = TypeVar("T")
+
+
+class ForkSafeClient(Generic[T]):
+    """Proxy that builds its client on first use and again in every forked child.
+
+    Importing the app in a pre-forking server (Gunicorn with preload_app) must not
+    open sockets the workers would then share; the client is only created when a
+    process first touches it, and a process with a different pid builds its own.
+    Attribute access is forwarded, so the proxy is a drop-in for the client.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._client: Optional[T] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> T:
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._client = self._factory()
+                    self._pid = pid
+        return self._client
+
+    @property
+    def initialized(self) -> bool:
+        return self._pid == os.getpid()
+
+    def reset(self):
+        """Drop the client so the next use builds a fresh one"""
+        with self._lock:
+            self._client = None
+            self._pid = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+
+def build_redis_client() -> redis.Redis:
+    pool = redis.BlockingConnectionPool.from_url(
+        settings.REDIS_URL,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        socket_keepalive=True,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        retry=Retry(ExponentialBackoff(), settings.REDIS_RETRIES),
+        decode_responses=True,
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+def build_elasticsearch_client() -> Elasticsearch:
+    return Elasticsearch(
+        [settings.ELASTICSEARCH_HOST],
+        ca_certs=settings.APP_CERT_PATH or None,
+        basic_auth=(settings.ELASTIC_USERNAME, settings.ELASTIC_PASSWORD),
+        connections_per_node=settings.ES_CONNECTIONS_PER_NODE,
+        request_timeout=settings.ES_REQUEST_TIMEOUT,
+        max_retries=settings.ES_MAX_RETRIES,
+        retry_on_timeout=settings.ES_RETRY_ON_TIMEOUT,
+    )
+
+
+def build_http_client() -> httpx.Client:
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    # Transport-level retries cover connection failures only, never a request that was sent
+    transport = httpx.HTTPTransport(limits=limits, retries=settings.HTTP_RETRIES)
+    return httpx.Client(
+        transport=transport,
+        timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+    )
+
+
+# Process-wide clients: pooled, configured from settings, built on first use per process
+redis_client = ForkSafeClient(build_redis_client)
+elasticsearch_client = ForkSafeClient(build_elasticsearch_client)
+http_client = ForkSafeClient(build_http_client)
+
+
+def get_redis() -> redis.Redis:
+    """FastAPI dependency: the shared Redis client"""
+    return redis_client.get()
+
+
+def get_elasticsearch() -> Elasticsearch:
+    """FastAPI dependency: the shared Elasticsearch client"""
+    return elasticsearch_client.get()
+
+
+def get_http_client() -> httpx.Client:
+    """FastAPI dependency: the shared outbound HTTP client"""
+    return http_client.get()
+
+
+def _redis_pool_usage() -> Optional[Dict[str, int]]:
+    if not redis_client.initialized:
+        return None
+    pool = redis_client.get().connection_pool
+    idle = sum(1 for connection in list(pool.pool.queue) if connection is not None)
+    return {"in_use": len(pool._connections) - idle, "idle": idle, "max": pool.max_connections}
+
+
+def _elasticsearch_pool_usage() -> Optional[Dict[str, int]]:
+    if not elasticsearch_client.initialized:
+        return None
+    in_use = idle = limit = 0
+    for node in elasticsearch_client.get().transport.node_pool.all():
+        queue = node.pool.pool
+        slots = list(queue.queue)
+        idle += sum(1 for connection in slots if connection is not None)
+        in_use += queue.maxsize - len(slots)
+        limit += queue.maxsize
+    return {"in_use": in_use, "idle": idle, "max": limit}
+
+
+def _http_pool_usage() -> Optional[Dict[str, int]]:
+    if not http_client.initialized:
+        return None
+    pool = http_client.get()._transport._pool
+    connections = list(pool.connections)
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {"in_use": len(connections) - idle, "idle": idle, "max": pool._max_connections}
+
+
+register_pool_usage("redis", _redis_pool_usage)
+register_pool_usage("elasticsearch", _elasticsearch_pool_usage)
+register_pool_usage("http", _http_pool_usage)
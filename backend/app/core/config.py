@@ -1,6 +1,37 @@
 import os
+import json
 import pathlib
+from dataclasses import dataclass
 from functools import lru_cache
+from typing import List
+
+@dataclass(frozen=True)
+class WorkspaceConfig:
+    """One Azure Log Analytics workspace and the service principal used to query it"""
+    name: str
+    workspace_id: str
+    tenant_id: str
+    client_id: str
+    client_secret: str
+
+def load_workspaces(raw: str, tenant_id: str, client_id: str, client_secret: str, workspace_id: str) -> List[WorkspaceConfig]:
+    """Parse AZURE_WORKSPACES (a JSON list); missing credentials default to the global ones.
+
+    Without AZURE_WORKSPACES a single workspace is built from WORKSPACE_ID/TENANT_ID/etc.
+    """
+    if not raw:
+        return [WorkspaceConfig("default", workspace_id, tenant_id, client_id, client_secret)]
+
+    workspaces = []
+    for entry in json.loads(raw):
+        workspaces.append(WorkspaceConfig(
+            name=entry.get("name", entry["workspace_id"]),
+            workspace_id=entry["workspace_id"],
+            tenant_id=entry.get("tenant_id", tenant_id),
+            client_id=entry.get("client_id", client_id),
+            client_secret=entry.get("client_secret", client_secret)
+        ))
+    return workspaces
 
 class BaseConfig:
     BASE_DIR:pathlib.Path = pathlib.Path(__file__).parent.parent
@@ -10,17 +41,159 @@ class BaseConfig:
 
     CELERY_BROKER_URL: str = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
     CELERY_RESULT_BACKEND: str = os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+    # Task arguments/results as msgpack (app.core.serialization); JSON still accepted from older senders
+    CELERY_TASK_SERIALIZER: str = os.environ.get("CELERY_TASK_SERIALIZER", "boron-msgpack")
+    CELERY_RESULT_SERIALIZER: str = os.environ.get("CELERY_RESULT_SERIALIZER", "boron-msgpack")
+    CELERY_ACCEPT_CONTENT: List[str] = os.environ.get("CELERY_ACCEPT_CONTENT", "boron-msgpack,json").split(",")
+    CELERY_RESULT_ACCEPT_CONTENT: List[str] = os.environ.get("CELERY_RESULT_ACCEPT_CONTENT", "boron-msgpack,json").split(",")
+    TASK_PAYLOAD_COMPRESS_THRESHOLD: int = int(os.environ.get("TASK_PAYLOAD_COMPRESS_THRESHOLD", "16384")) # bytes; 0 disables
+    TASK_PAYLOAD_ZSTD_LEVEL: int = int(os.environ.get("TASK_PAYLOAD_ZSTD_LEVEL", "3"))
 
     TENANT_ID: str = os.environ.get("TENANT_ID", "NO_TENANT_ID")
     CLIENT_ID: str = os.environ.get("CLIENT_ID", "NO_CLIENT_ID")
     CLIENT_SECRET: str = os.environ.get("CLIENT_SECRET", "NO_CLIENT_SECRET")
     WORKSPACE_ID: str = os.environ.get("WORKSPACE_ID", "LOCALHOST")
+    AZURE_WORKSPACES: List[WorkspaceConfig] = load_workspaces(
+        os.environ.get("AZURE_WORKSPACES", ""), TENANT_ID, CLIENT_ID, CLIENT_SECRET, WORKSPACE_ID
+    )
+    STARTUP_INGEST_ENABLED: bool = os.environ.get("STARTUP_INGEST_ENABLED", "true").lower() == "true"
+    INGEST_MAX_CONCURRENCY: int = int(os.environ.get("INGEST_MAX_CONCURRENCY", "4"))
+    INGEST_SLICE_MINUTES: int = int(os.environ.get("INGEST_SLICE_MINUTES", "60"))
+    INGEST_MAX_SLICES_PER_RUN: int = int(os.environ.get("INGEST_MAX_SLICES_PER_RUN", "24"))
+    # Fetched events are fsynced to this spool before the watermark moves, then shipped from it
+    INGEST_SPOOL_DIR: str = os.environ.get("INGEST_SPOOL_DIR", str(BASE_DIR.parent / "spool"))
+    INGEST_SPOOL_SEGMENT_BYTES: int = int(os.environ.get("INGEST_SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+    INGEST_SPOOL_BATCH_SIZE: int = int(os.environ.get("INGEST_SPOOL_BATCH_SIZE", "5000"))
+    INGEST_SPOOL_FSYNC: bool = os.environ.get("INGEST_SPOOL_FSYNC", "true").lower() == "true"
+    # Spooled events published to a Redis Stream, consumed by groups (logstash, rules, archive)
+    INGEST_STREAM_ENABLED: bool = os.environ.get("INGEST_STREAM_ENABLED", "false").lower() == "true"
+    INGEST_STREAM_KEY: str = os.environ.get("INGEST_STREAM_KEY", "ingest:events")
+    INGEST_STREAM_MAXLEN: int = int(os.environ.get("INGEST_STREAM_MAXLEN", "1000000"))
+    INGEST_STREAM_GROUPS: List[str] = os.environ.get("INGEST_STREAM_GROUPS", "logstash,rules,archive").split(",")
+    INGEST_STREAM_BATCH_SIZE: int = int(os.environ.get("INGEST_STREAM_BATCH_SIZE", "500"))
+    INGEST_STREAM_BLOCK_MS: int = int(os.environ.get("INGEST_STREAM_BLOCK_MS", "2000")) # below REDIS_SOCKET_TIMEOUT
+    INGEST_STREAM_CLAIM_IDLE_MS: int = int(os.environ.get("INGEST_STREAM_CLAIM_IDLE_MS", "60000"))
+    INGEST_STREAM_RETRY_SECONDS: int = int(os.environ.get("INGEST_STREAM_RETRY_SECONDS", "5"))
+    INGEST_ARCHIVE_DIR: str = os.environ.get("INGEST_ARCHIVE_DIR", str(BASE_DIR.parent / "archive"))
+    STREAM_DETECTION_WINDOW_MINUTES: int = int(os.environ.get("STREAM_DETECTION_WINDOW_MINUTES", "60"))
+    STREAM_DETECTION_MAX_EVENTS: int = int(os.environ.get("STREAM_DETECTION_MAX_EVENTS", "200000"))
+    # Evaluate chunkable rules on each fetched slice before it is indexed; the scheduled
+    # Elasticsearch run then only covers rules that cannot run on a sliding window
+    INLINE_DETECTION_ENABLED: bool = os.environ.get("INLINE_DETECTION_ENABLED", "false").lower() == "true"
+    AZURE_TOKEN_REFRESH_MARGIN: int = int(os.environ.get("AZURE_TOKEN_REFRESH_MARGIN", "300"))
+    AZURE_TOKEN_LOCK_TIMEOUT: int = int(os.environ.get("AZURE_TOKEN_LOCK_TIMEOUT", "30"))
+    AZURE_TOKEN_LOCK_WAIT: int = int(os.environ.get("AZURE_TOKEN_LOCK_WAIT", "10"))
+
+    # Pooled clients shared per process (app.core.clients)
+    REDIS_URL: str = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+    REDIS_MAX_CONNECTIONS: int = int(os.environ.get("REDIS_MAX_CONNECTIONS", "50"))
+    REDIS_POOL_TIMEOUT: float = float(os.environ.get("REDIS_POOL_TIMEOUT", "5"))
+    REDIS_SOCKET_TIMEOUT: float = float(os.environ.get("REDIS_SOCKET_TIMEOUT", "5"))
+    REDIS_CONNECT_TIMEOUT: float = float(os.environ.get("REDIS_CONNECT_TIMEOUT", "5"))
+    REDIS_HEALTH_CHECK_INTERVAL: int = int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+    REDIS_RETRIES: int = int(os.environ.get("REDIS_RETRIES", "3"))
+    ES_CONNECTIONS_PER_NODE: int = int(os.environ.get("ES_CONNECTIONS_PER_NODE", "25"))
+    ES_REQUEST_TIMEOUT: float = float(os.environ.get("ES_REQUEST_TIMEOUT", "30"))
+    ES_MAX_RETRIES: int = int(os.environ.get("ES_MAX_RETRIES", "3"))
+    ES_RETRY_ON_TIMEOUT: bool = os.environ.get("ES_RETRY_ON_TIMEOUT", "true").lower() == "true"
+    HTTP_MAX_CONNECTIONS: int = int(os.environ.get("HTTP_MAX_CONNECTIONS", "50"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+    HTTP_TIMEOUT: float = float(os.environ.get("HTTP_TIMEOUT", "60"))
+    HTTP_CONNECT_TIMEOUT: float = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "10"))
+    HTTP_RETRIES: int = int(os.environ.get("HTTP_RETRIES", "2"))
 
     ELASTIC_PASSWORD: str = os.environ.get("ELASTIC_PASSWORD", "")
     ELASTIC_USERNAME: str = os.environ.get("ELASTIC_USERNAME", "elastic")
     ELASTICSEARCH_HOST: str = os.environ.get("ELASTICSEARCH_HOST", "http://localhost:9200")
     APP_CERT_PATH: str = os.environ.get("APP_CERT_PATH", "")
 
+    ALERT_DEDUP_BUCKET_MINUTES: int = int(os.environ.get("ALERT_DEDUP_BUCKET_MINUTES", "60"))
+    ALERT_SEEN_TTL_SECONDS: int = int(os.environ.get("ALERT_SEEN_TTL_SECONDS", str(48 * 3600)))
+    ALERT_MAX_RAW_EVENTS: int = int(os.environ.get("ALERT_MAX_RAW_EVENTS", "500"))
+
+    RULES_DIR: str = os.environ.get("RULES_DIR", str(BASE_DIR.parent / "rules"))
+    RULES_RELOAD_SECONDS: int = int(os.environ.get("RULES_RELOAD_SECONDS", "30"))
+    IOC_DIR: str = os.environ.get("IOC_DIR", str(BASE_DIR.parent / "ioc"))
+    IOC_RELOAD_SECONDS: int = int(os.environ.get("IOC_RELOAD_SECONDS", "60"))
+    # "python" scans every event in-process; "aggregation" screens threshold rules in Elasticsearch first
+    RULE_EXECUTION_MODE: str = os.environ.get("RULE_EXECUTION_MODE", "python")
+    ES_COMPOSITE_PAGE_SIZE: int = int(os.environ.get("ES_COMPOSITE_PAGE_SIZE", "1000"))
+    ES_CANDIDATE_KEYS_PER_QUERY: int = int(os.environ.get("ES_CANDIDATE_KEYS_PER_QUERY", "100"))
+
+    # Per-entity failed-logon baselining (state in Redis, memory capped by the settings below)
+    BASELINE_ENABLED: bool = os.environ.get("BASELINE_ENABLED", "false").lower() == "true"
+    BASELINE_INTERVAL_MINUTES: int = int(os.environ.get("BASELINE_INTERVAL_MINUTES", "10"))
+    BASELINE_SETTLE_INTERVALS: int = int(os.environ.get("BASELINE_SETTLE_INTERVALS", "1"))
+    BASELINE_HALF_LIFE_HOURS: float = float(os.environ.get("BASELINE_HALF_LIFE_HOURS", "24"))
+    BASELINE_Z_THRESHOLD: float = float(os.environ.get("BASELINE_Z_THRESHOLD", "4.0"))
+    BASELINE_STD_FLOOR: float = float(os.environ.get("BASELINE_STD_FLOOR", "1.0"))
+    BASELINE_MIN_COUNT: int = int(os.environ.get("BASELINE_MIN_COUNT", "5"))
+    BASELINE_MIN_OBSERVATIONS: int = int(os.environ.get("BASELINE_MIN_OBSERVATIONS", "36"))
+    BASELINE_COLD_START_COUNT: int = int(os.environ.get("BASELINE_COLD_START_COUNT", "20"))
+    BASELINE_MAX_ENTITIES: int = int(os.environ.get("BASELINE_MAX_ENTITIES", "50000"))
+    BASELINE_CMS_WIDTH: int = int(os.environ.get("BASELINE_CMS_WIDTH", "4096"))
+    BASELINE_CMS_DEPTH: int = int(os.environ.get("BASELINE_CMS_DEPTH", "4"))
+    BASELINE_SPRAY_TARGETS: int = int(os.environ.get("BASELINE_SPRAY_TARGETS", "15"))
+    BASELINE_SPRAY_MAX_PER_TARGET: int = int(os.environ.get("BASELINE_SPRAY_MAX_PER_TARGET", "3"))
+    BASELINE_LOCK_TIMEOUT: int = int(os.environ.get("BASELINE_LOCK_TIMEOUT", "120"))
+    BASELINE_LOCK_WAIT: int = int(os.environ.get("BASELINE_LOCK_WAIT", "5"))
+
+    # Password spray: distinct target users per source IP in a sliding window
+    SPRAY_ENABLED: bool = os.environ.get("SPRAY_ENABLED", "true").lower() == "true"
+    SPRAY_DISTINCT_USERS: int = int(os.environ.get("SPRAY_DISTINCT_USERS", "10"))
+    SPRAY_WINDOW_MINUTES: float = float(os.environ.get("SPRAY_WINDOW_MINUTES", "30"))
+    SPRAY_MAX_TRACKED_IPS: int = int(os.environ.get("SPRAY_MAX_TRACKED_IPS", "200000"))
+    SPRAY_MAX_USERS_PER_IP: int = int(os.environ.get("SPRAY_MAX_USERS_PER_IP", "500"))
+
+    # Distribute shardable rules across Celery workers by consistent hash of their grouping key
+    RULE_SHARDING_ENABLED: bool = os.environ.get("RULE_SHARDING_ENABLED", "false").lower() == "true"
+    SHARD_VIRTUAL_NODES: int = int(os.environ.get("SHARD_VIRTUAL_NODES", "64"))
+    SHARD_HEARTBEAT_SECONDS: int = int(os.environ.get("SHARD_HEARTBEAT_SECONDS", "15"))
+    SHARD_MEMBER_TTL_SECONDS: int = int(os.environ.get("SHARD_MEMBER_TTL_SECONDS", "45"))
+    SHARD_TASK_EXPIRES_SECONDS: int = int(os.environ.get("SHARD_TASK_EXPIRES_SECONDS", "300"))
+
+    # Chunked evaluation of long windows: time slices sized by event count, evaluated as a chord
+    CHUNK_MAX_EVENTS: int = int(os.environ.get("CHUNK_MAX_EVENTS", "50000"))
+    CHUNK_MAX_MINUTES: int = int(os.environ.get("CHUNK_MAX_MINUTES", "60"))
+    CHUNK_HISTOGRAM_MINUTES: int = int(os.environ.get("CHUNK_HISTOGRAM_MINUTES", "5"))
+    CHUNK_OVERLAP_MINUTES: int = int(os.environ.get("CHUNK_OVERLAP_MINUTES", "60")) # >= longest rule window
+    CHUNK_SLICES_PER_TASK: int = int(os.environ.get("CHUNK_SLICES_PER_TASK", "1"))
+    CHUNK_PAGE_SIZE: int = int(os.environ.get("CHUNK_PAGE_SIZE", "5000"))
+    CHUNK_RESULT_TTL_SECONDS: int = int(os.environ.get("CHUNK_RESULT_TTL_SECONDS", "3600"))
+
+    # Replaying history through rules: partitions (capped at CHUNK_MAX_EVENTS) run on their
+    # own queue, at most BACKFILL_PARALLELISM at a time, so live evaluation keeps its workers
+    BACKFILL_QUEUE: str = os.environ.get("BACKFILL_QUEUE", "backfill")
+    BACKFILL_PARALLELISM: int = int(os.environ.get("BACKFILL_PARALLELISM", "4"))
+    BACKFILL_MAX_MINUTES: int = int(os.environ.get("BACKFILL_MAX_MINUTES", "360"))
+    BACKFILL_STATE_TTL_SECONDS: int = int(os.environ.get("BACKFILL_STATE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+    INCIDENT_WINDOW_MINUTES: int = int(os.environ.get("INCIDENT_WINDOW_MINUTES", "120"))
+    INCIDENT_LOOKBACK_HOURS: int = int(os.environ.get("INCIDENT_LOOKBACK_HOURS", "24"))
+    INCIDENT_MIN_ALERTS: int = int(os.environ.get("INCIDENT_MIN_ALERTS", "2"))
+    INCIDENT_MAX_ALERTS: int = int(os.environ.get("INCIDENT_MAX_ALERTS", "5000"))
+
+    # Read-path degraded mode: after ES_BREAKER_FAILURE_THRESHOLD consecutive failures Elasticsearch
+    # is skipped for ES_BREAKER_RESET_SECONDS and the last good alert pages are served from memory
+    ES_BREAKER_FAILURE_THRESHOLD: int = int(os.environ.get("ES_BREAKER_FAILURE_THRESHOLD", "5"))
+    ES_BREAKER_RESET_SECONDS: int = int(os.environ.get("ES_BREAKER_RESET_SECONDS", "30"))
+    ALERT_PAGE_CACHE_SIZE: int = int(os.environ.get("ALERT_PAGE_CACHE_SIZE", "128"))
+
+    ES_NUMBER_OF_SHARDS: int = int(os.environ.get("ES_NUMBER_OF_SHARDS", "1"))
+    ES_NUMBER_OF_REPLICAS: int = int(os.environ.get("ES_NUMBER_OF_REPLICAS", "0"))
+    ES_EVENTS_TOTAL_FIELDS_LIMIT: int = int(os.environ.get("ES_EVENTS_TOTAL_FIELDS_LIMIT", "2000"))
+    ES_EVENTS_WARM_AFTER_DAYS: int = int(os.environ.get("ES_EVENTS_WARM_AFTER_DAYS", "7"))
+    ES_EVENTS_DELETE_AFTER_DAYS: int = int(os.environ.get("ES_EVENTS_DELETE_AFTER_DAYS", "90"))
+    ES_ALERTS_ROLLOVER_MAX_AGE: str = os.environ.get("ES_ALERTS_ROLLOVER_MAX_AGE", "30d")
+    ES_ALERTS_ROLLOVER_MAX_SIZE: str = os.environ.get("ES_ALERTS_ROLLOVER_MAX_SIZE", "10gb")
+    ES_ALERTS_WARM_AFTER_DAYS: int = int(os.environ.get("ES_ALERTS_WARM_AFTER_DAYS", "30"))
+    ES_ALERTS_DELETE_AFTER_DAYS: int = int(os.environ.get("ES_ALERTS_DELETE_AFTER_DAYS", "365"))
+
+    PROFILING_ENABLED: bool = os.environ.get("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILE_DIR: str = os.environ.get("PROFILE_DIR", "/tmp/boron-profiles")
+    PROFILE_MAX_KEPT: int = int(os.environ.get("PROFILE_MAX_KEPT", "50"))
+
 class DevelopmentConfig(BaseConfig):
     DEBUG = True
     TESTING = True
@@ -0,0 +1,217 @@
+import os
+from typing import Callable, Dict, Optional
+
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Buckets tuned for in-process work (rule evaluation) vs. network round trips
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+NETWORK_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (0, 10, 100, 1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000)
+
+# Gauges report the largest value among live processes when Gunicorn workers are
+# aggregated in multiprocess mode (PROMETHEUS_MULTIPROC_DIR); a dead worker's are dropped
+
+RULE_EVALUATION_SECONDS = Histogram(
+    "boron_rule_evaluation_seconds",
+    "Time spent evaluating a single alert rule",
+    ["rule"],
+    buckets=FAST_BUCKETS,
+)
+
+RULE_EVENTS_SCANNED = Histogram(
+    "boron_rule_events_scanned",
+    "Number of events handed to a rule per evaluation",
+    ["rule"],
+    buckets=SIZE_BUCKETS,
+)
+
+RULE_ALERTS_GENERATED = Counter(
+    "boron_rule_alerts_generated_total",
+    "Alerts produced by each rule",
+    ["rule"],
+)
+
+ES_QUERY_SECONDS = Histogram(
+    "boron_es_query_seconds",
+    "Elasticsearch request latency by AlertService call site",
+    ["call_site"],
+    buckets=NETWORK_BUCKETS,
+)
+
+AZURE_FETCH_SECONDS = Histogram(
+    "boron_azure_fetch_seconds",
+    "Duration of Azure Log Analytics queries",
+    ["workspace"],
+    buckets=NETWORK_BUCKETS,
+)
+
+AZURE_FETCH_ROWS = Histogram(
+    "boron_azure_fetch_rows",
+    "Rows returned by a single Azure Log Analytics query",
+    ["workspace"],
+    buckets=SIZE_BUCKETS,
+)
+
+AZURE_FETCH_FAILURES = Counter(
+    "boron_azure_fetch_failures_total",
+    "Azure Log Analytics slices that failed and were left for the next run",
+    ["workspace"],
+)
+
+LOGSTASH_SEND_SECONDS = Histogram(
+    "boron_logstash_send_seconds",
+    "Time spent shipping a batch of events to Logstash",
+    buckets=NETWORK_BUCKETS,
+)
+
+LOGSTASH_EVENTS_SENT = Counter(
+    "boron_logstash_events_sent_total",
+    "Events written to the Logstash TCP input",
+)
+
+LOGSTASH_BYTES_SENT = Counter(
+    "boron_logstash_bytes_sent_total",
+    "Bytes written to the Logstash TCP input",
+)
+
+INGEST_SPOOL_RECORDS = Counter(
+    "boron_ingest_spool_records_total",
+    "Events written to the ingestion spool and acknowledged by Logstash",
+    ["stage"],
+)
+
+INGEST_SPOOL_PENDING_BYTES = Gauge(
+    "boron_ingest_spool_pending_bytes",
+    "Spooled bytes not yet acknowledged by Logstash",
+    multiprocess_mode="livemax",
+)
+
+INGEST_STREAM_LENGTH = Gauge(
+    "boron_ingest_stream_length",
+    "Entries currently retained in the ingestion stream",
+    multiprocess_mode="livemax",
+)
+
+INGEST_STREAM_LAG = Gauge(
+    "boron_ingest_stream_lag",
+    "Stream entries not yet delivered to each consumer group",
+    ["group"],
+    multiprocess_mode="livemax",
+)
+
+INGEST_STREAM_PENDING = Gauge(
+    "boron_ingest_stream_pending",
+    "Entries delivered to each consumer group but not yet acknowledged",
+    ["group"],
+    multiprocess_mode="livemax",
+)
+
+INGEST_STREAM_ACKED = Counter(
+    "boron_ingest_stream_acked_total",
+    "Stream entries acknowledged by each consumer group",
+    ["group"],
+)
+
+DETECTION_LATENCY_SECONDS = Histogram(
+    "boron_detection_latency_seconds",
+    "Time from receiving fetched events to storing the alerts they raised, by detection path",
+    ["path"],
+    buckets=FAST_BUCKETS,
+)
+
+CIRCUIT_BREAKER_OPEN = Gauge(
+    "boron_circuit_breaker_open",
+    "1 while a circuit breaker is open (calls to its dependency are skipped), else 0",
+    ["breaker"],
+    multiprocess_mode="livemax",
+)
+
+CACHE_REQUESTS = Counter(
+    "boron_cache_requests_total",
+    "Cache lookups by cache name and result (hit/miss)",
+    ["cache", "result"],
+)
+
+IOC_INDICATORS = Gauge(
+    "boron_ioc_indicators",
+    "Threat-intel indicators currently loaded, by kind",
+    ["kind"],
+    multiprocess_mode="livemax",
+)
+
+SHARD_WORKERS = Gauge(
+    "boron_shard_workers",
+    "Live workers on the rule-sharding hash ring, as last seen by this process",
+    multiprocess_mode="livemax",
+)
+
+SHARD_REBALANCES = Counter(
+    "boron_shard_rebalances_total",
+    "Times this process rebuilt the rule-sharding ring after workers joined or left",
+)
+
+
+# client name -> callable returning {"in_use": n, "idle": n, "max": n}, or None before the client exists
+PoolUsage = Callable[[], Optional[Dict[str, int]]]
+_pool_usage: Dict[str, PoolUsage] = {}
+
+
+class _PoolCollector:
+    """Reads connection-pool usage at scrape time instead of on every checkout"""
+
+    def collect(self):
+        connections = GaugeMetricFamily(
+            "boron_client_pool_connections",
+            "Pooled connections held by this process, by client and state (in_use/idle)",
+            labels=["client", "state"],
+        )
+        limit = GaugeMetricFamily(
+            "boron_client_pool_max_connections",
+            "Configured connection limit of each client pool",
+            labels=["client"],
+        )
+        for client, usage in sorted(_pool_usage.items()):
+            try:
+                stats = usage()
+            except Exception:
+                stats = None # pool internals changed or client mid-rebuild; skip this scrape
+            if not stats:
+                continue
+            connections.add_metric([client, "in_use"], stats["in_use"])
+            connections.add_metric([client, "idle"], stats["idle"])
+            limit.add_metric([client], stats["max"])
+        yield connections
+        yield limit
+
+
+def register_pool_usage(client: str, usage: PoolUsage):
+    """Export ``client``'s pool usage as boron_client_pool_* gauges"""
+    _pool_usage[client] = usage
+
+
+_pool_collector = _PoolCollector()
+REGISTRY.register(_pool_collector)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    """Count a cache hit or miss; hit ratio = hit / (hit + miss)"""
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def render_metrics() -> bytes:
+    """Render metrics in the Prometheus text exposition format.
+
+    Under Gunicorn (PROMETHEUS_MULTIPROC_DIR set) every worker writes its samples to
+    files in that directory, and a scrape aggregates all of them instead of showing
+    only the worker that happened to answer. Pool usage is still this process's own.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_pool_collector)
+    return generate_latest(registry)
+
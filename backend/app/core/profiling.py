@@ -0,0 +1,191 @@
+import os
+import re
+import time
+import uuid
+import pstats
+import cProfile
+import logging
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Boron-Profile"
+PROFILE_ID_HEADER = "X-Boron-Profile-Id"
+
+# Artifact name -> file suffix written for every profile
+PROFILE_ARTIFACTS = {
+    "pstats": ".pstats",
+    "collapsed": ".collapsed",
+    "memory": ".memory.txt",
+}
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]+-[a-z0-9_-]+-[0-9a-f]{8}$")
+
+# cProfile cannot be nested; the outermost profiled block wins
+_profiling_active: contextvars.ContextVar[bool] = contextvars.ContextVar("boron_profiling_active", default=False)
+
+FuncKey = Tuple[str, int, str]
+
+
+def header_requests_profile(value: Optional[str]) -> bool:
+    """Returns True if a request header value asks for profiling."""
+    return bool(value) and value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9_-]+", "-", name.lower()).strip("-")[:48] or "profile"
+
+
+def _frame_name(func: FuncKey) -> str:
+    filename, lineno, funcname = func
+    if filename == "~":
+        # Built-ins are reported as ('~', 0, '<built-in method ...>')
+        return funcname.replace(";", ",")
+    return f"{funcname} ({os.path.basename(filename)}:{lineno})".replace(";", ",")
+
+
+def collapse_stats(stats: pstats.Stats, max_depth: int = 64) -> List[str]:
+    """Convert cProfile call-graph data into collapsed stacks ("a;b;c <microseconds>").
+
+    cProfile only records caller/callee edges, so the time spent on each path is
+    approximated by splitting a function's time across its callers in proportion
+    to the cumulative time each caller attributed to it. The output can be fed
+    straight into flamegraph.pl or speedscope.
+    """
+    raw: Dict[FuncKey, Any] = stats.stats  # type: ignore[attr-defined]
+    callees: Dict[FuncKey, List[FuncKey]] = {}
+    for func, (_cc, _nc, _tt, _ct, callers) in raw.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+
+    weights: Dict[str, float] = {}
+
+    def visit(func: FuncKey, stack: List[FuncKey], path_time: float):
+        _cc, _nc, tt, ct, _callers = raw[func]
+        if ct <= 0 or path_time <= 0:
+            return
+        key = ";".join(_frame_name(f) for f in stack)
+        weights[key] = weights.get(key, 0.0) + path_time * (tt / ct)
+        if len(stack) >= max_depth:
+            return
+        for callee in callees.get(func, []):
+            if callee in stack:
+                continue  # recursion is already accounted for in the callee's totals
+            callee_ct = raw[callee][3]
+            edge_ct = raw[callee][4][func][3]
+            if callee_ct > 0:
+                visit(callee, stack + [callee], path_time * (edge_ct / ct))
+
+    roots = [func for func, entry in raw.items() if not entry[4]]
+    for root in roots:
+        visit(root, [root], raw[root][3])
+
+    lines = []
+    for key, seconds in weights.items():
+        micros = int(seconds * 1_000_000)
+        if micros > 0:
+            lines.append(f"{key} {micros}")
+    lines.sort()
+    return lines
+
+
+def _write_profile(profile_id: str, profiler: cProfile.Profile, snapshot: Optional[tracemalloc.Snapshot]):
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    base = os.path.join(settings.PROFILE_DIR, profile_id)
+
+    profiler.dump_stats(base + PROFILE_ARTIFACTS["pstats"])
+    stats = pstats.Stats(profiler)
+    with open(base + PROFILE_ARTIFACTS["collapsed"], "w") as f:
+        f.write("\n".join(collapse_stats(stats)) + "\n")
+
+    with open(base + PROFILE_ARTIFACTS["memory"], "w") as f:
+        if snapshot is None:
+            f.write("tracemalloc was already tracing in this process; no snapshot taken\n")
+        else:
+            for stat in snapshot.statistics("lineno")[:50]:
+                f.write(f"{stat}\n")
+
+    _prune_profiles()
+    logger.info(f"Stored profile {profile_id} in {settings.PROFILE_DIR}")
+
+
+def _prune_profiles():
+    """Keep only the newest PROFILE_MAX_KEPT profiles on disk."""
+    profiles = list_profiles()
+    for entry in profiles[settings.PROFILE_MAX_KEPT:]:
+        for suffix in PROFILE_ARTIFACTS.values():
+            try:
+                os.remove(os.path.join(settings.PROFILE_DIR, entry["id"] + suffix))
+            except FileNotFoundError:
+                pass
+
+
+@contextmanager
+def profiled(name: str, trace_memory: bool = True) -> Iterator[Optional[str]]:
+    """Profile the enclosed block with cProfile (and tracemalloc) and persist the results.
+
+    Yields the profile id, or None when an enclosing block is already profiling.
+    """
+    if _profiling_active.get():
+        yield None
+        return
+
+    profile_id = f"{int(time.time())}-{_slug(name)}-{uuid.uuid4().hex[:8]}"
+    profiler = cProfile.Profile()
+    owns_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+    token = _profiling_active.set(True)
+
+    if owns_tracemalloc:
+        tracemalloc.start(25)
+    profiler.enable()
+    try:
+        yield profile_id
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot() if owns_tracemalloc else None
+        if owns_tracemalloc:
+            tracemalloc.stop()
+        _profiling_active.reset(token)
+        try:
+            _write_profile(profile_id, profiler, snapshot)
+        except OSError as e:
+            logger.error(f"Error writing profile {profile_id}: {e}")
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """List stored profiles, newest first."""
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return []
+
+    profiles = []
+    suffix = PROFILE_ARTIFACTS["pstats"]
+    for filename in os.listdir(settings.PROFILE_DIR):
+        if not filename.endswith(suffix):
+            continue
+        profile_id = filename[:-len(suffix)]
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            continue
+        profiles.append({
+            "id": profile_id,
+            "created_at": int(profile_id.split("-", 1)[0]),
+            "artifacts": [
+                name for name, sfx in PROFILE_ARTIFACTS.items()
+                if os.path.exists(os.path.join(settings.PROFILE_DIR, profile_id + sfx))
+            ]
+        })
+
+    profiles.sort(key=lambda p: (p["created_at"], p["id"]), reverse=True)
+    return profiles
+
+
+def profile_artifact_path(profile_id: str, artifact: str) -> Optional[str]:
+    """Resolve the on-disk path of a profile artifact, or None if it does not exist."""
+    if artifact not in PROFILE_ARTIFACTS or not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = os.path.join(settings.PROFILE_DIR, profile_id + PROFILE_ARTIFACTS[artifact])
+    return path if os.path.exists(path) else None
@@ -0,0 +1,76 @@
+import struct
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Any
+
+import msgpack
+import zstandard
+from kombu.serialization import register
+
+from app.core.config import settings
+
+SERIALIZER_NAME = "boron-msgpack"
+CONTENT_TYPE = "application/x-boron-msgpack"
+
+# Extension types: aware datetimes keep their UTC offset, naive ones stay naive
+_EXT_DATETIME = 1
+_EXT_NAIVE_DATETIME = 2
+
+# One leading byte says whether the msgpack body that follows is zstd-compressed
+_PLAIN = b"\x00"
+_ZSTD = b"\x01"
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = _EPOCH.replace(tzinfo=timezone.utc)
+
+
+def _micros(delta: timedelta) -> int:
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            return msgpack.ExtType(_EXT_NAIVE_DATETIME, struct.pack(">q", _micros(obj - _EPOCH)))
+        offset = int(obj.utcoffset().total_seconds() // 60)
+        return msgpack.ExtType(_EXT_DATETIME, struct.pack(">qh", _micros(obj - _EPOCH_UTC), offset))
+    if isinstance(obj, Enum):
+        return obj.value # as Alert.to_dict writes severity/status
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Cannot serialize {type(obj).__name__} for a task payload")
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    if code == _EXT_DATETIME:
+        micros, offset = struct.unpack(">qh", data)
+        moment = _EPOCH_UTC + timedelta(microseconds=micros)
+        return moment.astimezone(timezone(timedelta(minutes=offset)))
+    if code == _EXT_NAIVE_DATETIME:
+        (micros,) = struct.unpack(">q", data)
+        return _EPOCH + timedelta(microseconds=micros)
+    return msgpack.ExtType(code, data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Pack a task payload, zstd-compressing it once it reaches TASK_PAYLOAD_COMPRESS_THRESHOLD bytes"""
+    body = msgpack.packb(obj, default=_default, use_bin_type=True)
+    threshold = settings.TASK_PAYLOAD_COMPRESS_THRESHOLD
+    if threshold and len(body) >= threshold:
+        return _ZSTD + zstandard.ZstdCompressor(level=settings.TASK_PAYLOAD_ZSTD_LEVEL).compress(body)
+    return _PLAIN + body
+
+
+def loads(data: bytes) -> Any:
+    data = bytes(data)
+    marker, body = data[:1], data[1:]
+    if marker == _ZSTD:
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif marker != _PLAIN:
+        raise ValueError(f"Unknown task payload encoding {marker!r}")
+    return msgpack.unpackb(body, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+def register_serializer():
+    """Make the compact serializer available to kombu under SERIALIZER_NAME"""
+    register(SERIALIZER_NAME, dumps, loads, content_type=CONTENT_TYPE, content_encoding="binary")
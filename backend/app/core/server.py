@@ -0,0 +1,15 @@
+from uvicorn_worker import UvicornWorker
+
+
+class BoronUvicornWorker(UvicornWorker):
+    """Gunicorn worker running the ASGI app on uvloop with the httptools parser.
+
+    Gunicorn's graceful_timeout also bounds how long uvicorn drains in-flight
+    requests on SIGTERM before closing them.
+    """
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.timeout_graceful_shutdown = self.cfg.graceful_timeout
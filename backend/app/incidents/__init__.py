@@ -0,0 +1,5 @@
+from fastapi import APIRouter
+
+incidents_router = APIRouter(prefix="/incidents", tags=["incidents"])
+
+from . import routes, tasks
@@ -0,0 +1,214 @@
+import hashlib
+from typing import List, Dict, Any, Optional, Tuple, Set
+from datetime import datetime
+from dataclasses import dataclass, field
+
+from app.alerts.models import Alert, AlertSeverity, AlertStatus
+
+import logging
+logger = logging.getLogger(__name__)
+
+SEVERITY_RANK = {
+    AlertSeverity.LOW: 0,
+    AlertSeverity.MEDIUM: 1,
+    AlertSeverity.HIGH: 2,
+    AlertSeverity.CRITICAL: 3
+}
+
+# Placeholder/shared values that would glue unrelated alerts together
+IGNORED_ENTITY_VALUES = {"", "-", "unknown", "system", "anonymous logon", "local service", "network service", "127.0.0.1", "::1"}
+
+Entity = Tuple[str, str]
+
+@dataclass
+class Incident:
+    id: str
+    title: str
+    severity: AlertSeverity
+    status: AlertStatus
+    first_seen: datetime
+    last_seen: datetime
+    alert_count: int
+    alert_ids: List[str]
+    rules: List[str]
+    users: List[str]
+    source_ips: List[str]
+    hosts: List[str]
+    # Compact summary of every member alert so a single read returns the whole chain
+    alerts: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "severity": self.severity.value,
+            "status": self.status.value,
+            "first_seen": self.first_seen.isoformat(),
+            "last_seen": self.last_seen.isoformat(),
+            "alert_count": self.alert_count,
+            "alert_ids": self.alert_ids,
+            "rules": self.rules,
+            "users": self.users,
+            "source_ips": self.source_ips,
+            "hosts": self.hosts,
+            "alerts": self.alerts
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Incident':
+        """Create Incident instance from dictionary"""
+        return cls(
+            id=data["id"],
+            title=data["title"],
+            severity=AlertSeverity(data["severity"]),
+            status=AlertStatus(data["status"]),
+            first_seen=datetime.fromisoformat(data["first_seen"].replace('Z', '+00:00')),
+            last_seen=datetime.fromisoformat(data["last_seen"].replace('Z', '+00:00')),
+            alert_count=data["alert_count"],
+            alert_ids=data.get("alert_ids", []),
+            rules=data.get("rules", []),
+            users=data.get("users", []),
+            source_ips=data.get("source_ips", []),
+            hosts=data.get("hosts", []),
+            alerts=data.get("alerts", [])
+        )
+
+def _clean(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    text = str(value).strip()
+    if text.lower() in IGNORED_ENTITY_VALUES:
+        return None
+    return text
+
+def alert_hosts(alert: Alert) -> List[str]:
+    """Host names seen in an alert's raw events"""
+    hosts = []
+    for event in alert.raw_events:
+        host = event.get("host")
+        name = _clean(host.get("name") if isinstance(host, dict) else event.get("host.name"))
+        if name and name not in hosts:
+            hosts.append(name)
+    return hosts
+
+def alert_entities(alert: Alert) -> Set[Entity]:
+    """The (type, value) entities an alert can be correlated on"""
+    entities: Set[Entity] = set()
+    for user in alert.affected_users:
+        value = _clean(user)
+        if value:
+            # Windows account names are case-insensitive
+            entities.add(("user", value.lower()))
+    for ip in alert.source_ips:
+        value = _clean(ip)
+        if value:
+            entities.add(("ip", value))
+    for host in alert_hosts(alert):
+        entities.add(("host", host.lower()))
+    return entities
+
+class UnionFind:
+    """Disjoint-set forest with path halving and union by size"""
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, item: int) -> int:
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a: int, b: int):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+
+def incident_id(alerts: List[Alert]) -> str:
+    """Incidents are keyed on their earliest alert so the id survives later alerts joining"""
+    anchor = min(alerts, key=lambda a: (a.timestamp, a.id))
+    return f"incident_{hashlib.sha1(anchor.id.encode('utf-8')).hexdigest()[:20]}"
+
+def _alert_summary(alert: Alert, hosts: List[str]) -> Dict[str, Any]:
+    return {
+        "id": alert.id,
+        "title": alert.title,
+        "severity": alert.severity.value,
+        "timestamp": alert.timestamp.isoformat(),
+        "event_count": alert.event_count,
+        "affected_users": alert.affected_users,
+        "source_ips": alert.source_ips,
+        "hosts": hosts
+    }
+
+def build_incident(alerts: List[Alert]) -> Incident:
+    alerts = sorted(alerts, key=lambda a: (a.timestamp, a.id))
+    users: List[str] = []
+    source_ips: List[str] = []
+    hosts: List[str] = []
+    rules: List[str] = []
+    summaries = []
+    for alert in alerts:
+        member_hosts = alert_hosts(alert)
+        summaries.append(_alert_summary(alert, member_hosts))
+        for values, target in ((alert.affected_users, users), (alert.source_ips, source_ips), (member_hosts, hosts), ([alert.title], rules)):
+            for value in values:
+                if _clean(value) and value not in target:
+                    target.append(value)
+
+    severity = max((a.severity for a in alerts), key=lambda s: SEVERITY_RANK[s])
+    focus = users[0] if users else (hosts[0] if hosts else (source_ips[0] if source_ips else "unknown entity"))
+    return Incident(
+        id=incident_id(alerts),
+        title=f"{len(alerts)} correlated alerts involving {focus}",
+        severity=severity,
+        status=AlertStatus.OPEN,
+        first_seen=alerts[0].timestamp,
+        last_seen=alerts[-1].timestamp,
+        alert_count=len(alerts),
+        alert_ids=[a.id for a in alerts],
+        rules=rules,
+        users=users,
+        source_ips=source_ips,
+        hosts=hosts,
+        alerts=summaries
+    )
+
+def correlate_alerts(alerts: List[Alert], window_minutes: int, min_alerts: int = 2) -> List[Incident]:
+    """Group alerts that share a user, source IP or host within ``window_minutes`` of each other.
+
+    Alerts are swept in time order while an inverted index remembers the last alert
+    seen for each entity; an alert is unioned with that alert when it falls inside the
+    window. Linking is transitive (single-linkage), so a brute-force alert, the group
+    change it enabled and the processes run afterwards end up in one incident.
+    Runs in O(n log n + total entities) time.
+    """
+    if not alerts:
+        return []
+
+    ordered = sorted(alerts, key=lambda a: (a.timestamp, a.id))
+    window_seconds = window_minutes * 60
+    forest = UnionFind(len(ordered))
+    last_seen: Dict[Entity, Tuple[int, float]] = {}
+
+    for index, alert in enumerate(ordered):
+        ts = alert.timestamp.timestamp()
+        for entity in alert_entities(alert):
+            previous = last_seen.get(entity)
+            if previous is not None and ts - previous[1] <= window_seconds:
+                forest.union(index, previous[0])
+            last_seen[entity] = (index, ts)
+
+    groups: Dict[int, List[Alert]] = {}
+    for index, alert in enumerate(ordered):
+        groups.setdefault(forest.find(index), []).append(alert)
+
+    incidents = [build_incident(members) for members in groups.values() if len(members) >= min_alerts]
+    incidents.sort(key=lambda i: i.last_seen, reverse=True)
+    return incidents
@@ -0,0 +1,64 @@
+from fastapi import HTTPException, Query
+from typing import Optional, List, Dict, Any
+from pydantic import BaseModel
+
+from . import incidents_router
+from .service import incident_service
+from app.alerts.models import AlertSeverity, AlertStatus
+
+
+class IncidentStatusUpdate(BaseModel):
+    status: AlertStatus
+
+@incidents_router.get("/")
+async def get_incidents(
+    status: Optional[AlertStatus] = Query(None, description="Filter by incident status"),
+    severity: Optional[AlertSeverity] = Query(None, description="Filter by incident severity"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of incidents to return")
+) -> List[Dict[str, Any]]:
+    """Get incidents with optional filtering"""
+    try:
+        return incident_service.get_incidents(status=status, severity=severity, limit=limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching incidents: {str(e)}")
+
+
+@incidents_router.post("/correlate")
+async def correlate_incidents(hours: int = Query(24, ge=1, le=168, description="Hours of alerts to correlate")) -> Dict[str, Any]:
+    """Manually trigger alert correlation"""
+    try:
+        incidents = incident_service.correlate_and_store(hours=hours)
+        return {
+            "message": f"Correlated {len(incidents)} incidents",
+            "incident_count": len(incidents)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error correlating incidents: {str(e)}")
+
+
+@incidents_router.get("/{incident_id}")
+async def get_incident(incident_id: str) -> Dict[str, Any]:
+    """Get an incident and the alerts that make up its attack chain"""
+    incident = incident_service.get_incident(incident_id)
+    if incident is None:
+        raise HTTPException(status_code=404, detail=f"Incident {incident_id} not found")
+    return incident
+
+
+@incidents_router.patch("/{incident_id}/status")
+async def update_incident_status(incident_id: str, status_update: IncidentStatusUpdate) -> Dict[str, Any]:
+    """Update the status of an incident"""
+    try:
+        success = incident_service.update_incident_status(incident_id, status_update.status)
+        if not success:
+            raise HTTPException(status_code=404, detail=f"Incident {incident_id} not found or could not be updated")
+
+        return {
+            "message": f"Incident {incident_id} status updated to {status_update.status.value}",
+            "incident_id": incident_id,
+            "new_status": status_update.status.value
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating incident status: {str(e)}")
@@ -0,0 +1,218 @@
+import logging
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timezone
+
+from app.core.config import settings
+from app.core.metrics import ES_QUERY_SECONDS
+from app.alerts.indices import ALERTS_ALIAS
+from app.alerts.models import Alert, AlertStatus, AlertSeverity
+from app.alerts.service import alert_service
+from .models import Incident, correlate_alerts
+
+logger = logging.getLogger(__name__)
+
+INCIDENTS_INDEX = "security-incidents"
+
+# Alert fields needed for correlation; raw events are reduced to their host
+ALERT_SOURCE_FIELDS = [
+    "id", "title", "description", "severity", "status", "source", "timestamp",
+    "event_count", "affected_users", "source_ips", "event_ids", "raw_events.host.name"
+]
+
+def incidents_index_mappings() -> Dict[str, Any]:
+    return {
+        "properties": {
+            "id": {"type": "keyword"},
+            "title": {"type": "text"},
+            "severity": {"type": "keyword"},
+            "status": {"type": "keyword"},
+            "first_seen": {"type": "date"},
+            "last_seen": {"type": "date"},
+            "alert_count": {"type": "integer"},
+            "alert_ids": {"type": "keyword"},
+            "rules": {"type": "keyword"},
+            "users": {"type": "keyword"},
+            "source_ips": {"type": "ip", "ignore_malformed": True},
+            "hosts": {"type": "keyword"},
+            "alerts": {"type": "object", "enabled": False},
+            "created_at": {"type": "date"},
+            "updated_at": {"type": "date"}
+        }
+    }
+
+class IncidentService:
+    """Correlates stored alerts into incidents; shares the AlertService Elasticsearch client"""
+
+    def __init__(self):
+        self._index_ready = False
+
+    @property
+    def es(self):
+        return alert_service.es
+
+    def _ensure_incidents_index(self):
+        if self._index_ready or not self.es:
+            return
+        try:
+            if not self.es.indices.exists(index=INCIDENTS_INDEX):
+                self.es.indices.create(
+                    index=INCIDENTS_INDEX,
+                    settings={
+                        "number_of_shards": settings.ES_NUMBER_OF_SHARDS,
+                        "number_of_replicas": settings.ES_NUMBER_OF_REPLICAS
+                    },
+                    mappings=incidents_index_mappings()
+                )
+                logger.info(f"Created incidents index {INCIDENTS_INDEX}")
+            self._index_ready = True
+        except Exception as e:
+            logger.error(f"Error creating incidents index: {e}")
+
+    def get_alerts_for_correlation(self, hours: Optional[int] = None) -> List[Alert]:
+        """Fetch stored alerts from the correlation lookback window"""
+        if not self.es:
+            logger.warning("Elasticsearch not available, no alerts to correlate")
+            return []
+
+        hours = hours or settings.INCIDENT_LOOKBACK_HOURS
+        try:
+            with ES_QUERY_SECONDS.labels(call_site="get_alerts_for_correlation").time():
+                response = self.es.search(
+                    index=ALERTS_ALIAS,
+                    query={"bool": {"filter": [{"range": {"timestamp": {"gte": f"now-{hours}h"}}}]}},
+                    source=ALERT_SOURCE_FIELDS,
+                    # Newest first so the cap drops the oldest alerts, not the most recent ones
+                    sort=[{"timestamp": {"order": "desc"}}],
+                    size=settings.INCIDENT_MAX_ALERTS
+                )
+            hits = response["hits"]["hits"]
+            total = response["hits"].get("total", {}).get("value", len(hits))
+            if total > len(hits):
+                logger.warning(
+                    f"Correlating the newest {len(hits)} of {total} alerts from the last {hours}h; "
+                    f"raise INCIDENT_MAX_ALERTS to include the rest"
+                )
+            alerts = []
+            for hit in reversed(hits):
+                try:
+                    alerts.append(Alert.from_dict(hit["_source"]))
+                except (KeyError, ValueError) as e:
+                    logger.warning(f"Skipping malformed alert {hit.get('_id')}: {e}")
+            return alerts
+        except Exception as e:
+            logger.error(f"Error fetching alerts for correlation: {e}")
+            return []
+
+    def correlate(self, alerts: Optional[List[Alert]] = None, hours: Optional[int] = None) -> List[Incident]:
+        """Group alerts into incidents by shared user, source IP and host"""
+        if alerts is None:
+            alerts = self.get_alerts_for_correlation(hours=hours)
+        incidents = correlate_alerts(alerts, settings.INCIDENT_WINDOW_MINUTES, settings.INCIDENT_MIN_ALERTS)
+        logger.info(f"Correlated {len(alerts)} alerts into {len(incidents)} incidents")
+        return incidents
+
+    def store_incident(self, incident: Incident) -> bool:
+        """Upsert an incident; an analyst-set status is kept when membership changes"""
+        if not self.es:
+            logger.warning("Elasticsearch not available, cannot store incident")
+            return False
+
+        self._ensure_incidents_index()
+        try:
+            now = datetime.now(timezone.utc).isoformat()
+            document = incident.to_dict()
+            document["updated_at"] = now
+            update = {k: v for k, v in document.items() if k != "status"}
+
+            with ES_QUERY_SECONDS.labels(call_site="store_incident").time():
+                self.es.update(
+                    index=INCIDENTS_INDEX,
+                    id=incident.id,
+                    doc=update,
+                    upsert={**document, "created_at": now},
+                    retry_on_conflict=3
+                )
+                # Incidents that have since merged into this one are superseded
+                self.es.delete_by_query(
+                    index=INCIDENTS_INDEX,
+                    query={
+                        "bool": {
+                            "filter": [{"terms": {"alert_ids": incident.alert_ids}}],
+                            "must_not": [{"ids": {"values": [incident.id]}}]
+                        }
+                    },
+                    conflicts="proceed"
+                )
+            logger.info(f"Stored incident {incident.id} with {incident.alert_count} alerts")
+            return True
+        except Exception as e:
+            logger.error(f"Error storing incident {incident.id}: {e}")
+            return False
+
+    def correlate_and_store(self, hours: Optional[int] = None) -> List[Incident]:
+        incidents = self.correlate(hours=hours)
+        for incident in incidents:
+            self.store_incident(incident)
+        return incidents
+
+    def get_incidents(self,
+                      status: Optional[AlertStatus] = None,
+                      severity: Optional[AlertSeverity] = None,
+                      limit: int = 100) -> List[Dict[str, Any]]:
+        """Get stored incidents, most recently active first"""
+        if not self.es:
+            logger.warning("Elasticsearch not available, returning no incidents")
+            return []
+
+        filters = []
+        if status:
+            filters.append({"term": {"status": status.value}})
+        if severity:
+            filters.append({"term": {"severity": severity.value}})
+
+        try:
+            with ES_QUERY_SECONDS.labels(call_site="get_incidents").time():
+                response = self.es.search(
+                    index=INCIDENTS_INDEX,
+                    query={"bool": {"filter": filters}} if filters else {"match_all": {}},
+                    sort=[{"last_seen": {"order": "desc"}}],
+                    size=limit,
+                    ignore_unavailable=True
+                )
+            return [hit["_source"] for hit in response["hits"]["hits"]]
+        except Exception as e:
+            logger.error(f"Error retrieving incidents: {e}")
+            return []
+
+    def get_incident(self, incident_id: str) -> Optional[Dict[str, Any]]:
+        """Get one incident including the summary of every alert in its chain"""
+        if not self.es:
+            return None
+        try:
+            with ES_QUERY_SECONDS.labels(call_site="get_incident").time():
+                response = self.es.get(index=INCIDENTS_INDEX, id=incident_id)
+            return response["_source"]
+        except Exception as e:
+            logger.error(f"Error retrieving incident {incident_id}: {e}")
+            return None
+
+    def update_incident_status(self, incident_id: str, status: AlertStatus) -> bool:
+        """Update the status of an incident"""
+        if not self.es:
+            logger.warning("Elasticsearch not available, cannot update incident")
+            return False
+        try:
+            with ES_QUERY_SECONDS.labels(call_site="update_incident_status").time():
+                self.es.update(
+                    index=INCIDENTS_INDEX,
+                    id=incident_id,
+                    doc={"status": status.value, "updated_at": datetime.now(timezone.utc).isoformat()}
+                )
+            logger.info(f"Updated incident {incident_id} status to {status.value}")
+            return True
+        except Exception as e:
+            logger.error(f"Error updating incident {incident_id} status: {e}")
+            return False
+
+# Global incident service instance
+incident_service = IncidentService()
@@ -0,0 +1,14 @@
+import logging
+from celery import shared_task
+
+from .service import incident_service
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name="incidents.correlate")
+def correlate_incidents_task(hours: int = 24) -> int:
+    """Correlate recent stored alerts into incidents"""
+    incidents = incident_service.correlate_and_store(hours=hours)
+    logger.info(f"Correlated {len(incidents)} incidents in Celery task")
+    return len(incidents)
@@ -4,4 +4,4 @@ log_router = APIRouter(
     prefix="/logs"
 )
 
-from . import service
\ No newline at end of file
+from . import service, tasks
\ No newline at end of file
@@ -0,0 +1,25 @@
+import re
+from typing import Any, Dict
+
+# Addresses Logstash leaves in IpAddress instead of promoting to source.ip (and geo-locating)
+_PRIVATE_IP = re.compile(r"^(10\.|192\.168\.|172\.(1[6-9]|2[0-9]|3[01])\.|127\.|::1)")
+
+
+def to_security_event(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a flattened Azure row like the document Logstash indexes (logstash/pipeline/logstash.conf).
+
+    Lets rules run on events straight from the fetch, before indexing: TimeGenerated
+    becomes @timestamp, EventID event.id, Computer host.name, and a public IpAddress
+    source.ip. GeoIP enrichment and the document fingerprint are not reproduced.
+    """
+    event = dict(row)
+    if "TimeGenerated" in event:
+        event["@timestamp"] = event.pop("TimeGenerated")
+    if "EventID" in event:
+        event["event"] = {"id": event.pop("EventID")}
+    if "Computer" in event:
+        event["host"] = {"name": event.pop("Computer")}
+    ip = event.get("IpAddress")
+    if ip and not _PRIVATE_IP.match(str(ip)):
+        event["source"] = {"ip": event.pop("IpAddress")}
+    return event
@@ -1,17 +1,29 @@
 import time
-import httpx
 import socket
 import ssl
 import json
 import logging
 import sys
+import threading
 import redis
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
 from azure.identity import ClientSecretCredential
-from typing import Any, List, Dict
+from typing import Any, List, Dict, Optional
 from datetime import datetime, timedelta, timezone
 
-from app.core.config import settings
+from app.core.config import settings, WorkspaceConfig
+from app.core.clients import redis_client, http_client
+from app.core.metrics import (
+    AZURE_FETCH_SECONDS, AZURE_FETCH_ROWS, AZURE_FETCH_FAILURES, LOGSTASH_SEND_SECONDS,
+    LOGSTASH_EVENTS_SENT, LOGSTASH_BYTES_SENT, DETECTION_LATENCY_SECONDS, record_cache_lookup
+)
+from app.alerts.service import alert_service
+from app.alerts.streaming import StreamingDetector
 from app.log import log_router
+from app.log.events import to_security_event
+from app.log.spool import spool
+from app.log.stream import publish_events
 
 
 logging.basicConfig(
@@ -22,75 +34,295 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-_token_cache = {
-    "access_token": None,
-    "expires_at": 0
-}
-
 REDIS_KEY = "azure:last_fetch_time"
-QUERY_TEMPLATE = "SecurityEvent | where TimeGenerated > datetime('{}')"
+QUERY_TEMPLATE = "SecurityEvent | where TimeGenerated > datetime('{}') and TimeGenerated <= datetime('{}')"
+
+TOKEN_SCOPE = "https://api.loganalytics.io/.default"
+TOKEN_REDIS_KEY = "azure:access_token"
+TOKEN_LOCK_KEY = "azure:access_token:refresh_lock"
+
+# Tokens and credentials are cached per service principal ("<tenant_id>:<client_id>")
+_token_cache: Dict[str, Dict[str, Any]] = {}
+_credentials: Dict[str, ClientSecretCredential] = {}
+_credential_lock = threading.Lock()
+
+_refresher_thread = None
+_refresher_stop = threading.Event()
+
+_startup_ingested = False
+
+def _default_workspace() -> WorkspaceConfig:
+    return settings.AZURE_WORKSPACES[0]
 
-# Connect to Redis (adjust host/port/db as needed)
-redis_client = redis.Redis(host="redis", port=6379, decode_responses=True)
+def _identity(workspace: WorkspaceConfig) -> str:
+    return f"{workspace.tenant_id}:{workspace.client_id}"
 
-def token_expired() -> bool:
+def _local_token(identity: str) -> Dict[str, Any]:
+    return _token_cache.setdefault(identity, {"access_token": None, "expires_at": 0})
+
+def token_expired(workspace: Optional[WorkspaceConfig] = None) -> bool:
     """Returns True if token is missing or expired."""
-    return time.time() >= _token_cache["expires_at"]
+    identity = _identity(workspace or _default_workspace())
+    return time.time() >= _local_token(identity)["expires_at"]
 
-def get_access_token() -> str:
-    """Returns cached token or fetches a new one if expired."""
-    if not token_expired():
-        return _token_cache["access_token"]
+def get_credential(workspace: Optional[WorkspaceConfig] = None) -> ClientSecretCredential:
+    """Returns the process-wide credential for the workspace's tenant, creating it on first use."""
+    workspace = workspace or _default_workspace()
+    identity = _identity(workspace)
+    with _credential_lock:
+        if identity not in _credentials:
+            _credentials[identity] = ClientSecretCredential (
+                tenant_id = workspace.tenant_id,
+                client_id = workspace.client_id,
+                client_secret = workspace.client_secret
+                )
+        return _credentials[identity]
+
+def _read_shared_token(identity: str) -> Optional[Dict[str, Any]]:
+    """Returns the token published in Redis by any worker, or None."""
+    try:
+        value = redis_client.get(f"{TOKEN_REDIS_KEY}:{identity}")
+    except redis.RedisError as e:
+        logger.warning(f"Could not read shared Azure token from Redis: {e}")
+        return None
+    if not value:
+        return None
+    try:
+        return json.loads(str(value))
+    except ValueError:
+        return None
+
+def _publish_token(identity: str, access_token: str, expires_at: float):
+    local = _local_token(identity)
+    local["access_token"] = access_token
+    local["expires_at"] = expires_at
 
-    credential = ClientSecretCredential (
-        tenant_id = settings.TENANT_ID,
-        client_id = settings.CLIENT_ID,
-        client_secret = settings.CLIENT_SECRET
+    ttl = int(expires_at - time.time())
+    if ttl <= 0:
+        return
+    try:
+        redis_client.set(
+            f"{TOKEN_REDIS_KEY}:{identity}",
+            json.dumps({"access_token": access_token, "expires_at": expires_at}),
+            ex=ttl
         )
-    token = credential.get_token("https://api.loganalytics.io/.default")
-    _token_cache["access_token"] = token.token
-    _token_cache["expires_at"] = token.expires_on - 60 # buffer
+    except redis.RedisError as e:
+        logger.warning(f"Could not publish Azure token to Redis: {e}")
+
+def _fetch_token_from_azure(workspace: WorkspaceConfig) -> str:
+    token = get_credential(workspace).get_token(TOKEN_SCOPE)
+    _publish_token(_identity(workspace), token.token, token.expires_on - 60) # buffer
+    return token.token
+
+def refresh_access_token(workspace: Optional[WorkspaceConfig] = None, min_remaining: float = 0) -> str:
+    """Refresh the token under a distributed lock so only one process hits Azure AD.
+
+    A token that is still valid for more than ``min_remaining`` seconds after the
+    lock is acquired (i.e. another process refreshed it meanwhile) is reused.
+    """
+    workspace = workspace or _default_workspace()
+    identity = _identity(workspace)
+    try:
+        lock = redis_client.lock(
+            f"{TOKEN_LOCK_KEY}:{identity}",
+            timeout=settings.AZURE_TOKEN_LOCK_TIMEOUT,
+            blocking_timeout=settings.AZURE_TOKEN_LOCK_WAIT
+        )
+        acquired = lock.acquire()
+    except redis.RedisError as e:
+        logger.warning(f"Token refresh lock unavailable, refreshing locally: {e}")
+        return _fetch_token_from_azure(workspace)
+
+    try:
+        shared = _read_shared_token(identity)
+        if shared and shared["expires_at"] - time.time() > min_remaining:
+            _local_token(identity).update(shared)
+            return shared["access_token"]
+
+        if not acquired:
+            logger.warning("Timed out waiting for token refresh lock, refreshing locally")
+        return _fetch_token_from_azure(workspace)
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except redis.RedisError:
+                pass # lock expired while fetching; another process may now hold it
+
+def get_access_token(workspace: Optional[WorkspaceConfig] = None) -> str:
+    """Returns cached token or fetches a new one if expired."""
+    workspace = workspace or _default_workspace()
+    identity = _identity(workspace)
+    local = _local_token(identity)
+    if not token_expired(workspace):
+        record_cache_lookup("azure_token", hit=True)
+        return local["access_token"]
+
+    shared = _read_shared_token(identity)
+    if shared and shared["expires_at"] > time.time():
+        record_cache_lookup("azure_token", hit=True)
+        local.update(shared)
+        return local["access_token"]
+
+    record_cache_lookup("azure_token", hit=False)
+    return refresh_access_token(workspace)
 
-    return _token_cache["access_token"]
+def _unique_identities() -> List[WorkspaceConfig]:
+    seen = {}
+    for workspace in settings.AZURE_WORKSPACES:
+        seen.setdefault(_identity(workspace), workspace)
+    return list(seen.values())
 
-def get_last_fetch_time() -> datetime:
-    value = redis_client.get(REDIS_KEY)
+def _token_refresher_loop():
+    margin = settings.AZURE_TOKEN_REFRESH_MARGIN
+    while not _refresher_stop.is_set():
+        wait = None
+        for workspace in _unique_identities():
+            remaining = _local_token(_identity(workspace))["expires_at"] - margin - time.time()
+            if remaining <= 0:
+                try:
+                    refresh_access_token(workspace, min_remaining=margin)
+                except Exception as e:
+                    logger.error(f"Background Azure token refresh for tenant {workspace.tenant_id} failed: {e}")
+                remaining = _local_token(_identity(workspace))["expires_at"] - margin - time.time()
+            wait = remaining if wait is None else min(wait, remaining)
+        # Never spin: retry failures (or unexpectedly short-lived tokens) after 30s
+        _refresher_stop.wait(max(wait or 0, 30))
+
+def start_token_refresher():
+    """Start a daemon thread that refreshes every tenant's token before it expires."""
+    global _refresher_thread
+    if _refresher_thread and _refresher_thread.is_alive():
+        return
+    _refresher_stop.clear()
+    _refresher_thread = threading.Thread(target=_token_refresher_loop, name="azure-token-refresher", daemon=True)
+    _refresher_thread.start()
+
+def stop_token_refresher():
+    _refresher_stop.set()
+
+def _watermark_key(workspace_id: Optional[str]) -> str:
+    return REDIS_KEY if workspace_id is None else f"{REDIS_KEY}:{workspace_id}"
+
+def get_last_fetch_time(workspace_id: Optional[str] = None) -> datetime:
+    value = redis_client.get(_watermark_key(workspace_id))
+    if not value and workspace_id is not None:
+        # Resume from the pre multi-workspace global watermark on first run
+        value = redis_client.get(REDIS_KEY)
     if value:
         return datetime.fromisoformat(str(value))
     # Default to 1 hour ago if no value
     return datetime.now(timezone.utc) - timedelta(hours=1)
 
-def save_last_fetch_time(timestamp: datetime):
-    redis_client.set(REDIS_KEY, timestamp.isoformat())
+def save_last_fetch_time(timestamp: datetime, workspace_id: Optional[str] = None):
+    redis_client.set(_watermark_key(workspace_id), timestamp.isoformat())
 
-def fetch_all_security_logs() -> List[Dict[str, Any]]:
-    """Fetch all security events from Azure Log Analytics and returns a flat list of dicts"""
-    logger.info("Getting access token...")
-    try:
-        token = get_access_token()
-        last_fetch_time = get_last_fetch_time().isoformat()
-
-        url = f"https://api.loganalytics.io/v1/workspaces/{settings.WORKSPACE_ID}/query"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        body = {"query": QUERY_TEMPLATE.format(last_fetch_time)}
-
-    
-        resp = httpx.post(url, headers=headers, json=body, timeout=60)
+def fetch_workspace_logs(workspace: WorkspaceConfig, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """Fetch one (start, end] slice of a workspace, spool it, and advance its watermark to ``end``.
+
+    The watermark only moves once the slice is durably in the spool, so a failure
+    to ship it later is replayed from disk instead of being lost.
+    """
+    token = get_access_token(workspace)
+
+    url = f"https://api.loganalytics.io/v1/workspaces/{workspace.workspace_id}/query"
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+    body = {"query": QUERY_TEMPLATE.format(start.isoformat(), end.isoformat())}
+
+    with AZURE_FETCH_SECONDS.labels(workspace=workspace.name).time():
+        resp = http_client.post(url, headers=headers, json=body)
         resp.raise_for_status()
+    received = time.perf_counter()
+
+    data = resp.json()
+    logs = flatten_response(data)
+    AZURE_FETCH_ROWS.labels(workspace=workspace.name).observe(len(logs))
+    for entry in logs:
+        entry["_workspace"] = workspace.name
+
+    spool.append(logs)
+    save_last_fetch_time(end, workspace.workspace_id)
+    if settings.INLINE_DETECTION_ENABLED:
+        detect_inline(workspace.name, logs, received)
+    return logs
+
+# One sliding window per workspace: a workspace catching up on its backlog must not
+# push another one's events out of a window keyed on the newest timestamp seen
+_inline_detectors: Dict[str, StreamingDetector] = {}
+_inline_detectors_lock = threading.Lock()
+
+def detect_inline(workspace: str, logs: List[Dict[str, Any]], received: Optional[float] = None) -> int:
+    """Evaluate freshly fetched rows against the workspace's sliding window and store the alerts.
+
+    Alerts are stored within the fetch that saw their events, instead of after
+    Logstash, the index refresh and the next scheduled rule run. Alerts still in
+    the window are re-stored as no-ops by store_alert's seen-set. The slice is
+    already spooled, so a detection error is logged rather than failing the fetch.
+    Returns the number of alerts the window raised.
+    """
+    received = received or time.perf_counter()
+    with _inline_detectors_lock:
+        detector = _inline_detectors.setdefault(workspace, StreamingDetector())
 
-        save_last_fetch_time(datetime.now(timezone.utc))
+    try:
+        alerts = detector.process(to_security_event(entry) for entry in logs)
+        for alert in alerts:
+            alert_service.store_alert(alert)
+    except Exception as e:
+        logger.error(f"Inline detection failed for {len(logs)} events from {workspace}: {e}")
+        return 0
+    if alerts:
+        DETECTION_LATENCY_SECONDS.labels(path="inline").observe(time.perf_counter() - received)
+    return len(alerts)
+
+def fetch_all_security_logs(workspaces: Optional[List[WorkspaceConfig]] = None) -> List[Dict[str, Any]]:
+    """Fetch security events from every configured workspace and return a flat list of dicts.
+
+    Each workspace's backlog is split into INGEST_SLICE_MINUTES slices. Workspaces
+    take turns in FIFO order with at most one slice in flight each, and at most
+    INGEST_MAX_CONCURRENCY slices run at once, so a workspace with a large backlog
+    cannot starve the others. A workspace whose slice fails is logged, counted and
+    left for the next run from its saved watermark; what the other workspaces
+    produced is still returned.
+    """
+    workspaces = workspaces or settings.AZURE_WORKSPACES
+    run_end = datetime.now(timezone.utc)
+    slice_length = timedelta(minutes=settings.INGEST_SLICE_MINUTES)
 
-        data = resp.json()
-        return flatten_response(data)
+    logger.info(f"Fetching security logs from {len(workspaces)} workspace(s)...")
+    ready = deque((workspace, get_last_fetch_time(workspace.workspace_id)) for workspace in workspaces)
+    slices_fetched = {workspace.name: 0 for workspace in workspaces}
+    in_flight: Dict[Future, Any] = {}
+    all_logs: List[Dict[str, Any]] = []
 
-    except httpx.HTTPError as e:
-        logger.error(f"Error fetching Azure logs: {e}")
-        raise
+    max_workers = max(1, min(settings.INGEST_MAX_CONCURRENCY, len(workspaces)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="azure-fetch") as pool:
+        while ready or in_flight:
+            while ready and len(in_flight) < max_workers:
+                workspace, start = ready.popleft()
+                end = start + slice_length
+                if end >= run_end - slice_length / 10:
+                    end = run_end # fold a tiny remainder into this slice instead of querying it alone
+                in_flight[pool.submit(fetch_workspace_logs, workspace, start, end)] = (workspace, end)
 
-    return []
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                workspace, end = in_flight.pop(future)
+                try:
+                    all_logs.extend(future.result())
+                except Exception as e:
+                    logger.error(f"Error fetching Azure logs for workspace {workspace.name}: {e}")
+                    AZURE_FETCH_FAILURES.labels(workspace=workspace.name).inc()
+                    continue
+
+                slices_fetched[workspace.name] += 1
+                if end < run_end and slices_fetched[workspace.name] < settings.INGEST_MAX_SLICES_PER_RUN:
+                    ready.append((workspace, end))
+
+    return all_logs
 
 def flatten_response(response_json) -> List[Dict[str, Any]]:
     table = response_json.get("tables", [])
@@ -117,16 +349,51 @@ def send_logs_to_logstash(logs: List[Dict[str, Any]]):
         context.verify_mode = ssl.CERT_REQUIRED
 
         # Connect to Logstash over TCP
-        with socket.create_connection(("logstash", 5000)) as sock:
+        with LOGSTASH_SEND_SECONDS.time(), socket.create_connection(("logstash", 5000)) as sock:
             # Wrap socket with SSL; server_hostname must match Logstash cert SAN (e.g. "logstash")
             with context.wrap_socket(sock, server_hostname="logstash") as ssl_sock:
                 for entry in logs:
-                    line = json.dumps(entry, default=str) + "\n"
-                    ssl_sock.sendall(line.encode("utf-8"))
+                    line = (json.dumps(entry, default=str) + "\n").encode("utf-8")
+                    ssl_sock.sendall(line)
+                    LOGSTASH_EVENTS_SENT.inc()
+                    LOGSTASH_BYTES_SENT.inc(len(line))
 
     except Exception as e:
         logger.error(f"Error sending logs to Logstash: {e}")
         return False
 
     print("Finished sending logs.")
-    return True
\ No newline at end of file
+    return True
+
+def ship_spooled_logs() -> int:
+    """Ship everything in the spool, oldest first; returns the events acknowledged.
+
+    Events go to Logstash directly, or with INGEST_STREAM_ENABLED to the ingestion
+    stream, whose consumer groups ship, evaluate and archive them independently.
+    Includes events left over from a failed or interrupted earlier run, so delivery
+    is at-least-once without re-querying Azure.
+    """
+    if settings.INGEST_STREAM_ENABLED:
+        shipped = spool.drain(publish_events)
+        logger.info(f"Published {shipped} spooled events to {settings.INGEST_STREAM_KEY}")
+    else:
+        shipped = spool.drain(send_logs_to_logstash)
+        logger.info(f"Shipped {shipped} spooled events to Logstash")
+    return shipped
+
+def run_startup_ingestion() -> bool:
+    """Fetch the Azure backlog and ship it to Logstash once per process tree.
+
+    The production server calls this in the Gunicorn master before forking, so
+    workers inherit the flag and skip it instead of each re-ingesting the backlog.
+    Returns False when it already ran or STARTUP_INGEST_ENABLED is off.
+    """
+    global _startup_ingested
+    if _startup_ingested or not settings.STARTUP_INGEST_ENABLED:
+        return False
+    _startup_ingested = True
+    try:
+        fetch_all_security_logs()
+    finally:
+        ship_spooled_logs()
+    return True
@@ -0,0 +1,222 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import INGEST_SPOOL_PENDING_BYTES, INGEST_SPOOL_RECORDS
+
+logger = logging.getLogger(__name__)
+
+# Record framing: payload length and CRC32, then the JSON payload
+_HEADER = struct.Struct(">II")
+_SEGMENT_SUFFIX = ".seg"
+_ACK_FILE = "ack.json"
+_LOCK_FILE = ".lock"
+
+# (segment number, byte offset just past a record)
+Position = Tuple[int, int]
+
+
+class Spool:
+    """Append-only on-disk queue between the Azure fetch and the Logstash shipper.
+
+    Records are appended to numbered segment files and fsynced before append()
+    returns, so a caller can move its watermark once they are on disk. The shipper
+    reads segments through mmap from the acknowledged position, and only after a
+    batch is delivered is that position saved (atomically) and fully shipped segments
+    deleted. Anything written but not acknowledged is shipped again after a crash,
+    so delivery is at-least-once. A torn record at the tail, from a crash mid-write,
+    ends the readable data and is cut off before the next append.
+
+    One lock file serialises appends and draining across threads and processes.
+    """
+
+    def __init__(self, directory: str, segment_bytes: Optional[int] = None, fsync: Optional[bool] = None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes or settings.INGEST_SPOOL_SEGMENT_BYTES
+        self.fsync = settings.INGEST_SPOOL_FSYNC if fsync is None else fsync
+        self._lock = threading.Lock()
+        # Where this process last left the newest segment; saves rescanning it when unchanged
+        self._tail: Optional[Position] = None
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(os.path.join(self.directory, _LOCK_FILE), "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:020d}{_SEGMENT_SUFFIX}")
+
+    def _segments(self) -> List[int]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name[:-len(_SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(_SEGMENT_SUFFIX))
+
+    def _sync_directory(self):
+        if self.fsync:
+            fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _read_ack(self) -> Position:
+        try:
+            with open(os.path.join(self.directory, _ACK_FILE)) as handle:
+                data = json.load(handle)
+            return int(data["segment"]), int(data["offset"])
+        except FileNotFoundError:
+            return 0, 0
+        except (ValueError, KeyError) as e:
+            # Never drop data over a bad ack file: replay from the oldest segment
+            logger.error(f"Unreadable spool ack file, replaying all segments: {e}")
+            return 0, 0
+
+    def _write_ack(self, position: Position):
+        path = os.path.join(self.directory, _ACK_FILE)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as handle:
+            json.dump({"segment": position[0], "offset": position[1]}, handle)
+            handle.flush()
+            if self.fsync:
+                os.fsync(handle.fileno())
+        os.replace(temporary, path)
+        self._sync_directory()
+
+    @staticmethod
+    def _scan(segment_file) -> Iterator[Tuple[int, bytes]]:
+        """Yield (end offset, payload) of each intact record in an open segment"""
+        size = os.fstat(segment_file.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            offset = 0
+            while offset + _HEADER.size <= size:
+                length, checksum = _HEADER.unpack_from(view, offset)
+                end = offset + _HEADER.size + length
+                if end > size:
+                    break
+                payload = view[offset + _HEADER.size:end]
+                if zlib.crc32(payload) != checksum:
+                    break
+                yield end, payload
+                offset = end
+
+    def _valid_length(self, segment: int) -> int:
+        path = self._segment_path(segment)
+        if self._tail == (segment, os.path.getsize(path)):
+            return self._tail[1]
+        with open(path, "rb") as handle:
+            end = 0
+            for end, _ in self._scan(handle):
+                pass
+            return end
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Durably append records; returns how many were written"""
+        frames = []
+        for record in records:
+            payload = json.dumps(record, default=str).encode("utf-8")
+            frames.append(_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        if not frames:
+            return 0
+
+        with self._locked():
+            segments = self._segments()
+            segment = segments[-1] if segments else self._read_ack()[0] + 1
+            length = self._valid_length(segment) if segments else 0
+            if length >= self.segment_bytes:
+                segment, length = segment + 1, 0
+            with open(self._segment_path(segment), "r+b" if segments and length else "wb") as handle:
+                handle.truncate(length) # drop a torn tail left by a crash mid-write
+                handle.seek(length)
+                for frame in frames:
+                    handle.write(frame)
+                handle.flush()
+                if self.fsync:
+                    os.fsync(handle.fileno())
+                self._tail = (segment, handle.tell())
+            if segment not in segments:
+                self._sync_directory()
+            INGEST_SPOOL_RECORDS.labels(stage="written").inc(len(frames))
+            INGEST_SPOOL_PENDING_BYTES.set(self._pending_bytes())
+        return len(frames)
+
+    def _pending_bytes(self) -> int:
+        acked_segment, acked_offset = self._read_ack()
+        total = 0
+        for segment in self._segments():
+            if segment >= acked_segment:
+                size = os.path.getsize(self._segment_path(segment))
+                total += size - (acked_offset if segment == acked_segment else 0)
+        return max(total, 0)
+
+    def _pending(self) -> Iterator[Tuple[Position, Dict[str, Any]]]:
+        acked_segment, acked_offset = self._read_ack()
+        for segment in self._segments():
+            if segment < acked_segment:
+                continue
+            start = acked_offset if segment == acked_segment else 0
+            with open(self._segment_path(segment), "rb") as handle:
+                for end, payload in self._scan(handle):
+                    if end > start:
+                        yield (segment, end), json.loads(payload)
+
+    def _ack(self, position: Position):
+        self._write_ack(position)
+        segments = self._segments()
+        for segment in segments[:-1]: # the newest segment is still being appended to
+            if segment < position[0] or (segment == position[0]
+                                         and position[1] >= os.path.getsize(self._segment_path(segment))):
+                os.remove(self._segment_path(segment))
+
+    def drain(self, send: Callable[[List[Dict[str, Any]]], bool], batch_size: Optional[int] = None) -> int:
+        """Ship pending records in batches through ``send``; stops at the first failed batch.
+
+        A batch is acknowledged only when ``send`` returns True. Returns the number
+        of records acknowledged.
+        """
+        batch_size = batch_size or settings.INGEST_SPOOL_BATCH_SIZE
+        shipped = 0
+        with self._locked():
+            batch: List[Dict[str, Any]] = []
+            position: Optional[Position] = None
+            records = self._pending()
+            while True:
+                for position_, record in records:
+                    batch.append(record)
+                    position = position_
+                    if len(batch) >= batch_size:
+                        break
+                if not batch:
+                    break
+                if not send(batch):
+                    logger.warning(f"Spool delivery failed, {len(batch)} events kept for replay")
+                    break
+                self._ack(position)
+                shipped += len(batch)
+                INGEST_SPOOL_RECORDS.labels(stage="acked").inc(len(batch))
+                batch = []
+            INGEST_SPOOL_PENDING_BYTES.set(self._pending_bytes())
+        return shipped
+
+    def pending_count(self) -> int:
+        with self._locked():
+            return sum(1 for _ in self._pending())
+
+
+# Shared by every fetch thread and the shipper in this process
+spool = Spool(settings.INGEST_SPOOL_DIR)
@@ -0,0 +1,180 @@
+import gzip
+import json
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import redis
+
+from app.alerts.service import alert_service
+from app.alerts.streaming import StreamingDetector
+from app.core.clients import redis_client
+from app.core.config import settings
+from app.core.metrics import INGEST_STREAM_ACKED, INGEST_STREAM_LAG, INGEST_STREAM_LENGTH, INGEST_STREAM_PENDING
+from app.log.events import to_security_event
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[List[Dict[str, Any]]], Any]
+
+
+def publish_events(events: List[Dict[str, Any]]) -> bool:
+    """Append events to the ingestion stream, trimmed to about INGEST_STREAM_MAXLEN entries.
+
+    Shaped as a spool sender: returns False instead of raising so undelivered
+    events stay spooled. Trimming is approximate and does not wait for slow groups;
+    INGEST_STREAM_MAXLEN must cover the lag any consumer group is allowed to build up.
+    """
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for event in events:
+            pipe.xadd(settings.INGEST_STREAM_KEY, {"event": json.dumps(event, default=str)},
+                      maxlen=settings.INGEST_STREAM_MAXLEN, approximate=True)
+        pipe.execute()
+        return True
+    except redis.RedisError as e:
+        logger.error(f"Error publishing {len(events)} events to {settings.INGEST_STREAM_KEY}: {e}")
+        return False
+
+
+class StreamConsumer:
+    """One consumer group on the ingestion stream, handing batches to ``handler``.
+
+    Each group reads every event at its own pace. Entries are acknowledged (XACK)
+    only after the handler returns; if it raises, they stay pending and are claimed
+    again once idle for INGEST_STREAM_CLAIM_IDLE_MS, by this or another consumer,
+    so delivery is at-least-once.
+    """
+
+    def __init__(self, group: str, handler: Handler, stream: Optional[str] = None):
+        self.group = group
+        self.handler = handler
+        self.stream = stream or settings.INGEST_STREAM_KEY
+        self._group_ready = False
+
+    def ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            # A new group starts from the oldest retained entry rather than only new ones
+            redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    def _read(self, consumer: str, count: int, block_ms: Optional[int]) -> List[Tuple[str, Dict[str, str]]]:
+        claimed = redis_client.xautoclaim(self.stream, self.group, consumer,
+                                          min_idle_time=settings.INGEST_STREAM_CLAIM_IDLE_MS, count=count)
+        entries = [entry for entry in claimed[1] if entry and entry[1] is not None]
+        if entries:
+            return entries
+        response = redis_client.xreadgroup(self.group, consumer, {self.stream: ">"}, count=count, block=block_ms)
+        return response[0][1] if response else []
+
+    def poll(self, consumer: str, count: Optional[int] = None, block_ms: Optional[int] = None) -> int:
+        """Handle one batch (reclaimed stale entries first); returns the number acknowledged"""
+        self.ensure_group()
+        entries = self._read(consumer, count or settings.INGEST_STREAM_BATCH_SIZE, block_ms)
+        if not entries:
+            return 0
+
+        ids, events = [], []
+        for entry_id, fields in entries:
+            ids.append(entry_id)
+            try:
+                events.append(json.loads(fields["event"]))
+            except (KeyError, TypeError, ValueError):
+                logger.error(f"Dropping malformed entry {entry_id} on {self.stream}")
+
+        if events:
+            self.handler(events)
+        redis_client.xack(self.stream, self.group, *ids)
+        INGEST_STREAM_ACKED.labels(group=self.group).inc(len(ids))
+        return len(ids)
+
+    def update_metrics(self):
+        for info in redis_client.xinfo_groups(self.stream):
+            if info["name"] == self.group and info.get("lag") is not None: # None before Redis 7, or once trimming makes it unknown
+                INGEST_STREAM_LAG.labels(group=self.group).set(info["lag"])
+        INGEST_STREAM_PENDING.labels(group=self.group).set(redis_client.xpending(self.stream, self.group)["pending"])
+        INGEST_STREAM_LENGTH.set(redis_client.xlen(self.stream))
+
+    def run(self, consumer: str, stop: threading.Event):
+        """Poll until ``stop`` is set; errors are logged and retried after a pause"""
+        while not stop.is_set():
+            try:
+                self.poll(consumer, block_ms=settings.INGEST_STREAM_BLOCK_MS)
+                self.update_metrics()
+            except Exception as e:
+                logger.error(f"Stream consumer {self.group}/{consumer} failed, retrying: {e}")
+                stop.wait(settings.INGEST_STREAM_RETRY_SECONDS)
+
+
+def _ship_to_logstash(events: List[Dict[str, Any]]):
+    from app.log.service import send_logs_to_logstash # service publishes through this module
+
+    if not send_logs_to_logstash(events):
+        raise ConnectionError("Logstash did not accept the batch")
+
+
+# Sliding window shared by the rules consumer thread of this process
+detector = StreamingDetector()
+
+
+def _evaluate_rules(events: List[Dict[str, Any]]):
+    for alert in detector.process(to_security_event(event) for event in events):
+        alert_service.store_alert(alert)
+
+
+def _archive(events: List[Dict[str, Any]]):
+    """Append events as gzip members to one JSON-lines file per day of TimeGenerated"""
+    by_day: Dict[str, List[str]] = {}
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    for event in events:
+        day = str(event.get("TimeGenerated") or "")[:10] or today
+        by_day.setdefault(day, []).append(json.dumps(event, default=str))
+    os.makedirs(settings.INGEST_ARCHIVE_DIR, exist_ok=True)
+    for day, lines in by_day.items():
+        with gzip.open(os.path.join(settings.INGEST_ARCHIVE_DIR, f"security-events-{day}.jsonl.gz"), "at") as handle:
+            handle.write("\n".join(lines) + "\n")
+
+
+CONSUMER_HANDLERS: Dict[str, Handler] = {
+    "logstash": _ship_to_logstash,
+    "rules": _evaluate_rules,
+    "archive": _archive,
+}
+
+_consumer_threads: List[threading.Thread] = []
+_consumers_stop = threading.Event()
+
+
+def start_stream_consumers(groups: Optional[List[str]] = None):
+    """Start one consumer thread per configured group (INGEST_STREAM_GROUPS) in this process"""
+    if any(thread.is_alive() for thread in _consumer_threads):
+        return
+    _consumer_threads.clear()
+    _consumers_stop.clear()
+    name = f"{socket.gethostname()}-{os.getpid()}"
+    for group in groups or settings.INGEST_STREAM_GROUPS:
+        if group == "rules" and settings.INLINE_DETECTION_ENABLED:
+            continue # rules already ran on these events when they were fetched
+        handler = CONSUMER_HANDLERS.get(group)
+        if handler is None:
+            logger.error(f"Unknown ingestion stream group '{group}', skipping")
+            continue
+        thread = threading.Thread(target=StreamConsumer(group, handler).run, args=(name, _consumers_stop),
+                                  name=f"stream-{group}", daemon=True)
+        thread.start()
+        _consumer_threads.append(thread)
+    logger.info(f"Started ingestion stream consumers: {[t.name for t in _consumer_threads]}")
+
+
+def stop_stream_consumers(timeout: float = 10):
+    _consumers_stop.set()
+    for thread in _consumer_threads:
+        thread.join(timeout)
@@ -0,0 +1,17 @@
+from celery.signals import worker_ready, worker_shutdown
+
+from app.core.config import settings
+from .stream import start_stream_consumers, stop_stream_consumers
+
+
+@worker_ready.connect
+def start_ingest_consumers(sender=None, **kwargs):
+    """Run this worker's share of the ingestion stream consumer groups"""
+    if settings.INGEST_STREAM_ENABLED:
+        start_stream_consumers()
+
+
+@worker_shutdown.connect
+def stop_ingest_consumers(sender=None, **kwargs):
+    if settings.INGEST_STREAM_ENABLED:
+        stop_stream_consumers()
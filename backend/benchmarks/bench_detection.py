@@ -0,0 +1,86 @@
+"""Benchmark inline detection: python -m benchmarks.bench_detection [--slices 60] [--rate 2000] [--window 60]
+
+Feeds one-minute fetch slices of synthetic Azure SecurityEvent rows (a failed-login
+burst every few slices) through fetch_workspace_logs with INLINE_DETECTION_ENABLED,
+with the Azure query, spool fsync and alert storage stubbed out. Reports the
+latency from the Azure response to the slice's alerts being stored, i.e. parsing,
+spooling and evaluating the active rules over the sliding window, as the window
+fills up to --window minutes.
+"""
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+import fakeredis
+
+from app.core.config import WorkspaceConfig, settings
+from app.log import service as log_service
+from app.log.spool import Spool
+
+BASE_TIME = datetime(2025, 9, 3, 10, 0, tzinfo=timezone.utc)
+COLUMNS = ["TimeGenerated", "EventID", "Computer", "IpAddress", "TargetUserName", "EventRecordID"]
+
+
+def make_slice(minute: int, rate: int, burst: bool):
+    rows = []
+    for i in range(rate):
+        at = BASE_TIME + timedelta(minutes=minute, seconds=60 * i / rate)
+        rows.append([at.isoformat().replace("+00:00", "Z"), 4624 if i % 4 else 4625,
+                     f"WS-{i % 200:04d}", f"198.51.{i % 250}.{i % 7}", f"user{i % 500}", minute * rate + i])
+    if burst:
+        for i in range(8):
+            at = BASE_TIME + timedelta(minutes=minute, seconds=i)
+            rows.append([at.isoformat().replace("+00:00", "Z"), 4625, "DC01", "203.0.113.7", "alice", -minute * 10 - i])
+    response = Mock()
+    response.json.return_value = {"tables": [{"name": "SecurityEvent", "columns": [{"name": c} for c in COLUMNS],
+                                              "rows": rows}]}
+    return response
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slices", type=int, default=60, help="one-minute fetch slices to feed")
+    parser.add_argument("--rate", type=int, default=2000, help="events per minute")
+    parser.add_argument("--window", type=int, default=60, help="STREAM_DETECTION_WINDOW_MINUTES")
+    parser.add_argument("--burst-every", type=int, default=5, help="slices between failed-login bursts")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    workspace = WorkspaceConfig("bench", "bench", "tenant", "client", "secret")
+    responses = [make_slice(minute, args.rate, minute % args.burst_every == 0) for minute in range(args.slices)]
+    stored = []
+    latencies = []
+
+    with tempfile.TemporaryDirectory() as directory, \
+         patch.object(log_service, "spool", Spool(directory, fsync=False)), \
+         patch.object(log_service, "redis_client", fakeredis.FakeRedis(decode_responses=True)), \
+         patch.object(log_service, "get_access_token", return_value="token"), \
+         patch.object(log_service.alert_service, "store_alert", side_effect=stored.append), \
+         patch.object(settings, "INLINE_DETECTION_ENABLED", True), \
+         patch.object(settings, "STREAM_DETECTION_WINDOW_MINUTES", args.window):
+        for minute, response in enumerate(responses):
+            start = BASE_TIME + timedelta(minutes=minute)
+            with patch.object(log_service.http_client, "post", return_value=response):
+                started = time.perf_counter()
+                log_service.fetch_workspace_logs(workspace, start, start + timedelta(minutes=1))
+                latencies.append(time.perf_counter() - started)
+        window = len(log_service._inline_detectors[workspace.name])
+
+    events = args.slices * args.rate
+    print(f"{args.slices} slices x {args.rate} events, window {args.window} min ({window:,} events at the end)")
+    print(f"fetch->alert  p50 {statistics.median(latencies) * 1000:8.1f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:8.1f} ms  max {max(latencies) * 1000:8.1f} ms")
+    print(f"throughput    {events / sum(latencies):10,.0f} events/s  ({len(stored)} alert stores)")
+
+
+if __name__ == "__main__":
+    main()
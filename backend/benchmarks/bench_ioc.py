@@ -0,0 +1,60 @@
+"""Benchmark threat-intel matching: python -m benchmarks.bench_ioc [--networks 100000] [--events 1000000]
+
+Times building the CIDR interval index, raw IP lookups, and the IOC rule over a
+synthetic event batch with a realistic amount of repeated source addresses.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.alerts.dsl import EventBatch
+from app.alerts.ioc import IocSnapshot, IocStore
+
+
+def random_ip(rng: random.Random) -> str:
+    return f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--networks", type=int, default=100_000)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--distinct-ips", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    networks = [(f"{random_ip(rng)}/{rng.choice((20, 24, 28, 32, 32))}", rng.choice(("feed_a", "feed_b"))) for _ in range(args.networks)]
+    started = time.perf_counter()
+    snapshot = IocSnapshot(networks=networks)
+    print(f"build:   {len(snapshot.ipv4):,} segments from {args.networks:,} networks in {time.perf_counter() - started:.2f}s")
+
+    pool = [random_ip(rng) for _ in range(args.distinct_ips)]
+    addresses = [rng.choice(pool) for _ in range(args.events)]
+    match_ip = snapshot.match_ip
+    started = time.perf_counter()
+    hits = sum(1 for address in addresses if match_ip(address))
+    seconds = time.perf_counter() - started
+    print(f"lookup:  {args.events:,} uncached lookups in {seconds:.2f}s ({args.events / seconds:,.0f}/s, {hits:,} hits)")
+
+    base = datetime.now(timezone.utc) - timedelta(hours=24)
+    timestamps = [(base + timedelta(seconds=s)).isoformat() for s in range(0, 86400, 2)]
+    batch = EventBatch({
+        "@timestamp": rng.choice(timestamps),
+        "event": {"id": 4624},
+        "source": {"ip": address},
+        "EventRecordID": i
+    } for i, address in enumerate(addresses))
+    batch.select(None)
+
+    store = IocStore()
+    store.snapshot = snapshot
+    started = time.perf_counter()
+    alerts = store.rule.check(batch)
+    seconds = time.perf_counter() - started
+    print(f"rule:    {args.events:,} events in {seconds:.2f}s ({args.events / seconds:,.0f} events/s, {len(alerts):,} alerts)")
+
+
+if __name__ == "__main__":
+    main()
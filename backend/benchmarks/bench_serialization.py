@@ -0,0 +1,91 @@
+"""Benchmark task payload serializers: python -m benchmarks.bench_serialization [--events 10000] [--repeat 20]
+
+Encodes a batch of synthetic security events (the shape get_recent_events returns)
+and the alerts built from them with kombu's JSON serializer and with boron-msgpack,
+with and without zstd, and reports broker bytes and encode/decode time per batch.
+"""
+import argparse
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from kombu import serialization
+
+from app.alerts.models import MultipleFailedLoginsRule
+from app.core.serialization import CONTENT_TYPE, SERIALIZER_NAME, register_serializer
+
+
+def make_events(count: int, seed: int):
+    rng = random.Random(seed)
+    base = datetime(2025, 9, 3, tzinfo=timezone.utc)
+    return [{
+        "@timestamp": (base + timedelta(seconds=i * 3)).isoformat().replace("+00:00", "Z"),
+        "event": {"id": rng.choice([4624, 4625, 4625, 4672, 4688])},
+        "EventRecordID": 1_000_000 + i,
+        "host": {"name": f"WS-{rng.randrange(200):04d}.corp.example.com"},
+        "source": {"ip": f"10.{rng.randrange(4)}.{rng.randrange(256)}.{rng.randrange(256)}"},
+        "TargetUserName": f"user{rng.randrange(500)}",
+        "TargetDomainName": "CORP",
+        "LogonType": rng.choice([2, 3, 10]),
+        "ProcessName": rng.choice(["C:\\Windows\\System32\\svchost.exe", "C:\\Windows\\System32\\lsass.exe", "-"]),
+        "message": "An account failed to log on." if rng.random() < 0.5 else "An account was successfully logged on.",
+    } for i in range(count)]
+
+
+def make_alerts(events, per_alert: int = 100):
+    """Alerts carrying ``per_alert`` raw events each, as the shard/chunk reducers receive them"""
+    rule = MultipleFailedLoginsRule()
+    alerts = []
+    for offset in range(0, len(events) - per_alert + 1, per_alert):
+        batch = events[offset:offset + per_alert]
+        # Same failed-logon key throughout, so the batch becomes one alert
+        same_key = {"event": {"id": 4625}, "source": batch[0]["source"], "TargetUserName": batch[0]["TargetUserName"]}
+        alerts.extend(rule.check([dict(event, **same_key) for event in batch])[:1])
+    return alerts
+
+
+def measure(payload, serializer, accept, repeat):
+    encode = decode = 0.0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        content_type, encoding, data = serialization.dumps(payload, serializer=serializer)
+        encode += time.perf_counter() - started
+        started = time.perf_counter()
+        serialization.loads(data, content_type, encoding, accept=accept)
+        decode += time.perf_counter() - started
+    return len(data), encode / repeat * 1000, decode / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    register_serializer()
+    logging.disable(logging.INFO)
+
+    events = make_events(args.events, args.seed)
+    payloads = {
+        "events": ((events,), {}, {}),
+        "alerts": (([alert.to_dict() for alert in make_alerts(events)],), {}, {}),
+    }
+    variants = [
+        ("json", "json", ["application/json"], None),
+        ("msgpack", SERIALIZER_NAME, [CONTENT_TYPE], 0),
+        ("msgpack+zstd", SERIALIZER_NAME, [CONTENT_TYPE], 1),
+    ]
+    for name, payload in payloads.items():
+        baseline = None
+        for label, serializer, accept, threshold in variants:
+            with patch('app.core.serialization.settings.TASK_PAYLOAD_COMPRESS_THRESHOLD', threshold):
+                size, encode_ms, decode_ms = measure(payload, serializer, accept, args.repeat)
+            baseline = baseline or size
+            print(f"{name:7} {label:13} {size / 1024:9,.1f} KiB ({size / baseline:5.1%})   "
+                  f"encode {encode_ms:7.2f} ms   decode {decode_ms:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Benchmark the server profiles: python -m benchmarks.bench_server [--duration 10] [--concurrency 64]
+
+Starts the app under the development profile (single uvicorn process with --reload)
+and the production profile (gunicorn.conf.py: pre-forked Uvicorn workers on uvloop
+and httptools), drives each with several load-generating processes, and reports
+requests/s and latency percentiles. Startup ingestion is disabled for the runs.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = {
+    "development": lambda port: [sys.executable, "-m", "uvicorn", "main:app", "--reload", "--reload-dir", "app",
+                                 "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+    "production": lambda port: [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+}
+
+
+def start_server(profile: str, port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ, STARTUP_INGEST_ENABLED="false", SERVER_BIND=f"127.0.0.1:{port}",
+               SERVER_ACCESS_LOG="", SERVER_LOG_LEVEL="warning")
+    if workers:
+        env["SERVER_WORKERS"] = str(workers)
+    process = subprocess.Popen(PROFILES[profile](port), cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            time.sleep(0.25)
+    stop_server(process)
+    raise RuntimeError(f"{profile} server did not come up on port {port}")
+
+
+def stop_server(process: subprocess.Popen):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+async def _load(url: str, connections: int, duration: float):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+
+    async with httpx.AsyncClient(limits=limits, timeout=10) as client:
+        async def loop():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+                except httpx.HTTPError:
+                    errors += 1
+
+        await asyncio.gather(*(loop() for _ in range(connections)))
+    return latencies, errors
+
+
+def _load_process(args):
+    return asyncio.run(_load(*args))
+
+
+def run_load(url: str, concurrency: int, clients: int, duration: float):
+    per_client = max(1, concurrency // clients)
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(_load_process, [(url, per_client, duration)] * clients)
+    latencies = sorted(l for result, _ in results for l in result)
+    return latencies, sum(errors for _, errors in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=max(2, multiprocessing.cpu_count() // 2),
+                        help="load-generating processes")
+    parser.add_argument("--workers", type=int, default=0, help="production workers (default: gunicorn.conf.py sizing)")
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    for profile in PROFILES:
+        process = start_server(profile, args.port, args.workers)
+        try:
+            url = f"http://127.0.0.1:{args.port}{args.path}"
+            run_load(url, args.concurrency, args.clients, 1)  # warm up
+            latencies, errors = run_load(url, args.concurrency, args.clients, args.duration)
+        finally:
+            stop_server(process)
+        if not latencies:
+            print(f"{profile:12} no successful requests ({errors:,} errors)")
+            continue
+        p50 = statistics.median(latencies) * 1000
+        p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+        print(f"{profile:12} {len(latencies) / args.duration:10,.0f} req/s   p50 {p50:6.1f} ms   "
+              f"p99 {p99:6.1f} ms   errors {errors:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark compiled Sigma rules: python -m benchmarks.bench_sigma [--rules 500] [--events 1000000]
+
+Generates synthetic Windows Security events and Sigma rules, then times compiling the
+rules, building the shared EventBatch index and evaluating every rule over it.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.alerts.dsl import EventBatch
+from app.alerts.sigma import compile_sigma_documents
+
+EVENT_IDS = [4624, 4625, 4634, 4648, 4672, 4688, 4689, 4720, 4722, 4724, 4726, 4728,
+             4732, 4738, 4740, 4756, 4768, 4769, 4771, 4776, 5140, 5145, 1102, 4697]
+PROCESSES = ["cmd.exe", "powershell.exe", "rundll32.exe", "regsvr32.exe", "mshta.exe", "certutil.exe",
+             "svchost.exe", "explorer.exe", "chrome.exe", "msedge.exe", "wscript.exe", "schtasks.exe"]
+ARGUMENTS = ["-enc AAAA", "/c whoami", "-nop -w hidden", "/s /q", "--type=renderer", "-urlcache -f http://x",
+             "javascript:alert", "/create /tn upd", "", "-File run.ps1"]
+USERS = [f"user{i}" for i in range(200)] + ["administrator", "svc_backup", "svc_sql", "guest"]
+
+
+def make_events(count: int, rng: random.Random):
+    base = datetime.now(timezone.utc) - timedelta(hours=24)
+    # Pre-render timestamps/paths so the generator doesn't dominate memory
+    timestamps = [(base + timedelta(seconds=s)).isoformat() for s in range(0, 86400, 3)]
+    paths = [f"C:\\Windows\\System32\\{p}" for p in PROCESSES]
+    command_lines = [f"{p} {a}".strip() for p in PROCESSES for a in ARGUMENTS]
+    ips = [f"10.{a}.{b}.{c}" for a in range(2) for b in range(4) for c in range(1, 60)]
+    hosts = [f"ws{i:03d}" for i in range(150)]
+    events = []
+    for i in range(count):
+        events.append({
+            "@timestamp": rng.choice(timestamps),
+            "event": {"id": rng.choice(EVENT_IDS)},
+            "host": {"name": rng.choice(hosts)},
+            "EventRecordID": i,
+            "TargetUserName": rng.choice(USERS),
+            "SubjectUserName": rng.choice(USERS),
+            "NewProcessName": rng.choice(paths),
+            "CommandLine": rng.choice(command_lines),
+            "LogonType": rng.choice((2, 3, 10)),
+            "IpAddress": rng.choice(ips)
+        })
+    return events
+
+
+def make_rules(count: int, rng: random.Random):
+    documents = []
+    for i in range(count):
+        ids = rng.sample(EVENT_IDS, rng.choice((1, 1, 2, 3)))
+        selection = {"EventID": ids}
+        shape = i % 5
+        if shape == 0:
+            selection["NewProcessName|endswith"] = [f"\\{p}" for p in rng.sample(PROCESSES, 3)]
+        elif shape == 1:
+            selection["CommandLine|contains"] = rng.sample([a for a in ARGUMENTS if a], 5)
+        elif shape == 2:
+            selection["TargetUserName"] = rng.sample(USERS, 20)
+        elif shape == 3:
+            selection["CommandLine"] = f"*{rng.choice(PROCESSES).split('.')[0]}*{rng.choice(ARGUMENTS[:3]).split()[0]}*"
+        else:
+            selection["LogonType"] = rng.choice((3, 10))
+            selection["IpAddress|cidr"] = f"10.{rng.randrange(2)}.{rng.randrange(4)}.0/24"
+        detection = {"selection": selection, "condition": "selection"}
+        if i % 3 == 0:
+            detection["filter"] = {"SubjectUserName|startswith": "svc_"}
+            detection["condition"] = "selection and not filter"
+        documents.append({
+            "title": f"Synthetic Rule {i}",
+            "id": f"bench-{i}",
+            "level": rng.choice(("low", "medium", "high", "critical")),
+            "logsource": {"product": "windows", "service": "security"},
+            "detection": detection
+        })
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", type=int, default=500)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    started = time.perf_counter()
+    events = make_events(args.events, rng)
+    documents = make_rules(args.rules, rng)
+    print(f"generated {len(events):,} events and {len(documents)} rules in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    rules = compile_sigma_documents(documents, origin="benchmark")
+    print(f"compile:  {len(rules)} rules in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    started = time.perf_counter()
+    batch = EventBatch(events)
+    batch.select(None)
+    index_seconds = time.perf_counter() - started
+    print(f"index:    {index_seconds:.2f}s (timestamps parsed once, {len(events) / index_seconds:,.0f} events/s)")
+
+    started = time.perf_counter()
+    alerts = 0
+    for rule in rules:
+        alerts += len(rule.check(batch))
+    evaluate_seconds = time.perf_counter() - started
+    print(f"evaluate: {evaluate_seconds:.2f}s for {len(rules)} rules -> {alerts:,} alerts "
+          f"({len(events) * len(rules) / evaluate_seconds:,.0f} rule-event pairs/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark the ingestion spool: python -m benchmarks.bench_spool [--events 200000] [--batch 5000] [--no-fsync]
+
+Appends synthetic Azure SecurityEvent rows in fetch-slice sized batches, then drains
+them through a no-op sender, and reports events/s and MiB/s for each direction, i.e.
+the overhead the spool adds between fetch and Logstash.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from app.log.spool import Spool
+
+
+def make_rows(count: int):
+    return [{
+        "TimeGenerated": f"2025-09-03T10:{i // 60 % 60:02d}:{i % 60:02d}.000Z",
+        "EventID": 4625,
+        "Computer": f"WS-{i % 200:04d}.corp.example.com",
+        "IpAddress": f"10.0.{i // 256 % 256}.{i % 256}",
+        "TargetUserName": f"user{i % 500}",
+        "Activity": "4625 - An account failed to log on.",
+        "_table": "SecurityEvent",
+        "_workspace": "default",
+    } for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=5000, help="rows per append (one fetch slice)")
+    parser.add_argument("--no-fsync", action="store_true")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    rows = make_rows(args.events)
+    with tempfile.TemporaryDirectory() as directory:
+        spool = Spool(directory, fsync=not args.no_fsync)
+
+        started = time.perf_counter()
+        for offset in range(0, len(rows), args.batch):
+            spool.append(rows[offset:offset + args.batch])
+        append_seconds = time.perf_counter() - started
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+        started = time.perf_counter()
+        shipped = spool.drain(lambda batch: True)
+        drain_seconds = time.perf_counter() - started
+
+    mib = size / 2**20
+    print(f"append  {args.events / append_seconds:10,.0f} events/s  {mib / append_seconds:7.1f} MiB/s  "
+          f"({mib:.1f} MiB, fsync {'off' if args.no_fsync else 'on'})")
+    print(f"drain   {shipped / drain_seconds:10,.0f} events/s  {mib / drain_seconds:7.1f} MiB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Production server profile: gunicorn -c gunicorn.conf.py main:app
+
+Sized from the CPU count unless SERVER_WORKERS is set. The app is imported once in
+the master (preload_app) and forked; Elasticsearch/Redis clients are created lazily
+per process, and the startup Azure ingestion runs once here before the fork.
+Prometheus metrics run in multiprocess mode so /metrics aggregates every worker.
+"""
+import logging
+import multiprocessing
+import os
+import glob
+import tempfile
+
+# Must be set before prometheus_client is first imported (by preload_app, below). The
+# sample files are removed on every start so counts from a previous run don't leak in.
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "boron-prometheus"))
+os.makedirs(metrics_dir, exist_ok=True)
+for stale in glob.glob(os.path.join(metrics_dir, "*.db")):
+    os.remove(stale)
+
+bind = os.environ.get("SERVER_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("SERVER_WORKERS", "0")) or min(multiprocessing.cpu_count() * 2 + 1, 12)
+worker_class = "app.core.server.BoronUvicornWorker"
+preload_app = True
+
+# Seconds a worker may go silent before it is restarted, and how long SIGTERM waits for in-flight requests
+timeout = int(os.environ.get("SERVER_TIMEOUT", "120"))
+graceful_timeout = int(os.environ.get("SERVER_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("SERVER_KEEPALIVE", "5"))
+backlog = int(os.environ.get("SERVER_BACKLOG", "2048"))
+
+# Recycle workers periodically (jittered so they don't all restart together)
+max_requests = int(os.environ.get("SERVER_MAX_REQUESTS", "10000"))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get("SERVER_ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.environ.get("SERVER_LOG_LEVEL", "info")
+
+
+def when_ready(server):
+    from app.log.service import run_startup_ingestion
+
+    try:
+        run_startup_ingestion()
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Startup ingestion failed, serving anyway: {e}")
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    # Drop the dead worker's live gauges; its counters and histograms keep counting
+    multiprocess.mark_process_dead(worker.pid)
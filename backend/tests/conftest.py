@@ -1,5 +1,6 @@
 import pytest
 import asyncio
+import fakeredis
 from unittest.mock import Mock, MagicMock, patch
 from datetime import datetime, timezone
 from typing import List, Dict, Any
@@ -8,6 +9,10 @@ from typing import List, Dict, Any
 import tests.test_config
 
 from app.alerts.models import Alert, AlertSeverity, AlertStatus
+from app.alerts.service import alert_service
+from app.core.breaker import CircuitBreaker, LRUCache
+from app.core.clients import elasticsearch_client
+from app.log.spool import spool
 
 
 @pytest.fixture(scope="session")
@@ -21,14 +26,37 @@ def event_loop():
 @pytest.fixture(autouse=True)
 def mock_alert_service_elasticsearch():
     """Automatically mock Elasticsearch in AlertService for all tests."""
-    with patch('app.alerts.service.Elasticsearch') as mock_es_class:
+    with patch('app.core.clients.Elasticsearch') as mock_es_class:
         mock_es = Mock()
         mock_es.ping.return_value = False  # Simulate no connection to avoid real ES calls
         mock_es.search.return_value = {"hits": {"hits": [], "total": {"value": 0}}}
         mock_es.index.return_value = {"_id": "test-id", "result": "created"}
         mock_es.update.return_value = {"_id": "test-id", "result": "updated"}
         mock_es_class.return_value = mock_es
-        yield mock_es
+        # The shared client is cached per process; rebuild it from this test's mock
+        elasticsearch_client.reset()
+        # Nor should one test's failures or cached pages leak into the next
+        with patch.object(alert_service, 'read_breaker', CircuitBreaker("alerts_read")), \
+             patch.object(alert_service, 'page_cache', LRUCache("alert_pages", 128)):
+            yield mock_es
+    elasticsearch_client.reset()
+
+
+@pytest.fixture(autouse=True)
+def fake_alerts_redis():
+    """Back the alert seen-set with an in-memory Redis for all tests."""
+    client = fakeredis.FakeRedis(decode_responses=True)
+    with patch('app.alerts.service.redis_client', client):
+        yield client
+
+
+@pytest.fixture(autouse=True)
+def ingest_spool(tmp_path):
+    """Keep the ingestion spool in a per-test directory."""
+    with patch.object(spool, 'directory', str(tmp_path / "spool")), \
+         patch.object(spool, 'fsync', False), \
+         patch.object(spool, '_tail', None):
+        yield spool
 
 
 @pytest.fixture
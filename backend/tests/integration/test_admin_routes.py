@@ -0,0 +1,164 @@
+import asyncio
+import pytest
+import fakeredis
+import httpx
+import redis
+from contextlib import contextmanager
+from fastapi.testclient import TestClient
+from unittest.mock import Mock, patch
+
+from main import app
+from app import create_app
+from app.alerts import tasks
+from app.alerts.models import MultipleFailedLoginsRule
+from app.alerts.service import alert_service
+from app.core.clients import get_elasticsearch, get_redis
+from app.core.config import settings
+from app.core.profiling import list_profiles, profiled
+
+
+class TestAdminProfilesAPI:
+    """Test profiling toggles and admin profile download endpoints."""
+
+    @pytest.fixture
+    def client(self):
+        """Create test client."""
+        return TestClient(app)
+
+    @pytest.fixture
+    def profiling_enabled(self, tmp_path):
+        with patch.object(settings, "PROFILING_ENABLED", True), \
+             patch.object(settings, "PROFILE_DIR", str(tmp_path)):
+            yield tmp_path
+
+    def test_profiles_disabled(self, client):
+        """Test admin endpoints are hidden when profiling is disabled."""
+        with patch.object(settings, "PROFILING_ENABLED", False):
+            response = client.get("/admin/profiles")
+
+        assert response.status_code == 404
+
+    def test_request_without_header_is_not_profiled(self, client, profiling_enabled):
+        """Test requests are only profiled when the header is sent."""
+        response = client.get("/")
+
+        assert response.status_code == 200
+        assert "X-Boron-Profile-Id" not in response.headers
+        assert client.get("/admin/profiles").json() == []
+
+    def test_profile_header_stores_and_serves_profile(self, client, profiling_enabled):
+        """Test the profile header captures a profile that can be downloaded."""
+        response = client.get("/", headers={"X-Boron-Profile": "1"})
+
+        assert response.status_code == 200
+        profile_id = response.headers["X-Boron-Profile-Id"]
+
+        profiles = client.get("/admin/profiles").json()
+        assert [p["id"] for p in profiles] == [profile_id]
+        assert set(profiles[0]["artifacts"]) == {"pstats", "collapsed", "memory"}
+
+        collapsed = client.get(f"/admin/profiles/{profile_id}/collapsed")
+        assert collapsed.status_code == 200
+        pstats_file = client.get(f"/admin/profiles/{profile_id}/pstats")
+        assert pstats_file.status_code == 200
+        assert pstats_file.headers["content-type"] == "application/octet-stream"
+
+    def test_concurrent_profiled_requests_run_one_at_a_time(self, profiling_enabled):
+        """Test overlapping profiled requests each get their own profile, one after the other."""
+        profiling_app = create_app()
+        spans = []
+
+        @profiling_app.get("/slow")
+        async def slow():
+            await asyncio.sleep(0.05)
+            return {}
+
+        @contextmanager
+        def recording_profiled(name):
+            spans.append("start")
+            with profiled(name) as profile_id:
+                yield profile_id
+            spans.append("end")
+
+        async def two_requests():
+            transport = httpx.ASGITransport(app=profiling_app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                return await asyncio.gather(*(http.get("/slow", headers={"X-Boron-Profile": "1"}) for _ in range(2)))
+
+        with patch('app.profiled', recording_profiled):
+            responses = asyncio.run(two_requests())
+
+        assert spans == ["start", "end", "start", "end"]
+        profile_ids = {response.headers["X-Boron-Profile-Id"] for response in responses}
+        assert len(profile_ids) == 2
+        assert {p["id"] for p in list_profiles()} == profile_ids
+
+    def test_download_unknown_profile(self, client, profiling_enabled):
+        """Test downloading a missing profile returns 404."""
+        response = client.get("/admin/profiles/1-missing-deadbeef/pstats")
+
+        assert response.status_code == 404
+
+    def test_download_unknown_artifact(self, client, profiling_enabled):
+        """Test requesting an unknown artifact type returns 400."""
+        response = client.get("/admin/profiles/1-missing-deadbeef/svg")
+
+        assert response.status_code == 400
+
+
+class TestAdminHealthAPI:
+    """Test the health endpoint built on the shared client dependencies."""
+
+    @pytest.fixture
+    def client(self):
+        yield TestClient(app)
+        app.dependency_overrides.clear()
+
+    def test_health_reports_each_backend(self, client):
+        """Test the injected clients are pinged and reported separately."""
+        es = Mock()
+        es.ping.return_value = True
+        broken_redis = Mock()
+        broken_redis.ping.side_effect = redis.ConnectionError("down")
+        app.dependency_overrides[get_elasticsearch] = lambda: es
+        app.dependency_overrides[get_redis] = lambda: broken_redis
+
+        response = client.get("/admin/health")
+
+        assert response.status_code == 200
+        assert response.json() == {"elasticsearch": True, "redis": False}
+
+
+class TestAdminBackfillAPI:
+    """Test starting and reporting backfill runs."""
+
+    @pytest.fixture
+    def client(self):
+        """Create test client."""
+        with patch('app.alerts.backfill.redis_client', fakeredis.FakeRedis(decode_responses=True)), \
+             patch.object(alert_service, 'active_rules', return_value=[MultipleFailedLoginsRule()]), \
+             patch.object(alert_service, 'get_event_histogram', return_value=None), \
+             patch.object(tasks.backfill_partition_task, 'apply_async'):
+            yield TestClient(app)
+
+    def test_start_and_report(self, client):
+        """Test starting a backfill returns its report, which can be fetched again."""
+        response = client.post("/admin/backfill", json={
+            "start": "2025-08-01T00:00:00+00:00", "end": "2025-08-01T02:00:00+00:00",
+            "rules": [MultipleFailedLoginsRule().name]
+        })
+
+        assert response.status_code == 200
+        run_id = response.json()["run_id"]
+        report = client.get(f"/admin/backfill/{run_id}").json()
+        assert report["partitions"] == 1 # within one BACKFILL_MAX_MINUTES partition
+        assert report["status"] == "running"
+
+    def test_bad_requests(self, client):
+        """Test missing ranges, unknown rules and unknown runs are rejected."""
+        assert client.post("/admin/backfill", json={"rules": []}).status_code == 400
+        assert client.post("/admin/backfill", json={
+            "start": "2025-08-01T00:00:00+00:00", "end": "2025-08-01T02:00:00+00:00", "rules": ["nope"]
+        }).status_code == 400
+        assert client.post("/admin/backfill", json={"run_id": "missing"}).status_code == 404
+        assert client.get("/admin/backfill/missing").status_code == 404
@@ -4,6 +4,7 @@ from unittest.mock import Mock, patch
 
 from main import app
 from app.alerts.models import AlertStatus, AlertSeverity
+from app.alerts.service import AlertVersionConflict
 
 
 class TestAlertsAPI:
@@ -143,9 +144,67 @@ class TestAlertsAPI:
         assert data["alert_id"] == "test-alert-1"
         assert data["new_status"] == "investigating"
         mock_alert_service.update_alert_status.assert_called_once_with(
-            "test-alert-1", AlertStatus.INVESTIGATING
+            "test-alert-1", AlertStatus.INVESTIGATING, if_seq_no=None, if_primary_term=None, index=None
         )
 
+    def test_update_alert_status_conflict(self, client, mock_alert_service):
+        """Test a conditional update of a changed alert returns 409."""
+        mock_alert_service.update_alert_status.side_effect = AlertVersionConflict("changed")
+        
+        response = client.patch(
+            "/alerts/test-alert-1/status",
+            json={"status": "resolved", "index": "security-alerts-000002", "if_seq_no": 3, "if_primary_term": 1}
+        )
+        
+        assert response.status_code == 409
+        mock_alert_service.update_alert_status.assert_called_once_with(
+            "test-alert-1", AlertStatus.RESOLVED, if_seq_no=3, if_primary_term=1, index="security-alerts-000002"
+        )
+
+    def test_update_alert_status_rejects_foreign_index(self, client, mock_alert_service):
+        """Test a status update cannot be pointed at an index other than the alerts ones."""
+        response = client.patch("/alerts/test-alert-1/status", json={"status": "resolved", "index": "security-events-v2-2025.09.03"})
+        
+        assert response.status_code == 422
+        mock_alert_service.update_alert_status.assert_not_called()
+
+    def test_bulk_update_by_ids(self, client, mock_alert_service):
+        """Test a list of ids is updated in one service call."""
+        mock_alert_service.update_alerts_status.return_value = {"updated": 2, "not_found": [], "conflicts": 0, "failed": 0}
+        
+        response = client.patch("/alerts/status", json={"status": "investigating", "ids": ["a1", "a2"]})
+        
+        assert response.status_code == 200
+        assert response.json()["updated"] == 2
+        mock_alert_service.update_alerts_status.assert_called_once_with(
+            AlertStatus.INVESTIGATING, alert_ids=["a1", "a2"]
+        )
+
+    def test_bulk_update_by_query(self, client, mock_alert_service):
+        """Test a query is passed on as filters."""
+        mock_alert_service.update_alerts_status.return_value = {"updated": 5, "not_found": [], "conflicts": 0, "failed": 0}
+        
+        response = client.patch("/alerts/status", json={"status": "resolved", "query": {"severity": "low"}})
+        
+        assert response.status_code == 200
+        kwargs = mock_alert_service.update_alerts_status.call_args[1]
+        assert kwargs["severity"] == AlertSeverity.LOW
+        assert kwargs["current_status"] is None
+
+    def test_bulk_update_needs_ids_or_query(self, client, mock_alert_service):
+        """Test exactly one of ids and query must be given."""
+        assert client.patch("/alerts/status", json={"status": "resolved"}).status_code == 400
+        assert client.patch("/alerts/status", json={
+            "status": "resolved", "ids": ["a1"], "query": {"severity": "low"}
+        }).status_code == 400
+
+    def test_bulk_update_rejects_empty_query(self, client, mock_alert_service):
+        """Test a query without filters is refused instead of updating every alert."""
+        response = client.patch("/alerts/status", json={"status": "resolved", "query": {}})
+
+        assert response.status_code == 400
+        mock_alert_service.update_alerts_status.assert_not_called()
+
     def test_update_alert_status_not_found(self, client, mock_alert_service):
         """Test alert status update for non-existent alert."""
         mock_alert_service.update_alert_status.return_value = False
@@ -0,0 +1,75 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from main import app
+from app.alerts.models import AlertStatus
+
+
+class TestIncidentsAPI:
+    """Test Incident API endpoints."""
+
+    @pytest.fixture
+    def client(self):
+        """Create test client."""
+        return TestClient(app)
+
+    @pytest.fixture
+    def mock_incident_service(self):
+        """Mock incident service for testing."""
+        with patch('app.incidents.routes.incident_service') as mock_service:
+            yield mock_service
+
+    def test_get_incidents(self, client, mock_incident_service):
+        """Test incidents retrieval with filters."""
+        mock_incident_service.get_incidents.return_value = [{"id": "incident_1"}]
+
+        response = client.get("/incidents/?status=open&limit=10")
+
+        assert response.status_code == 200
+        assert response.json() == [{"id": "incident_1"}]
+        mock_incident_service.get_incidents.assert_called_once_with(status=AlertStatus.OPEN, severity=None, limit=10)
+
+    def test_get_incident(self, client, mock_incident_service):
+        """Test a single incident is returned with its alerts."""
+        mock_incident_service.get_incident.return_value = {"id": "incident_1", "alerts": [{"id": "a"}]}
+
+        response = client.get("/incidents/incident_1")
+
+        assert response.status_code == 200
+        assert response.json()["alerts"] == [{"id": "a"}]
+
+    def test_get_incident_not_found(self, client, mock_incident_service):
+        """Test a missing incident returns 404."""
+        mock_incident_service.get_incident.return_value = None
+
+        response = client.get("/incidents/missing")
+
+        assert response.status_code == 404
+
+    def test_correlate(self, client, mock_incident_service):
+        """Test manual correlation."""
+        mock_incident_service.correlate_and_store.return_value = [object(), object()]
+
+        response = client.post("/incidents/correlate?hours=12")
+
+        assert response.status_code == 200
+        assert response.json()["incident_count"] == 2
+        mock_incident_service.correlate_and_store.assert_called_once_with(hours=12)
+
+    def test_update_incident_status(self, client, mock_incident_service):
+        """Test incident status update."""
+        mock_incident_service.update_incident_status.return_value = True
+
+        response = client.patch("/incidents/incident_1/status", json={"status": "investigating"})
+
+        assert response.status_code == 200
+        assert response.json()["new_status"] == "investigating"
+
+    def test_update_incident_status_not_found(self, client, mock_incident_service):
+        """Test status update on a missing incident."""
+        mock_incident_service.update_incident_status.return_value = False
+
+        response = client.patch("/incidents/missing/status", json={"status": "resolved"})
+
+        assert response.status_code == 404
@@ -0,0 +1,156 @@
+import pytest
+import fakeredis
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from app.alerts import tasks
+from app.alerts.backfill import backfill_report, backfill_rules, claim_partition, create_run, run_partition
+from app.alerts.baseline import FailedLoginBaselineRule
+from app.alerts.models import MultipleFailedLoginsRule, PrivilegeEscalationRule
+from app.alerts.service import alert_service
+
+
+BASE_TIME = datetime(2025, 8, 1, 0, 0, tzinfo=timezone.utc)
+
+
+def failed_login(seconds, ip="203.0.113.7", user="alice"):
+    return {
+        "@timestamp": (BASE_TIME + timedelta(seconds=seconds)).isoformat().replace('+00:00', 'Z'),
+        "event": {"id": 4625},
+        "EventRecordID": f"{ip}-{user}-{seconds}",
+        "source": {"ip": ip},
+        "TargetUserName": user
+    }
+
+
+def hours(n):
+    return BASE_TIME + timedelta(hours=n)
+
+
+@pytest.fixture(autouse=True)
+def backfill_redis():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    rules = [MultipleFailedLoginsRule(), PrivilegeEscalationRule(), FailedLoginBaselineRule()]
+    with patch('app.alerts.backfill.redis_client', client), \
+         patch.object(alert_service, 'active_rules', return_value=rules), \
+         patch.object(alert_service, 'get_event_histogram', return_value=None), \
+         patch('app.alerts.backfill.settings.BACKFILL_MAX_MINUTES', 60):
+        yield client
+
+
+class TestBackfillRules:
+    """Test choosing the rules a backfill replays."""
+
+    def test_defaults_to_chunkable_rules(self):
+        """Test stateful rules are left out when no rules are named."""
+        assert [rule.name for rule in backfill_rules()] == [
+            MultipleFailedLoginsRule().name, PrivilegeEscalationRule().name
+        ]
+
+    def test_stateful_rule_rejected(self):
+        """Test a rule whose live watermark a replay would disturb is refused."""
+        with pytest.raises(ValueError, match="live state"):
+            backfill_rules([FailedLoginBaselineRule().name])
+
+    def test_unknown_rule_rejected(self):
+        """Test a misspelt rule name fails instead of silently replaying nothing."""
+        with pytest.raises(ValueError, match="Unknown rules"):
+            backfill_rules(["nope"])
+
+
+class TestBackfillRun:
+    """Test planning, replaying and reporting a backfill run."""
+
+    def test_partition_stores_tagged_alerts_and_checkpoints(self):
+        """Test a partition's alerts carry the backfill tag and its progress is recorded."""
+        run_id = create_run(hours(0), hours(3), [MultipleFailedLoginsRule().name])
+        events = [failed_login(3600 + i * 10) for i in range(6)]
+
+        with patch.object(alert_service, 'get_events_between', return_value=events) as mock_fetch, \
+             patch.object(alert_service, 'store_alert') as mock_store:
+            stats = run_partition(run_id, 1)
+
+        start, end = mock_fetch.call_args[0][:2]
+        assert (start, end) == (hours(0), hours(3)) # partition padded by the overlap
+        alert = mock_store.call_args[0][0]
+        assert alert.tags == ["backfill"] and alert.to_dict()["tags"] == ["backfill"]
+        assert stats["events"] == 6 and stats["alerts"] == 1
+
+        report = backfill_report(run_id)
+        assert report["partitions"] == 3
+        assert report["completed_partitions"] == 1
+        assert report["status"] == "running"
+        assert report["events"] == 6
+
+    def test_alerts_outside_partition_not_owned(self):
+        """Test alerts in the overlap are left to the neighbouring partition."""
+        run_id = create_run(hours(0), hours(3))
+        events = [failed_login(3600 + i * 10) for i in range(6)]
+
+        with patch.object(alert_service, 'get_events_between', return_value=events), \
+             patch.object(alert_service, 'store_alert') as mock_store:
+            run_partition(run_id, 0)
+
+        mock_store.assert_not_called()
+
+    def test_claim_skips_checkpointed_partitions(self):
+        """Test a resumed run only hands out partitions without a checkpoint."""
+        run_id = create_run(hours(0), hours(3))
+        with patch.object(alert_service, 'get_events_between', return_value=[]):
+            run_partition(run_id, 0)
+            run_partition(run_id, 2)
+
+        assert claim_partition(run_id, 3) == 1
+        assert claim_partition(run_id, 3) is None
+
+    def test_report_complete(self):
+        """Test a run reports complete with throughput once every partition is done."""
+        run_id = create_run(hours(0), hours(2))
+        with patch.object(alert_service, 'get_events_between', return_value=[failed_login(0)]):
+            run_partition(run_id, 0)
+            run_partition(run_id, 1)
+
+        report = backfill_report(run_id)
+        assert report["status"] == "complete"
+        assert report["events"] == 2
+        assert report["events_per_second"] > 0
+
+    def test_empty_range_rejected(self):
+        """Test a range that ends before it starts is refused."""
+        with pytest.raises(ValueError):
+            create_run(hours(2), hours(1))
+
+
+class TestBackfillTasks:
+    """Test dispatching backfill partitions on their own queue."""
+
+    def test_lanes_capped_by_parallelism(self):
+        """Test only BACKFILL_PARALLELISM partitions are queued at once."""
+        with patch('app.alerts.tasks.settings.BACKFILL_PARALLELISM', 2), \
+             patch.object(tasks.backfill_partition_task, 'apply_async') as mock_apply:
+            run_id = tasks.start_backfill(hours(0), hours(5))
+
+        assert [c[0][0] for c in mock_apply.call_args_list] == [(run_id, 0), (run_id, 1)]
+        assert all(c[1]["queue"] == "backfill" for c in mock_apply.call_args_list)
+
+    def test_lane_continues_with_next_partition(self):
+        """Test a finished partition task queues the next unclaimed partition."""
+        with patch('app.alerts.tasks.settings.BACKFILL_PARALLELISM', 2), \
+             patch.object(tasks.backfill_partition_task, 'apply_async') as mock_apply, \
+             patch.object(alert_service, 'get_events_between', return_value=[]):
+            run_id = tasks.start_backfill(hours(0), hours(3))
+            tasks.backfill_partition_task(run_id, 0)
+
+        assert mock_apply.call_args[0][0] == (run_id, 2)
+
+    def test_resume_dispatches_unfinished_partitions(self):
+        """Test resuming a run restarts from its checkpoints rather than from scratch."""
+        run_id = create_run(hours(0), hours(3))
+        with patch.object(alert_service, 'get_events_between', return_value=[]):
+            run_partition(run_id, 0)
+
+        with patch.object(tasks.backfill_partition_task, 'apply_async') as mock_apply:
+            tasks.start_backfill(run_id=run_id)
+
+        assert [c[0][0][1] for c in mock_apply.call_args_list] == [1, 2]
+
@@ -0,0 +1,194 @@
+import pytest
+import fakeredis
+import redis
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+from app.alerts.baseline import FailedLoginBaselineRule, baseline_rules
+from app.alerts.sketches import (
+    BoundedEwmaTable, Ewma, RedisCountMinSketch, RedisDistinctCounter, ewma_alpha
+)
+from app.core.config import settings
+
+
+BASE_TIME = datetime(2025, 9, 3, 0, 0, tzinfo=timezone.utc)
+INTERVAL = settings.BASELINE_INTERVAL_MINUTES
+
+
+def failed_logins(interval, count, ip="10.0.0.5", user="alice"):
+    start = BASE_TIME + timedelta(minutes=interval * INTERVAL)
+    events = []
+    for i in range(count):
+        events.append({
+            "@timestamp": (start + timedelta(seconds=i)).isoformat().replace('+00:00', 'Z'),
+            "event": {"id": 4625},
+            "EventRecordID": f"{interval}-{ip}-{user}-{i}",
+            "source": {"ip": ip},
+            "TargetUserName": user
+        })
+    return events
+
+
+@pytest.fixture
+def redis_client():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    with patch('app.alerts.baseline.redis_client', client):
+        yield client
+
+
+class TestEwma:
+    """Test the exponentially weighted baseline."""
+
+    def test_converges_to_constant_rate(self):
+        """Test a steady count yields that mean and no variance."""
+        state = Ewma()
+        for interval in range(50):
+            state.update(6, interval, ewma_alpha(10))
+
+        assert state.mean == pytest.approx(6)
+        assert state.std == pytest.approx(0)
+        assert state.count == 50
+
+    def test_idle_intervals_decay_the_mean(self):
+        """Test gaps between observations count as zero-count intervals."""
+        alpha = ewma_alpha(10)
+        state = Ewma()
+        state.update(10, 0, alpha)
+        state.decay_to(11, alpha)
+
+        assert state.mean == pytest.approx(5, rel=0.01)
+        assert state.count == 11
+        assert state.last == 10
+
+    def test_roundtrip(self):
+        """Test the Redis string encoding preserves the state."""
+        state = Ewma(2.5, 0.75, 12, 99)
+        assert Ewma.loads(state.dumps()) == state
+        assert Ewma.loads(Ewma().dumps()) == Ewma()
+
+
+class TestSketches:
+    """Test the Redis-backed sketches."""
+
+    def test_count_min_never_undercounts(self, redis_client):
+        """Test estimates are at least the true count and exact without collisions."""
+        sketch = RedisCountMinSketch(redis_client, "cms", width=64, depth=4)
+        counts = {f"10.0.0.{i}|user{i % 7}": i + 1 for i in range(200)}
+        sketch.add_many(counts)
+
+        estimates = sketch.estimate_many(counts)
+        assert all(estimates[key] >= count for key, count in counts.items())
+        # Fixed size: width x depth counters at most
+        assert redis_client.hlen("cms") <= 64 * 4
+
+        wide = RedisCountMinSketch(redis_client, "wide", width=4096, depth=4)
+        wide.add_many({"a|b": 3, "c|d": 1})
+        assert wide.estimate_many(["a|b", "c|d", "e|f"]) == {"a|b": 3, "c|d": 1, "e|f": 0}
+
+    def test_ewma_table_evicts_least_recent(self, redis_client):
+        """Test the table never holds more than its cap."""
+        table = BoundedEwmaTable(redis_client, "ewma", max_entries=3)
+        for interval in range(5):
+            table.put_many({f"ip:{interval}": Ewma(1.0, 0.0, 1, interval)})
+
+        assert redis_client.hlen("ewma") == 3
+        assert sorted(redis_client.hkeys("ewma")) == ["ip:2", "ip:3", "ip:4"]
+        assert table.get_many(["ip:0", "ip:4"])["ip:0"] == Ewma()
+
+    def test_distinct_counter(self, redis_client):
+        """Test HyperLogLog counts distinct members across calls."""
+        counter = RedisDistinctCounter(redis_client, "targets", ttl=60)
+        counter.add_and_count({"1.2.3.4": {f"user{i}" for i in range(50)}})
+        counts = counter.add_and_count({"1.2.3.4": {f"user{i}" for i in range(25, 100)}, "5.6.7.8": {"bob"}})
+
+        assert counts["1.2.3.4"] == pytest.approx(100, rel=0.05)
+        assert counts["5.6.7.8"] == 1
+        assert 0 < redis_client.ttl("targets:1.2.3.4") <= 60
+
+        counter.delete(["1.2.3.4"])
+        assert not redis_client.exists("targets:1.2.3.4")
+
+
+class TestFailedLoginBaselineRule:
+    """Test the failed-logon baselining rule."""
+
+    def test_disabled_by_default(self):
+        """Test the stateful rule is opt-in."""
+        assert baseline_rules() == []
+        with patch.object(settings, "BASELINE_ENABLED", True):
+            assert [rule.name for rule in baseline_rules()] == ["Failed Login Baseline"]
+
+    def test_habitual_failures_stay_quiet(self, redis_client):
+        """Test a service account failing at a steady rate does not alert."""
+        rule = FailedLoginBaselineRule()
+        events = []
+        for interval in range(settings.BASELINE_MIN_OBSERVATIONS + 10):
+            events.extend(failed_logins(interval, 6, ip="10.0.0.9", user="svc-backup"))
+
+        assert rule.check(events) == []
+
+    def test_burst_above_baseline_alerts(self, redis_client):
+        """Test a spike relative to the entity's own history alerts once."""
+        rule = FailedLoginBaselineRule()
+        history = settings.BASELINE_MIN_OBSERVATIONS + 4
+        events = []
+        for interval in range(history):
+            events.extend(failed_logins(interval, 1 + interval % 2))
+        events.extend(failed_logins(history, 12))
+
+        alerts = rule.check(events)
+        titles = sorted(alert.title for alert in alerts)
+        assert titles == ["Failed Login Rate Anomaly (ip)", "Failed Login Rate Anomaly (user)"]
+        ip_alert = next(a for a in alerts if a.title.endswith("(ip)"))
+        assert ip_alert.event_count == 12
+        assert ip_alert.source_ips == ["10.0.0.5"]
+        assert "z=" in ip_alert.description
+
+        # A second run over the same events folds nothing in again
+        assert rule.check(events) == []
+        state = Ewma.loads(redis_client.hget("baseline:failed_logins:ewma", "ip:10.0.0.5"))
+        assert state.count == history + 1
+
+    def test_cold_start_needs_large_burst(self, redis_client):
+        """Test entities without history only alert past the cold-start count."""
+        rule = FailedLoginBaselineRule()
+        small = failed_logins(0, settings.BASELINE_COLD_START_COUNT - 1, ip="10.0.0.1")
+        large = failed_logins(0, settings.BASELINE_COLD_START_COUNT, ip="10.0.0.2", user="bob")
+
+        alerts = rule.check(small + large)
+        assert {alert.source_ips[0] for alert in alerts} == {"10.0.0.2"}
+        assert all("no baseline yet" in alert.description for alert in alerts)
+
+    def test_slow_spray_detected(self, redis_client):
+        """Test many distinct targets with few attempts each flags a spray below any rate threshold."""
+        rule = FailedLoginBaselineRule()
+        events = []
+        for interval in range(settings.BASELINE_SPRAY_TARGETS):
+            events.extend(failed_logins(interval, 1, ip="203.0.113.7", user=f"user{interval}"))
+
+        alerts = rule.check(events)
+        assert [alert.title for alert in alerts] == ["Password Spray Suspected"]
+        assert alerts[0].source_ips == ["203.0.113.7"]
+
+    def test_memory_is_capped(self, redis_client):
+        """Test distinct IPs beyond the cap are evicted with their HyperLogLogs."""
+        rule = FailedLoginBaselineRule()
+        events = []
+        for interval in range(30):
+            events.extend(failed_logins(interval, 1, ip=f"198.51.100.{interval}", user="carol"))
+
+        with patch.object(settings, "BASELINE_MAX_ENTITIES", 10):
+            rule.check(events)
+
+        assert redis_client.hlen("baseline:failed_logins:ewma") == 10
+        assert len(redis_client.keys("baseline:failed_logins:targets:*")) < 10
+
+    def test_redis_failure_returns_no_alerts(self):
+        """Test an unreachable Redis skips the rule instead of failing the run."""
+        rule = FailedLoginBaselineRule()
+        client = Mock()
+        client.lock.return_value.acquire.return_value = True
+        client.get.side_effect = redis.ConnectionError("unreachable")
+        with patch('app.alerts.baseline.redis_client', client):
+            assert rule.check(failed_logins(0, 50)) == []
+        client.lock.return_value.release.assert_called_once()
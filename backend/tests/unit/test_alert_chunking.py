@@ -0,0 +1,222 @@
+import pytest
+import fakeredis
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+from app.alerts import tasks
+from app.alerts.baseline import FailedLoginBaselineRule
+from app.alerts.chunking import (
+    chunk_result_key, chunk_rules, load_chunk_results, owned_alerts, plan_slices, save_chunk_result, slice_bounds
+)
+from app.alerts.models import MultipleFailedLoginsRule, parse_timestamp
+from app.alerts.service import AlertService
+from app.alerts.sharding import merge_alerts
+from app.alerts.spray import PasswordSprayRule
+
+
+BASE_TIME = datetime(2025, 9, 3, 0, 0, tzinfo=timezone.utc)
+
+
+def failed_login(seconds, ip, user):
+    return {
+        "@timestamp": (BASE_TIME + timedelta(seconds=seconds)).isoformat().replace('+00:00', 'Z'),
+        "event": {"id": 4625},
+        "EventRecordID": f"{ip}-{user}-{seconds}",
+        "source": {"ip": ip},
+        "TargetUserName": user
+    }
+
+
+def minutes(n):
+    return BASE_TIME + timedelta(minutes=n)
+
+
+@pytest.fixture
+def redis_client():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    with patch('app.alerts.chunking.redis_client', client):
+        yield client
+
+
+class TestPlanSlices:
+    """Test cutting a window into bounded slices."""
+
+    def test_packs_intervals_up_to_max_events(self):
+        """Test consecutive intervals share a slice until the event budget is used up."""
+        histogram = [(minutes(0), 40), (minutes(5), 40), (minutes(10), 40), (minutes(15), 10)]
+
+        slices = plan_slices(minutes(0), minutes(60), histogram, max_events=100, max_minutes=60)
+
+        assert [slice_bounds(s) for s in slices] == [(minutes(0), minutes(10)), (minutes(10), minutes(60))]
+
+    def test_slices_capped_in_time(self):
+        """Test a slice never spans more than max_minutes of intervals."""
+        histogram = [(minutes(m), 1) for m in range(0, 120, 5)]
+
+        slices = plan_slices(minutes(0), minutes(120), histogram, max_events=1000, max_minutes=30)
+
+        assert [slice_bounds(s)[0] for s in slices] == [minutes(0), minutes(30), minutes(60), minutes(90)]
+
+    def test_oversized_interval_gets_its_own_slice(self):
+        """Test one interval above the budget is kept whole rather than dropped."""
+        histogram = [(minutes(0), 5), (minutes(5), 500), (minutes(10), 5)]
+
+        slices = plan_slices(minutes(0), minutes(15), histogram, max_events=100, max_minutes=60)
+
+        assert [slice_bounds(s) for s in slices] == [
+            (minutes(0), minutes(5)), (minutes(5), minutes(10)), (minutes(10), minutes(15))
+        ]
+
+    def test_quiet_gaps_produce_no_slices(self):
+        """Test the window before the first event is skipped and an empty window gives nothing."""
+        slices = plan_slices(minutes(0), minutes(60), [(minutes(50), 3)], max_events=100, max_minutes=60)
+
+        assert [slice_bounds(s) for s in slices] == [(minutes(50), minutes(60))]
+        assert plan_slices(minutes(0), minutes(60), [], max_events=100, max_minutes=60) == []
+
+    def test_fixed_slices_without_histogram(self):
+        """Test the window is cut into max_minutes slices when counts are unavailable."""
+        slices = plan_slices(minutes(0), minutes(70), None, max_minutes=30)
+
+        assert [slice_bounds(s) for s in slices] == [
+            (minutes(0), minutes(30)), (minutes(30), minutes(60)), (minutes(60), minutes(70))
+        ]
+
+
+class TestChunkEvaluation:
+    """Test per-chunk evaluation, result hand-off and merging."""
+
+    def test_stateful_rules_are_not_chunked(self):
+        """Test watermark-driven rules are kept out of the chunks."""
+        failed, baseline = MultipleFailedLoginsRule(), FailedLoginBaselineRule()
+
+        assert chunk_rules([failed, baseline]) == ([failed], [baseline])
+
+    def test_chunked_results_match_single_pass(self):
+        """Test slicing with overlap and ownership gives the same alerts as one pass over the window."""
+        # Separate attack episodes, several straddling slice boundaries
+        events = [
+            failed_login(start * 60 + i * 50, f"10.0.{start}.{i % 2}", f"user{i % 6 if i % 3 else i}")
+            for start in (10, 75, 130, 199, 250) for i in range(24)
+        ]
+        rules = [MultipleFailedLoginsRule(), PasswordSprayRule(threshold=5, window_minutes=30)]
+        overlap = timedelta(minutes=60)
+
+        results = []
+        for time_slice in plan_slices(minutes(0), minutes(300), None, max_minutes=20):
+            start, end = slice_bounds(time_slice)
+            window = [e for e in events if start - overlap <= parse_timestamp(e["@timestamp"]) < end + overlap]
+            alerts = owned_alerts([a for rule in rules for a in rule.check(window)], time_slice)
+            results.append([a.to_dict() for a in alerts])
+
+        expected = [alert for rule in rules for alert in rule.check(events)]
+        assert expected
+        assert sorted(a.id for a in merge_alerts(results)) == sorted(a.id for a in expected)
+
+    def test_results_round_trip_through_redis(self, redis_client):
+        """Test a retried chunk replaces its parked alerts and the reducer drops the key."""
+        alert = PasswordSprayRule(threshold=3).check([failed_login(i, "10.0.0.1", f"u{i}") for i in range(3)])[0]
+        key = chunk_result_key("run1", 0)
+
+        save_chunk_result(key, [alert])
+        save_chunk_result(key, [alert])
+
+        assert redis_client.ttl(key) > 0
+        assert load_chunk_results([key]) == [[alert.to_dict()]]
+        assert not redis_client.exists(key)
+
+
+class TestChunkedGenerationTask:
+    """Test the chunked pipeline tasks."""
+
+    def test_dispatches_one_chunk_per_slice(self):
+        """Test the coordinator sends time ranges, not events, and runs whole-window rules itself."""
+        failed, baseline = MultipleFailedLoginsRule(), FailedLoginBaselineRule()
+        histogram = [(datetime.now(timezone.utc) - timedelta(hours=h), 10) for h in (3, 2, 1)]
+        with patch.object(tasks.alert_service, 'active_rules', return_value=[failed, baseline]), \
+             patch.object(tasks.alert_service, 'get_event_histogram', return_value=histogram), \
+             patch.object(tasks.alert_service, 'generate_alerts', return_value=[]) as mock_generate, \
+             patch('app.alerts.tasks.settings.CHUNK_MAX_MINUTES', 60), \
+             patch('app.alerts.tasks.settings.CHUNK_SLICES_PER_TASK', 1), \
+             patch.object(tasks, 'chord') as mock_chord:
+            assert tasks.generate_chunked_alerts_task(hours=4) == 3
+
+        assert mock_generate.call_args[1]["rules"] == [baseline]
+        header = mock_chord.call_args[0][0]
+        signatures = list(header.tasks)
+        assert len(signatures) == 3
+        assert all(set(sig.args[0]) == {"start", "end"} for sig in signatures)
+        assert [sig.args[2] for sig in signatures] == [0, 1, 2]
+        mock_chord.return_value.assert_called_once()
+
+    def test_batches_slices_with_chunks(self):
+        """Test several slices per task are sent as Celery chunks."""
+        histogram = [(datetime.now(timezone.utc) - timedelta(hours=h), 10) for h in (4, 3, 2, 1)]
+        with patch.object(tasks.alert_service, 'active_rules', return_value=[MultipleFailedLoginsRule()]), \
+             patch.object(tasks.alert_service, 'get_event_histogram', return_value=histogram), \
+             patch('app.alerts.tasks.settings.CHUNK_MAX_MINUTES', 60), \
+             patch('app.alerts.tasks.settings.CHUNK_SLICES_PER_TASK', 2), \
+             patch.object(tasks, 'chord') as mock_chord:
+            assert tasks.generate_chunked_alerts_task(hours=5) == 4
+
+        assert len(mock_chord.call_args[0][0].tasks) == 2
+
+    def test_chunk_fetches_its_slice_with_overlap(self, redis_client):
+        """Test a chunk queries its own range padded by the overlap and keeps only alerts it owns."""
+        time_slice = {"start": minutes(60).isoformat(), "end": minutes(120).isoformat()}
+        inside = PasswordSprayRule(threshold=3).check([failed_login(4000 + i, "10.0.0.1", f"u{i}") for i in range(3)])[0]
+        outside = PasswordSprayRule(threshold=3).check([failed_login(i, "10.0.0.2", f"u{i}") for i in range(3)])[0]
+        with patch.object(tasks.alert_service, 'active_rules', return_value=[MultipleFailedLoginsRule()]), \
+             patch.object(tasks.alert_service, 'get_events_between', return_value=[]) as mock_fetch, \
+             patch.object(tasks.alert_service, 'generate_alerts', return_value=[inside, outside]), \
+             patch('app.alerts.tasks.settings.CHUNK_OVERLAP_MINUTES', 30):
+            key = tasks.evaluate_chunk_task(time_slice, "run1", 4)
+
+        assert key == chunk_result_key("run1", 4)
+        assert mock_fetch.call_args[0][:2] == (minutes(30), minutes(150))
+        assert load_chunk_results([key]) == [[inside.to_dict()]]
+
+    def test_merge_task_dedups_and_stores(self, redis_client):
+        """Test the reducer stores an alert reported by two chunks once."""
+        alert = PasswordSprayRule(threshold=3).check([failed_login(i, "10.0.0.1", f"u{i}") for i in range(3)])[0]
+        first = save_chunk_result(chunk_result_key("run1", 0), [alert])
+        second = save_chunk_result(chunk_result_key("run1", 1), [alert])
+        with patch.object(tasks.alert_service, 'store_alert') as mock_store:
+            assert tasks.merge_chunk_results_task([first, [second]]) == 1
+
+        mock_store.assert_called_once()
+
+
+class TestEventsBetween:
+    """Test paging a time range through a point in time."""
+
+    def test_pages_until_short_page(self):
+        """Test search_after paging continues past full pages and closes the point in time."""
+        es = Mock()
+        es.open_point_in_time.return_value = {"id": "pit1"}
+        es.search.side_effect = [
+            {"pit_id": "pit2", "hits": {"hits": [{"_source": {"n": 1}, "sort": [1]}, {"_source": {"n": 2}, "sort": [2]}]}},
+            {"pit_id": "pit2", "hits": {"hits": [{"_source": {"n": 3}, "sort": [3]}]}},
+        ]
+        service = AlertService(lazy=True)
+        service.es = es
+        with patch('app.alerts.service.settings.CHUNK_PAGE_SIZE', 2):
+            events = service.get_events_between(minutes(0), minutes(60), rules=[MultipleFailedLoginsRule()])
+
+        assert [e["n"] for e in events] == [1, 2, 3]
+        second = es.search.call_args_list[1][1]["body"]
+        assert second["search_after"] == [2]
+        assert second["pit"]["id"] == "pit2"
+        es.close_point_in_time.assert_called_once_with(id="pit2")
+
+    def test_errors_are_raised_for_retry(self):
+        """Test a failed page is raised instead of returning a partial range."""
+        es = Mock()
+        es.open_point_in_time.return_value = {"id": "pit1"}
+        es.search.side_effect = RuntimeError("timeout")
+        service = AlertService(lazy=True)
+        service.es = es
+
+        with pytest.raises(RuntimeError):
+            service.get_events_between(minutes(0), minutes(60))
+        es.close_point_in_time.assert_called_once_with(id="pit1")
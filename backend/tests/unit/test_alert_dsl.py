@@ -0,0 +1,229 @@
+import os
+import json
+import pytest
+from unittest.mock import patch
+from datetime import datetime, timedelta, timezone
+
+from app.alerts.dsl import DeclarativeRule, EventBatch, RuleRegistry, RuleSpecError, get_field, load_rule_file
+from app.alerts.models import AlertSeverity
+from app.alerts.service import build_rules_filter
+
+
+BASE_TIME = datetime(2025, 9, 3, 10, 0, tzinfo=timezone.utc)
+
+
+def event(event_id, minutes, record_id, **fields):
+    data = {
+        "@timestamp": (BASE_TIME + timedelta(minutes=minutes)).isoformat().replace('+00:00', 'Z'),
+        "event": {"id": event_id},
+        "EventRecordID": record_id
+    }
+    data.update(fields)
+    return data
+
+
+class TestEventBatch:
+    """Test the shared event index."""
+
+    def test_select_by_event_id_in_time_order(self):
+        """Test selection merges per-id lists in timestamp order and skips bad timestamps."""
+        batch = EventBatch([
+            event(4625, 5, "b"),
+            event(4624, 1, "a"),
+            event(4625, 0, "c"),
+            {"@timestamp": "not-a-date", "event": {"id": 4625}}
+        ])
+
+        selected = batch.select(["4624", "4625"])
+
+        assert [e["EventRecordID"] for _, e in selected] == ["c", "a", "b"]
+        assert len(batch) == 4
+        assert batch == list(batch)
+
+    def test_get_field_dotted_and_flat(self):
+        """Test dotted paths resolve nested and flattened keys."""
+        assert get_field({"source": {"ip": "1.2.3.4"}}, "source.ip") == "1.2.3.4"
+        assert get_field({"source.ip": "5.6.7.8"}, "source.ip") == "5.6.7.8"
+        assert get_field({"source": "x"}, "source.ip") is None
+
+
+class TestDeclarativeRule:
+    """Test rules compiled from declarative definitions."""
+
+    def test_threshold_window_grouping(self):
+        """Test a sliding-window threshold rule groups by key and emits one alert per burst."""
+        rule = DeclarativeRule({
+            "name": "Spray",
+            "severity": "high",
+            "event_ids": [4625],
+            "where": [{"field": "LogonType", "op": "in", "value": ["3", "10"]}],
+            "group_by": ["source.ip"],
+            "threshold": 3,
+            "window_minutes": 10
+        })
+        events = [event(4625, i, str(i), LogonType=3, source={"ip": "203.0.113.5"}, TargetUserName=f"user{i}") for i in range(4)]
+        events += [event(4625, 60 + i, f"late{i}", LogonType=3, source={"ip": "203.0.113.5"}) for i in range(3)]
+        events += [event(4625, i, f"other{i}", LogonType=2, source={"ip": "198.51.100.1"}) for i in range(5)]
+
+        alerts = rule.check(events)
+
+        assert len(alerts) == 2
+        assert alerts[0].event_count == 4
+        assert alerts[0].source_ips == ["203.0.113.5"]
+        assert alerts[0].severity == AlertSeverity.HIGH
+        assert "source.ip=203.0.113.5" in alerts[0].description
+        assert alerts[0].id != alerts[1].id
+
+    def test_burst_ending_on_last_event(self):
+        """Test a burst that runs to the group's final event is emitted, not lost to an IndexError."""
+        rule = DeclarativeRule({
+            "name": "Lockouts",
+            "event_ids": [4740],
+            "group_by": ["TargetUserName"],
+            "threshold": 3,
+            "window_minutes": 15
+        })
+        events = [event(4740, i, str(i), TargetUserName="alice") for i in range(4)]
+
+        alerts = rule.check(events)
+
+        assert len(alerts) == 1
+        assert alerts[0].event_count == 4
+
+    def test_ids_are_stable_across_runs(self):
+        """Test re-running the rule over the same events gives the same ids."""
+        rule = DeclarativeRule({"name": "Log Cleared", "event_ids": [1102], "group_by": ["host.name"]})
+        events = [event(1102, 0, "1", host={"name": "dc01"}), event(1102, 5, "2", host={"name": "dc02"})]
+
+        first = [a.id for a in rule.check(events)]
+        second = [a.id for a in rule.check(EventBatch(events))]
+
+        assert len(first) == 2
+        assert first == second
+
+    def test_predicates(self):
+        """Test string predicate operators."""
+        rule = DeclarativeRule({
+            "name": "Encoded PowerShell",
+            "event_ids": [4688],
+            "where": [
+                {"field": "NewProcessName", "op": "endswith", "value": "\\powershell.exe", "ignore_case": True},
+                {"field": "CommandLine", "op": "regex", "value": "-enc(odedcommand)?\\s", "ignore_case": True},
+                {"field": "SubjectUserName", "op": "not_in", "value": ["svc_backup"]}
+            ]
+        })
+        match = event(4688, 0, "1", NewProcessName="C:\\Windows\\PowerShell.EXE", CommandLine="powershell -EncodedCommand AAA", SubjectUserName="bob")
+        wrong_user = dict(match, SubjectUserName="svc_backup", EventRecordID="2")
+        no_flag = dict(match, CommandLine="powershell -File x.ps1", EventRecordID="3")
+
+        alerts = rule.check([match, wrong_user, no_flag])
+
+        assert len(alerts) == 1
+        assert alerts[0].event_ids == ["1"]
+
+    def test_pushdown_attributes(self):
+        """Test compiled rules expose event ids and fields for query pushdown."""
+        rule = DeclarativeRule({"name": "Lockout", "event_ids": [4740], "group_by": ["TargetUserName"]})
+
+        assert rule.event_ids == {4740}
+        assert "TargetUserName" in rule.source_fields
+        assert build_rules_filter([rule])["bool"]["filter"][0] == {"terms": {"event.id": [4740]}}
+        assert rule.threshold_plan() is None
+
+    def test_threshold_plan(self):
+        """Test windowed threshold rules can be screened by aggregation."""
+        rule = DeclarativeRule({"name": "Burst", "event_ids": [4740], "group_by": ["host.name"], "threshold": 3, "window_minutes": 15})
+
+        plan = rule.threshold_plan()
+
+        assert plan.group_by == ("host.name",)
+        assert (plan.threshold, plan.window_minutes) == (3, 15.0)
+
+    @pytest.mark.parametrize("spec", [
+        {"severity": "high"},
+        {"name": "x", "severity": "urgent"},
+        {"name": "x", "where": [{"field": "a", "op": "between", "value": 1}]},
+        {"name": "x", "where": [{"field": "a", "op": "in", "value": "b"}]},
+        {"name": "x", "threshold": 0},
+        {"name": "x", "threshold": "many"},
+        {"name": "x", "where": ["oops"]},
+        {"name": "x", "where": [{"field": "a", "op": "regex", "value": "("}]},
+        {"name": "x", "group_by": "host.name"},
+        {"name": "x", "event_ids": 4625}
+    ])
+    def test_invalid_specs(self, spec):
+        """Test invalid definitions are rejected at compile time."""
+        with pytest.raises(RuleSpecError):
+            DeclarativeRule(spec)
+
+
+class TestRuleRegistry:
+    """Test loading and hot-reloading rule files."""
+
+    def write(self, path, rules, mtime):
+        with open(path, "w") as f:
+            json.dump({"rules": rules}, f)
+        os.utime(path, ns=(mtime, mtime))
+
+    def test_hot_reload(self, tmp_path):
+        """Test rules are added, replaced, kept on bad edits and removed with their file."""
+        registry = RuleRegistry(str(tmp_path))
+        path = str(tmp_path / "rules.json")
+
+        assert registry.rules() == []
+
+        self.write(path, [{"name": "One", "event_ids": [1102]}], 1_000_000_000)
+        assert registry.reload_if_changed(force=True) is True
+        assert [r.name for r in registry.rules()] == ["One"]
+
+        self.write(path, [{"name": "Two", "event_ids": [4740]}], 2_000_000_000)
+        registry.reload_if_changed(force=True)
+        assert [r.name for r in registry.rules()] == ["Two"]
+
+        with open(path, "w") as f:
+            f.write("{not json")
+        os.utime(path, ns=(3_000_000_000, 3_000_000_000))
+        assert registry.reload_if_changed(force=True) is False
+        assert [r.name for r in registry.rules()] == ["Two"]
+
+        os.remove(path)
+        assert registry.reload_if_changed(force=True) is True
+        assert registry.rules() == []
+
+    def test_malformed_file_keeps_other_rules(self, tmp_path):
+        """Test a malformed definition is logged and skipped, keeping good files and the last good version."""
+        registry = RuleRegistry(str(tmp_path))
+        good, bad = str(tmp_path / "good.json"), str(tmp_path / "bad.json")
+        self.write(good, [{"name": "One", "event_ids": [1102]}], 1_000_000_000)
+        self.write(bad, [{"name": "Two", "event_ids": [4740]}], 1_000_000_000)
+        registry.reload_if_changed(force=True)
+
+        self.write(bad, [{"name": "Two", "where": ["oops"]}], 2_000_000_000)
+        assert registry.reload_if_changed(force=True) is False
+        assert [r.name for r in registry.rules()] == ["Two", "One"]
+
+    def test_unexpected_compile_error_is_contained(self, tmp_path):
+        """Test any exception from compiling a file is contained to that file."""
+        registry = RuleRegistry(str(tmp_path))
+        self.write(str(tmp_path / "rules.json"), [{"name": "One"}], 1_000_000_000)
+
+        with patch('app.alerts.dsl.load_rule_file', side_effect=AttributeError("boom")):
+            assert registry.reload_if_changed(force=True) is False
+
+        assert registry.rules() == []
+
+    def test_reload_is_throttled(self, tmp_path):
+        """Test the directory is not rescanned within RULES_RELOAD_SECONDS."""
+        registry = RuleRegistry(str(tmp_path))
+        registry.reload_if_changed(force=True)
+        self.write(str(tmp_path / "rules.json"), [{"name": "One"}], 1_000_000_000)
+
+        with patch('app.alerts.dsl.settings') as mock_settings:
+            mock_settings.RULES_RELOAD_SECONDS = 3600
+            assert registry.reload_if_changed() is False
+
+    def test_bundled_rules_compile(self):
+        """Test the rule files shipped in the repository compile."""
+        rules_dir = os.path.join(os.path.dirname(__file__), "..", "..", "rules")
+        for name in os.listdir(rules_dir):
+            assert load_rule_file(os.path.join(rules_dir, name))
@@ -0,0 +1,95 @@
+from unittest.mock import Mock, patch
+
+from app.alerts.indices import (
+    install_index_templates, events_index_template, alerts_index_template,
+    events_ilm_policy, alerts_ilm_policy,
+    EVENTS_POLICY, ALERTS_POLICY, EVENTS_TEMPLATE, ALERTS_TEMPLATE, ALERTS_ALIAS
+)
+from app.alerts.service import AlertService
+from app.incidents.service import incidents_index_mappings
+
+
+def ip_fields(properties, prefix=""):
+    for name, mapping in properties.items():
+        if mapping.get("type") == "ip":
+            yield prefix + name, mapping
+        yield from ip_fields(mapping.get("properties", {}), f"{prefix}{name}.")
+
+
+class TestIndexTemplates:
+    """Test index templates and ILM policies."""
+
+    def test_events_template_maps_rule_fields(self):
+        """Test fields used by rules get explicit, query-friendly types."""
+        template = events_index_template()
+        properties = template["template"]["mappings"]["properties"]
+
+        assert template["index_patterns"] == ["security-events-v2-*"]
+        assert properties["@timestamp"] == {"type": "date"}
+        assert properties["event"]["properties"]["id"] == {"type": "keyword"}
+        assert properties["source"]["properties"]["ip"] == {"type": "ip", "ignore_malformed": True}
+        assert template["template"]["settings"]["index.lifecycle.name"] == EVENTS_POLICY
+
+    def test_events_template_limits_dynamic_strings(self):
+        """Test unknown string fields map to a single keyword instead of text + keyword."""
+        dynamic = events_index_template()["template"]["mappings"]["dynamic_templates"][0]["strings_as_keywords"]
+
+        assert dynamic["mapping"]["type"] == "keyword"
+        assert "index.mapping.total_fields.limit" in events_index_template()["template"]["settings"]
+
+    def test_alerts_template_uses_rollover_alias(self):
+        """Test alert indices roll over behind the security-alerts alias."""
+        template = alerts_index_template()
+        settings = template["template"]["settings"]
+
+        assert template["index_patterns"] == ["security-alerts-*"]
+        assert settings["index.lifecycle.rollover_alias"] == ALERTS_ALIAS
+        assert template["template"]["mappings"]["properties"]["raw_events"] == {"type": "object", "enabled": False}
+
+    def test_ip_fields_accept_unparseable_addresses(self):
+        """Test a "-" address (4625 logons without a network source) is skipped, not rejected."""
+        mappings = [
+            events_index_template()["template"]["mappings"]["properties"],
+            alerts_index_template()["template"]["mappings"]["properties"],
+            incidents_index_mappings()["properties"],
+        ]
+        fields = [field for properties in mappings for field in ip_fields(properties)]
+
+        assert [name for name, _ in fields] == ["source.ip", "source_ips", "source_ips"]
+        assert all(mapping["ignore_malformed"] for _, mapping in fields)
+
+    def test_ilm_policies(self):
+        """Test events age out and alerts roll over before deletion."""
+        assert "delete" in events_ilm_policy()["phases"]
+        assert "warm" in events_ilm_policy()["phases"]
+        assert "rollover" in alerts_ilm_policy()["phases"]["hot"]["actions"]
+        assert "delete" in alerts_ilm_policy()["phases"]
+
+    def test_install_index_templates(self):
+        """Test policies are installed before the templates that reference them."""
+        es = Mock()
+
+        assert install_index_templates(es) is True
+
+        assert [c[1]["name"] for c in es.ilm.put_lifecycle.call_args_list] == [EVENTS_POLICY, ALERTS_POLICY]
+        assert [c[1]["name"] for c in es.indices.put_index_template.call_args_list] == [EVENTS_TEMPLATE, ALERTS_TEMPLATE]
+
+    def test_install_index_templates_failure(self):
+        """Test template installation errors are logged, not raised."""
+        es = Mock()
+        es.ilm.put_lifecycle.side_effect = Exception("forbidden")
+
+        assert install_index_templates(es) is False
+
+    def test_ensure_alerts_index_bootstraps_rollover(self, mock_elasticsearch):
+        """Test a fresh cluster gets security-alerts-000001 as the alias write index."""
+        mock_elasticsearch.indices.exists.return_value = False
+
+        with patch('app.core.clients.Elasticsearch', return_value=mock_elasticsearch):
+            AlertService()
+
+        mock_elasticsearch.indices.put_index_template.assert_called()
+        mock_elasticsearch.indices.create.assert_called_once_with(
+            index="security-alerts-000001",
+            aliases={"security-alerts": {"is_write_index": True}}
+        )
@@ -0,0 +1,153 @@
+import os
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from app.alerts.ioc import IntervalIndex, IocSnapshot, IocStore
+from app.alerts.models import MultipleFailedLoginsRule
+from app.alerts.service import AlertService, build_rules_filter
+
+
+BASE_TIME = datetime(2025, 9, 3, 10, 0, tzinfo=timezone.utc)
+
+
+def event(minutes, record_id, **fields):
+    data = {
+        "@timestamp": (BASE_TIME + timedelta(minutes=minutes)).isoformat().replace('+00:00', 'Z'),
+        "event": {"id": 4624},
+        "EventRecordID": record_id
+    }
+    data.update(fields)
+    return data
+
+
+def write_list(directory, kind, name, lines):
+    os.makedirs(directory / kind, exist_ok=True)
+    path = directory / kind / name
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+class TestIntervalIndex:
+    """Test the CIDR interval index."""
+
+    def test_overlapping_ranges_are_split(self):
+        """Test overlapping ranges keep the labels of every list covering them."""
+        index = IntervalIndex([(10, 20, "a"), (15, 30, "b"), (40, 40, "a")])
+
+        assert index.lookup(9) is None
+        assert index.lookup(10) == {"a"}
+        assert index.lookup(15) == {"a", "b"}
+        assert index.lookup(20) == {"a", "b"}
+        assert index.lookup(21) == {"b"}
+        assert index.lookup(31) is None
+        assert index.lookup(40) == {"a"}
+        assert len(index) == 4
+
+    def test_adjacent_ranges_merge(self):
+        """Test adjacent ranges from the same list collapse into one segment."""
+        index = IntervalIndex([(0, 9, "a"), (10, 19, "a")], typecode="Q")
+
+        assert len(index) == 1
+        assert index.lookup(19) == {"a"}
+
+
+class TestIocSnapshot:
+    """Test indicator lookups."""
+
+    def test_ip_cidr_user_and_hash_lookups(self):
+        """Test CIDR membership for IPv4/IPv6 and case-insensitive exact matches."""
+        snapshot = IocSnapshot(
+            networks=[("203.0.113.0/24", "feed"), ("198.51.100.7", "manual"), ("2001:db8::/32", "feed"), ("bogus", "x")],
+            users=[("EvilAdmin", "insider")],
+            hashes=[("ABCDEF0123", "malware")]
+        )
+
+        assert snapshot.match_ip("203.0.113.200") == {"feed"}
+        assert snapshot.match_ip("198.51.100.7") == {"manual"}
+        assert snapshot.match_ip("198.51.100.8") is None
+        assert snapshot.match_ip("2001:db8::1") == {"feed"}
+        assert snapshot.match_ip("not-an-ip") is None
+        assert snapshot.match_user("evILadmin") == {"insider"}
+        assert snapshot.match_hash("abcdef0123") == {"malware"}
+        assert snapshot.invalid == 1
+        assert snapshot.counts == {"ips": 3, "users": 1, "hashes": 1}
+
+
+class TestIocRule:
+    """Test the threat-intel alert rule and its store."""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        write_list(tmp_path, "ips", "blocklist.txt", ["# known bad", "203.0.113.0/24", "10.9.9.9  # internal scanner"])
+        write_list(tmp_path, "users", "compromised.txt", ["mallory"])
+        write_list(tmp_path, "hashes", "malware.txt", ["d41d8cd98f00b204e9800998ecf8427e"])
+        store = IocStore(str(tmp_path))
+        store.reload_if_changed(force=True)
+        return store
+
+    def test_rule_matches_ip_user_and_hash(self, store):
+        """Test events are matched on source.ip, IpAddress, user names and process hashes."""
+        events = [
+            event(0, "1", source={"ip": "203.0.113.5"}),
+            event(1, "2", source={"ip": "203.0.113.5"}),
+            event(2, "3", IpAddress="10.9.9.9"),
+            event(3, "4", TargetUserName="Mallory"),
+            event(4, "5", Hashes="SHA1=AAAA,MD5=D41D8CD98F00B204E9800998ECF8427E"),
+            event(5, "6", source={"ip": "8.8.8.8"}, TargetUserName="bob")
+        ]
+
+        alerts = store.rule.check(events)
+
+        by_title = {}
+        for alert in alerts:
+            by_title.setdefault(alert.title, []).append(alert)
+        assert sorted(a.event_count for a in by_title["Threat Intel Match (ip)"]) == [1, 2]
+        assert by_title["Threat Intel Match (user)"][0].event_ids == ["4"]
+        assert "malware" in by_title["Threat Intel Match (hash)"][0].description
+        assert all(a.source == "Threat Intel" for a in alerts)
+
+    def test_reload_swaps_snapshot(self, store, tmp_path):
+        """Test a changed list produces a new snapshot while the old one stays usable."""
+        old = store.snapshot
+        path = write_list(tmp_path, "ips", "blocklist.txt", ["192.0.2.0/24"])
+        os.utime(path, ns=(1, 1))
+
+        assert store.reload_if_changed(force=True) is True
+        assert store.snapshot is not old
+        assert old.match_ip("203.0.113.5") == {"blocklist"}
+        assert store.snapshot.match_ip("203.0.113.5") is None
+        assert store.reload_if_changed(force=True) is False
+
+    def test_rule_inactive_without_indicators(self, tmp_path):
+        """Test the rule is only registered while indicators are loaded."""
+        store = IocStore(str(tmp_path / "missing"))
+
+        assert store.rules() == []
+        assert store.rule.check([event(0, "1", source={"ip": "203.0.113.5"})]) == []
+
+    def test_pushdown_filter_requires_an_indicator_field(self, tmp_path):
+        """Test the IOC rule only widens the event query to events carrying a loaded indicator field."""
+        write_list(tmp_path, "users", "compromised.txt", ["mallory"])
+        store = IocStore(str(tmp_path))
+        store.reload_if_changed(force=True)
+
+        rules_filter = build_rules_filter([MultipleFailedLoginsRule(), store.rule])
+
+        ioc_clause = rules_filter["bool"]["should"][1]["bool"]["filter"]
+        alternatives = ioc_clause[-1]["bool"]
+        assert alternatives["minimum_should_match"] == 1
+        assert alternatives["should"] == [
+            {"exists": {"field": "TargetUserName"}},
+            {"exists": {"field": "SubjectUserName"}}
+        ]
+
+    def test_generate_alerts_includes_ioc_rule(self, store, mock_elasticsearch):
+        """Test the IOC rule runs alongside the native rules."""
+        from unittest.mock import patch
+        with patch('app.core.clients.Elasticsearch') as mock_es_class, \
+             patch('app.alerts.service.ioc_store', store):
+            mock_es_class.return_value = mock_elasticsearch
+            service = AlertService()
+            alerts = service.generate_alerts(events=[event(0, "1", source={"ip": "203.0.113.5"})])
+
+        assert [a.source for a in alerts] == ["Threat Intel"]
@@ -5,7 +5,8 @@ from typing import List, Dict, Any
 
 from app.alerts.models import (
     Alert, AlertRule, AlertSeverity, AlertStatus,
-    MultipleFailedLoginsRule, PrivilegeEscalationRule, SuspiciousProcessRule
+    MultipleFailedLoginsRule, PrivilegeEscalationRule, SuspiciousProcessRule,
+    alert_fingerprint, time_bucket
 )
 
 
@@ -279,3 +280,62 @@ class TestSuspiciousProcessRule:
         if alerts:
             alert = alerts[0]
             assert alert.severity == AlertSeverity.MEDIUM
+
+
+class TestAlertFingerprints:
+    """Test deterministic alert ids."""
+
+    @staticmethod
+    def escalation_event(minutes, record_id):
+        timestamp = datetime(2025, 9, 3, 10, 0, tzinfo=timezone.utc) + timedelta(minutes=minutes)
+        return {
+            "@timestamp": timestamp.isoformat().replace('+00:00', 'Z'),
+            "event": {"id": 4728},
+            "TargetUserName": "admin_user",
+            "EventRecordID": record_id
+        }
+
+    def test_fingerprint_is_deterministic(self):
+        """Test the same rule, key and bucket give the same id."""
+        bucket = time_bucket(datetime(2025, 9, 3, 10, 17, tzinfo=timezone.utc), 60)
+
+        assert bucket == datetime(2025, 9, 3, 10, 0, tzinfo=timezone.utc)
+        assert alert_fingerprint("x", "Rule", ("1.2.3.4", "bob"), bucket) == alert_fingerprint("x", "Rule", ("1.2.3.4", "bob"), bucket)
+        assert alert_fingerprint("x", "Rule", ("1.2.3.4", "bob"), bucket) != alert_fingerprint("x", "Rule", ("1.2.3.4", "eve"), bucket)
+
+    def test_privilege_escalation_rerun_same_ids(self):
+        """Test re-running a rule over the same events yields identical alert ids."""
+        rule = PrivilegeEscalationRule()
+        events = [self.escalation_event(0, "1"), self.escalation_event(5, "2")]
+
+        first = rule.check(events)
+        second = rule.check(events)
+
+        assert [a.id for a in first] == [a.id for a in second]
+        assert first[0].id.startswith("privilege_escalation_")
+
+    def test_privilege_escalation_buckets_events(self):
+        """Test events in different dedup buckets produce separate alerts."""
+        rule = PrivilegeEscalationRule()
+        events = [self.escalation_event(0, "1"), self.escalation_event(90, "2")]
+
+        alerts = rule.check(events)
+
+        assert len(alerts) == 2
+        assert len({a.id for a in alerts}) == 2
+
+    def test_failed_logins_id_stable_within_bucket(self):
+        """Test the failed-logins alert id does not depend on the exact window start."""
+        rule = MultipleFailedLoginsRule()
+        base = datetime(2025, 9, 3, 10, 0, tzinfo=timezone.utc)
+
+        def attempts(offset):
+            return [{
+                "@timestamp": (base + timedelta(minutes=offset + i)).isoformat(),
+                "event": {"id": 4625},
+                "source": {"ip": "203.0.113.5"},
+                "TargetUserName": "bob",
+                "EventRecordID": str(offset * 10 + i)
+            } for i in range(5)]
+
+        assert rule.check(attempts(0))[0].id == rule.check(attempts(20))[0].id
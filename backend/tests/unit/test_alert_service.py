@@ -1,9 +1,24 @@
 import pytest
 from unittest.mock import Mock, patch, MagicMock
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
-from app.alerts.service import AlertService
-from app.alerts.models import AlertStatus, AlertSeverity
+from app.alerts.service import (
+    AlertService, AlertVersionConflict, build_rules_filter, build_rules_source,
+    build_threshold_aggregation, find_threshold_candidates
+)
+from app.alerts.dsl import rule_registry
+from app.alerts.models import (
+    AlertRule, AlertStatus, AlertSeverity, ThresholdPlan,
+    MultipleFailedLoginsRule, PrivilegeEscalationRule, SuspiciousProcessRule
+)
+
+
+class ApiError(Exception):
+    """Stand-in for elasticsearch.ApiError, which the test config mocks out"""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
 
 
 class TestAlertService:
@@ -12,14 +27,14 @@ class TestAlertService:
     @pytest.fixture
     def alert_service(self, mock_elasticsearch):
         """Create AlertService instance with mocked Elasticsearch."""
-        with patch('app.alerts.service.Elasticsearch') as mock_es_class:
+        with patch('app.core.clients.Elasticsearch') as mock_es_class:
             mock_es_class.return_value = mock_elasticsearch
             service = AlertService()
             return service
 
     def test_service_initialization_success(self, mock_elasticsearch):
         """Test successful service initialization."""
-        with patch('app.alerts.service.Elasticsearch') as mock_es_class:
+        with patch('app.core.clients.Elasticsearch') as mock_es_class:
             mock_es_class.return_value = mock_elasticsearch
             service = AlertService()
             
@@ -28,7 +43,7 @@ class TestAlertService:
 
     def test_service_initialization_failure(self):
         """Test service initialization with Elasticsearch failure."""
-        with patch('app.alerts.service.Elasticsearch') as mock_es_class:
+        with patch('app.core.clients.Elasticsearch') as mock_es_class:
             mock_es = Mock()
             mock_es.ping.return_value = False
             mock_es_class.return_value = mock_es
@@ -37,6 +52,21 @@ class TestAlertService:
             
             assert service.es is None
 
+    def test_lazy_service_connects_on_first_use(self, mock_elasticsearch):
+        """Test a lazy service defers connecting until .es is used, once per process."""
+        with patch('app.core.clients.Elasticsearch', return_value=mock_elasticsearch) as mock_es_class:
+            service = AlertService(lazy=True)
+            mock_es_class.assert_not_called()
+
+            assert service.es is mock_elasticsearch
+            assert service.es is mock_elasticsearch
+            mock_es_class.assert_called_once()
+
+            # A forked worker has a different pid and builds its own client
+            with patch('app.alerts.service.os.getpid', return_value=-1):
+                assert service.es is mock_elasticsearch
+            assert mock_es_class.call_count == 2
+
     def test_ensure_alerts_index_creates_index(self, alert_service, mock_elasticsearch):
         """Test alerts index creation."""
         mock_elasticsearch.indices.exists.return_value = False
@@ -71,7 +101,7 @@ class TestAlertService:
 
     def test_get_recent_events_no_elasticsearch(self):
         """Test get_recent_events when Elasticsearch is unavailable."""
-        with patch('app.alerts.service.Elasticsearch') as mock_es_class:
+        with patch('app.core.clients.Elasticsearch') as mock_es_class:
             mock_es_class.side_effect = Exception("Connection failed")
             service = AlertService()
             
@@ -81,24 +111,77 @@ class TestAlertService:
 
     def test_store_alert_success(self, alert_service, mock_elasticsearch, sample_alert):
         """Test successful alert storage."""
-        mock_elasticsearch.index.return_value = {"_id": "test-alert-1", "result": "created"}
+        mock_elasticsearch.update.return_value = {"_id": "test-alert-1", "result": "created"}
         
         result = alert_service.store_alert(sample_alert)
         
         assert result is True
-        mock_elasticsearch.index.assert_called_once()
+        mock_elasticsearch.update.assert_called_once()
+        call_kwargs = mock_elasticsearch.update.call_args[1]
+        assert call_kwargs["index"] == "security-alerts"
+        assert call_kwargs["id"] == "test-alert-1"
+        assert call_kwargs["upsert"]["event_ids"] == ["event-1", "event-2"]
+        assert call_kwargs["script"]["params"]["event_ids"] == ["event-1", "event-2"]
+
+    def test_store_alert_merges_into_rolled_over_index(self, alert_service, mock_elasticsearch, sample_alert):
+        """Test an alert stored before a rollover is merged where it lives, not copied to the write index."""
+        mock_elasticsearch.search.return_value = {
+            "hits": {"hits": [{"_id": "test-alert-1", "_index": "security-alerts-000001"}], "total": {"value": 1}}
+        }
+
+        assert alert_service.store_alert(sample_alert) is True
+
+        assert mock_elasticsearch.search.call_args[1]["index"] == "security-alerts*"
+        assert mock_elasticsearch.search.call_args[1]["query"] == {"ids": {"values": ["test-alert-1"]}}
+        assert mock_elasticsearch.update.call_args[1]["index"] == "security-alerts-000001"
 
     def test_store_alert_failure(self, alert_service, mock_elasticsearch, sample_alert):
         """Test alert storage failure."""
-        mock_elasticsearch.index.side_effect = Exception("Storage failed")
+        mock_elasticsearch.update.side_effect = Exception("Storage failed")
         
         result = alert_service.store_alert(sample_alert)
         
         assert result is False
 
+    def test_store_alert_repeated_is_noop(self, alert_service, mock_elasticsearch, sample_alert):
+        """Test storing the same alert with the same events skips Elasticsearch."""
+        assert alert_service.store_alert(sample_alert) is True
+        assert alert_service.store_alert(sample_alert) is True
+
+        mock_elasticsearch.update.assert_called_once()
+
+    def test_store_alert_with_new_events_upserts_again(self, alert_service, mock_elasticsearch, sample_alert):
+        """Test new events for an existing fingerprint are merged into the stored alert."""
+        alert_service.store_alert(sample_alert)
+        sample_alert.event_ids = sample_alert.event_ids + ["event-3"]
+        sample_alert.event_count += 1
+
+        alert_service.store_alert(sample_alert)
+
+        assert mock_elasticsearch.update.call_count == 2
+
+    def test_store_alert_failure_is_retried(self, alert_service, mock_elasticsearch, sample_alert):
+        """Test a failed write is not remembered in the seen-set."""
+        mock_elasticsearch.update.side_effect = [Exception("Storage failed"), {"result": "created"}]
+
+        assert alert_service.store_alert(sample_alert) is False
+        assert alert_service.store_alert(sample_alert) is True
+        assert mock_elasticsearch.update.call_count == 2
+
+    def test_store_alert_without_redis(self, alert_service, mock_elasticsearch, sample_alert):
+        """Test alerts are still written when the seen-set is unavailable."""
+        import redis
+        broken = Mock()
+        broken.set.side_effect = redis.ConnectionError("down")
+
+        with patch('app.alerts.service.redis_client', broken):
+            assert alert_service.store_alert(sample_alert) is True
+
+        mock_elasticsearch.update.assert_called_once()
+
     def test_store_alert_no_elasticsearch(self, sample_alert):
         """Test alert storage when Elasticsearch is unavailable."""
-        with patch('app.alerts.service.Elasticsearch') as mock_es_class:
+        with patch('app.core.clients.Elasticsearch') as mock_es_class:
             mock_es_class.side_effect = Exception("Connection failed")
             service = AlertService()
             
@@ -107,33 +190,129 @@ class TestAlertService:
             assert result is False
 
     def test_update_alert_status_success(self, alert_service, mock_elasticsearch):
-        """Test successful alert status update."""
-        mock_elasticsearch.exists.return_value = True
+        """Test successful alert status update is a single request."""
         mock_elasticsearch.update.return_value = {"_id": "test-alert-1", "result": "updated"}
         
         result = alert_service.update_alert_status("test-alert-1", AlertStatus.INVESTIGATING)
         
         assert result is True
         mock_elasticsearch.update.assert_called_once()
+        mock_elasticsearch.exists.assert_not_called()
+        assert mock_elasticsearch.update.call_args[1]["doc"]["status"] == "investigating"
 
     def test_update_alert_status_not_found(self, alert_service, mock_elasticsearch):
-        """Test alert status update for non-existent alert."""
-        mock_elasticsearch.exists.return_value = False
+        """Test alert status update for non-existent alert relies on the update's 404."""
+        mock_elasticsearch.update.side_effect = ApiError(404)
         
         result = alert_service.update_alert_status("non-existent", AlertStatus.RESOLVED)
         
         assert result is False
-        mock_elasticsearch.update.assert_not_called()
+        mock_elasticsearch.exists.assert_not_called()
 
     def test_update_alert_status_failure(self, alert_service, mock_elasticsearch):
         """Test alert status update failure."""
-        mock_elasticsearch.exists.return_value = True
         mock_elasticsearch.update.side_effect = Exception("Update failed")
         
         result = alert_service.update_alert_status("test-alert-1", AlertStatus.RESOLVED)
         
         assert result is False
 
+    def test_update_alert_status_conditional(self, alert_service, mock_elasticsearch):
+        """Test the read version is passed on and a concurrent change is reported as a conflict."""
+        mock_elasticsearch.update.side_effect = ApiError(409)
+        
+        with pytest.raises(AlertVersionConflict):
+            alert_service.update_alert_status("test-alert-1", AlertStatus.RESOLVED, if_seq_no=7, if_primary_term=1)
+        
+        assert mock_elasticsearch.update.call_args[1]["if_seq_no"] == 7
+        assert mock_elasticsearch.update.call_args[1]["if_primary_term"] == 1
+
+    def test_update_alert_status_read_index(self, alert_service, mock_elasticsearch):
+        """Test an alert read from a rolled-over index is updated there, in one request."""
+        result = alert_service.update_alert_status(
+            "test-alert-1", AlertStatus.RESOLVED, if_seq_no=7, if_primary_term=1, index="security-alerts-000001"
+        )
+        
+        assert result is True
+        mock_elasticsearch.update.assert_called_once()
+        assert mock_elasticsearch.update.call_args[1]["index"] == "security-alerts-000001"
+        mock_elasticsearch.search.assert_not_called()
+
+    def test_update_alert_status_rolled_over(self, alert_service, mock_elasticsearch):
+        """Test an alert missing from the write index is found in an older backing index."""
+        mock_elasticsearch.update.side_effect = [ApiError(404), {"result": "updated"}]
+        mock_elasticsearch.search.return_value = {
+            "hits": {"hits": [{"_id": "test-alert-1", "_index": "security-alerts-000001"}], "total": {"value": 1}}
+        }
+        
+        result = alert_service.update_alert_status("test-alert-1", AlertStatus.RESOLVED)
+        
+        assert result is True
+        assert [c[1]["index"] for c in mock_elasticsearch.update.call_args_list] == [
+            "security-alerts", "security-alerts-000001"
+        ]
+        assert mock_elasticsearch.search.call_args[1]["index"] == "security-alerts*"
+
+    def test_update_alerts_status_by_ids_rolled_over(self, alert_service, mock_elasticsearch):
+        """Test ids missing from the write index are retried where they live, the rest reported missing."""
+        mock_elasticsearch.bulk.side_effect = [
+            {"errors": True, "items": [
+                {"update": {"_id": "a1", "status": 200, "result": "updated"}},
+                {"update": {"_id": "a2", "status": 404, "error": {"type": "document_missing_exception"}}},
+                {"update": {"_id": "a3", "status": 404, "error": {"type": "document_missing_exception"}}},
+            ]},
+            {"errors": False, "items": [{"update": {"_id": "a2", "status": 200, "result": "updated"}}]},
+        ]
+        mock_elasticsearch.search.return_value = {
+            "hits": {"hits": [{"_id": "a2", "_index": "security-alerts-000001"}], "total": {"value": 1}}
+        }
+        
+        result = alert_service.update_alerts_status(AlertStatus.RESOLVED, alert_ids=["a1", "a2", "a3"])
+        
+        assert result == {"updated": 2, "not_found": ["a3"], "conflicts": 0, "failed": 0}
+        assert mock_elasticsearch.search.call_args[1]["query"] == {"ids": {"values": ["a2", "a3"]}}
+        retry = mock_elasticsearch.bulk.call_args_list[1][1]["operations"]
+        assert retry[0] == {"update": {"_index": "security-alerts-000001", "_id": "a2"}}
+
+    def test_update_alerts_status_by_ids(self, alert_service, mock_elasticsearch):
+        """Test many alerts are updated in one _bulk request, with missing ones reported."""
+        mock_elasticsearch.bulk.return_value = {"errors": True, "items": [
+            {"update": {"_id": "a1", "status": 200, "result": "updated"}},
+            {"update": {"_id": "a2", "status": 404, "error": {"type": "document_missing_exception"}}},
+            {"update": {"_id": "a3", "status": 200, "result": "noop"}},
+        ]}
+        
+        result = alert_service.update_alerts_status(AlertStatus.RESOLVED, alert_ids=["a1", "a2", "a3"])
+        
+        assert result == {"updated": 2, "not_found": ["a2"], "conflicts": 0, "failed": 0}
+        operations = mock_elasticsearch.bulk.call_args[1]["operations"]
+        assert len(operations) == 6
+        assert operations[0] == {"update": {"_index": "security-alerts", "_id": "a1"}}
+        assert operations[1]["doc"]["status"] == "resolved"
+
+    def test_update_alerts_status_by_query(self, alert_service, mock_elasticsearch):
+        """Test a filter is applied with update_by_query across every alerts index."""
+        mock_elasticsearch.update_by_query.return_value = {"updated": 40, "version_conflicts": 2, "failures": []}
+        
+        result = alert_service.update_alerts_status(
+            AlertStatus.FALSE_POSITIVE, severity=AlertSeverity.LOW, current_status=AlertStatus.OPEN
+        )
+        
+        assert result == {"updated": 40, "not_found": [], "conflicts": 2, "failed": 0}
+        kwargs = mock_elasticsearch.update_by_query.call_args[1]
+        assert kwargs["index"] == "security-alerts*"
+        assert kwargs["conflicts"] == "proceed"
+        assert {"term": {"severity": "low"}} in kwargs["query"]["bool"]["filter"]
+        assert {"term": {"status": "open"}} in kwargs["query"]["bool"]["filter"]
+        assert kwargs["script"]["params"]["status"] == "false_positive"
+
+    def test_update_alerts_status_without_filters_refused(self, alert_service, mock_elasticsearch):
+        """Test an update with neither ids nor filters never reaches update_by_query."""
+        with pytest.raises(ValueError):
+            alert_service.update_alerts_status(AlertStatus.RESOLVED)
+
+        mock_elasticsearch.update_by_query.assert_not_called()
+
     def test_get_stored_alerts_success(self, alert_service, mock_elasticsearch, sample_alert_dict):
         """Test successful retrieval of stored alerts."""
         mock_elasticsearch.search.return_value = {
@@ -148,6 +327,16 @@ class TestAlertService:
         assert len(alerts) == 1
         assert alerts[0]["id"] == "test-alert-1"
 
+    def test_get_stored_alerts_carry_location_and_version(self, alert_service, mock_elasticsearch, sample_alert_dict):
+        """Test each alert comes with the index and version a status update should target."""
+        mock_elasticsearch.search.return_value = {"hits": {"hits": [{
+            "_index": "security-alerts-000001", "_seq_no": 12, "_primary_term": 1, "_source": sample_alert_dict
+        }], "total": {"value": 1}}}
+        
+        alert = alert_service.get_stored_alerts()[0]
+        
+        assert (alert["index"], alert["seq_no"], alert["primary_term"]) == ("security-alerts-000001", 12, 1)
+
     def test_get_stored_alerts_with_filters(self, alert_service, mock_elasticsearch):
         """Test stored alerts retrieval with filters."""
         mock_elasticsearch.search.return_value = {
@@ -171,16 +360,18 @@ class TestAlertService:
         assert "bool" in query
         assert len(query["bool"]["must"]) == 2
 
-    def test_get_stored_alerts_fallback(self, alert_service, mock_elasticsearch):
-        """Test fallback to generated alerts when storage fails."""
+    def test_get_stored_alerts_fallback(self, alert_service, mock_elasticsearch, sample_alert_dict):
+        """Test a failed search serves the last good page instead of generating alerts."""
+        mock_elasticsearch.search.return_value = {"hits": {"hits": [{"_source": sample_alert_dict}]}}
+        alert_service.get_stored_alerts()
         mock_elasticsearch.search.side_effect = Exception("Search failed")
         
-        with patch.object(alert_service, 'get_alerts') as mock_get_alerts:
-            mock_get_alerts.return_value = []
-            
+        with patch.object(alert_service, 'generate_alerts') as mock_generate:
             alerts = alert_service.get_stored_alerts()
             
-            mock_get_alerts.assert_called_once()
+        assert alerts == [sample_alert_dict]
+        mock_generate.assert_not_called()
+        assert alert_service.get_stored_alerts(severity=AlertSeverity.LOW) == [] # never fetched
 
     @patch('app.alerts.service.ALERT_RULES')
     def test_generate_alerts_success(self, mock_rules, alert_service, sample_events, sample_alert):
@@ -216,29 +407,55 @@ class TestAlertService:
             # Should continue processing despite rule failure
             assert alerts == []
 
-    def test_get_alert_stats(self, alert_service, sample_alert):
-        """Test alert statistics generation."""
+    def test_get_alert_stats(self, alert_service, mock_elasticsearch):
+        """Test alert statistics are aggregated from stored alerts."""
+        hour = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H")
+        mock_elasticsearch.search.return_value = {
+            "hits": {"total": {"value": 3}, "hits": []},
+            "aggregations": {
+                "by_severity": {"buckets": [{"key": "high", "doc_count": 2}, {"key": "low", "doc_count": 1}]},
+                "by_status": {"buckets": [{"key": "open", "doc_count": 3}]},
+                "recent": {"by_hour": {"buckets": [{
+                    "key_as_string": f"{hour}:00:00.000Z", "doc_count": 3,
+                    "by_severity": {"buckets": [{"key": "high", "doc_count": 2}, {"key": "low", "doc_count": 1}]}
+                }]}}
+            }
+        }
+        
         with patch.object(alert_service, 'generate_alerts') as mock_generate:
-            mock_generate.return_value = [sample_alert]
-            
             stats = alert_service.get_alert_stats()
-            
-            assert stats["total_alerts"] == 1
-            assert stats["by_severity"]["high"] == 1
-            assert stats["by_status"]["open"] == 1
-            assert "recent_activity" in stats
+        
+        mock_generate.assert_not_called()
+        assert mock_elasticsearch.search.call_args[1]["size"] == 0
+        assert stats["total_alerts"] == 3
+        assert stats["by_severity"]["high"] == 2
+        assert stats["by_severity"]["critical"] == 0
+        assert stats["by_status"]["open"] == 3
+        assert stats["recent_activity"][0]["total"] == 3
+        assert stats["recent_activity"][0]["high"] == 2
+
+    def test_get_alert_stats_degraded(self, alert_service, mock_elasticsearch):
+        """Test stats fall back to the last good aggregation, or zeros, when the search fails."""
+        mock_elasticsearch.search.side_effect = Exception("Search failed")
+        
+        stats = alert_service.get_alert_stats()
+        
+        assert stats["total_alerts"] == 0
+        assert stats["by_status"]["open"] == 0
 
-    def test_get_recent_activity_stats(self, alert_service, sample_alert):
-        """Test recent activity statistics generation."""
-        with patch.object(alert_service, 'generate_alerts') as mock_generate:
-            mock_generate.return_value = [sample_alert]
-            
-            stats = alert_service._get_recent_activity_stats([sample_alert])
-            
-            assert isinstance(stats, list)
-            assert len(stats) == 24  # 24 hours
-            assert all("time" in stat for stat in stats)
-            assert all("total" in stat for stat in stats)
+    def test_get_recent_activity_stats(self, alert_service):
+        """Test recent activity covers the last 24 hours, newest first, including empty hours."""
+        now = datetime(2025, 9, 3, 10, 30, tzinfo=timezone.utc)
+        buckets = [{"key_as_string": "2025-09-03T09:00:00.000Z", "doc_count": 4,
+                    "by_severity": {"buckets": [{"key": "critical", "doc_count": 4}]}}]
+        
+        stats = alert_service._get_recent_activity_stats(buckets, now)
+        
+        assert isinstance(stats, list)
+        assert len(stats) == 24  # 24 hours
+        assert [stat["time"] for stat in stats[:2]] == ["10:00", "09:00"]
+        assert stats[1]["total"] == 4 and stats[1]["critical"] == 4
+        assert stats[0]["total"] == 0
 
     def test_get_all_events_success(self, alert_service, mock_elasticsearch):
         """Test successful retrieval of all events."""
@@ -325,114 +542,318 @@ class TestAlertService:
             # Should return empty list and log error
             assert alerts == []
 
-    def test_get_alerts_with_fallback_generation(self, alert_service):
-        """Test get_alerts falling back to real-time generation when no stored alerts."""
-        with patch.object(alert_service, 'get_stored_alerts') as mock_stored, \
+    def test_get_alerts_never_generates(self, alert_service):
+        """Test get_alerts only reads stored alerts, even when there are none."""
+        with patch.object(alert_service, 'get_stored_alerts', return_value=[]) as mock_stored, \
              patch.object(alert_service, 'generate_alerts') as mock_generate, \
              patch.object(alert_service, 'store_alert') as mock_store:
             
-            # Setup: no stored alerts, generate new ones
-            mock_stored.return_value = []
-            mock_alert = Mock()
-            mock_alert.status = AlertStatus.OPEN
-            mock_alert.severity = AlertSeverity.HIGH
-            mock_alert.timestamp = datetime.now(timezone.utc)
-            mock_alert.to_dict.return_value = {"id": "test", "status": "open"}
-            mock_generate.return_value = [mock_alert]
-            
-            result = alert_service.get_alerts()
-            
-            mock_stored.assert_called_once()
-            mock_generate.assert_called_once()
-            mock_store.assert_called_once_with(mock_alert)
-            assert len(result) == 1
-
-    def test_get_alerts_with_status_filtering(self, alert_service):
-        """Test get_alerts with status filtering applied to generated alerts."""
-        with patch.object(alert_service, 'get_stored_alerts') as mock_stored, \
-             patch.object(alert_service, 'generate_alerts') as mock_generate, \
-             patch.object(alert_service, 'store_alert') as mock_store:
-            
-            mock_stored.return_value = []
-            
-            # Create alerts with different statuses
-            alert1 = Mock()
-            alert1.status = AlertStatus.OPEN
-            alert1.severity = AlertSeverity.HIGH
-            alert1.timestamp = datetime.now(timezone.utc)
-            alert1.to_dict.return_value = {"id": "1", "status": "open"}
-            
-            alert2 = Mock()
-            alert2.status = AlertStatus.RESOLVED
-            alert2.severity = AlertSeverity.LOW
-            alert2.timestamp = datetime.now(timezone.utc)
-            alert2.to_dict.return_value = {"id": "2", "status": "resolved"}
-            
-            mock_generate.return_value = [alert1, alert2]
-            
-            # Test filtering by status
             result = alert_service.get_alerts(status=AlertStatus.OPEN)
-            assert len(result) == 1
-            assert result[0]["id"] == "1"
-
-    def test_get_alerts_with_severity_filtering(self, alert_service):
-        """Test get_alerts with severity filtering applied to generated alerts."""
-        with patch.object(alert_service, 'get_stored_alerts') as mock_stored, \
-             patch.object(alert_service, 'generate_alerts') as mock_generate, \
-             patch.object(alert_service, 'store_alert') as mock_store:
-            
-            mock_stored.return_value = []
-            
-            # Create alerts with different severities
-            alert1 = Mock()
-            alert1.status = AlertStatus.OPEN
-            alert1.severity = AlertSeverity.HIGH
-            alert1.timestamp = datetime.now(timezone.utc)
-            alert1.to_dict.return_value = {"id": "1", "severity": "high"}
-            
-            alert2 = Mock()
-            alert2.status = AlertStatus.OPEN
-            alert2.severity = AlertSeverity.LOW
-            alert2.timestamp = datetime.now(timezone.utc)
-            alert2.to_dict.return_value = {"id": "2", "severity": "low"}
             
-            mock_generate.return_value = [alert1, alert2]
-            
-            # Test filtering by severity  
-            result = alert_service.get_alerts(severity=AlertSeverity.LOW)
-            assert len(result) == 1
-            assert result[0]["id"] == "2"
+        assert result == []
+        mock_stored.assert_called_once_with(status=AlertStatus.OPEN, severity=None, limit=100)
+        mock_generate.assert_not_called()
+        mock_store.assert_not_called()
 
     def test_update_alert_status_alert_not_found(self, alert_service, mock_elasticsearch):
         """Test updating status of non-existent alert."""
-        mock_elasticsearch.exists.return_value = False
+        mock_elasticsearch.update.side_effect = ApiError(404)
         
         result = alert_service.update_alert_status("nonexistent-id", AlertStatus.RESOLVED)
         
         assert result is False
-        mock_elasticsearch.exists.assert_called_once_with(index="security-alerts", id="nonexistent-id")
-        mock_elasticsearch.update.assert_not_called()
+        assert mock_elasticsearch.update.call_args[1]["index"] == "security-alerts"
+        assert mock_elasticsearch.update.call_args[1]["id"] == "nonexistent-id"
 
     def test_update_alert_status_elasticsearch_exception(self, alert_service, mock_elasticsearch):
         """Test update_alert_status with Elasticsearch exception."""
-        mock_elasticsearch.exists.side_effect = Exception("Connection failed")
+        mock_elasticsearch.update.side_effect = Exception("Connection failed")
         
         result = alert_service.update_alert_status("test-id", AlertStatus.RESOLVED)
         
         assert result is False
 
     def test_get_stored_alerts_no_elasticsearch_fallback(self):
-        """Test get_stored_alerts falling back when Elasticsearch unavailable."""
+        """Test get_stored_alerts without Elasticsearch returns no alerts instead of recursing."""
         service = AlertService()
         service.es = None
         
-        with patch.object(service, 'get_alerts') as mock_get_alerts:
-            mock_get_alerts.return_value = [{"id": "fallback"}]
-            
+        with patch.object(service, 'get_alerts') as mock_get_alerts, \
+             patch.object(service, '_connect'):
             result = service.get_stored_alerts(status=AlertStatus.OPEN)
             
-            mock_get_alerts.assert_called_once_with(
-                status=AlertStatus.OPEN, 
-                severity=None, 
-                limit=100
-            )
+        assert result == []
+        mock_get_alerts.assert_not_called()
+
+    def test_breaker_opens_after_repeated_failures(self, alert_service, mock_elasticsearch, sample_alert_dict):
+        """Test Elasticsearch is skipped while the breaker is open and tried again after the reset."""
+        mock_elasticsearch.search.return_value = {"hits": {"hits": [{"_source": sample_alert_dict}]}}
+        alert_service.get_stored_alerts()
+        mock_elasticsearch.search.reset_mock()
+        mock_elasticsearch.search.side_effect = Exception("Search failed")
+        
+        with patch('app.core.breaker.settings.ES_BREAKER_FAILURE_THRESHOLD', 2):
+            for _ in range(5):
+                assert alert_service.get_stored_alerts() == [sample_alert_dict]
+        
+        assert mock_elasticsearch.search.call_count == 2
+        assert alert_service.read_breaker.is_open
+        
+        mock_elasticsearch.search.side_effect = None
+        with patch('app.core.breaker.settings.ES_BREAKER_RESET_SECONDS', 0):
+            alert_service.get_stored_alerts()
+        assert not alert_service.read_breaker.is_open
+
+
+class TestRuleQueryPushdown:
+    """Test pushing rule requirements into Elasticsearch queries."""
+
+    @pytest.fixture
+    def alert_service(self, mock_elasticsearch):
+        with patch('app.core.clients.Elasticsearch') as mock_es_class:
+            mock_es_class.return_value = mock_elasticsearch
+            return AlertService()
+
+    def test_build_rules_filter_combines_rules(self):
+        """Test each rule contributes a terms/exists clause to a should filter."""
+        rules_filter = build_rules_filter([MultipleFailedLoginsRule(), SuspiciousProcessRule()])
+
+        clauses = rules_filter["bool"]["should"]
+        assert rules_filter["bool"]["minimum_should_match"] == 1
+        assert {"terms": {"event.id": [4625]}} in clauses[0]["bool"]["filter"]
+        assert {"terms": {"event.id": [4688]}} in clauses[1]["bool"]["filter"]
+        assert {"exists": {"field": "NewProcessName"}} in clauses[1]["bool"]["filter"]
+
+    def test_build_rules_filter_unconstrained_rule(self):
+        """Test a rule without declared requirements disables event filtering."""
+        assert build_rules_filter([MultipleFailedLoginsRule(), AlertRule("Any", AlertSeverity.LOW)]) is None
+
+    def test_build_rules_source(self):
+        """Test _source includes are the union of the rules' fields."""
+        source = build_rules_source([MultipleFailedLoginsRule(), PrivilegeEscalationRule()])
+
+        assert "TargetUserName" in source["includes"]
+        assert "MemberName" in source["includes"]
+        assert "@timestamp" in source["includes"]
+        assert build_rules_source([AlertRule("Any", AlertSeverity.LOW)]) is None
+
+    def test_get_recent_events_with_rules(self, alert_service, mock_elasticsearch):
+        """Test rule requirements are placed in filter context."""
+        alert_service.get_recent_events(hours=1, rules=[PrivilegeEscalationRule()])
+
+        body = mock_elasticsearch.search.call_args[1]["body"]
+        filters = body["query"]["bool"]["filter"]
+        assert "must" not in body["query"]["bool"]
+        assert "range" in filters[0]
+        assert filters[1]["bool"]["filter"][0] == {"terms": {"event.id": [4728, 4732, 4756]}}
+        assert "MemberName" in body["_source"]["includes"]
+
+    def test_get_recent_events_without_rules_is_unfiltered(self, alert_service, mock_elasticsearch):
+        """Test the events API still returns full documents."""
+        alert_service.get_recent_events(hours=1)
+
+        body = mock_elasticsearch.search.call_args[1]["body"]
+        assert len(body["query"]["bool"]["filter"]) == 1
+        assert "_source" not in body
+
+    def test_generate_alerts_pushes_active_rules(self, alert_service):
+        """Test generate_alerts asks for events narrowed to the active rules."""
+        with patch.object(alert_service, 'get_recent_events', return_value=[]) as mock_recent, \
+             patch.object(alert_service, 'get_all_events', return_value=[]) as mock_all:
+            alert_service.generate_alerts()
+
+        rules = mock_recent.call_args[1]["rules"]
+        declarative = {rule.name for rule in rule_registry.rules()}
+        assert {rule.name for rule in rules} == {"Multiple Failed Logins", "Privilege Escalation", "Suspicious Process", "Password Spray"} | declarative
+        assert mock_all.call_args[1]["rules"] == rules
+
+    def test_get_shard_keys_pages_composite(self, alert_service, mock_elasticsearch):
+        """Test shard keys are read per field through composite pages, filtered by the field's rules."""
+        mock_elasticsearch.search.side_effect = [
+            {"aggregations": {"keys": {"buckets": [{"key": {"value": "10.0.0.1"}}], "after_key": {"value": "10.0.0.1"}}}},
+            {"aggregations": {"keys": {"buckets": [{"key": {"value": "10.0.0.2"}}]}}}
+        ]
+        end = datetime.now(timezone.utc)
+
+        keys = alert_service.get_shard_keys(end - timedelta(hours=1), end, [MultipleFailedLoginsRule()])
+
+        assert keys == {"source.ip": ["10.0.0.1", "10.0.0.2"]}
+        first, second = (c[1] for c in mock_elasticsearch.search.call_args_list)
+        assert first["size"] == 0 and "after" not in first["aggs"]["keys"]["composite"]
+        assert second["aggs"]["keys"]["composite"]["after"] == {"value": "10.0.0.1"}
+        assert first["query"]["bool"]["filter"][1]["bool"]["filter"][0] == {"terms": {"event.id": [4625]}}
+
+
+class TestAggregationPushdown:
+    """Test screening threshold rules with Elasticsearch aggregations."""
+
+    PLAN = ThresholdPlan(("source.ip", "TargetUserName"), 5, 10)
+    MINUTE_MS = 60 * 1000
+
+    @pytest.fixture
+    def alert_service(self, mock_elasticsearch):
+        with patch('app.core.clients.Elasticsearch') as mock_es_class:
+            mock_es_class.return_value = mock_elasticsearch
+            return AlertService()
+
+    @staticmethod
+    def bucket(ip, user, window_ms, count):
+        return {"key": {"g0": ip, "g1": user, "window": window_ms}, "doc_count": count}
+
+    @classmethod
+    def simulate_composite(cls, events, plan):
+        """Compute composite buckets in Python, ordered as Elasticsearch returns them."""
+        interval = int(plan.window_minutes * cls.MINUTE_MS)
+        counts = {}
+        for event in events:
+            ts = int(datetime.fromisoformat(event["@timestamp"].replace('Z', '+00:00')).timestamp() * 1000)
+            key = (event["source"]["ip"], event.get("TargetUserName"), ts - ts % interval)
+            counts[key] = counts.get(key, 0) + 1
+        return [cls.bucket(ip, user, window, count) for (ip, user, window), count in sorted(counts.items())]
+
+    def test_aggregation_body(self):
+        """Test group fields come before the time bucket and paging is supported."""
+        aggs = build_threshold_aggregation(self.PLAN, 500, after={"g0": "x"})
+        composite = aggs["candidates"]["composite"]
+
+        assert [list(source)[0] for source in composite["sources"]] == ["g0", "g1", "window"]
+        assert composite["sources"][2]["window"]["date_histogram"]["fixed_interval"] == "600s"
+        assert composite["sources"][0]["g0"]["terms"]["missing_bucket"] is True
+        assert composite["after"] == {"g0": "x"} and composite["size"] == 500
+
+    def test_candidates_single_and_adjacent_buckets(self):
+        """Test single full buckets and adjacent pairs are candidates; gaps are not."""
+        w = 10 * self.MINUTE_MS
+        buckets = [
+            self.bucket("1.1.1.1", "bob", 0, 5),        # alone over threshold
+            self.bucket("2.2.2.2", "eve", 0, 3),
+            self.bucket("2.2.2.2", "eve", w, 2),        # adjacent pair sums to 5
+            self.bucket("3.3.3.3", "amy", 0, 3),
+            self.bucket("3.3.3.3", "amy", 2 * w, 3),    # not adjacent
+            self.bucket("4.4.4.4", "joe", 0, 4)
+        ]
+
+        candidates = find_threshold_candidates(buckets, self.PLAN)
+
+        assert candidates == {
+            ("1.1.1.1", "bob"): [(0, 2 * w)],
+            ("2.2.2.2", "eve"): [(0, 2 * w)]
+        }
+
+    def test_candidates_match_full_evaluation(self):
+        """Test evaluating only candidate spans yields exactly the alerts of a full scan."""
+        import random
+        rng = random.Random(7)
+        base = datetime(2025, 9, 3, 0, 0, tzinfo=timezone.utc)
+        events = []
+        for i in range(3000):
+            minute = rng.randrange(0, 24 * 60)
+            second = rng.randrange(0, 60)
+            ip = f"10.0.0.{rng.randrange(0, 40)}"
+            events.append({
+                "@timestamp": (base + timedelta(minutes=minute, seconds=second)).isoformat().replace('+00:00', 'Z'),
+                "event": {"id": 4625},
+                "source": {"ip": ip},
+                "TargetUserName": f"user{rng.randrange(0, 3)}",
+                "EventRecordID": str(i)
+            })
+        # A real burst hidden among the noise, straddling a bucket boundary
+        for i in range(6):
+            events.append({
+                "@timestamp": (base + timedelta(hours=5, minutes=7 + i)).isoformat().replace('+00:00', 'Z'),
+                "event": {"id": 4625},
+                "source": {"ip": "203.0.113.9"},
+                "TargetUserName": "admin",
+                "EventRecordID": f"burst{i}"
+            })
+        rule = MultipleFailedLoginsRule()
+        plan = rule.threshold_plan()
+
+        candidates = find_threshold_candidates(self.simulate_composite(events, plan), plan)
+
+        def in_candidate_span(event):
+            spans = candidates.get((event["source"]["ip"], event.get("TargetUserName")), [])
+            ts = int(datetime.fromisoformat(event["@timestamp"].replace('Z', '+00:00')).timestamp() * 1000)
+            return any(start <= ts < end for start, end in spans)
+
+        subset = [e for e in events if in_candidate_span(e)]
+        full_ids = sorted(a.id for a in rule.check(events))
+
+        assert "203.0.113.9" in {a.source_ips[0] for a in rule.check(events)}
+        assert sorted(a.id for a in rule.check(subset)) == full_ids
+        assert len(subset) < len(events) / 5
+
+    def test_get_threshold_events_pages_and_fetches_candidates(self, alert_service, mock_elasticsearch):
+        """Test composite pages are followed and only candidate keys are fetched."""
+        w = 10 * self.MINUTE_MS
+        mock_elasticsearch.open_point_in_time.return_value = {"id": "pit-1"}
+        mock_elasticsearch.search.side_effect = [
+            {"aggregations": {"candidates": {"buckets": [self.bucket("1.1.1.1", "bob", 0, 6)], "after_key": {"g0": "1.1.1.1"}}}},
+            {"aggregations": {"candidates": {"buckets": [self.bucket("2.2.2.2", None, w, 1)], "after_key": {"g0": "2.2.2.2"}}}},
+            {"aggregations": {"candidates": {"buckets": []}}},
+            {"hits": {"hits": [{"_source": {"EventRecordID": "1"}}]}}
+        ]
+
+        events = alert_service.get_threshold_events(MultipleFailedLoginsRule())
+
+        assert events == [{"EventRecordID": "1"}]
+        calls = mock_elasticsearch.search.call_args_list
+        assert calls[1][1]["aggs"]["candidates"]["composite"]["after"] == {"g0": "1.1.1.1"}
+        fetch = calls[3][1]["body"]
+        candidate_clauses = fetch["query"]["bool"]["filter"][-1]["bool"]["should"]
+        assert len(candidate_clauses) == 1
+        assert candidate_clauses[0]["bool"]["filter"][0] == {"term": {"source.ip": "1.1.1.1"}}
+        assert fetch["pit"]["id"] == "pit-1"
+        mock_elasticsearch.close_point_in_time.assert_called_once_with(id="pit-1")
+
+    def test_get_threshold_events_pages_candidate_events(self, alert_service, mock_elasticsearch):
+        """Test candidate events beyond one page are fetched with search_after, not truncated."""
+        mock_elasticsearch.open_point_in_time.return_value = {"id": "pit-1"}
+        mock_elasticsearch.search.side_effect = [
+            {"aggregations": {"candidates": {"buckets": [self.bucket("1.1.1.1", "bob", 0, 6)]}}},
+            {"hits": {"hits": [{"_source": {"EventRecordID": "1"}, "sort": [1]}, {"_source": {"EventRecordID": "2"}, "sort": [2]}]}},
+            {"hits": {"hits": [{"_source": {"EventRecordID": "3"}, "sort": [3]}]}}
+        ]
+
+        with patch('app.alerts.service.settings.CHUNK_PAGE_SIZE', 2):
+            events = alert_service.get_threshold_events(MultipleFailedLoginsRule())
+
+        assert [e["EventRecordID"] for e in events] == ["1", "2", "3"]
+        assert mock_elasticsearch.search.call_args_list[2][1]["body"]["search_after"] == [2]
+
+    def test_get_threshold_events_not_applicable(self, alert_service, mock_elasticsearch):
+        """Test rules without a threshold plan are not pushed down."""
+        assert alert_service.get_threshold_events(PrivilegeEscalationRule()) is None
+        mock_elasticsearch.search.assert_not_called()
+
+    def test_generate_alerts_aggregation_mode(self, alert_service):
+        """Test threshold rules get screened events while other rules share the scan."""
+        failed_logins = MultipleFailedLoginsRule()
+        escalation = PrivilegeEscalationRule()
+        with patch('app.alerts.service.ALERT_RULES', [failed_logins, escalation]), \
+             patch('app.alerts.service.rule_registry') as mock_registry, \
+             patch('app.alerts.service.settings.RULE_EXECUTION_MODE', "aggregation"), \
+             patch('app.alerts.service.settings.SPRAY_ENABLED', False), \
+             patch.object(alert_service, 'get_threshold_events', side_effect=lambda rule: [] if rule is failed_logins else None) as mock_threshold, \
+             patch.object(alert_service, 'get_recent_events', return_value=[]) as mock_recent, \
+             patch.object(alert_service, 'get_all_events', return_value=[]):
+            mock_registry.rules.return_value = []
+            alert_service.generate_alerts()
+
+        assert mock_threshold.call_count == 2
+        assert mock_recent.call_args[1]["rules"] == [escalation]
+
+    def test_generate_alerts_aggregation_failure_falls_back(self, alert_service):
+        """Test a failed aggregation puts the rule back on the full scan."""
+        failed_logins = MultipleFailedLoginsRule()
+        with patch('app.alerts.service.ALERT_RULES', [failed_logins]), \
+             patch('app.alerts.service.rule_registry') as mock_registry, \
+             patch('app.alerts.service.settings.RULE_EXECUTION_MODE', "aggregation"), \
+             patch('app.alerts.service.settings.SPRAY_ENABLED', False), \
+             patch.object(alert_service, 'get_threshold_events', return_value=None), \
+             patch.object(alert_service, 'get_recent_events', return_value=[]) as mock_recent, \
+             patch.object(alert_service, 'get_all_events', return_value=[]):
+            mock_registry.rules.return_value = []
+            alert_service.generate_alerts()
+
+        assert mock_recent.call_args[1]["rules"] == [failed_logins]
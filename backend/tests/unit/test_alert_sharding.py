@@ -0,0 +1,320 @@
+import pytest
+import fakeredis
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+from app.alerts import tasks
+from app.alerts.dsl import DeclarativeRule, get_field
+from app.alerts.models import MultipleFailedLoginsRule, PrivilegeEscalationRule
+from app.alerts.service import build_shard_filter
+from app.alerts.sharding import (
+    HashRing, ShardMembership, assign_shard_keys, evaluate_shard, merge_alerts, partition_events, shard_queue, shard_value
+)
+from app.alerts.spray import PasswordSprayRule
+
+
+BASE_TIME = datetime(2025, 9, 3, 10, 0, tzinfo=timezone.utc)
+
+
+def failed_login(seconds, ip, user, event_id=4625):
+    return {
+        "@timestamp": (BASE_TIME + timedelta(seconds=seconds)).isoformat().replace('+00:00', 'Z'),
+        "event": {"id": event_id},
+        "EventRecordID": f"{ip}-{user}-{seconds}",
+        "source": {"ip": ip},
+        "TargetUserName": user
+    }
+
+
+def matches(clause, event):
+    """Evaluate the bool/terms/exists/range subset of the query DSL the shard filters use"""
+    kind, body = next(iter(clause.items()))
+    if kind == "bool":
+        should = body.get("should", [])
+        return (all(matches(c, event) for c in body.get("filter", []))
+                and not any(matches(c, event) for c in body.get("must_not", []))
+                and (not should or sum(matches(c, event) for c in should) >= body.get("minimum_should_match", 1)))
+    if kind == "terms":
+        field, values = next(iter(body.items()))
+        return get_field(event, field) in values
+    if kind == "exists":
+        return get_field(event, body["field"]) is not None
+    return kind == "range"
+
+
+def shard_keys(events, fields):
+    return {field: sorted({str(get_field(e, field)) for e in events if get_field(e, field) is not None}) for field in fields}
+
+
+@pytest.fixture
+def shard_redis():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    with patch('app.alerts.sharding.redis_client', client), patch('app.alerts.chunking.redis_client', client):
+        yield client
+
+
+@pytest.fixture
+def redis_client():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    with patch('app.alerts.sharding.redis_client', client):
+        yield client
+
+
+class TestHashRing:
+    """Test consistent-hash key ownership."""
+
+    def test_owner_is_deterministic(self):
+        """Test the same members always give the same owner, whatever their order."""
+        ring = HashRing(["w1", "w2", "w3"])
+
+        assert all(ring.owner(f"k{i}") == HashRing(["w3", "w1", "w2"]).owner(f"k{i}") for i in range(100))
+
+    def test_keys_spread_across_members(self):
+        """Test virtual nodes spread keys roughly evenly."""
+        ring = HashRing(["w1", "w2", "w3", "w4"])
+
+        counts = Counter(ring.owner(f"10.0.{i // 256}.{i % 256}") for i in range(20000))
+
+        assert set(counts) == {"w1", "w2", "w3", "w4"}
+        assert min(counts.values()) > 20000 / 4 * 0.7
+
+    def test_join_moves_only_a_share_of_keys(self):
+        """Test a joining worker takes keys only from others, about 1/n of them."""
+        before = HashRing(["w1", "w2", "w3"])
+        after = HashRing(["w1", "w2", "w3", "w4"])
+        keys = [f"key{i}" for i in range(10000)]
+
+        moved = [k for k in keys if before.owner(k) != after.owner(k)]
+
+        assert all(after.owner(k) == "w4" for k in moved)
+        assert 0.15 < len(moved) / len(keys) < 0.35
+
+    def test_empty_ring(self):
+        """Test an empty ring refuses lookups."""
+        with pytest.raises(LookupError):
+            HashRing([]).owner("key")
+
+
+class TestShardMembership:
+    """Test worker heartbeats and rebalancing."""
+
+    def test_stale_members_are_dropped(self, redis_client):
+        """Test a worker that stops heartbeating leaves the ring after the TTL."""
+        membership = ShardMembership()
+        membership.heartbeat("w1")
+        redis_client.zadd(membership.key, {"w2": 0})
+
+        assert membership.live_members() == ["w1"]
+
+    def test_ring_rebuilt_on_join_and_leave(self, redis_client):
+        """Test the ring follows membership changes."""
+        membership = ShardMembership()
+        membership.heartbeat("w1")
+        first = membership.ring()
+
+        assert membership.ring() is first
+        membership.heartbeat("w2")
+        assert membership.ring().members == ("w1", "w2")
+        membership.leave("w1")
+        assert membership.ring().members == ("w2",)
+
+
+class TestPartitioning:
+    """Test splitting events across shards and merging the results."""
+
+    def test_shard_value_falls_back_to_later_fields(self):
+        """Test the first non-empty shard field is used."""
+        rule = PasswordSprayRule()
+
+        assert shard_value(rule, {"source": {"ip": "10.0.0.1"}}) == "10.0.0.1"
+        assert shard_value(rule, {"source": {"ip": "-"}, "IpAddress": "10.0.0.2"}) == "10.0.0.2"
+        assert shard_value(rule, {}) == ""
+
+    def test_events_for_one_key_stay_together(self):
+        """Test every event of a source IP lands on the same worker, shipped once."""
+        ring = HashRing(["w1", "w2", "w3"])
+        events = [failed_login(i, f"10.0.0.{i % 7}", f"user{i}") for i in range(70)]
+        rules = [MultipleFailedLoginsRule(), PasswordSprayRule(threshold=5)]
+
+        payloads = partition_events(rules, events, ring)
+
+        owners = {}
+        for owner, payload in payloads.items():
+            assert sorted(payload["rules"]) == ["Multiple Failed Logins", "Password Spray"]
+            assert len(payload["events"]) == len(payload["rules"]["Password Spray"])
+            for event in payload["events"]:
+                owners.setdefault(event["source"]["ip"], set()).add(owner)
+        assert all(len(o) == 1 for o in owners.values())
+        assert sum(len(p["events"]) for p in payloads.values()) == 70
+
+    def test_only_rule_event_ids_are_shipped(self):
+        """Test a rule's shard only holds the event IDs it asks for."""
+        events = [failed_login(0, "10.0.0.1", "a"), failed_login(1, "10.0.0.1", "b", event_id=4624)]
+
+        payloads = partition_events([MultipleFailedLoginsRule()], events, HashRing(["w1"]))
+
+        assert [e["event"]["id"] for e in payloads["w1"]["events"]] == [4625]
+
+    def test_sharded_results_match_single_worker(self):
+        """Test evaluating shards and merging gives the same alerts as one pass."""
+        events = [failed_login(i * 20, f"10.0.0.{i % 4}", f"user{i}") for i in range(80)]
+        rules = [MultipleFailedLoginsRule(), PasswordSprayRule(threshold=5, window_minutes=30)]
+
+        payloads = partition_events(rules, events, HashRing(["w1", "w2", "w3"]))
+        merged = merge_alerts(evaluate_shard(payload, rules) for payload in payloads.values())
+
+        expected = [alert for rule in rules for alert in rule.check(events)]
+        assert expected
+        assert sorted(a.id for a in merged) == sorted(a.id for a in expected)
+
+    def test_merge_keeps_larger_duplicate(self):
+        """Test a key split by a rebalance resolves to the alert with more events."""
+        rule = PasswordSprayRule(threshold=3)
+        small = rule.check([failed_login(i, "10.0.0.1", f"u{i}") for i in range(3)])[0]
+        large = rule.check([failed_login(i, "10.0.0.1", f"u{i}") for i in range(5)])[0]
+
+        merged = merge_alerts([[large.to_dict()], [small.to_dict()]])
+
+        assert len(merged) == 1
+        assert merged[0].event_count == 5
+
+    def test_shard_filter_selects_owned_keys(self):
+        """Test each owner's query selects exactly the events partitioning gives it."""
+        rules = [MultipleFailedLoginsRule(), PasswordSprayRule(threshold=5)]
+        events = [failed_login(i, f"10.0.0.{i % 7}", f"user{i}") for i in range(40)]
+        events += [dict(failed_login(100 + i, "-", f"late{i}"), IpAddress=f"192.0.2.{i % 3}") for i in range(6)]
+        events.append(dict(failed_login(200, None, "nobody"), source={}))
+        ring = HashRing(["w1", "w2", "w3"])
+
+        owned = assign_shard_keys(rules, shard_keys(events, ["source.ip", "IpAddress"]), ring)
+        payloads = partition_events(rules, events, ring)
+
+        for owner in ring.members:
+            shard_filter = build_shard_filter(rules, owned[owner])
+            fetched = [e["EventRecordID"] for e in events if shard_filter and matches(shard_filter, e)]
+            expected = [e["EventRecordID"] for e in payloads.get(owner, {"events": []})["events"]]
+            assert sorted(fetched) == sorted(expected)
+
+    def test_shard_filter_keeps_rule_requirements(self):
+        """Test an owner's keys only match the event IDs of the rule that owns them."""
+        rule = MultipleFailedLoginsRule()
+        owned = assign_shard_keys([rule], {"source.ip": ["10.0.0.1"]}, HashRing(["w1"]))["w1"]
+
+        shard_filter = build_shard_filter([rule], owned)
+
+        assert matches(shard_filter, failed_login(0, "10.0.0.1", "a"))
+        assert not matches(shard_filter, failed_login(0, "10.0.0.1", "a", event_id=4624))
+        assert build_shard_filter([rule], {}) is None
+
+    def test_declarative_rule_shards_on_first_group_field(self):
+        """Test declarative rules partition on their first grouping field only."""
+        grouped = DeclarativeRule({"name": "g", "event_ids": [4625], "group_by": ["source.ip", "TargetUserName"]})
+        ungrouped = DeclarativeRule({"name": "u", "event_ids": [4625]})
+
+        assert grouped.shard_fields == ["source.ip"]
+        assert ungrouped.shard_fields == []
+        assert PrivilegeEscalationRule().shard_fields == []
+
+
+class TestShardedGenerationTask:
+    """Test the coordinator task."""
+
+    def test_falls_back_without_enough_workers(self):
+        """Test a single live worker runs the ordinary unsharded generation."""
+        with patch('app.alerts.tasks.settings.RULE_SHARDING_ENABLED', True), \
+             patch.object(tasks.membership, 'ring', return_value=HashRing(["w1"])), \
+             patch.object(tasks, 'generate_alerts_task') as mock_generate, \
+             patch.object(tasks, 'chord') as mock_chord:
+            assert tasks.generate_sharded_alerts_task() == 0
+
+        mock_generate.assert_called_once()
+        mock_chord.assert_not_called()
+
+    def test_dispatches_shards_to_owner_queues(self, shard_redis):
+        """Test shard tasks carry time bounds, not events, to their owners and unsharded rules run locally."""
+        failed, escalation = MultipleFailedLoginsRule(), PrivilegeEscalationRule()
+        with patch('app.alerts.tasks.settings.RULE_SHARDING_ENABLED', True), \
+             patch.object(tasks.membership, 'ring', return_value=HashRing(["w1", "w2"])), \
+             patch.object(tasks.alert_service, 'active_rules', return_value=[failed, escalation]), \
+             patch.object(tasks.alert_service, 'generate_alerts', return_value=[]) as mock_generate, \
+             patch.object(tasks.evaluate_shard_task, 'apply_async') as mock_shard, \
+             patch.object(tasks.recover_shards_task, 'apply_async') as mock_recover:
+            dispatched = tasks.generate_sharded_alerts_task()
+
+        assert dispatched == 2
+        assert mock_generate.call_args[1]["rules"] == [escalation]
+        assert sorted(c[1]["queue"] for c in mock_shard.call_args_list) == [shard_queue("w1"), shard_queue("w2")]
+        payload = mock_shard.call_args[0][0][0]
+        assert "events" not in payload and payload["members"] == ["w1", "w2"]
+        assert set(payload["keys"]) == {failed.name}
+        assert mock_recover.call_args[1]["countdown"] == tasks.settings.SHARD_TASK_EXPIRES_SECONDS
+
+    def test_dead_owner_is_recovered(self, shard_redis):
+        """Test the shards of an owner that never runs are evaluated by recovery and the run still merges."""
+        events = [failed_login(i * 20, f"10.0.0.{i % 4}", f"user{i}") for i in range(80)]
+        rules = [MultipleFailedLoginsRule(), PasswordSprayRule(threshold=5, window_minutes=30)]
+        fetched = []
+
+        def get_events_between(start, end, rules=None, extra_filter=None):
+            selected = [e for e in events if matches(extra_filter, e)]
+            fetched.append(len(selected))
+            return selected
+
+        with patch('app.alerts.tasks.settings.RULE_SHARDING_ENABLED', True), \
+             patch.object(tasks.membership, 'ring', return_value=HashRing(["w1", "w2", "w3"])), \
+             patch.object(tasks.alert_service, 'active_rules', return_value=rules), \
+             patch.object(tasks.alert_service, 'get_shard_keys', return_value=shard_keys(events, ["source.ip"])), \
+             patch.object(tasks.alert_service, 'get_events_between', side_effect=get_events_between), \
+             patch.object(tasks.alert_service, 'store_alert') as mock_store, \
+             patch.object(tasks.evaluate_shard_task, 'apply_async') as mock_shard, \
+             patch.object(tasks.recover_shards_task, 'apply_async') as mock_recover:
+            tasks.generate_sharded_alerts_task()
+            payloads = {c[0][0][0]["owner"]: c[0][0][0] for c in mock_shard.call_args_list}
+            # w3 is dead: only w1 and w2 run their shards
+            tasks.evaluate_shard_task(payloads["w1"])
+            tasks.evaluate_shard_task(payloads["w2"])
+            mock_store.assert_not_called()
+
+            assert tasks.recover_shards_task(*mock_recover.call_args[0][0]) == 1
+            # w3 comes back after recovery: its late task skips the recovered shard
+            assert tasks.evaluate_shard_task(payloads["w3"]) == 0
+
+        expected = [alert for rule in rules for alert in rule.check(events)]
+        assert sorted(c[0][0].id for c in mock_store.call_args_list) == sorted(a.id for a in expected)
+        # Owners fetched only their own keys' events (none at all without keys), each event once
+        assert sum(fetched) == len(events) and max(fetched) < len(events)
+
+    def test_recovery_is_noop_when_every_shard_finished(self, shard_redis):
+        """Test recovery does nothing once every owner reported back."""
+        with patch.object(tasks.alert_service, 'active_rules', return_value=[PasswordSprayRule(threshold=3)]), \
+             patch.object(tasks.alert_service, 'get_events_between', return_value=[]), \
+             patch.object(tasks.alert_service, 'store_alert'):
+            run_id = tasks.create_shard_run(["w1"])
+            tasks.evaluate_shard_task({"run_id": run_id, "owner": "w1", "members": ["w1"],
+                                       "start": BASE_TIME.isoformat(), "end": BASE_TIME.isoformat(), "keys": {}})
+
+            assert tasks.recover_shards_task(run_id, 24, BASE_TIME.isoformat()) == 0
+
+    def test_merge_stores_alerts(self, shard_redis):
+        """Test the merge stores each alert once, however many shards reported it."""
+        alert = PasswordSprayRule(threshold=3).check([failed_login(i, "10.0.0.1", f"u{i}") for i in range(3)])[0]
+        run_id = tasks.create_shard_run(["w1", "w2"])
+        assert tasks.finish_shard(run_id, "w1", [alert]) is False
+        assert tasks.finish_shard(run_id, "w2", [alert]) is True
+        assert tasks.finish_shard(run_id, "w2", [alert]) is False # merged only once
+
+        with patch.object(tasks.alert_service, 'store_alert') as mock_store:
+            assert tasks.merge_shard_results(run_id) == 1
+
+        mock_store.assert_called_once()
+
+    def test_worker_consumes_its_shard_queue(self):
+        """Test a worker subscribes to its own shard queue when sharding is enabled."""
+        instance = Mock()
+        with patch('app.alerts.tasks.settings.RULE_SHARDING_ENABLED', True), \
+             patch.object(tasks, '_worker_name', None):
+            tasks.consume_shard_queue("celery@w1", instance)
+            assert tasks._worker_name == "celery@w1"
+
+        instance.app.amqp.queues.select_add.assert_called_once_with(shard_queue("celery@w1"))
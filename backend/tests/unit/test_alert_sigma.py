@@ -0,0 +1,157 @@
+import pytest
+import yaml
+from datetime import datetime, timedelta, timezone
+
+from app.alerts.dsl import EventBatch, load_rule_file
+from app.alerts.models import AlertSeverity
+from app.alerts.sigma import SigmaRule, SigmaError, compile_sigma_documents
+
+
+BASE_TIME = datetime(2025, 9, 3, 10, 0, tzinfo=timezone.utc)
+
+ENCODED_POWERSHELL = """
+title: Encoded PowerShell Launched
+id: 6f8a3c1e-0000-4000-8000-000000000001
+description: PowerShell started with an encoded command
+logsource:
+    product: windows
+    service: security
+detection:
+    selection:
+        EventID: 4688
+        NewProcessName|endswith:
+            - '\\powershell.exe'
+            - '\\pwsh.exe'
+    encoded:
+        CommandLine|contains:
+            - ' -enc '
+            - ' -encodedcommand '
+    filter_admin:
+        SubjectUserName|startswith: 'svc_'
+    condition: selection and encoded and not filter_admin
+level: high
+"""
+
+
+def event(event_id, minutes, record_id, **fields):
+    data = {
+        "@timestamp": (BASE_TIME + timedelta(minutes=minutes)).isoformat().replace('+00:00', 'Z'),
+        "event": {"id": event_id},
+        "host": {"name": "ws01"},
+        "EventRecordID": record_id
+    }
+    data.update(fields)
+    return data
+
+
+def sigma(detection, **extra):
+    document = {
+        "title": "Test Rule",
+        "logsource": {"product": "windows", "service": "security"},
+        "detection": detection
+    }
+    document.update(extra)
+    return SigmaRule(document)
+
+
+class TestSigmaRule:
+    """Test compiling Sigma rules into Boron rules."""
+
+    def test_selection_condition_and_filter(self):
+        """Test selections, modifiers and 'not' filters evaluate as Sigma specifies."""
+        rule = SigmaRule(yaml.safe_load(ENCODED_POWERSHELL))
+        events = [
+            event(4688, 0, "1", NewProcessName="C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\POWERSHELL.EXE", CommandLine="powershell -Enc AAAA", SubjectUserName="bob"),
+            event(4688, 1, "2", NewProcessName="C:\\Windows\\powershell.exe", CommandLine="powershell -enc BBBB", SubjectUserName="svc_backup"),
+            event(4688, 2, "3", NewProcessName="C:\\Windows\\powershell.exe", CommandLine="powershell -File x.ps1", SubjectUserName="bob"),
+            event(4624, 3, "4", NewProcessName="C:\\Windows\\powershell.exe", CommandLine="powershell -enc CCCC", SubjectUserName="bob")
+        ]
+
+        alerts = rule.check(events)
+
+        assert rule.severity == AlertSeverity.HIGH
+        assert rule.event_ids == {4688}
+        assert len(alerts) == 1
+        assert alerts[0].event_ids == ["1"]
+        assert alerts[0].source == "Sigma"
+
+    def test_wildcards_and_value_lists(self):
+        """Test wildcard values and value lists (set membership) match case-insensitively."""
+        rule = sigma({
+            "selection": {"EventID": [4720, 4726], "TargetUserName": ["ADMIN*", "backdoor"]},
+            "condition": "selection"
+        })
+
+        assert rule.event_ids == {4720, 4726}
+        assert len(rule.check([event(4720, 0, "1", TargetUserName="administrator2")])) == 1
+        assert len(rule.check([event(4726, 0, "2", TargetUserName="BackDoor")])) == 1
+        assert rule.check([event(4720, 0, "3", TargetUserName="alice")]) == []
+
+    def test_quantifiers_and_list_selections(self):
+        """Test '1 of sel*', 'all of them' and OR-ed list selections."""
+        one_of = sigma({
+            "sel_a": {"EventID": 4625, "LogonType": 3},
+            "sel_b": [{"EventID": 4625, "LogonType": 10}, {"EventID": 4771}],
+            "condition": "1 of sel_*"
+        })
+        all_of = sigma({
+            "sel_id": {"EventID": 4625},
+            "sel_type": {"LogonType": 3},
+            "condition": "all of them"
+        })
+
+        assert one_of.event_ids == {4625, 4771}
+        assert len(one_of.check([event(4771, 0, "1"), event(4625, 1, "2", LogonType=10)])[0].event_ids) == 2
+        assert all_of.event_ids == {4625}
+        assert all_of.check([event(4625, 0, "1", LogonType=10)]) == []
+
+    def test_field_mapping_cidr_and_null(self):
+        """Test Sigma field names map to the pipeline's fields and special values work."""
+        rule = sigma({
+            "selection": {"EventID": 4624, "IpAddress|cidr": "10.0.0.0/8", "WorkstationName": None},
+            "condition": "selection"
+        })
+
+        assert len(rule.check([event(4624, 0, "1", IpAddress="10.1.2.3")])) == 1
+        assert rule.check([event(4624, 0, "2", IpAddress="10.1.2.3", WorkstationName="ws")]) == []
+        assert rule.check([event(4624, 0, "3", IpAddress="192.168.1.1")]) == []
+
+    def test_not_constrained_by_negated_ids(self):
+        """Test negated event IDs don't narrow the pushed-down filter."""
+        rule = sigma({"selection": {"EventID": 4688}, "condition": "not selection"})
+
+        assert rule.event_ids is None
+
+    @pytest.mark.parametrize("detection", [
+        {"selection": {"EventID": 4625}, "condition": "selection | count() by IpAddress > 10"},
+        {"keywords": ["mimikatz"], "condition": "keywords"},
+        {"selection": {"CommandLine|base64offset|contains": "IEX"}, "condition": "selection"},
+        {"selection": {"EventID": 4625}, "condition": "missing"}
+    ])
+    def test_unsupported_features(self, detection):
+        """Test features outside the compiled subset are rejected."""
+        with pytest.raises(SigmaError):
+            sigma(detection)
+
+    def test_compile_documents_skips_other_logsources(self):
+        """Test non Windows Security and broken rules are skipped, not fatal."""
+        documents = [
+            yaml.safe_load(ENCODED_POWERSHELL),
+            {"title": "Sysmon", "logsource": {"product": "windows", "category": "process_creation"}, "detection": {"s": {"Image": "x"}, "condition": "s"}},
+            {"title": "Broken", "logsource": {"product": "windows", "service": "security"}, "detection": {"condition": "nothing"}}
+        ]
+
+        rules = compile_sigma_documents(documents)
+
+        assert [r.name for r in rules] == ["Encoded PowerShell Launched"]
+
+    def test_rules_directory_loads_sigma(self, tmp_path):
+        """Test Sigma files in the rules directory go through the same loader as native rules."""
+        path = tmp_path / "sigma.yml"
+        path.write_text(ENCODED_POWERSHELL)
+
+        rules = load_rule_file(str(path))
+
+        assert [r.name for r in rules] == ["Encoded PowerShell Launched"]
+        batch = EventBatch([event(4688, 0, "1", NewProcessName="C:\\pwsh.exe", CommandLine="pwsh -enc AA", SubjectUserName="bob")])
+        assert len(rules[0].check(batch)) == 1
@@ -0,0 +1,120 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from app.alerts.dsl import EventBatch
+from app.alerts.models import MultipleFailedLoginsRule
+from app.alerts.spray import PasswordSprayRule, spray_rules
+
+
+BASE_TIME = datetime(2025, 9, 3, 10, 0, tzinfo=timezone.utc)
+
+
+def failed_login(seconds, user, ip="203.0.113.7", event_id=4625):
+    return {
+        "@timestamp": (BASE_TIME + timedelta(seconds=seconds)).isoformat().replace('+00:00', 'Z'),
+        "event": {"id": event_id},
+        "EventRecordID": f"{ip}-{user}-{seconds}",
+        "source": {"ip": ip},
+        "TargetUserName": user
+    }
+
+
+def spray(count, ip="203.0.113.7", start=0, step=30):
+    return [failed_login(start + i * step, f"user{i}", ip) for i in range(count)]
+
+
+@pytest.fixture
+def rule():
+    return PasswordSprayRule(threshold=5, window_minutes=10)
+
+
+class TestPasswordSprayRule:
+    """Test distinct-user counting per source IP."""
+
+    def test_spray_missed_by_failed_logins_rule(self, rule):
+        """Test one attempt against many users alerts here but not per (IP, user)."""
+        events = spray(8)
+
+        assert MultipleFailedLoginsRule().check(events) == []
+        alerts = rule.check(events)
+
+        assert len(alerts) == 1
+        assert alerts[0].source_ips == ["203.0.113.7"]
+        assert alerts[0].affected_users == sorted(f"user{i}" for i in range(8))
+        assert alerts[0].event_count == 8
+        assert alerts[0].timestamp == BASE_TIME
+
+    def test_repeated_attempts_on_one_user_do_not_count(self, rule):
+        """Test retries against the same users never reach the distinct threshold."""
+        events = [failed_login(i, f"user{i % 4}") for i in range(40)]
+
+        assert rule.check(events) == []
+
+    def test_usernames_are_case_insensitive(self, rule):
+        """Test case variants of one account count once."""
+        events = [failed_login(i, name) for i, name in enumerate(["Alice", "ALICE", "alice", "bob", "carol", "dave"])]
+
+        assert rule.check(events) == []
+
+    def test_targets_outside_window_expire(self, rule):
+        """Test distinct users spread wider than the window do not alert."""
+        events = spray(12, step=200)
+
+        assert rule.check(events) == []
+
+    def test_sources_counted_separately(self, rule):
+        """Test distinct users are counted per source IP."""
+        events = spray(3, ip="10.0.0.1") + spray(3, ip="10.0.0.2")
+
+        assert rule.check(EventBatch(events)) == []
+
+    def test_one_alert_per_burst(self, rule):
+        """Test a long spray yields one alert per window rather than one per threshold."""
+        events = spray(15, step=20) + spray(6, start=3600)
+
+        alerts = rule.check(events)
+
+        assert len(alerts) == 2
+        assert alerts[0].event_count == 15
+        assert alerts[1].timestamp == BASE_TIME + timedelta(hours=1)
+
+    def test_alert_ids_are_stable(self, rule):
+        """Test re-running over the same events yields the same alert id."""
+        events = spray(6)
+
+        assert rule.check(events)[0].id == rule.check(list(reversed(events)))[0].id
+
+    def test_ignores_other_events_and_missing_fields(self, rule):
+        """Test successful logons and events without IP or user are skipped."""
+        events = [failed_login(i, f"user{i}", event_id=4624) for i in range(10)]
+        events += [failed_login(i, "-") for i in range(10)]
+        events += [failed_login(i, f"user{i}", ip="-") for i in range(10)]
+
+        assert rule.check(events) == []
+
+    def test_tracked_sources_are_capped(self):
+        """Test the least recently active sources are evicted past the cap."""
+        rule = PasswordSprayRule(threshold=5, window_minutes=10, max_tracked_ips=2)
+        events = []
+        for i in range(5):
+            for ip in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+                events.append(failed_login(len(events), f"user{i}", ip))
+
+        assert rule.check(events) == []
+        assert len(PasswordSprayRule(threshold=5, window_minutes=10, max_tracked_ips=3).check(events)) == 3
+
+    def test_users_per_source_are_capped(self):
+        """Test a source keeps at most the configured number of targets."""
+        rule = PasswordSprayRule(threshold=5, window_minutes=10, max_users_per_ip=6)
+
+        alerts = rule.check(spray(20, step=1))
+
+        assert len(alerts) == 1
+        assert alerts[0].event_count == 6
+
+    def test_spray_rules_toggle(self):
+        """Test the rule can be switched off."""
+        assert [r.name for r in spray_rules()] == ["Password Spray"]
+        with patch('app.alerts.spray.settings.SPRAY_ENABLED', False):
+            assert spray_rules() == []
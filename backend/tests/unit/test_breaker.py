@@ -0,0 +1,59 @@
+from unittest.mock import patch
+
+from app.core.breaker import CircuitBreaker, LRUCache
+from app.core.metrics import render_metrics
+
+
+class TestCircuitBreaker:
+    """Test the closed / open / half-open cycle."""
+
+    def test_opens_after_consecutive_failures(self):
+        """Test failures only open the breaker once they reach the threshold in a row."""
+        breaker = CircuitBreaker("test_breaker", failure_threshold=3, reset_seconds=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.allow()
+
+        breaker.record_failure()
+
+        assert breaker.is_open
+        assert not breaker.allow()
+        assert 'boron_circuit_breaker_open{breaker="test_breaker"} 1.0' in render_metrics().decode()
+
+    def test_single_trial_after_reset(self):
+        """Test one call is let through after the reset period and its outcome decides the state."""
+        breaker = CircuitBreaker("test_breaker", failure_threshold=1, reset_seconds=30)
+        with patch('app.core.breaker.time.monotonic', return_value=100.0):
+            breaker.record_failure()
+        with patch('app.core.breaker.time.monotonic', return_value=131.0):
+            assert breaker.allow()
+            assert not breaker.allow() # trial still in flight
+            breaker.record_failure()
+            assert not breaker.allow() # reopened
+
+        with patch('app.core.breaker.time.monotonic', return_value=162.0):
+            assert breaker.allow()
+            breaker.record_success()
+
+        assert not breaker.is_open
+        assert breaker.allow()
+
+
+class TestLRUCache:
+    """Test the bounded last-good cache."""
+
+    def test_evicts_least_recently_used(self):
+        """Test reading an entry keeps it while an older untouched one is evicted."""
+        cache = LRUCache("test_cache", maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+
+        cache.put("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1 and cache.get("c") == 3
+        assert len(cache) == 2
@@ -0,0 +1,115 @@
+import os
+from unittest.mock import Mock, patch
+
+from app.core import clients
+from app.core.clients import ForkSafeClient, build_elasticsearch_client, build_http_client, build_redis_client
+from app.core.config import settings
+from app.core.metrics import render_metrics
+
+
+class TestForkSafeClient:
+    """Test the lazily created, per-process client proxy."""
+
+    def test_created_on_first_use(self):
+        """Test the factory runs on first attribute access, not at construction."""
+        factory = Mock()
+        client = ForkSafeClient(factory)
+
+        factory.assert_not_called()
+        assert not client.initialized
+        client.get_thing()
+
+        factory.assert_called_once()
+        factory.return_value.get_thing.assert_called_once()
+        assert client.initialized
+
+    def test_reused_within_a_process(self):
+        """Test the same client serves every call in one process."""
+        factory = Mock(side_effect=lambda: Mock())
+        client = ForkSafeClient(factory)
+
+        assert client.get() is client.get()
+        assert factory.call_count == 1
+
+    def test_rebuilt_after_fork(self):
+        """Test a process with another pid gets its own client."""
+        factory = Mock(side_effect=lambda: Mock())
+        client = ForkSafeClient(factory)
+        parent = client.get()
+
+        with patch('app.core.clients.os.getpid', return_value=-1):
+            child = client.get()
+
+        assert child is not parent
+        assert factory.call_count == 2
+
+    def test_reset(self):
+        """Test reset drops the client so the next use rebuilds it."""
+        factory = Mock(side_effect=lambda: Mock())
+        client = ForkSafeClient(factory)
+        first = client.get()
+
+        client.reset()
+
+        assert client.get() is not first
+
+
+class TestClientFactory:
+    """Test the pooled clients are configured from settings."""
+
+    def test_redis_pool_settings(self):
+        """Test Redis uses a bounded blocking pool from REDIS_URL."""
+        with patch('app.core.clients.settings.REDIS_URL', "redis://cache:6380/2"), \
+             patch('app.core.clients.settings.REDIS_MAX_CONNECTIONS', 7):
+            client = build_redis_client()
+
+        pool = client.connection_pool
+        assert pool.max_connections == 7
+        assert pool.connection_kwargs["host"] == "cache"
+        assert pool.connection_kwargs["port"] == 6380
+        assert pool.connection_kwargs["db"] == 2
+        assert pool.connection_kwargs["decode_responses"] is True
+
+    def test_elasticsearch_pool_settings(self):
+        """Test Elasticsearch gets pool size, timeouts and retries from settings."""
+        with patch('app.core.clients.Elasticsearch') as mock_es_class, \
+             patch('app.core.clients.settings.ES_CONNECTIONS_PER_NODE', 11):
+            build_elasticsearch_client()
+
+        kwargs = mock_es_class.call_args[1]
+        assert kwargs["connections_per_node"] == 11
+        assert kwargs["max_retries"] == settings.ES_MAX_RETRIES
+        assert kwargs["request_timeout"] == settings.ES_REQUEST_TIMEOUT
+
+    def test_http_client_limits(self):
+        """Test the outbound HTTP client keeps a bounded keep-alive pool."""
+        with patch('app.core.clients.settings.HTTP_MAX_CONNECTIONS', 9):
+            client = build_http_client()
+
+        assert client._transport._pool._max_connections == 9
+        assert client.timeout.read == settings.HTTP_TIMEOUT
+        client.close()
+
+
+class TestPoolMetrics:
+    """Test pool usage is exported for clients that exist."""
+
+    def test_pool_usage_exported(self):
+        """Test in-use and idle connections of the Redis pool are reported."""
+        with patch('app.core.clients.settings.REDIS_MAX_CONNECTIONS', 7):
+            client = build_redis_client()
+        with patch.object(clients.redis_client, 'get', return_value=client), \
+             patch.object(clients.redis_client, '_pid', os.getpid()):
+            metrics = render_metrics().decode()
+
+        assert 'boron_client_pool_connections{client="redis",state="idle"} 0.0' in metrics
+        assert 'boron_client_pool_max_connections{client="redis"} 7.0' in metrics
+
+    def test_unbuilt_clients_are_skipped(self):
+        """Test a scrape never builds a client just to report on it."""
+        with patch.object(clients.http_client, '_pid', None), \
+             patch.object(clients.http_client, 'get') as mock_get:
+            metrics = render_metrics().decode()
+
+        mock_get.assert_not_called()
+        assert 'client="http"' not in metrics
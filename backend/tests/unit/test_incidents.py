@@ -0,0 +1,157 @@
+import pytest
+from unittest.mock import patch
+from datetime import datetime, timedelta, timezone
+
+from app.alerts.models import Alert, AlertSeverity, AlertStatus
+from app.incidents.models import UnionFind, alert_entities, correlate_alerts, incident_id
+from app.incidents.service import IncidentService, INCIDENTS_INDEX
+
+
+BASE_TIME = datetime(2025, 9, 3, 10, 0, tzinfo=timezone.utc)
+
+
+def make_alert(alert_id, minutes, users=(), ips=(), host=None, severity=AlertSeverity.MEDIUM, title="Rule"):
+    return Alert(
+        id=alert_id,
+        title=title,
+        description="test",
+        severity=severity,
+        status=AlertStatus.OPEN,
+        source="Security Events",
+        timestamp=BASE_TIME + timedelta(minutes=minutes),
+        event_count=1,
+        affected_users=list(users),
+        source_ips=list(ips),
+        event_ids=[],
+        raw_events=[{"host": {"name": host}}] if host else []
+    )
+
+
+class TestUnionFind:
+    """Test the disjoint-set structure."""
+
+    def test_union_and_find(self):
+        """Test unions are transitive and leave other sets alone."""
+        forest = UnionFind(5)
+        forest.union(0, 1)
+        forest.union(1, 2)
+
+        assert forest.find(0) == forest.find(2)
+        assert forest.find(3) != forest.find(0)
+        assert forest.size[forest.find(0)] == 3
+
+
+class TestCorrelation:
+    """Test grouping alerts into incidents."""
+
+    def test_attack_chain_is_one_incident(self):
+        """Test brute force, group add and process alerts chain through shared entities."""
+        alerts = [
+            make_alert("bruteforce", 0, users=["bob"], ips=["203.0.113.5"], severity=AlertSeverity.HIGH, title="Multiple Failed Login Attempts"),
+            make_alert("group_add", 20, users=["Bob"], host="dc01", severity=AlertSeverity.CRITICAL, title="Potential Privilege Escalation Detected"),
+            make_alert("process", 45, users=["alice"], host="DC01", title="Suspicious Process Activity Detected"),
+            make_alert("unrelated", 30, users=["carol"], ips=["198.51.100.7"])
+        ]
+
+        incidents = correlate_alerts(alerts, window_minutes=60)
+
+        assert len(incidents) == 1
+        incident = incidents[0]
+        assert incident.alert_ids == ["bruteforce", "group_add", "process"]
+        assert incident.severity == AlertSeverity.CRITICAL
+        assert incident.hosts == ["dc01", "DC01"]
+        assert len(incident.alerts) == 3
+        assert incident.first_seen == BASE_TIME
+        assert incident.last_seen == BASE_TIME + timedelta(minutes=45)
+
+    def test_alerts_outside_window_not_linked(self):
+        """Test a shared entity outside the window does not correlate."""
+        alerts = [
+            make_alert("a", 0, users=["bob"]),
+            make_alert("b", 180, users=["bob"])
+        ]
+
+        assert correlate_alerts(alerts, window_minutes=60) == []
+
+    def test_placeholder_entities_ignored(self):
+        """Test placeholder values like 'Unknown' do not glue alerts together."""
+        alerts = [
+            make_alert("a", 0, users=["Unknown"], ips=["-"]),
+            make_alert("b", 5, users=["unknown"], ips=["-"])
+        ]
+
+        assert alert_entities(alerts[0]) == set()
+        assert correlate_alerts(alerts, window_minutes=60) == []
+
+    def test_incident_id_stable_when_alerts_join(self):
+        """Test later alerts joining an incident keep its id."""
+        first = [make_alert("a", 0, users=["bob"]), make_alert("b", 10, users=["bob"])]
+        later = first + [make_alert("c", 20, users=["bob"])]
+
+        assert correlate_alerts(first, 60)[0].id == correlate_alerts(later, 60)[0].id == incident_id(first)
+
+
+class TestIncidentService:
+    """Test incident storage and retrieval."""
+
+    @pytest.fixture
+    def incident_service(self, mock_elasticsearch):
+        with patch('app.incidents.service.alert_service') as mock_alert_service:
+            mock_alert_service.es = mock_elasticsearch
+            yield IncidentService()
+
+    def test_store_incident_preserves_status(self, incident_service, mock_elasticsearch):
+        """Test the partial update leaves status alone while the upsert sets it."""
+        incident = correlate_alerts([make_alert("a", 0, users=["bob"]), make_alert("b", 10, users=["bob"])], 60)[0]
+
+        assert incident_service.store_incident(incident) is True
+
+        call_kwargs = mock_elasticsearch.update.call_args[1]
+        assert call_kwargs["index"] == INCIDENTS_INDEX
+        assert "status" not in call_kwargs["doc"]
+        assert call_kwargs["upsert"]["status"] == "open"
+        mock_elasticsearch.delete_by_query.assert_called_once()
+
+    def test_store_incident_failure(self, incident_service, mock_elasticsearch):
+        """Test incident storage failure."""
+        mock_elasticsearch.update.side_effect = Exception("Storage failed")
+        incident = correlate_alerts([make_alert("a", 0, users=["bob"]), make_alert("b", 10, users=["bob"])], 60)[0]
+
+        assert incident_service.store_incident(incident) is False
+
+    def test_correlate_loads_stored_alerts(self, incident_service, mock_elasticsearch):
+        """Test stored alerts are read back and correlated."""
+        mock_elasticsearch.search.return_value = {"hits": {"hits": [
+            {"_id": "a", "_source": make_alert("a", 0, ips=["203.0.113.5"]).to_dict()},
+            {"_id": "b", "_source": make_alert("b", 5, ips=["203.0.113.5"]).to_dict()}
+        ]}}
+
+        incidents = incident_service.correlate()
+
+        assert len(incidents) == 1
+        search_kwargs = mock_elasticsearch.search.call_args[1]
+        assert "raw_events.host.name" in search_kwargs["source"]
+
+    def test_correlation_cap_keeps_newest_alerts(self, incident_service, mock_elasticsearch, caplog):
+        """Test the cap drops the oldest alerts and the truncation is logged."""
+        mock_elasticsearch.search.return_value = {"hits": {"total": {"value": 3}, "hits": [
+            {"_id": "c", "_source": make_alert("c", 10).to_dict()},
+            {"_id": "b", "_source": make_alert("b", 5).to_dict()}
+        ]}}
+
+        alerts = incident_service.get_alerts_for_correlation()
+
+        assert [alert.id for alert in alerts] == ["b", "c"]
+        search_kwargs = mock_elasticsearch.search.call_args[1]
+        assert search_kwargs["sort"] == [{"timestamp": {"order": "desc"}}]
+        assert "newest 2 of 3 alerts" in caplog.text
+
+    def test_no_elasticsearch(self):
+        """Test the service degrades when Elasticsearch is unavailable."""
+        with patch('app.incidents.service.alert_service') as mock_alert_service:
+            mock_alert_service.es = None
+            service = IncidentService()
+
+            assert service.get_incidents() == []
+            assert service.get_incident("missing") is None
+            assert service.update_incident_status("missing", AlertStatus.RESOLVED) is False
@@ -5,6 +5,8 @@ from unittest.mock import Mock, patch, MagicMock
 from datetime import datetime, timezone, timedelta
 from typing import List, Dict, Any
 import redis
+import fakeredis
+from prometheus_client import REGISTRY
 import httpx
 import ssl
 import socket
@@ -12,9 +14,18 @@ import socket
 from app.log.service import (
     token_expired, get_access_token, get_last_fetch_time, 
     save_last_fetch_time, fetch_all_security_logs, 
-    flatten_response, send_logs_to_logstash,
-    _token_cache, REDIS_KEY, QUERY_TEMPLATE
+    flatten_response, send_logs_to_logstash, refresh_access_token,
+    fetch_workspace_logs, _token_cache, REDIS_KEY, QUERY_TEMPLATE, TOKEN_REDIS_KEY, TOKEN_LOCK_KEY
 )
+from app.log import service as log_service
+from app.core.config import settings, WorkspaceConfig, load_workspaces
+
+DEFAULT_IDENTITY = "NO_TENANT_ID:NO_CLIENT_ID"
+
+
+def default_token():
+    """Token cache entry of the default (single) workspace's service principal."""
+    return _token_cache.setdefault(DEFAULT_IDENTITY, {"access_token": None, "expires_at": 0})
 
 
 class TestTokenManagement:
@@ -22,27 +33,34 @@ class TestTokenManagement:
     
     def setup_method(self):
         """Reset token cache before each test."""
-        _token_cache["access_token"] = None
-        _token_cache["expires_at"] = 0
+        _token_cache.clear()
+        log_service._credentials.clear()
+
+    @pytest.fixture(autouse=True)
+    def fake_redis(self):
+        """Back the shared token cache with an in-memory Redis."""
+        client = fakeredis.FakeRedis(decode_responses=True)
+        with patch('app.log.service.redis_client', client):
+            yield client
     
     def test_token_expired_when_missing(self):
         """Test token is considered expired when missing."""
-        _token_cache["access_token"] = None
-        _token_cache["expires_at"] = 0
+        default_token()["access_token"] = None
+        default_token()["expires_at"] = 0
         
         assert token_expired() is True
     
     def test_token_expired_when_past_expiry(self):
         """Test token is considered expired when past expiry time."""
-        _token_cache["access_token"] = "test-token"
-        _token_cache["expires_at"] = time.time() - 100  # 100 seconds ago
+        default_token()["access_token"] = "test-token"
+        default_token()["expires_at"] = time.time() - 100  # 100 seconds ago
         
         assert token_expired() is True
     
     def test_token_not_expired_when_valid(self):
         """Test token is not expired when still valid."""
-        _token_cache["access_token"] = "test-token"
-        _token_cache["expires_at"] = time.time() + 1000  # 1000 seconds from now
+        default_token()["access_token"] = "test-token"
+        default_token()["expires_at"] = time.time() + 1000  # 1000 seconds from now
         
         assert token_expired() is False
     
@@ -59,13 +77,13 @@ class TestTokenManagement:
         mock_credential.get_token.return_value = mock_token
         
         # Ensure token is expired
-        _token_cache["expires_at"] = 0
+        default_token()["expires_at"] = 0
         
         token = get_access_token()
         
         assert token == "new-access-token"
-        assert _token_cache["access_token"] == "new-access-token"
-        assert _token_cache["expires_at"] == mock_token.expires_on - 60
+        assert default_token()["access_token"] == "new-access-token"
+        assert default_token()["expires_at"] == mock_token.expires_on - 60
         
         # Verify credential was created with correct settings
         mock_credential_class.assert_called_once()
@@ -75,8 +93,8 @@ class TestTokenManagement:
         """Test returning cached token when still valid."""
         # Setup valid cached token
         cached_token = "cached-access-token"
-        _token_cache["access_token"] = cached_token
-        _token_cache["expires_at"] = time.time() + 1000
+        default_token()["access_token"] = cached_token
+        default_token()["expires_at"] = time.time() + 1000
         
         with patch('app.log.service.ClientSecretCredential') as mock_credential_class:
             token = get_access_token()
@@ -85,6 +103,68 @@ class TestTokenManagement:
             # Should not have created new credential
             mock_credential_class.assert_not_called()
 
+    @patch('app.log.service.ClientSecretCredential')
+    def test_get_access_token_publishes_to_redis(self, mock_credential_class, fake_redis):
+        """Test a freshly fetched token is shared with other workers through Redis."""
+        mock_token = Mock(token="shared-token", expires_on=time.time() + 3600)
+        mock_credential_class.return_value.get_token.return_value = mock_token
+
+        get_access_token()
+
+        shared = json.loads(fake_redis.get(f"{TOKEN_REDIS_KEY}:{DEFAULT_IDENTITY}"))
+        assert shared["access_token"] == "shared-token"
+        assert shared["expires_at"] == mock_token.expires_on - 60
+        assert 0 < fake_redis.ttl(f"{TOKEN_REDIS_KEY}:{DEFAULT_IDENTITY}") <= 3600
+
+    def test_get_access_token_uses_token_from_redis(self, fake_redis):
+        """Test a token refreshed by another worker is reused without hitting Azure AD."""
+        expires_at = time.time() + 1000
+        fake_redis.set(f"{TOKEN_REDIS_KEY}:{DEFAULT_IDENTITY}", json.dumps({"access_token": "other-worker-token", "expires_at": expires_at}))
+
+        with patch('app.log.service.ClientSecretCredential') as mock_credential_class:
+            token = get_access_token()
+
+            assert token == "other-worker-token"
+            assert default_token()["expires_at"] == expires_at
+            mock_credential_class.assert_not_called()
+
+    @patch('app.log.service.ClientSecretCredential')
+    def test_credential_is_reused_across_refreshes(self, mock_credential_class):
+        """Test the credential object is created once per process."""
+        mock_credential_class.return_value.get_token.return_value = Mock(token="t", expires_on=time.time() + 3600)
+
+        refresh_access_token(min_remaining=10_000)
+        refresh_access_token(min_remaining=10_000)
+
+        mock_credential_class.assert_called_once()
+        assert mock_credential_class.return_value.get_token.call_count == 2
+
+    @patch('app.log.service.ClientSecretCredential')
+    def test_refresh_waits_for_lock_then_falls_back(self, mock_credential_class, fake_redis):
+        """Test a refresh proceeds locally if another process holds the lock too long."""
+        mock_credential_class.return_value.get_token.return_value = Mock(token="local", expires_on=time.time() + 3600)
+        held = fake_redis.lock(f"{TOKEN_LOCK_KEY}:{DEFAULT_IDENTITY}", timeout=30)
+        assert held.acquire()
+
+        with patch.object(log_service.settings, "AZURE_TOKEN_LOCK_WAIT", 0.1):
+            token = refresh_access_token()
+
+        assert token == "local"
+        held.release()
+
+    def test_get_access_token_without_redis(self):
+        """Test tokens are still fetched when Redis is unreachable."""
+        broken = Mock()
+        broken.get.side_effect = redis.ConnectionError("down")
+        broken.set.side_effect = redis.ConnectionError("down")
+        broken.lock.side_effect = redis.ConnectionError("down")
+
+        with patch('app.log.service.redis_client', broken), \
+             patch('app.log.service.ClientSecretCredential') as mock_credential_class:
+            mock_credential_class.return_value.get_token.return_value = Mock(token="direct", expires_on=time.time() + 3600)
+
+            assert get_access_token() == "direct"
+
 
 class TestRedisOperations:
     """Test Redis operations for last fetch time management."""
@@ -130,14 +210,14 @@ class TestAzureLogFetching:
     
     @patch('app.log.service.redis_client')
     @patch('app.log.service.flatten_response')
-    @patch('app.log.service.httpx.post')
+    @patch('app.log.service.http_client.post')
     @patch('app.log.service.get_last_fetch_time')
     @patch('app.log.service.get_access_token')
     def test_fetch_all_security_logs_success(self, mock_get_token, mock_get_last_time, mock_post, mock_flatten, mock_redis_client):
         """Test successful fetching of security logs."""
         # Setup mocks
         mock_get_token.return_value = "test-token"
-        last_time = datetime.now(timezone.utc) - timedelta(hours=1)
+        last_time = datetime.now(timezone.utc) - timedelta(minutes=30)
         mock_get_last_time.return_value = last_time
         
         mock_response = Mock()
@@ -155,48 +235,46 @@ class TestAzureLogFetching:
             "Authorization": "Bearer test-token",
             "Content-Type": "application/json"
         }
-        expected_body = {"query": QUERY_TEMPLATE.format(last_time.isoformat())}
-        
         mock_post.assert_called_once_with(
             expected_url, 
             headers=expected_headers, 
-            json=expected_body, 
-            timeout=60
+            json=unittest.mock.ANY
         )
+        query = mock_post.call_args[1]["json"]["query"]
+        assert query.startswith(f"SecurityEvent | where TimeGenerated > datetime('{last_time.isoformat()}')")
         mock_response.raise_for_status.assert_called_once()
         mock_flatten.assert_called_once_with({"tables": []})
         
         # Verify that save_last_fetch_time is called through Redis
         mock_redis_client.set.assert_called_once()
-        # Check that the call was made with the REDIS_KEY
+        # Check that the call was made with the workspace's watermark key
         call_args = mock_redis_client.set.call_args
-        assert call_args[0][0] == REDIS_KEY  # First argument should be the Redis key
+        assert call_args[0][0] == f"{REDIS_KEY}:LOCALHOST"
         
-        assert result == [{"event": "test"}]
+        assert result == [{"event": "test", "_workspace": "default"}]
     
     @patch('app.log.service.redis_client')
-    @patch('app.log.service.httpx.post')
+    @patch('app.log.service.http_client.post')
     @patch('app.log.service.get_last_fetch_time')
     @patch('app.log.service.get_access_token')
     def test_fetch_all_security_logs_http_error(self, mock_get_token, mock_get_last_time, mock_post, mock_redis_client):
-        """Test handling HTTP errors when fetching logs."""
+        """Test an HTTP error is logged and the watermark kept, not raised."""
         mock_get_token.return_value = "test-token"
         mock_get_last_time.return_value = datetime.now(timezone.utc)
         
         mock_post.side_effect = httpx.HTTPError("Connection failed")
         
-        with pytest.raises(httpx.HTTPError, match="Connection failed"):
-            fetch_all_security_logs()
+        assert fetch_all_security_logs() == []
             
         # Verify save_last_fetch_time is not called on error (Redis set should not be called)
         mock_redis_client.set.assert_not_called()
     
     @patch('app.log.service.redis_client')
-    @patch('app.log.service.httpx.post')
+    @patch('app.log.service.http_client.post')
     @patch('app.log.service.get_last_fetch_time')
     @patch('app.log.service.get_access_token')
     def test_fetch_all_security_logs_response_error(self, mock_get_token, mock_get_last_time, mock_post, mock_redis_client):
-        """Test handling response errors when fetching logs."""
+        """Test an error response is logged and the watermark kept, not raised."""
         mock_get_token.return_value = "test-token"
         mock_get_last_time.return_value = datetime.now(timezone.utc)
         
@@ -206,13 +284,130 @@ class TestAzureLogFetching:
         )
         mock_post.return_value = mock_response
         
-        with pytest.raises(httpx.HTTPStatusError):
-            fetch_all_security_logs()
+        assert fetch_all_security_logs() == []
             
         # Verify save_last_fetch_time is not called on error (Redis set should not be called)
         mock_redis_client.set.assert_not_called()
 
 
+class TestMultiWorkspaceIngestion:
+    """Test concurrent ingestion across several workspaces."""
+
+    @pytest.fixture
+    def fake_redis(self):
+        client = fakeredis.FakeRedis(decode_responses=True)
+        with patch('app.log.service.redis_client', client):
+            yield client
+
+    @staticmethod
+    def workspace(name, tenant="tenant-a"):
+        return WorkspaceConfig(name, f"ws-{name}", tenant, "client", "secret")
+
+    def test_load_workspaces_defaults_to_single_workspace(self):
+        """Test the legacy single-workspace settings still work."""
+        workspaces = load_workspaces("", "tenant", "client", "secret", "ws-1")
+
+        assert workspaces == [WorkspaceConfig("default", "ws-1", "tenant", "client", "secret")]
+
+    def test_load_workspaces_from_json(self):
+        """Test AZURE_WORKSPACES entries inherit missing credentials."""
+        raw = json.dumps([
+            {"name": "prod", "workspace_id": "ws-prod"},
+            {"workspace_id": "ws-other", "tenant_id": "tenant-b", "client_id": "c2", "client_secret": "s2"}
+        ])
+
+        workspaces = load_workspaces(raw, "tenant-a", "client", "secret", "unused")
+
+        assert workspaces[0] == WorkspaceConfig("prod", "ws-prod", "tenant-a", "client", "secret")
+        assert workspaces[1] == WorkspaceConfig("ws-other", "ws-other", "tenant-b", "c2", "s2")
+
+    def test_watermarks_are_per_workspace(self, fake_redis):
+        """Test each workspace resumes from its own watermark, falling back to the legacy key."""
+        legacy = datetime(2025, 9, 1, tzinfo=timezone.utc)
+        own = datetime(2025, 9, 2, tzinfo=timezone.utc)
+        fake_redis.set(REDIS_KEY, legacy.isoformat())
+        save_last_fetch_time(own, "ws-b")
+
+        assert get_last_fetch_time("ws-a") == legacy
+        assert get_last_fetch_time("ws-b") == own
+
+    def test_fetch_all_workspaces_round_robin(self, fake_redis):
+        """Test a workspace with a long backlog does not delay the others' first slice."""
+        now = datetime.now(timezone.utc)
+        save_last_fetch_time(now - timedelta(hours=5), "ws-noisy")
+        save_last_fetch_time(now - timedelta(minutes=30), "ws-quiet1")
+        save_last_fetch_time(now - timedelta(minutes=30), "ws-quiet2")
+        workspaces = [self.workspace("noisy"), self.workspace("quiet1"), self.workspace("quiet2")]
+        order = []
+
+        def fake_fetch(workspace, start, end):
+            order.append(workspace.name)
+            save_last_fetch_time(end, workspace.workspace_id)
+            return [{"ws": workspace.name}]
+
+        with patch('app.log.service.fetch_workspace_logs', side_effect=fake_fetch), \
+             patch.object(settings, "INGEST_MAX_CONCURRENCY", 1):
+            logs = fetch_all_security_logs(workspaces)
+
+        # 5 hourly slices for the noisy workspace, one each for the quiet ones
+        assert len(logs) == 7
+        assert order[:3] == ["noisy", "quiet1", "quiet2"]
+        assert get_last_fetch_time("ws-noisy") > now - timedelta(minutes=1)
+
+    def test_fetch_caps_slices_per_run(self, fake_redis):
+        """Test INGEST_MAX_SLICES_PER_RUN bounds the work done for one workspace."""
+        save_last_fetch_time(datetime.now(timezone.utc) - timedelta(hours=10), "ws-noisy")
+
+        with patch('app.log.service.fetch_workspace_logs', return_value=[{}]) as mock_fetch, \
+             patch.object(settings, "INGEST_MAX_SLICES_PER_RUN", 3):
+            fetch_all_security_logs([self.workspace("noisy")])
+
+        assert mock_fetch.call_count == 3
+
+    def test_failing_workspace_does_not_block_others(self, fake_redis):
+        """Test one workspace's HTTP error is logged while others are still ingested."""
+        def fake_fetch(workspace, start, end):
+            if workspace.name == "broken":
+                raise httpx.HTTPError("boom")
+            return [{"ws": workspace.name}]
+
+        with patch('app.log.service.fetch_workspace_logs', side_effect=fake_fetch):
+            logs = fetch_all_security_logs([self.workspace("broken"), self.workspace("ok")])
+
+        assert logs == [{"ws": "ok"}]
+
+    def test_unexpected_workspace_error_keeps_other_results(self, fake_redis):
+        """Test a non-HTTP error in one workspace is counted and the others' events are returned."""
+        failures = REGISTRY.get_sample_value("boron_azure_fetch_failures_total", {"workspace": "broken"}) or 0
+
+        def fake_fetch(workspace, start, end):
+            if workspace.name == "broken":
+                raise KeyError("tables")
+            return [{"ws": workspace.name}]
+
+        with patch('app.log.service.fetch_workspace_logs', side_effect=fake_fetch):
+            logs = fetch_all_security_logs([self.workspace("broken"), self.workspace("ok")])
+
+        assert logs == [{"ws": "ok"}]
+        assert REGISTRY.get_sample_value("boron_azure_fetch_failures_total", {"workspace": "broken"}) == failures + 1
+
+    @patch('app.log.service.http_client.post')
+    def test_fetch_workspace_logs_uses_per_tenant_token(self, mock_post, fake_redis):
+        """Test each workspace is queried with its own tenant's token."""
+        mock_post.return_value.json.return_value = {"tables": []}
+        workspace = self.workspace("b", tenant="tenant-b")
+        start = datetime.now(timezone.utc) - timedelta(minutes=5)
+        end = datetime.now(timezone.utc)
+
+        with patch('app.log.service.get_access_token', return_value="token-b") as mock_token:
+            fetch_workspace_logs(workspace, start, end)
+
+        mock_token.assert_called_once_with(workspace)
+        assert mock_post.call_args[1]["headers"]["Authorization"] == "Bearer token-b"
+        assert "ws-b" in mock_post.call_args[0][0]
+        assert get_last_fetch_time("ws-b") == end
+
+
 class TestResponseFlattening:
     """Test response flattening functionality."""
     
@@ -375,6 +570,46 @@ class TestLogstashIntegration:
         mock_ssl_sock.sendall.assert_not_called()
 
 
+class TestStartupIngestion:
+    """Test the once-per-process-tree startup ingestion."""
+
+    @pytest.fixture(autouse=True)
+    def reset_flag(self):
+        with patch.object(log_service, '_startup_ingested', False):
+            yield
+
+    @patch('app.log.service.send_logs_to_logstash', return_value=True)
+    @patch('app.log.service.fetch_all_security_logs')
+    def test_runs_once(self, mock_fetch, mock_send, ingest_spool):
+        """Test a second call (e.g. a worker forked from the master) skips ingestion."""
+        mock_fetch.side_effect = lambda: ingest_spool.append([{"EventID": 4625}])
+
+        assert log_service.run_startup_ingestion() is True
+        assert log_service.run_startup_ingestion() is False
+
+        mock_fetch.assert_called_once()
+        mock_send.assert_called_once_with([{"EventID": 4625}])
+
+    @patch('app.log.service.send_logs_to_logstash', return_value=True)
+    @patch('app.log.service.fetch_all_security_logs', side_effect=httpx.ConnectError("down"))
+    def test_replays_spool_when_fetch_fails(self, mock_fetch, mock_send, ingest_spool):
+        """Test events spooled by an earlier run are shipped even if Azure is unreachable."""
+        ingest_spool.append([{"EventID": 4624}])
+
+        with pytest.raises(httpx.ConnectError):
+            log_service.run_startup_ingestion()
+
+        mock_send.assert_called_once_with([{"EventID": 4624}])
+
+    @patch('app.log.service.fetch_all_security_logs')
+    def test_can_be_disabled(self, mock_fetch):
+        """Test STARTUP_INGEST_ENABLED=false skips ingestion."""
+        with patch('app.log.service.settings.STARTUP_INGEST_ENABLED', False):
+            assert log_service.run_startup_ingestion() is False
+
+        mock_fetch.assert_not_called()
+
+
 class TestConstants:
     """Test module constants and configuration."""
     
@@ -384,7 +619,7 @@ class TestConstants:
     
     def test_query_template_constant(self):
         """Test query template constant is correct."""
-        expected = "SecurityEvent | where TimeGenerated > datetime('{}')"
+        expected = "SecurityEvent | where TimeGenerated > datetime('{}') and TimeGenerated <= datetime('{}')"
         assert QUERY_TEMPLATE == expected
 
 
@@ -0,0 +1,154 @@
+import os
+import pytest
+import fakeredis
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+from app.core.config import WorkspaceConfig
+from app.log import service as log_service
+from app.log.spool import Spool
+
+
+def records(start, count):
+    return [{"EventID": 4625, "EventRecordID": i} for i in range(start, start + count)]
+
+
+class Recorder:
+    """Stand-in for send_logs_to_logstash that can be told to fail"""
+
+    def __init__(self, fail_on=()):
+        self.batches = []
+        self.fail_on = set(fail_on)
+
+    def __call__(self, batch):
+        call = len(self.batches)
+        self.batches.append(list(batch))
+        return call not in self.fail_on
+
+    def ids(self, *calls):
+        return [r["EventRecordID"] for call in calls for r in self.batches[call]]
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return Spool(str(tmp_path / "spool"), segment_bytes=1024 * 1024, fsync=False)
+
+
+class TestSpool:
+    """Test the append-only ingestion spool."""
+
+    def test_drain_ships_in_order_and_acknowledges(self, spool):
+        """Test spooled records are shipped oldest first, in batches, exactly once when delivery succeeds."""
+        spool.append(records(0, 5))
+        spool.append(records(5, 3))
+        send = Recorder()
+
+        assert spool.drain(send, batch_size=3) == 8
+        assert send.ids(0, 1, 2) == list(range(8))
+        assert spool.drain(send) == 0
+        assert spool.pending_count() == 0
+
+    def test_failed_batch_is_replayed(self, spool):
+        """Test a batch that fails is kept, with earlier acknowledged batches not resent."""
+        spool.append(records(0, 6))
+        send = Recorder(fail_on={1})
+
+        assert spool.drain(send, batch_size=3) == 3
+        assert spool.pending_count() == 3
+        assert spool.drain(send, batch_size=3) == 3
+        assert send.ids(2) == [3, 4, 5]
+
+    def test_pending_survives_restart(self, spool):
+        """Test a new process picks up what the previous one spooled but never shipped."""
+        spool.append(records(0, 4))
+        spool.drain(Recorder(fail_on={1}), batch_size=2)
+
+        restarted = Spool(spool.directory, fsync=False)
+        send = Recorder()
+
+        assert restarted.drain(send) == 2
+        assert send.ids(0) == [2, 3]
+
+    def test_segments_rotate_and_are_removed_once_shipped(self, tmp_path):
+        """Test appends roll over to new segments and fully acknowledged ones are deleted."""
+        spool = Spool(str(tmp_path / "spool"), segment_bytes=200, fsync=False)
+        for start in range(0, 20, 2):
+            spool.append(records(start, 2))
+        assert len(spool._segments()) > 3
+
+        send = Recorder()
+        assert spool.drain(send, batch_size=7) == 20
+
+        assert send.ids(*range(len(send.batches))) == list(range(20))
+        assert len(spool._segments()) == 1
+        spool.append(records(20, 1))
+        assert spool.drain(send) == 1
+
+    def test_torn_tail_is_ignored_and_overwritten(self, spool):
+        """Test a record cut short by a crash is not shipped and the next append replaces it."""
+        spool.append(records(0, 2))
+        path = spool._segment_path(spool._segments()[-1])
+        with open(path, "ab") as handle:
+            handle.write(b"\x00\x00\x01\x00garbage")
+
+        assert spool.pending_count() == 2
+        Spool(spool.directory, fsync=False).append(records(2, 1))
+
+        send = Recorder()
+        assert spool.drain(send) == 3
+        assert send.ids(0) == [0, 1, 2]
+
+    def test_unreadable_ack_replays_everything(self, spool):
+        """Test a damaged ack file errs towards resending rather than dropping."""
+        spool.append(records(0, 3))
+        spool.drain(Recorder())
+        with open(os.path.join(spool.directory, "ack.json"), "w") as handle:
+            handle.write("{")
+
+        assert spool.pending_count() == 3
+
+
+class TestSpooledFetch:
+    """Test fetching only advances the watermark once events are spooled."""
+
+    @pytest.fixture
+    def fake_redis(self):
+        client = fakeredis.FakeRedis(decode_responses=True)
+        with patch('app.log.service.redis_client', client), \
+             patch('app.log.service.get_access_token', return_value="token"):
+            yield client
+
+    def azure_response(self):
+        response = Mock()
+        response.json.return_value = {"tables": [{"name": "SecurityEvent", "columns": [{"name": "EventID"}],
+                                                  "rows": [[4625], [4624]]}]}
+        return response
+
+    def test_events_spooled_before_watermark(self, fake_redis, ingest_spool):
+        """Test a fetched slice is in the spool when its watermark is saved."""
+        workspace = WorkspaceConfig("ws1", "id1", "tenant", "client", "secret")
+        end = datetime(2025, 9, 3, 11, tzinfo=timezone.utc)
+        with patch.object(log_service.http_client, 'post', return_value=self.azure_response()):
+            log_service.fetch_workspace_logs(workspace, end - timedelta(hours=1), end)
+
+        assert ingest_spool.pending_count() == 2
+        assert log_service.get_last_fetch_time("id1") == end
+
+    def test_watermark_kept_when_spool_write_fails(self, fake_redis, ingest_spool):
+        """Test a slice that cannot be spooled is fetched again next run."""
+        workspace = WorkspaceConfig("ws1", "id1", "tenant", "client", "secret")
+        end = datetime(2025, 9, 3, 11, tzinfo=timezone.utc)
+        with patch.object(log_service.http_client, 'post', return_value=self.azure_response()), \
+             patch.object(ingest_spool, 'append', side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                log_service.fetch_workspace_logs(workspace, end - timedelta(hours=1), end)
+
+        assert fake_redis.get("azure:last_fetch_time:id1") is None
+
+    def test_ship_spooled_logs(self, ingest_spool):
+        """Test the shipper sends spooled events through send_logs_to_logstash."""
+        ingest_spool.append(records(0, 2))
+        with patch('app.log.service.send_logs_to_logstash', return_value=True) as mock_send:
+            assert log_service.ship_spooled_logs() == 2
+
+        mock_send.assert_called_once_with(records(0, 2))
@@ -0,0 +1,299 @@
+import gzip
+import json
+import os
+import pytest
+import fakeredis
+import redis
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+from app.alerts import tasks as alert_tasks
+from app.alerts.baseline import FailedLoginBaselineRule
+from app.alerts.models import MultipleFailedLoginsRule
+from app.alerts.streaming import StreamingDetector
+from app.core.config import WorkspaceConfig
+from app.core.metrics import render_metrics
+from app.log import service as log_service
+from app.log import stream
+from app.log.events import to_security_event
+from app.log.stream import StreamConsumer, publish_events
+
+
+BASE_TIME = datetime(2025, 9, 3, 10, 0, tzinfo=timezone.utc)
+
+
+def azure_row(seconds, ip="203.0.113.7", user="alice", event_id=4625):
+    return {
+        "TimeGenerated": (BASE_TIME + timedelta(seconds=seconds)).isoformat().replace('+00:00', 'Z'),
+        "EventID": event_id,
+        "Computer": "DC01",
+        "IpAddress": ip,
+        "TargetUserName": user,
+        "EventRecordID": seconds,
+    }
+
+
+@pytest.fixture
+def stream_redis():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    with patch('app.log.stream.redis_client', client):
+        yield client
+
+
+class Collector:
+    def __init__(self, fail=False):
+        self.events = []
+        self.fail = fail
+
+    def __call__(self, events):
+        if self.fail:
+            raise ConnectionError("sink down")
+        self.events.extend(events)
+
+
+class TestSecurityEventShape:
+    """Test Azure rows are shaped like the documents Logstash indexes."""
+
+    def test_fields_renamed_like_logstash(self):
+        """Test timestamp, event id, host and public source IP are mapped."""
+        event = to_security_event(azure_row(0))
+
+        assert event["@timestamp"] == "2025-09-03T10:00:00Z"
+        assert event["event"] == {"id": 4625}
+        assert event["host"] == {"name": "DC01"}
+        assert event["source"] == {"ip": "203.0.113.7"}
+        assert "TimeGenerated" not in event and "IpAddress" not in event
+
+    def test_private_address_stays_in_ipaddress(self):
+        """Test private addresses are not promoted to source.ip, as in the pipeline."""
+        event = to_security_event(azure_row(0, ip="10.1.2.3"))
+
+        assert event["IpAddress"] == "10.1.2.3"
+        assert "source" not in event
+
+
+class TestIngestStream:
+    """Test publishing to and consuming from the ingestion stream."""
+
+    def test_groups_each_receive_every_event(self, stream_redis):
+        """Test independent consumer groups read the same events at their own pace."""
+        publish_events([azure_row(i) for i in range(5)])
+        shipped, archived = Collector(), Collector()
+
+        assert StreamConsumer("logstash", shipped).poll("c1", count=10) == 5
+        assert StreamConsumer("archive", archived).poll("c1", count=2) == 2
+        assert StreamConsumer("archive", archived).poll("c1", count=10) == 3
+
+        assert [e["EventRecordID"] for e in shipped.events] == list(range(5))
+        assert [e["EventRecordID"] for e in archived.events] == list(range(5))
+        assert stream_redis.xpending("ingest:events", "logstash")["pending"] == 0
+
+    def test_failed_batch_is_redelivered(self, stream_redis):
+        """Test entries stay pending when the handler fails and are claimed again once idle."""
+        publish_events([azure_row(i) for i in range(3)])
+        collector = Collector()
+
+        with pytest.raises(ConnectionError):
+            StreamConsumer("logstash", Collector(fail=True)).poll("c1")
+        assert stream_redis.xpending("ingest:events", "logstash")["pending"] == 3
+        assert StreamConsumer("logstash", collector).poll("c2") == 0 # not idle long enough yet
+
+        with patch('app.log.stream.settings.INGEST_STREAM_CLAIM_IDLE_MS', 0):
+            assert StreamConsumer("logstash", collector).poll("c2") == 3
+        assert len(collector.events) == 3
+        assert stream_redis.xpending("ingest:events", "logstash")["pending"] == 0
+
+    def test_malformed_entries_are_dropped(self, stream_redis):
+        """Test an undecodable entry is acknowledged instead of blocking the group."""
+        stream_redis.xadd("ingest:events", {"event": "{not json"})
+        publish_events([azure_row(0)])
+        collector = Collector()
+
+        assert StreamConsumer("archive", collector).poll("c1") == 2
+        assert len(collector.events) == 1
+
+    def test_stream_is_trimmed(self, stream_redis):
+        """Test the stream is capped near INGEST_STREAM_MAXLEN."""
+        with patch('app.log.stream.settings.INGEST_STREAM_MAXLEN', 10):
+            for i in range(5):
+                publish_events([azure_row(i * 10 + j) for j in range(10)])
+
+        assert stream_redis.xlen("ingest:events") < 50
+
+    def test_publish_failure_keeps_events_spooled(self, ingest_spool):
+        """Test a Redis error makes the spool keep the batch for the next drain."""
+        broken = Mock()
+        broken.pipeline.return_value.execute.side_effect = redis.ConnectionError("down")
+        ingest_spool.append([azure_row(0)])
+        with patch('app.log.stream.redis_client', broken), \
+             patch('app.log.service.settings.INGEST_STREAM_ENABLED', True):
+            assert log_service.ship_spooled_logs() == 0
+
+        assert ingest_spool.pending_count() == 1
+
+    def test_spool_published_when_enabled(self, stream_redis, ingest_spool):
+        """Test the spool drains into the stream instead of straight to Logstash."""
+        ingest_spool.append([azure_row(0), azure_row(1)])
+        with patch('app.log.service.settings.INGEST_STREAM_ENABLED', True), \
+             patch('app.log.service.send_logs_to_logstash') as mock_send:
+            assert log_service.ship_spooled_logs() == 2
+
+        mock_send.assert_not_called()
+        assert stream_redis.xlen("ingest:events") == 2
+
+    def test_lag_metrics(self, stream_redis):
+        """Test pending entries and stream length are exported per group."""
+        publish_events([azure_row(i) for i in range(4)])
+        consumer = StreamConsumer("logstash", Collector(fail=True))
+        with pytest.raises(ConnectionError):
+            consumer.poll("c1", count=3)
+
+        consumer.update_metrics()
+        metrics = render_metrics().decode()
+
+        assert 'boron_ingest_stream_pending{group="logstash"} 3.0' in metrics
+        assert 'boron_ingest_stream_lag{group="logstash"} 1.0' in metrics
+        assert 'boron_ingest_stream_length 4.0' in metrics
+
+
+class TestStreamConsumers:
+    """Test the built-in consumer groups."""
+
+    def test_rules_consumer_detects_across_batches(self, stream_redis):
+        """Test a burst split over two batches still alerts once the window holds all of it."""
+        detector = StreamingDetector(rules=[MultipleFailedLoginsRule()])
+        with patch.object(stream, 'detector', detector), \
+             patch.object(stream.alert_service, 'store_alert') as mock_store:
+            stream._evaluate_rules([azure_row(i * 10) for i in range(3)])
+            mock_store.assert_not_called()
+            stream._evaluate_rules([azure_row(30 + i * 10) for i in range(3)])
+
+        alert = mock_store.call_args[0][0]
+        assert alert.event_count == 6
+        assert alert.source_ips == ["203.0.113.7"]
+
+    def test_logstash_consumer_raises_on_failed_send(self):
+        """Test a refused batch is not acknowledged."""
+        with patch('app.log.service.send_logs_to_logstash', return_value=False):
+            with pytest.raises(ConnectionError):
+                stream._ship_to_logstash([azure_row(0)])
+
+    def test_archive_writes_daily_files(self, tmp_path):
+        """Test events are appended to one gzip JSON-lines file per day."""
+        with patch('app.log.stream.settings.INGEST_ARCHIVE_DIR', str(tmp_path)):
+            stream._archive([azure_row(0), azure_row(86400)])
+            stream._archive([azure_row(1)])
+
+        with gzip.open(tmp_path / "security-events-2025-09-03.jsonl.gz", "rt") as handle:
+            assert [json.loads(line)["EventRecordID"] for line in handle] == [0, 1]
+        assert os.path.exists(tmp_path / "security-events-2025-09-04.jsonl.gz")
+
+    def test_unknown_group_skipped(self):
+        """Test a misconfigured group name does not start a thread."""
+        with patch.object(stream, '_consumer_threads', []):
+            stream.start_stream_consumers(["nope"])
+            assert stream._consumer_threads == []
+
+
+class TestStreamingDetector:
+    """Test the sliding detection window."""
+
+    def test_old_events_leave_the_window(self):
+        """Test events older than the window are no longer evaluated."""
+        detector = StreamingDetector(window_minutes=5, rules=[MultipleFailedLoginsRule()])
+        with patch.object(stream.alert_service, 'generate_alerts', return_value=[]) as mock_generate:
+            detector.process([to_security_event(azure_row(i)) for i in range(3)])
+            detector.process([to_security_event(azure_row(600))])
+
+        assert len(mock_generate.call_args[1]["events"]) == 1
+        assert len(detector) == 1
+
+    def test_late_events_evaluated_in_time_order(self):
+        """Test rules see the window sorted by timestamp whatever the arrival order."""
+        detector = StreamingDetector(rules=[MultipleFailedLoginsRule()])
+        with patch.object(stream.alert_service, 'generate_alerts', return_value=[]) as mock_generate:
+            detector.process([to_security_event(azure_row(i)) for i in (30, 10)])
+            detector.process([to_security_event(azure_row(20)), to_security_event(azure_row(5, event_id=4624))])
+
+        batch = mock_generate.call_args[1]["events"]
+        assert [e["EventRecordID"] for _, e in batch.select(["4625"])] == [10, 20, 30]
+        assert len(batch) == 4
+
+    def test_buffer_capped(self):
+        """Test the window never holds more than max_events."""
+        detector = StreamingDetector(max_events=10, rules=[MultipleFailedLoginsRule()])
+        with patch.object(stream.alert_service, 'generate_alerts', return_value=[]):
+            detector.process([to_security_event(azure_row(i)) for i in range(25)])
+
+        assert len(detector) == 10
+
+
+class TestInlineDetection:
+    """Test rules running on fetched slices before they are indexed."""
+
+    @pytest.fixture(autouse=True)
+    def inline(self, ingest_spool):
+        client = fakeredis.FakeRedis(decode_responses=True)
+        with patch('app.log.service.redis_client', client), \
+             patch('app.log.service.get_access_token', return_value="token"), \
+             patch('app.log.service.settings.INLINE_DETECTION_ENABLED', True), \
+             patch.dict(log_service._inline_detectors, clear=True), \
+             patch.object(StreamingDetector, 'rules', return_value=[MultipleFailedLoginsRule()]):
+            yield client
+
+    def azure_response(self, rows):
+        columns = list(rows[0])
+        response = Mock()
+        response.json.return_value = {"tables": [{"name": "SecurityEvent", "columns": [{"name": c} for c in columns],
+                                                  "rows": [[row[c] for c in columns] for row in rows]}]}
+        return response
+
+    def fetch(self, rows, workspace="ws1"):
+        end = BASE_TIME + timedelta(hours=1)
+        with patch.object(log_service.http_client, 'post', return_value=self.azure_response(rows)):
+            return log_service.fetch_workspace_logs(WorkspaceConfig(workspace, workspace, "t", "c", "s"),
+                                                    BASE_TIME, end)
+
+    def test_alert_stored_during_fetch(self):
+        """Test a burst completed by a later slice is alerted on within that fetch."""
+        with patch.object(log_service.alert_service, 'store_alert', return_value=True) as mock_store:
+            self.fetch([azure_row(i * 10) for i in range(3)])
+            mock_store.assert_not_called()
+            self.fetch([azure_row(30 + i * 10) for i in range(3)])
+
+        assert mock_store.call_args[0][0].event_count == 6
+        assert "boron_detection_latency_seconds_count{path=\"inline\"}" in render_metrics().decode()
+
+    def test_workspaces_have_separate_windows(self):
+        """Test a workspace far ahead in time does not expire another one's window."""
+        with patch.object(log_service.alert_service, 'store_alert', return_value=True):
+            self.fetch([azure_row(i * 10) for i in range(3)], workspace="ws1")
+            self.fetch([azure_row(86400)], workspace="ws2")
+
+        assert len(log_service._inline_detectors["ws1"]) == 3
+
+    def test_detection_error_does_not_fail_fetch(self, inline):
+        """Test the watermark still advances when rule evaluation fails."""
+        with patch.object(StreamingDetector, 'process', side_effect=RuntimeError("bad rule")):
+            assert len(self.fetch([azure_row(0)])) == 1
+
+        assert inline.get("azure:last_fetch_time:ws1") is not None
+
+    def test_rules_consumer_not_started(self):
+        """Test the stream's rules group is skipped when events are evaluated at fetch time."""
+        with patch.object(stream, '_consumer_threads', []), \
+             patch('app.log.stream.settings.INLINE_DETECTION_ENABLED', True), \
+             patch('app.log.stream.threading.Thread') as mock_thread:
+            stream.start_stream_consumers(["logstash", "rules"])
+
+        assert [c[1]["name"] for c in mock_thread.call_args_list] == ["stream-logstash"]
+
+    def test_scheduled_run_keeps_whole_window_rules(self):
+        """Test the scheduled Elasticsearch run only evaluates rules that cannot run inline."""
+        baseline = FailedLoginBaselineRule()
+        with patch('app.alerts.tasks.settings.INLINE_DETECTION_ENABLED', True), \
+             patch.object(alert_tasks.alert_service, 'active_rules', return_value=[MultipleFailedLoginsRule(), baseline]), \
+             patch.object(alert_tasks.alert_service, 'generate_alerts', return_value=[]) as mock_generate:
+            alert_tasks.generate_alerts_task()
+
+        assert mock_generate.call_args[1]["rules"] == [baseline]
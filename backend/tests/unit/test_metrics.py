@@ -0,0 +1,104 @@
+import os
+import runpy
+import subprocess
+import sys
+from unittest.mock import Mock, patch
+from fastapi.testclient import TestClient
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY
+
+from main import app
+from app.alerts.service import AlertService
+from app.core.metrics import record_cache_lookup, render_metrics
+
+# Stands in for a Gunicorn worker writing samples to the shared multiprocess directory
+WORKER_SCRIPT = """
+import os, sys
+from prometheus_client import Counter, Gauge
+Counter("boron_test_worker_requests", "test").inc(int(sys.argv[1]))
+Gauge("boron_test_worker_busy", "test", multiprocess_mode="livemax").set(int(sys.argv[1]))
+print(os.getpid())
+"""
+GUNICORN_CONF = os.path.join(os.path.dirname(__file__), "..", "..", "gunicorn.conf.py")
+
+
+def sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+class TestMetrics:
+    """Test Prometheus instrumentation."""
+
+    def test_record_cache_lookup_hit_and_miss(self):
+        """Test cache lookups are counted per result."""
+        hits = sample("boron_cache_requests_total", {"cache": "test_cache", "result": "hit"})
+        misses = sample("boron_cache_requests_total", {"cache": "test_cache", "result": "miss"})
+
+        record_cache_lookup("test_cache", hit=True)
+        record_cache_lookup("test_cache", hit=True)
+        record_cache_lookup("test_cache", hit=False)
+
+        assert sample("boron_cache_requests_total", {"cache": "test_cache", "result": "hit"}) == hits + 2
+        assert sample("boron_cache_requests_total", {"cache": "test_cache", "result": "miss"}) == misses + 1
+
+    def test_generate_alerts_records_rule_metrics(self, sample_alert):
+        """Test per-rule timing and scanned-event histograms are observed."""
+        service = AlertService()
+        mock_rule = Mock()
+        mock_rule.name = "Metrics Test Rule"
+        mock_rule.check.return_value = [sample_alert]
+        labels = {"rule": "Metrics Test Rule"}
+
+        before_count = sample("boron_rule_evaluation_seconds_count", labels)
+        before_scanned = sample("boron_rule_events_scanned_sum", labels)
+
+        with patch('app.alerts.service.ALERT_RULES', [mock_rule]):
+            service.generate_alerts(events=[{"event": {"id": 4625}}] * 3)
+
+        assert sample("boron_rule_evaluation_seconds_count", labels) == before_count + 1
+        assert sample("boron_rule_events_scanned_sum", labels) == before_scanned + 3
+        assert sample("boron_rule_alerts_generated_total", labels) >= 1
+
+    def test_es_query_latency_recorded_by_call_site(self, mock_elasticsearch):
+        """Test Elasticsearch latency is labelled with the calling method."""
+        with patch('app.core.clients.Elasticsearch') as mock_es_class:
+            mock_es_class.return_value = mock_elasticsearch
+            service = AlertService()
+        labels = {"call_site": "get_recent_events"}
+        before = sample("boron_es_query_seconds_count", labels)
+
+        service.get_recent_events()
+
+        assert sample("boron_es_query_seconds_count", labels) == before + 1
+
+    def test_metrics_endpoint(self):
+        """Test /metrics exposes the Prometheus text format."""
+        client = TestClient(app)
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == CONTENT_TYPE_LATEST
+        assert "boron_rule_evaluation_seconds" in response.text
+
+    def test_multiprocess_scrape_aggregates_workers(self, tmp_path):
+        """Test a scrape sums every worker's counters and a dead worker's gauges are dropped."""
+        (tmp_path / "counter_1.db").write_bytes(b"stale")
+        env = {"PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+
+        with patch.dict(os.environ, env):
+            conf = runpy.run_path(GUNICORN_CONF)
+            assert not (tmp_path / "counter_1.db").exists() # previous run's samples cleared
+            pids = [
+                int(subprocess.run([sys.executable, "-c", WORKER_SCRIPT, str(n)], env={**os.environ, **env},
+                                   capture_output=True, text=True, check=True).stdout)
+                for n in (2, 3)
+            ]
+            metrics = render_metrics().decode()
+            assert "boron_test_worker_requests_total 5.0" in metrics
+            assert "boron_test_worker_busy 3.0" in metrics
+
+            conf["child_exit"](None, Mock(pid=pids[1]))
+            metrics = render_metrics().decode()
+
+        assert "boron_test_worker_requests_total 5.0" in metrics
+        assert "boron_test_worker_busy 2.0" in metrics
@@ -0,0 +1,102 @@
+import pstats
+import cProfile
+import pytest
+from unittest.mock import patch
+
+from app.core.profiling import (
+    profiled, collapse_stats, list_profiles, profile_artifact_path,
+    header_requests_profile, PROFILE_ARTIFACTS
+)
+from app.core.config import settings
+
+
+def busy_leaf(n):
+    return sum(i * i for i in range(n))
+
+
+def busy_parent():
+    return busy_leaf(20000) + busy_leaf(10000)
+
+
+@pytest.fixture
+def profile_dir(tmp_path):
+    with patch.object(settings, "PROFILE_DIR", str(tmp_path)):
+        yield tmp_path
+
+
+class TestProfiling:
+    """Test cProfile/tracemalloc profiling hooks."""
+
+    def test_profiled_writes_all_artifacts(self, profile_dir):
+        """Test a profiled block stores pstats, collapsed stacks and memory stats."""
+        with profiled("unit test") as profile_id:
+            busy_parent()
+
+        assert profile_id is not None
+        for suffix in PROFILE_ARTIFACTS.values():
+            assert (profile_dir / f"{profile_id}{suffix}").exists()
+
+        stats = pstats.Stats(str(profile_dir / f"{profile_id}.pstats"))
+        assert any(func[2] == "busy_parent" for func in stats.stats)
+
+    def test_nested_profiled_is_noop(self, profile_dir):
+        """Test nested profiling blocks do not start a second profiler."""
+        with profiled("outer") as outer_id:
+            with profiled("inner") as inner_id:
+                busy_leaf(10)
+
+        assert outer_id is not None
+        assert inner_id is None
+        assert len(list_profiles()) == 1
+
+    def test_collapse_stats_format(self):
+        """Test collapsed stacks are 'frame;frame weight' lines with callers first."""
+        profiler = cProfile.Profile()
+        profiler.enable()
+        busy_parent()
+        profiler.disable()
+
+        lines = collapse_stats(pstats.Stats(profiler))
+
+        assert lines
+        for line in lines:
+            stack, weight = line.rsplit(" ", 1)
+            assert int(weight) > 0
+        assert any("busy_parent" in line and "busy_leaf" in line and
+                   line.index("busy_parent") < line.index("busy_leaf") for line in lines)
+
+    def test_prune_keeps_newest(self, profile_dir):
+        """Test old profiles are removed beyond PROFILE_MAX_KEPT."""
+        with patch.object(settings, "PROFILE_MAX_KEPT", 2):
+            for i in range(3):
+                with patch("app.core.profiling.time.time", return_value=1000 + i):
+                    with profiled(f"run {i}"):
+                        busy_leaf(10)
+
+            profiles = list_profiles()
+
+        assert len(profiles) == 2
+        assert [p["created_at"] for p in profiles] == [1002, 1001]
+
+    def test_profile_artifact_path_rejects_traversal(self, profile_dir):
+        """Test artifact lookup refuses ids that are not generated profile ids."""
+        assert profile_artifact_path("../../etc/passwd", "pstats") is None
+        assert profile_artifact_path("1-x-deadbeef", "unknown") is None
+
+    def test_header_requests_profile(self):
+        """Test header values that enable profiling."""
+        assert header_requests_profile("1") is True
+        assert header_requests_profile("true") is True
+        assert header_requests_profile("0") is False
+        assert header_requests_profile(None) is False
+
+    def test_generate_alerts_with_profile_flag(self, profile_dir):
+        """Test generate_alerts(profile=True) stores a profile."""
+        from app.alerts.service import AlertService
+
+        service = AlertService()
+        service.generate_alerts(events=[], profile=True)
+
+        profiles = list_profiles()
+        assert len(profiles) == 1
+        assert "generate_alerts" in profiles[0]["id"]
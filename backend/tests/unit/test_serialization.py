@@ -0,0 +1,89 @@
+import pytest
+from datetime import datetime, timezone, timedelta
+from unittest.mock import patch
+
+from kombu import serialization
+
+from app import celery_app
+from app.alerts.models import Alert, AlertSeverity, AlertStatus
+from app.core.serialization import CONTENT_TYPE, SERIALIZER_NAME, dumps, loads
+
+
+def sample_alert():
+    return Alert(
+        id="failed_logins_abc", title="Multiple Failed Logins", description="5 failures",
+        severity=AlertSeverity.HIGH, status=AlertStatus.OPEN, source="Security Events",
+        timestamp=datetime(2025, 9, 3, 10, 0, tzinfo=timezone.utc), event_count=5,
+        affected_users=["alice"], source_ips=["10.0.0.1"], event_ids=["1", "2"],
+        raw_events=[{"event": {"id": 4625}, "source": {"ip": "10.0.0.1"}}]
+    )
+
+
+class TestMsgpackSerializer:
+    """Test the compact task payload serializer."""
+
+    def test_alert_dict_round_trip(self):
+        """Test Alert.to_dict output survives unchanged."""
+        data = sample_alert().to_dict()
+
+        assert loads(dumps(data)) == data
+
+    def test_datetimes_keep_timezone(self):
+        """Test aware datetimes keep their offset and naive ones stay naive, to the microsecond."""
+        aware = datetime(2025, 9, 3, 10, 0, 1, 123456, tzinfo=timezone(timedelta(hours=-5)))
+        naive = datetime(1969, 12, 31, 23, 59, 59, 999999)
+
+        decoded = loads(dumps({"aware": aware, "naive": naive}))
+
+        assert decoded["aware"] == aware
+        assert decoded["aware"].utcoffset() == timedelta(hours=-5)
+        assert decoded["naive"] == naive
+        assert decoded["naive"].tzinfo is None
+
+    def test_enums_and_sets(self):
+        """Test enums are sent as their values, like Alert.to_dict, and sets as lists."""
+        decoded = loads(dumps({"severity": AlertSeverity.CRITICAL, "ids": {4625}, 4625: "int key"}))
+
+        assert decoded == {"severity": "critical", "ids": [4625], 4625: "int key"}
+
+    def test_unknown_types_rejected(self):
+        """Test objects without an encoding fail loudly instead of being stringified."""
+        with pytest.raises(TypeError):
+            dumps({"alert": sample_alert()})
+
+    def test_compresses_above_threshold(self):
+        """Test large payloads are zstd-compressed and small ones are not."""
+        batch = [sample_alert().to_dict() for _ in range(200)]
+        with patch('app.core.serialization.settings.TASK_PAYLOAD_COMPRESS_THRESHOLD', 1024):
+            large, small = dumps(batch), dumps({"n": 1})
+
+        assert large[:1] == b"\x01"
+        assert small[:1] == b"\x00"
+        assert loads(large) == batch
+        with patch('app.core.serialization.settings.TASK_PAYLOAD_COMPRESS_THRESHOLD', 0):
+            assert dumps(batch)[:1] == b"\x00"
+
+    def test_unknown_marker(self):
+        """Test a payload with an unknown encoding byte is refused."""
+        with pytest.raises(ValueError):
+            loads(b"\x07" + dumps({})[1:])
+
+
+class TestCeleryIntegration:
+    """Test the serializer is wired into the Celery app."""
+
+    def test_celery_uses_serializer(self):
+        """Test task and result serialization default to the compact format, with JSON still accepted."""
+        assert celery_app.conf.task_serializer == SERIALIZER_NAME
+        assert celery_app.conf.result_serializer == SERIALIZER_NAME
+        assert set(celery_app.conf.accept_content) == {SERIALIZER_NAME, "json"}
+
+    def test_registered_with_kombu(self):
+        """Test kombu encodes and decodes a task body through the registered serializer."""
+        body = ((sample_alert().to_dict(),), {"index": 1}, {})
+
+        content_type, encoding, payload = serialization.dumps(body, serializer=SERIALIZER_NAME)
+
+        assert (content_type, encoding) == (CONTENT_TYPE, "binary")
+        decoded = serialization.loads(payload, content_type, encoding, accept=[CONTENT_TYPE])
+        assert decoded == [[sample_alert().to_dict()], {"index": 1}, {}]